@@ -13,6 +13,7 @@ from ..core.config import settings
 from ..models.user import User
 from ..models.finance import CashSession, ExchangeRate
 from ..schemas.user import TokenPayload
+from ..services.currency_service import CurrencyService
 
 oauth2_scheme = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login"
@@ -72,12 +73,10 @@ def get_current_exchange_rate(
     db: Session = Depends(get_db)
 ) -> ExchangeRate:
     """
-    Dependency para obtener la tasa de cambio activa.
+    Dependency para obtener la tasa de cambio vigente hoy (CurrencyService.current_rate_record).
     Lanza HTTPException si no hay tasa configurada.
     """
-    rate = db.query(ExchangeRate).filter(
-        ExchangeRate.is_active == True
-    ).order_by(ExchangeRate.effective_date.desc()).first()
+    rate = CurrencyService.current_rate_record(db)
     
     if not rate:
         raise HTTPException(
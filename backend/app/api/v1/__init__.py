@@ -1,2 +1,2 @@
-from . import auth, customers, inventory, sales, finance, repairs, dashboard, purchases, expenses, reports, users, settings, health
+from . import auth, customers, inventory, sales, finance, repairs, dashboard, purchases, expenses, reports, users, settings, health, events, admin
 
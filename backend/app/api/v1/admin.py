@@ -0,0 +1,100 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from ...core.database import get_db
+from ...core.scheduler import scheduler
+from ...models.job import JobRun
+from ...services.outbox_service import OutboxService
+from ..deps import get_current_active_user
+
+router = APIRouter(tags=["admin"])
+
+
+def require_admin(current_user = Depends(get_current_active_user)):
+    if not any(role.name == "admin" for role in current_user.roles):
+        raise HTTPException(status_code=403, detail="No tiene permisos suficientes")
+    return current_user
+
+
+@router.get("/jobs")
+def read_jobs(
+    db: Session = Depends(get_db),
+    current_user = Depends(require_admin)
+):
+    """Tareas periódicas registradas: cron, próximo turno, última corrida y duraciones."""
+    return scheduler.get_jobs(db)
+
+
+@router.get("/jobs/runs")
+def read_job_runs(
+    job_name: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user = Depends(require_admin)
+):
+    """Historial de ejecuciones (más recientes primero)."""
+    query = db.query(JobRun)
+    if job_name:
+        query = query.filter(JobRun.job_name == job_name)
+    if status:
+        query = query.filter(JobRun.status == status)
+    return [
+        {
+            "id": run.id,
+            "job_name": run.job_name,
+            "scheduled_for": run.scheduled_for,
+            "status": run.status,
+            "worker": run.worker,
+            "started_at": run.started_at,
+            "finished_at": run.finished_at,
+            "duration_ms": run.duration_ms,
+            "result": run.result,
+            "error": run.error,
+        }
+        for run in query.order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit)
+    ]
+
+
+@router.post("/jobs/{job_name}/run")
+async def run_job_now(
+    job_name: str,
+    current_user = Depends(require_admin)
+):
+    """Ejecuta una tarea de inmediato (respeta el lock: no se solapa con una corrida en curso)."""
+    if job_name not in scheduler.jobs:
+        raise HTTPException(status_code=404, detail="Tarea no encontrada")
+    run_id = await scheduler.trigger(job_name)
+    if run_id is None:
+        raise HTTPException(status_code=409, detail="La tarea ya fue reclamada por otro proceso")
+    return {"run_id": run_id}
+
+
+@router.get("/outbox")
+def read_outbox(
+    status: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    reference_type: Optional[str] = None,
+    reference_id: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user = Depends(require_admin)
+):
+    """Mensajes salientes con su estado, intentos y último error."""
+    return [
+        {
+            "id": message.id,
+            "channel": message.channel,
+            "recipient": message.recipient,
+            "status": message.status,
+            "attempts": message.attempts,
+            "next_attempt_at": message.next_attempt_at,
+            "last_error": message.last_error,
+            "reference_type": message.reference_type,
+            "reference_id": message.reference_id,
+            "batch_id": message.batch_id,
+            "created_at": message.created_at,
+            "sent_at": message.sent_at,
+        }
+        for message in OutboxService.get_messages(db, status, batch_id, reference_type, reference_id, limit)
+    ]
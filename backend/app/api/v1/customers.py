@@ -1,20 +1,15 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
 import csv
 import io
 from sqlalchemy.orm import Session
 from ...core.database import get_db
+from ...core.config import settings
 from ...models.customer import Customer
-from ...models.repair import Repair
-from ...models.sale import Sale
 from ...schemas.customer import CustomerCreate, CustomerRead, CustomerUpdate, CustomerProfile
 from ..deps import get_current_active_user
-from ...utils.pdf_generator import PDFGenerator
-from reportlab.platypus import Paragraph, Spacer, Table
-from reportlab.lib.units import inch
-from ...models.finance import AccountReceivable, CustomerPayment
-import pandas as pd
 
 router = APIRouter(tags=["customers"])
 
@@ -125,86 +120,45 @@ async def import_customers_csv(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
+    """
+    Importación masiva por etapas (tabla temporal + merge en SQL).
+    Las filas rechazadas se pueden descargar desde `reject_file`.
+    """
+    from ...services.customer_import_service import CustomerImportService
+    
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="El archivo debe ser un CSV")
     
     contents = await file.read()
-    try:
-        decoded = contents.decode('utf-8')
-    except UnicodeDecodeError:
-        decoded = contents.decode('latin-1')
-        
-    delimiter = ','
-    if ';' in decoded and decoded.count(';') > decoded.count(','):
-        delimiter = ';'
-        
-    input_file = io.StringIO(decoded)
-    reader = csv.DictReader(input_file, delimiter=delimiter)
-    
-    # Normalize headers
-    if reader.fieldnames:
-        reader.fieldnames = [field.strip().lower().replace('ï»¿', '') for field in reader.fieldnames]
+    fieldnames, rows = CustomerImportService.parse_csv(contents)
     
     # Validation: Check for required columns
     required_cols = {'name'} # DNI is recommended but name is absolute min
-    if not reader.fieldnames or not required_cols.issubset(set(reader.fieldnames)):
-        missing = required_cols - set(reader.fieldnames if reader.fieldnames else [])
+    if not fieldnames or not required_cols.issubset(set(fieldnames)):
+        missing = required_cols - set(fieldnames)
         raise HTTPException(
             status_code=400, 
             detail=f"Faltan columnas requeridas: {', '.join(missing)}."
         )
     
-    stats = {"created": 0, "updated": 0, "errors": 0}
-    
-    for row in reader:
-        try:
-            row = {k: v for k, v in row.items() if k}
-            name = row.get("name")
-            dni = row.get("dni")
-            
-            if not name:
-                continue
-                
-            # Check if customer exists by DNI
-            existing = None
-            if dni:
-                existing = db.query(Customer).filter(Customer.dni == dni).first()
-            
-            if existing:
-                # Update
-                existing.name = name
-                existing.email = row.get("email", existing.email)
-                existing.phone = row.get("phone", existing.phone)
-                existing.address = row.get("address", existing.address)
-                if row.get("payment_terms"):
-                    try:
-                        existing.payment_terms = int(row.get("payment_terms"))
-                    except: pass
-                stats["updated"] += 1
-            else:
-                # Create
-                new_customer = Customer(
-                    name=name,
-                    dni=dni,
-                    email=row.get("email"),
-                    phone=row.get("phone"),
-                    address=row.get("address")
-                )
-                if row.get("payment_terms"):
-                    try:
-                        new_customer.payment_terms = int(row.get("payment_terms"))
-                    except: pass
-                db.add(new_customer)
-                stats["created"] += 1
-                
-        except Exception as e:
-            print(f"Error importing customer row {row}: {e}")
-            stats["errors"] += 1
-            continue
-            
-    db.commit()
+    stats = await run_in_threadpool(CustomerImportService.import_rows, db, rows)
+    token = stats.pop("reject_token")
+    stats["reject_file"] = f"{settings.API_V1_STR}/customers/import-rejects/{token}" if token else None
     return stats
 
+@router.get("/import-rejects/{token}")
+def download_import_rejects(
+    token: str,
+    current_user = Depends(get_current_active_user)
+):
+    """Descarga el CSV de filas rechazadas de una importación (disponible 24 horas)."""
+    from ...services.customer_import_service import CustomerImportService
+    
+    path = CustomerImportService.reject_file_path(token)
+    if not path:
+        raise HTTPException(status_code=404, detail="Archivo de rechazos no encontrado")
+    return FileResponse(path, media_type="text/csv", filename=f"rechazos_{token}.csv")
+
 @router.get("/{customer_id}", response_model=CustomerRead)
 def read_customer(
     customer_id: int,
@@ -220,70 +174,29 @@ def read_customer(
 def read_customer_profile(
     customer_id: int,
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_active_user)
+    current_user = Depends(get_current_active_user),
+    transactions_limit: int = 100
 ):
+    from ...services.customer_profile_service import CustomerProfileService
+    
+    # Perfil cacheado (se invalida al registrar ventas, pagos o reparaciones)
+    use_cache = transactions_limit == 100
+    if use_cache:
+        cached_profile = CustomerProfileService.get_cached(customer_id)
+        if cached_profile:
+            return cached_profile
+    
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    # Fetch Related Data
-    
-    # 1. Repairs
-    repairs = db.query(Repair).filter(Repair.customer_id == customer_id).order_by(Repair.created_at.desc()).all()
-    active_repairs = [r for r in repairs if r.status in ['received', 'technical_review', 'pending_approval', 'in_progress', 'ready']]
-    repair_history = [r for r in repairs if r.status in ['delivered', 'cancelled']][:5]
-    
-    # 2. Sales & Spending
-    sales = db.query(Sale).filter(Sale.customer_id == customer_id).order_by(Sale.created_at.desc()).all()
-    recent_sales = sales[:5]
-    
-    total_spent = sum(sale.total_usd for sale in sales)
-    last_purchase_date = sales[0].created_at.date() if sales else None
-    
-    # 3. Financial Transactions (Ledger)
-    from ...models.finance import AccountReceivable, CustomerPayment
-    
-    # Charges (Debts)
-    charges = db.query(AccountReceivable).filter(AccountReceivable.customer_id == customer_id).all()
-    transaction_list = []
-    
-    for charge in charges:
-        transaction_list.append({
-            "id": charge.id,
-            "date": charge.created_at,
-            "type": "CHARGE",
-            "amount": charge.total_amount,
-            "reference": f"Credit Sale #{charge.sale_id}" if charge.sale_id else f"Repair #{charge.repair_id}",
-            "description": charge.notes or "Cargo a cuenta"
-        })
-        
-    # Payments (Abonos)
-    payments = db.query(CustomerPayment).filter(CustomerPayment.customer_id == customer_id).all()
-    for payment in payments:
-        transaction_list.append({
-            "id": payment.id,
-            "date": payment.payment_date,
-            "type": "PAYMENT",
-            "amount": payment.amount_usd,
-            "reference": payment.reference,
-            "description": f"Abono ({payment.payment_method})"
-        })
-        
-    # Sort transactions by date desc
-    transaction_list.sort(key=lambda x: x["date"], reverse=True)
-    
-    # Construct profile
-    profile_data = {
-        **customer.__dict__,
-        "total_spent": total_spent,
-        "last_purchase_date": last_purchase_date,
-        "active_repairs": active_repairs,
-        "repair_history": repair_history,
-        "recent_sales": recent_sales,
-        "transactions": transaction_list
-    }
+    profile = CustomerProfile.model_validate(
+        CustomerProfileService.build_profile(db, customer, transactions_limit)
+    )
+    if use_cache:
+        CustomerProfileService.store(customer_id, profile.model_dump(mode="json"))
     
-    return profile_data
+    return profile
 
 @router.put("/{customer_id}", response_model=CustomerRead)
 def update_customer(
@@ -328,72 +241,34 @@ def export_customer_history(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
-    """Export all transactions (Sales, Repairs, Payments) for a specific customer."""
+    """Export all transactions (Sales, Repairs, Payments) for a specific customer, with running balance."""
+    from ...services.statement_service import CustomerStatementService
+    
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
     if not customer:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
-        
-    # Gather Data (Similar to Profile endpoint)
-    repairs = db.query(Repair).filter(Repair.customer_id == customer_id).order_by(Repair.created_at.desc()).all()
-    sales = db.query(Sale).filter(Sale.customer_id == customer_id).order_by(Sale.created_at.desc()).all()
-    charges = db.query(AccountReceivable).filter(AccountReceivable.customer_id == customer_id).all()
-    payments = db.query(CustomerPayment).filter(CustomerPayment.customer_id == customer_id).all()
     
-    # Unified transaction list
-    data_list = []
-    for s in sales:
-        data_list.append({"date": s.created_at, "type": "VENTA", "ref": f"#{s.id}", "amount": float(s.total_usd)})
-    for r in repairs:
-        total = (r.labor_cost_usd or 0) + (r.parts_cost_usd or 0)
-        data_list.append({"date": r.created_at, "type": "REPARACIÓN", "ref": f"#{r.id} ({r.device_model})", "amount": float(total)})
-    for p in payments:
-        data_list.append({"date": p.payment_date, "type": "PAGO/ABONO", "ref": p.reference or "N/A", "amount": -float(p.amount_usd)})
+    if format == "csv":
+        return StreamingResponse(
+            CustomerStatementService.stream_csv(db, customer_id),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename=historial_cliente_{customer_id}.csv"}
+        )
     
-    data_list.sort(key=lambda x: x["date"], reverse=True)
-
     if format == "pdf":
-        pdf = PDFGenerator(filename_prefix=f"historial_{customer_id}")
-        elements = pdf.create_standard_header(db, f"ESTADO DE CUENTA: {customer.name}")
-        
-        # Summary
-        debt = float(customer.current_debt or 0)
-        elements.append(Paragraph(f"DNI/RIF: {customer.dni or 'N/A'}", pdf.styles['Normal']))
-        elements.append(Paragraph(f"Saldo Pendiente: ${debt}", pdf.styles['Normal']))
-        elements.append(Spacer(1, 0.2 * inch))
-        
-        # Table
-        table_data = [["Fecha", "Tipo", "Referencia", "Monto (USD)"]]
-        for item in data_list:
-            table_data.append([
-                item["date"].strftime("%d/%m/%Y"),
-                item["type"],
-                item["ref"],
-                f"${item['amount']}"
-            ])
-            
-        t = Table(table_data, colWidths=[1.2*inch, 1.2*inch, 2.8*inch, 1.3*inch])
-        t.setStyle(pdf.get_table_style())
-        elements.append(t)
-        
-        buffer = pdf.generate_streaming_response(elements)
+        output = CustomerStatementService.spooled_file()
+        filename = CustomerStatementService.write_pdf(db, customer, output)
         return StreamingResponse(
-            buffer,
+            CustomerStatementService.iter_file(output),
             media_type="application/pdf",
-            headers={"Content-Disposition": f"attachment; filename={pdf.filename}"}
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
         )
         
     elif format == "excel":
-        df = pd.DataFrame(data_list)
-        if not df.empty:
-            df['date'] = df['date'].dt.strftime('%Y-%m-%d %H:%M')
-            
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Historial')
-            
-        output.seek(0)
+        output = CustomerStatementService.spooled_file()
+        CustomerStatementService.write_excel(db, customer, output)
         return StreamingResponse(
-            output,
+            CustomerStatementService.iter_file(output),
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             headers={"Content-Disposition": f"attachment; filename=historial_cliente_{customer_id}.xlsx"}
         )
@@ -1,13 +1,15 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from datetime import date, timedelta, datetime, timezone
+from datetime import date, timedelta
 from ...core.database import get_db
 from ...models.sale import Sale
-from ...models.repair import Repair
 from ...models.customer import Customer
 from ...models.inventory import Product
 from ..deps import get_current_active_user
+from ...services.activity_service import ActivityService
+from ...services.repair_workflow_service import RepairWorkflowService
 
 router = APIRouter(tags=["dashboard"])
 
@@ -24,7 +26,7 @@ def get_dashboard_summary(
     total_sales_count = db.query(func.count(Sale.id)).scalar() or 0
     total_customers = db.query(func.count(Customer.id)).scalar() or 0
     total_products = db.query(func.count(Product.id)).scalar() or 0
-    pending_repairs = db.query(func.count(Repair.id)).filter(Repair.status != "DELIVERED", Repair.status != "CANCELLED").scalar() or 0
+    pending_repairs = RepairWorkflowService.count_active(db)
     
     # Revenue calculations
     total_sales_revenue_usd = db.query(func.sum(Sale.total_usd)).scalar() or 0
@@ -89,105 +91,29 @@ def get_dashboard_summary(
 def get_recent_activity(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user),
-    limit: int = 10
+    limit: int = 10,
+    since_id: Optional[int] = None
 ):
     """
     Retorna las últimas actividades del sistema para el dashboard.
     Incluye: ventas, reparaciones recibidas, clientes nuevos y alertas de stock.
+    Con `since_id` solo devuelve lo nuevo desde el último evento recibido.
     """
-    from datetime import datetime, timedelta, timezone
-    from ...models.inventory import Inventory
-    
-    activities = []
-    now = datetime.now(timezone.utc)
-    
-    def time_ago(dt):
-        """Calcula tiempo transcurrido en formato legible."""
-        if not dt:
-            return "Hace un momento"
-        diff = now - dt
-        if diff.days > 0:
-            return f"Hace {diff.days} día{'s' if diff.days > 1 else ''}"
-        hours = diff.seconds // 3600
-        if hours > 0:
-            return f"Hace {hours} hora{'s' if hours > 1 else ''}"
-        minutes = diff.seconds // 60
-        if minutes > 0:
-            return f"Hace {minutes} min"
-        return "Hace un momento"
-    
-    # 1. Últimas ventas (últimas 24 horas)
-    yesterday = now - timedelta(days=1)
-    recent_sales = db.query(Sale).filter(
-        Sale.created_at >= yesterday
-    ).order_by(Sale.created_at.desc()).limit(5).all()
-    
-    for sale in recent_sales:
-        activities.append({
-            "type": "sale",
-            "icon": "CheckCircle2",
-            "title": "Venta Finalizada",
-            "description": f"Venta #{sale.id} por ${float(sale.total_usd):.2f}",
-            "time": time_ago(sale.created_at),
-            "timestamp": sale.created_at.isoformat() if sale.created_at else now.isoformat(),
-            "color": "emerald"
-        })
-    
-    # 2. Últimas reparaciones recibidas
-    recent_repairs = db.query(Repair).filter(
-        Repair.created_at >= yesterday
-    ).order_by(Repair.created_at.desc()).limit(5).all()
-    
-    for repair in recent_repairs:
-        device = repair.device_model or "Equipo"
-        activities.append({
-            "type": "repair",
-            "icon": "Wrench",
-            "title": "Equipo Recibido",
-            "description": f"{device} - {repair.problem_description[:30]}..." if len(repair.problem_description) > 30 else f"{device} - {repair.problem_description}",
-            "time": time_ago(repair.created_at),
-            "timestamp": repair.created_at.isoformat() if repair.created_at else now.isoformat(),
-            "color": "primary"
-        })
-    
-    # 3. Clientes nuevos (últimas 24 horas)
-    recent_customers = db.query(Customer).filter(
-        Customer.created_at >= yesterday
-    ).order_by(Customer.created_at.desc()).limit(3).all()
-    
-    for customer in recent_customers:
-        activities.append({
-            "type": "customer",
-            "icon": "Users",
-            "title": "Nuevo Cliente",
-            "description": f"{customer.name} - Registrado",
-            "time": time_ago(customer.created_at),
-            "timestamp": customer.created_at.isoformat() if customer.created_at else now.isoformat(),
-            "color": "blue"
-        })
-    
-    # 4. Alertas de stock bajo (siempre mostrar si existen)
-    low_stock = db.query(Product).join(
-        Inventory, Product.id == Inventory.product_id
-    ).filter(
-        Inventory.quantity <= Inventory.min_stock,
-        Inventory.quantity > 0
-    ).limit(3).all()
-    
-    for product in low_stock:
-        inv = db.query(Inventory).filter(Inventory.product_id == product.id).first()
-        qty = inv.quantity if inv else 0
-        activities.append({
-            "type": "alert",
-            "icon": "AlertCircle",
-            "title": "Stock Bajo",
-            "description": f"{product.name} (Quedan {qty})",
-            "time": "Alerta activa",
-            "timestamp": now.isoformat(),
-            "color": "amber"
-        })
-    
-    # Ordenar por timestamp descendente
-    activities.sort(key=lambda x: x["timestamp"], reverse=True)
-    
-    return activities[:limit]
+    return ActivityService.get_feed(db, limit=limit, since_id=since_id)
+
+
+@router.get("/activity")
+def get_activity_page(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user),
+    limit: int = Query(50, ge=1, le=200),
+    before_id: Optional[int] = None,
+    since_id: Optional[int] = None,
+    type: Optional[str] = None
+):
+    """Historial completo de actividad paginado por cursor (`next_cursor` → `before_id`)."""
+    items = ActivityService.get_feed(db, limit=limit, since_id=since_id, before_id=before_id, event_type=type)
+    return {
+        "items": items,
+        "next_cursor": items[-1]["id"] if len(items) == limit else None
+    }
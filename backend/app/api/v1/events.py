@@ -0,0 +1,74 @@
+"""
+Live Events Endpoint (Server-Sent Events)
+
+Supervisors subscribe once instead of polling the cash session, finance
+summary and dashboard endpoints. Events are published after commit by the
+broker in app/core/events.py.
+"""
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from ...core.config import settings
+from ...core.database import get_db
+from ...core.events import get_broker, serialize_event
+from ..deps import get_current_user
+
+router = APIRouter(tags=["Events"])
+
+
+def _extract_token(request: Request, token: Optional[str]) -> str:
+    # EventSource no permite cabeceras personalizadas: se acepta ?token=
+    if token:
+        return token
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, value = authorization.partition(" ")
+    if scheme.lower() == "bearer" and value:
+        return value
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    token: Optional[str] = None,
+    types: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream de eventos en vivo (SSE).
+
+    - `types`: lista separada por comas para filtrar (p.ej. `sale.created,cash_session.updated`).
+    - Envía un comentario keepalive cada SSE_HEARTBEAT_SECONDS.
+    """
+    user = get_current_user(db=db, token=_extract_token(request, token))
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    # No mantener una conexión del pool abierta durante todo el stream
+    db.close()
+
+    wanted = {t.strip() for t in types.split(",") if t.strip()} if types else None
+    broker = get_broker()
+
+    async def event_generator():
+        async with broker.subscribe() as subscription:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    evt = await asyncio.wait_for(subscription.get(), timeout=settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if wanted and evt["type"] not in wanted:
+                    continue
+                yield f"event: {evt['type']}\ndata: {serialize_event(evt)}\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        # Content-Encoding explícito evita que GZipMiddleware acumule los eventos en buffer
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+    )
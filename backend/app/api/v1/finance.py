@@ -4,14 +4,19 @@ from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from ...core.database import get_db
-from ...models.finance import ExchangeRate, CashSession, CashTransaction, Payment
+from ...models.finance import CashSession, CashTransaction, Payment
 from ...schemas.finance import (
     ExchangeRateCreate, ExchangeRateRead, 
     CashSessionCreate, CashSessionRead, CashSessionClose
 )
-from ..deps import get_current_active_user, transaction_wrapper
+from ..deps import get_current_active_user
 from ...core.cache import cache
 from ...services.audit_service import AuditService
+from ...services.currency_service import CurrencyService
+from ...services.rate_ingestion_service import RateIngestionService
+from ...services.ar_aging_service import ARAgingService
+from ...services.customer_ledger_service import CustomerLedgerService
+from ...core.events import queue_event, queue_cash_session_update
 
 router = APIRouter(tags=["finance"])
 
@@ -23,54 +28,29 @@ def create_exchange_rate(
     current_user = Depends(get_current_active_user)
 ):
     """
-    Crear o actualizar la tasa de cambio del día.
+    Crear o actualizar la tasa de cambio de una fecha (hoy por defecto).
     
-    Usa transaction_wrapper para garantizar atomicidad en las operaciones.
+    CurrencyService.store_rate decide cuál tasa queda activa: la última con
+    effective_date <= hoy, así una tasa con fecha futura no se usa antes de tiempo.
     """
-    from datetime import date
-    
-    with transaction_wrapper(db):
-        today = date.today()
-        
-        # Check if a rate for today already exists
-        existing_rate = db.query(ExchangeRate).filter(ExchangeRate.effective_date == today).first()
-        
-        if existing_rate:
-            # Update existing rate
-            existing_rate.rate = rate_in.rate
-            existing_rate.source = rate_in.source
-            db.refresh(existing_rate)
-            rate_result = existing_rate
-        else:
-            db.query(ExchangeRate).filter(ExchangeRate.is_active == True).update({"is_active": False})
-            
-            db_rate = ExchangeRate(
-                **rate_in.model_dump(),
-                is_active=True
-            )
-            db.add(db_rate)
-            rate_result = db_rate
-        
-        # Invalidate cache
-        cache.delete("current_exchange_rate")
-        
-        return rate_result
+    return CurrencyService.store_rate(db, rate_in.rate, rate_in.source, rate_in.effective_date)
 
 @router.get("/exchange-rates/current/", response_model=ExchangeRateRead)
 def get_current_rate(db: Session = Depends(get_db)):
     # Try cache first
-    cached_rate = cache.get("current_exchange_rate")
+    cache_key = CurrencyService.current_rate_cache_key()
+    cached_rate = cache.get(cache_key)
     if cached_rate:
         return cached_rate
         
-    rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).order_by(ExchangeRate.effective_date.desc()).first()
+    rate = CurrencyService.current_rate_record(db)
     if not rate:
         raise HTTPException(status_code=404, detail="No active exchange rate found")
     
     # Store in cache for 10 minutes
     # Using Pydantic's model_dump to ensure it is JSON serializable for the CacheService
     rate_data = ExchangeRateRead.model_validate(rate).model_dump(mode='json')
-    cache.set("current_exchange_rate", rate_data, ttl=600)
+    cache.set(cache_key, rate_data, ttl=600)
     
     return rate
 
@@ -80,7 +60,6 @@ async def update_exchange_rate_auto(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
-    from ...services.currency_service import CurrencyService
     rate = await CurrencyService.update_official_rate(db)
     if not rate:
         raise HTTPException(
@@ -88,9 +67,17 @@ async def update_exchange_rate_auto(
             detail="No se pudo obtener la tasa desde el BCV. Por favor intente más tarde o use el modo manual."
         )
     
-    # Get the newly created/updated record
-    db_rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).order_by(ExchangeRate.effective_date.desc()).first()
-    return db_rate
+    # Get the rate in force today (the fetched one unless a later manual rate exists)
+    return CurrencyService.current_rate_record(db)
+
+
+@router.get("/exchange-rates/metrics")
+def get_exchange_rate_metrics(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Latencia de cada fuente de tasa y antigüedad de la última tasa registrada."""
+    return RateIngestionService.get_metrics(db)
 
 # --- Cash Session Endpoints ---
 
@@ -119,7 +106,7 @@ def open_cash_session(
     session_code = f"CAJA-{date_str}-{current_user.id}-{rand_str}"
     
     # Get current rate
-    rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
+    rate = CurrencyService.current_rate(db)
     if not rate:
          raise HTTPException(status_code=400, detail="No active exchange rate. Please set one first.")
 
@@ -143,7 +130,7 @@ def open_cash_session(
             transaction_type="opening",
             amount_usd=session_in.opening_amount,
             amount_ves=0,
-            exchange_rate=rate.rate,
+            exchange_rate=rate,
             currency="USD",
             description="Apertura de caja (USD)"
         ))
@@ -154,7 +141,7 @@ def open_cash_session(
             transaction_type="opening",
             amount_usd=0,
             amount_ves=session_in.opening_amount_ves,
-            exchange_rate=rate.rate,
+            exchange_rate=rate,
             description="Apertura de caja (VES)"
         ))
     
@@ -182,6 +169,29 @@ def get_current_session(
         CashSession.status == "open"
     ).first()
 
+@router.get("/cash-sessions/current/summary")
+def get_current_session_summary(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Reporte X: cuadre parcial de la caja abierta sin cerrarla."""
+    from ...services.cash_service import CashService
+
+    db_session = db.query(CashSession).filter(
+        CashSession.user_id == current_user.id,
+        CashSession.status == "open"
+    ).first()
+    if not db_session:
+        raise HTTPException(status_code=404, detail="No hay una caja abierta")
+
+    summary = CashService.calculate_session_summary(db, db_session.id)
+    return {
+        "session_id": db_session.id,
+        "session_code": db_session.session_code,
+        "opened_at": db_session.opened_at,
+        **summary
+    }
+
 @router.get("/cash-sessions/", response_model=List[CashSessionRead])
 def read_cash_sessions(
     db: Session = Depends(get_db),
@@ -217,8 +227,7 @@ def close_cash_session(
         # Since this is a POS, opening and closing usually happen same day.
     
     # Get current rate for calculations
-    rate_obj = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
-    current_rate = rate_obj.rate if rate_obj else Decimal('1.0') # Fallback to Decimal
+    current_rate = CurrencyService.current_rate(db) or Decimal('1.0') # Fallback to Decimal
     
     # Calculate expected amount using service
     summary = CashService.calculate_session_summary(db, db_session.id)
@@ -268,6 +277,20 @@ def close_cash_session(
     )
     db.add(transaction)
     
+    queue_event(
+        db,
+        "cash_session.closed",
+        session_id=db_session.id,
+        session_code=db_session.session_code,
+        user_id=db_session.user_id,
+        expected_amount=expected_amount,
+        expected_amount_ves=expected_amount_ves,
+        actual_amount=session_in.actual_amount,
+        actual_amount_ves=session_in.actual_amount_ves,
+        shortage=shortage_usd,
+        overage=overage_usd
+    )
+    
     db.commit()
     db.refresh(db_session)
 
@@ -306,14 +329,15 @@ def create_account_receivable(
     if not customer:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
-    # Update customer debt
-    customer.current_debt = (customer.current_debt or 0) + account_in.total_amount
-    
     db_account = AccountReceivable(
         **account_in.model_dump(),
         created_by=current_user.id
     )
     db.add(db_account)
+    db.flush()
+    ARAgingService.record_charge(db, db_account)
+    # Update customer debt (ledger + current_debt)
+    CustomerLedgerService.record_charge(db, db_account)
     db.commit()
     db.refresh(db_account)
     return db_account
@@ -357,7 +381,7 @@ def register_payment(
         raise HTTPException(status_code=400, detail="Debes tener una caja abierta para registrar pagos")
 
     # Get rate
-    rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
+    rate = CurrencyService.current_rate(db)
     if not rate:
         raise HTTPException(status_code=400, detail="No hay tasa de cambio activa")
 
@@ -368,7 +392,7 @@ def register_payment(
     
     # Create payment
     balance_after = current_balance - payment_in.amount_usd
-    amount_ves = payment_in.amount_usd * rate.rate
+    amount_ves = payment_in.amount_usd * rate
     
     payment = CustomerPayment(
         account_id=account.id,
@@ -376,7 +400,7 @@ def register_payment(
         session_id=session.id,
         amount_usd=payment_in.amount_usd,
         amount_ves=amount_ves,
-        exchange_rate=rate.rate,
+        exchange_rate=rate,
         balance_before=current_balance,
         balance_after=balance_after,
         payment_method=payment_in.payment_method,
@@ -386,6 +410,7 @@ def register_payment(
         created_by=current_user.id
     )
     db.add(payment)
+    db.flush()
     
     # Update account
     account.paid_amount = (account.paid_amount or 0) + payment_in.amount_usd
@@ -395,16 +420,31 @@ def register_payment(
     else:
         account.status = "partial"
         
-    # Update customer debt
-    customer = db.query(Customer).filter(Customer.id == account.customer_id).first()
-    if customer:
-        customer.current_debt = max(0, (customer.current_debt or 0) - payment_in.amount_usd)
+    # Update customer debt (ledger + current_debt)
+    CustomerLedgerService.record_payment(db, payment)
+
+    # Update aging buckets (customer_ar_balances)
+    ARAgingService.record_payment(db, account, payment_in.amount_usd)
         
     # Update cash session (cuadre físico)
     if payment_in.currency == "VES":
         session.expected_amount_ves += amount_ves
+        queue_cash_session_update(db, session, delta_ves=amount_ves, reason=f"ar_payment:{account.id}")
     else:
         session.expected_amount += payment_in.amount_usd
+        queue_cash_session_update(db, session, delta_usd=payment_in.amount_usd, reason=f"ar_payment:{account.id}")
+    
+    queue_event(
+        db,
+        "ar.payment_registered",
+        account_id=account.id,
+        customer_id=account.customer_id,
+        session_id=session.id,
+        amount_usd=payment_in.amount_usd,
+        balance_after=balance_after,
+        account_status=account.status,
+        currency=payment_in.currency
+    )
     
     # Create cash transaction
     transaction = CashTransaction(
@@ -412,7 +452,7 @@ def register_payment(
         transaction_type="payment",
         amount_usd=payment_in.amount_usd,
         amount_ves=amount_ves,
-        exchange_rate=rate.rate,
+        exchange_rate=rate,
         currency=payment_in.currency,
         description=f"Abono Cliente #{account.customer_id} ({payment_in.currency})",
         reference_id=payment.id
@@ -465,8 +505,7 @@ def pay_accounts_payable(
     if not session:
         raise HTTPException(status_code=400, detail="Debes tener una caja abierta para realizar pagos")
 
-    rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
-    current_rate = rate.rate if rate else Decimal(1)
+    current_rate = CurrencyService.current_rate(db) or Decimal(1)
 
     # Update AP
     ap.paid_amount += payment_in.amount_usd
@@ -506,25 +545,12 @@ def get_finance_summary(
     
     today = date.today()
     
-    # Total Receivables
-    total_receivables = db.query(
-        func.sum(AccountReceivable.total_amount - AccountReceivable.paid_amount)
-    ).filter(AccountReceivable.status != "paid").scalar() or Decimal(0)
-    
-    # Overdue Amount
-    overdue_amount = db.query(
-        func.sum(AccountReceivable.total_amount - AccountReceivable.paid_amount)
-    ).filter(
-        AccountReceivable.status != "paid",
-        AccountReceivable.due_date < today
-    ).scalar() or Decimal(0)
-    
-    # Count of morosos (customers with overdue > 30 days)
-    thirty_days_ago = today - timedelta(days=30)
-    morosos_count = db.query(func.count(func.distinct(AccountReceivable.customer_id))).filter(
-        AccountReceivable.status != "paid",
-        AccountReceivable.due_date < thirty_days_ago
-    ).scalar() or 0
+    # Cartera desde la tabla agregada customer_ar_balances (una sola consulta)
+    ar_totals = ARAgingService.get_totals(db)
+    total_receivables = ar_totals["open_balance"]
+    overdue_amount = ar_totals["overdue_balance"]
+    # Morosos: clientes con saldo vencido > 30 días
+    morosos_count = ar_totals["delinquent_customers"]
     
     # Current cash session
     session = db.query(CashSession).filter(
@@ -536,8 +562,7 @@ def get_finance_summary(
     cash_in_session_ves = Decimal(session.expected_amount_ves) if session else Decimal(0)
     
     # Exchange rate
-    rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).order_by(ExchangeRate.effective_date.desc(), ExchangeRate.id.desc()).first()
-    exchange_rate = rate.rate if rate else Decimal(1)
+    exchange_rate = CurrencyService.current_rate(db) or Decimal(1)
     
     # Collections by method (Today)
     collections = db.query(
@@ -578,50 +603,56 @@ def get_finance_summary(
 def get_cashflow_history(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user),
-    days: int = 7
+    days: int = 7,
+    bucket: str = "day",
+    currency: str = "USD"
 ):
-    """Returns daily income vs expenses for the last X days"""
+    """Returns income vs expenses per bucket (day/week/month) for the last X days"""
     from datetime import date, timedelta
-    from sqlalchemy import func
+    from ...services.timeseries_service import TimeSeriesService, Series, BUCKETS
+    
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Bucket inválido. Use: {', '.join(BUCKETS)}")
+    if currency not in ("USD", "VES"):
+        raise HTTPException(status_code=400, detail="Moneda inválida. Use USD o VES")
     
     end_date = date.today()
     start_date = end_date - timedelta(days=days-1)
     
-    # Income (Sales and Payments)
-    income_data = db.query(
-        func.date(CashTransaction.created_at).label('date'),
-        func.sum(CashTransaction.amount_usd).label('total')
-    ).filter(
-        CashTransaction.transaction_type.in_(['sale', 'payment']),
-        CashTransaction.created_at >= start_date
-    ).group_by(func.date(CashTransaction.created_at)).all()
-    
-    # Expenses
-    expense_data = db.query(
-        func.date(CashTransaction.created_at).label('date'),
-        func.sum(CashTransaction.amount_usd).label('total')
-    ).filter(
-        CashTransaction.transaction_type == 'expense',
-        CashTransaction.created_at >= start_date
-    ).group_by(func.date(CashTransaction.created_at)).all()
+    # Ingresos (ventas y abonos) y egresos en una sola consulta con huecos rellenados en SQL
+    series = [
+        Series(
+            "ingresos", CashTransaction.created_at, CashTransaction.amount_usd,
+            amount_ves=CashTransaction.amount_ves,
+            filters=[CashTransaction.transaction_type.in_(['sale', 'payment'])]
+        ),
+        Series(
+            "egresos", CashTransaction.created_at, CashTransaction.amount_usd,
+            amount_ves=CashTransaction.amount_ves,
+            filters=[CashTransaction.transaction_type == 'expense']
+        ),
+    ]
+    rows = TimeSeriesService.aggregate(db, series, start_date, end_date, bucket=bucket)
+    
+    days_map = ["Lun", "Mar", "Mie", "Jue", "Vie", "Sab", "Dom"]
+    month_names = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
+    suffix = currency.lower()
     
-    # Format for chart
     history = []
-    income_map = {d.strftime('%Y-%m-%d'): float(t) for d, t in income_data}
-    expense_map = {d.strftime('%Y-%m-%d'): float(t) for d, t in expense_data}
-    
-    days_map = ["Dom", "Lun", "Mar", "Mie", "Jue", "Vie", "Sab"]
-    
-    for i in range(days):
-        current_date = start_date + timedelta(days=i)
-        date_str = current_date.strftime('%Y-%m-%d')
-        day_name = days_map[int(current_date.strftime('%w'))]
+    for row in rows:
+        current_date = row["bucket"]
+        if bucket == "day":
+            name = days_map[current_date.weekday()]
+        elif bucket == "week":
+            name = f"Sem {current_date.strftime('%d/%m')}"
+        else:
+            name = month_names[current_date.month - 1]
         
         history.append({
-            "name": day_name,
-            "full_date": date_str,
-            "ingresos": income_map.get(date_str, 0),
-            "egresos": expense_map.get(date_str, 0)
+            "name": name,
+            "full_date": current_date.isoformat(),
+            "ingresos": row[f"ingresos_{suffix}"],
+            "egresos": row[f"egresos_{suffix}"]
         })
         
     return history
@@ -637,58 +668,69 @@ def get_morosos(
     from datetime import date, timedelta
     from sqlalchemy import func
     
+    from ...models.finance import CustomerARBalance
+
     today = date.today()
     thirty_days_ago = today - timedelta(days=30)
+
+    delinquent_balance = (
+        CustomerARBalance.bucket_31_60 + CustomerARBalance.bucket_61_90 + CustomerARBalance.bucket_over_90
+    )
     
-    # Get accounts overdue > 30 days grouped by customer
-    overdue_accounts = db.query(AccountReceivable).filter(
-        AccountReceivable.status != "paid",
-        AccountReceivable.due_date < thirty_days_ago
-    ).all()
-    
-    # Group by customer
-    customer_debts = {}
-    for ar in overdue_accounts:
-        cid = ar.customer_id
-        if cid not in customer_debts:
-            customer = db.query(Customer).filter(Customer.id == cid).first()
-            customer_debts[cid] = {
-                "customer_id": cid,
-                "customer_name": customer.name if customer else f"Cliente #{cid}",
-                "phone": customer.phone if customer else None,
-                "total_debt": 0,
-                "oldest_due_date": ar.due_date,
-                "accounts": []
-            }
-        
-        balance = float(ar.total_amount - (ar.paid_amount or 0))
-        customer_debts[cid]["total_debt"] += balance
-        customer_debts[cid]["accounts"].append({
-            "id": ar.id,
-            "balance": balance,
-            "due_date": ar.due_date.isoformat(),
-            "days_overdue": (today - ar.due_date).days
-        })
-        
-        if ar.due_date < customer_debts[cid]["oldest_due_date"]:
-            customer_debts[cid]["oldest_due_date"] = ar.due_date
-    
-    # Calculate days overdue for each customer
-    morosos = []
-    for cid, data in customer_debts.items():
-        data["days_overdue"] = (today - data["oldest_due_date"]).days
-        data["oldest_due_date"] = data["oldest_due_date"].isoformat()
-        morosos.append(data)
-    
-    # Sort by days overdue desc
-    morosos.sort(key=lambda x: x["days_overdue"], reverse=True)
-    
-    total_at_risk = sum(m["total_debt"] for m in morosos)
+    # Totales de morosidad directamente sobre la tabla agregada
+    total_morosos, total_at_risk = db.query(
+        func.count(CustomerARBalance.customer_id),
+        func.coalesce(func.sum(delinquent_balance), 0)
+    ).filter(delinquent_balance > 0).one()
+    
+    # Top 10 por antigüedad (una consulta con JOIN a customers)
+    top_rows = db.query(
+        CustomerARBalance.customer_id,
+        CustomerARBalance.oldest_due_date,
+        delinquent_balance.label("total_debt"),
+        Customer.name,
+        Customer.phone
+    ).join(
+        Customer, Customer.id == CustomerARBalance.customer_id
+    ).filter(
+        delinquent_balance > 0
+    ).order_by(
+        CustomerARBalance.oldest_due_date.asc(), CustomerARBalance.customer_id
+    ).limit(10).all()
+    
+    # Detalle de cuentas vencidas del top en una sola consulta IN
+    accounts_by_customer = {row.customer_id: [] for row in top_rows}
+    if accounts_by_customer:
+        overdue_accounts = db.query(AccountReceivable).filter(
+            AccountReceivable.customer_id.in_(accounts_by_customer.keys()),
+            AccountReceivable.status != "paid",
+            AccountReceivable.due_date < thirty_days_ago
+        ).order_by(AccountReceivable.due_date).all()
+        for ar in overdue_accounts:
+            accounts_by_customer[ar.customer_id].append({
+                "id": ar.id,
+                "balance": float(ar.total_amount - (ar.paid_amount or 0)),
+                "due_date": ar.due_date.isoformat(),
+                "days_overdue": (today - ar.due_date).days
+            })
+    
+    morosos = [
+        {
+            "customer_id": row.customer_id,
+            "customer_name": row.name or f"Cliente #{row.customer_id}",
+            "phone": row.phone,
+            "total_debt": float(row.total_debt),
+            "oldest_due_date": row.oldest_due_date.isoformat(),
+            "days_overdue": (today - row.oldest_due_date).days,
+            "accounts": accounts_by_customer[row.customer_id]
+        }
+        for row in top_rows
+    ]
     
     return {
-        "morosos": morosos[:10],  # Top 10
-        "total_morosos": len(morosos),
-        "total_at_risk": total_at_risk
+        "morosos": morosos,  # Top 10
+        "total_morosos": total_morosos,
+        "total_at_risk": float(total_at_risk)
     }
 
 @router.post("/calculate-aging")
@@ -14,6 +14,8 @@ from ...schemas.inventory import (
 )
 from ..deps import get_current_active_user
 from ...services.audit_service import AuditService
+from ...services.costing_service import CostingService
+from ...services.stock_service import StockService
 
 router = APIRouter(tags=["inventory"])
 
@@ -111,9 +113,14 @@ def create_product(
         db.add(db_product)
         db.flush() # Get product ID
         
-        # Automatically create inventory record
+        # Automatically create inventory record (stock inicial como capa de costo)
+        CostingService.add_layer(db, db_product.id, inventory_quantity or 0, db_product.cost_usd, "opening")
         db_inventory = Inventory(product_id=db_product.id, quantity=inventory_quantity)
         db.add(db_inventory)
+        StockService.record(
+            db, db_product.id, inventory_quantity or 0, inventory_quantity or 0, "opening",
+            user_id=current_user.id, unit_cost=db_product.cost_usd, note="Stock inicial"
+        )
         
         db.commit()
         db.refresh(db_product)
@@ -128,6 +135,17 @@ def create_product(
         print(f"DEBUG: 500 Error Traceback: {tb_str}")
         raise HTTPException(status_code=500, detail=f"Error al crear producto: {str(e)} | Details: {tb_str[:200]}")
 
+@router.get("/low-stock")
+def read_low_stock(
+    limit: int = 50,
+    include_out_of_stock: bool = True,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Productos con stock bajo (flag mantenido en escritura; los cambios llegan por /events/stream)."""
+    from ...services.low_stock_service import LowStockService
+    return LowStockService.get_low_stock(db, limit, include_out_of_stock)
+
 @router.get("/categories", response_model=List[CategoryRead])
 def read_categories(
     db: Session = Depends(get_db),
@@ -178,12 +196,18 @@ def update_product(
     # 3. ACTUALIZAR EL STOCK (La parte que faltaba)
     if inventory_quantity is not None:
         inventory = db.query(Inventory).filter(Inventory.product_id == product.id).first()
+        old_quantity = (inventory.quantity or 0) if inventory else 0
+        CostingService.adjust(db, product.id, inventory_quantity - old_quantity, product.cost_usd)
         if inventory:
             inventory.quantity = inventory_quantity
         else:
             # Si por algún error el producto no tenía registro de inventario, lo creamos
             new_inventory = Inventory(product_id=product.id, quantity=inventory_quantity)
             db.add(new_inventory)
+        StockService.record(
+            db, product.id, inventory_quantity - old_quantity, inventory_quantity, "adjustment",
+            user_id=current_user.id, note="Edición de producto"
+        )
     
     # Audit logging for cost/price changes
     details = {}
@@ -257,7 +281,14 @@ def adjust_stock(
     if new_quantity < 0:
         raise HTTPException(status_code=400, detail="Insufficient stock")
     
+    # Capas de costo: las entradas crean una capa, las salidas consumen FIFO
+    CostingService.adjust(db, product_id, adjustment.quantity, product.cost_usd)
+    
     inventory.quantity = new_quantity
+    StockService.record(
+        db, product_id, adjustment.quantity, new_quantity, "adjustment",
+        user_id=current_user.id, unit_cost=product.cost_usd, note=adjustment.reason
+    )
     
     # Create inventory log for audit trail
     log = InventoryLog(
@@ -469,6 +500,11 @@ async def import_products_csv(
                     # Inventory
                     inv_record = db.query(Inventory).filter(Inventory.product_id == existing_product.id).first()
                     if inv_record:
+                        CostingService.adjust(db, existing_product.id, quantity - (inv_record.quantity or 0), cost_usd)
+                        StockService.record(
+                            db, existing_product.id, quantity - (inv_record.quantity or 0), quantity, "adjustment",
+                            user_id=current_user.id, note="Importación de inventario"
+                        )
                         inv_record.quantity = quantity
                     stats["updated"] += 1
                 elif name and name.lower() != 'nan':
@@ -485,8 +521,13 @@ async def import_products_csv(
                     db.add(new_product)
                     db.flush()
                     
+                    CostingService.add_layer(db, new_product.id, quantity, cost_usd, "opening")
                     new_inventory = Inventory(product_id=new_product.id, quantity=quantity)
                     db.add(new_inventory)
+                    StockService.record(
+                        db, new_product.id, quantity, quantity, "opening",
+                        user_id=current_user.id, unit_cost=cost_usd, note="Importación de inventario"
+                    )
                     stats["created"] += 1
                 else:
                     stats["errors"] += 1
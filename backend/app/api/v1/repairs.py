@@ -10,11 +10,18 @@ from ...core.database import get_db
 from ...models.customer import Customer
 from ...models.repair import Repair, RepairItem, RepairLog
 from ...models.inventory import Product, Inventory
-from ...models.finance import Payment, CashTransaction, CashSession, ExchangeRate
-from ...schemas.repair import RepairCreate, RepairRead, RepairUpdate, RepairItemCreate, RepairItemRead, RepairPaymentCreate
+from ...models.finance import Payment, CashTransaction, CashSession
+from ...schemas.repair import RepairCreate, RepairRead, RepairUpdate, RepairItemCreate, RepairItemRead, RepairPaymentCreate, RepairBulkStatusUpdate, RepairBulkStatusResult
 from ..deps import get_current_active_user, transaction_wrapper
 from ...utils.pdf_generator import PDFGenerator
 from ...services.whatsapp_service import WhatsAppService
+from ...services.outbox_service import OutboxService
+from ...services.repair_workflow_service import RepairWorkflowService
+from ...core.events import queue_event, queue_cash_session_update
+from ...services.costing_service import CostingService
+from ...services.stock_service import StockService
+from ...services.currency_service import CurrencyService
+from ...utils.enums import RepairStatus
 from reportlab.platypus import Paragraph, Spacer, Table, KeepTogether, SimpleDocTemplate
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
@@ -34,20 +41,26 @@ def export_repairs_csv(
     writer.writerow([
         "id", "date", "customer", "equipment", "brand", 
         "model", "status", "labor_cost", "parts_cost", 
-        "total_cost", "paid_amount"
+        "total_cost", "paid_amount", "exchange_rate", "total_cost_ves"
     ])
     
     repairs = db.query(Repair).order_by(Repair.created_at.desc()).all()
+    total_costs = [(r.labor_cost_usd or 0) + (r.parts_cost_usd or 0) for r in repairs]
+    # Tasa del día de cada reparación, resuelta en bloque contra el índice de tasas
+    days = [r.created_at.date() for r in repairs]
+    rates = CurrencyService.rates_on(db, days)
+    totals_ves = CurrencyService.convert(db, total_costs, days)
     
-    for r in repairs:
+    for r, total_cost, rate, total_ves in zip(repairs, total_costs, rates, totals_ves):
         customer_name = r.customer.name if r.customer else "N/A"
-        total_cost = (r.labor_cost_usd or 0) + (r.parts_cost_usd or 0)
         writer.writerow([
             r.id, r.created_at.strftime("%Y-%m-%d %H:%M:%S"),
             customer_name, r.device_model or "", "",
             "", r.status,
             float(r.labor_cost_usd or 0), float(r.parts_cost_usd or 0),
-            float(total_cost), float(r.paid_amount_usd or 0)
+            float(total_cost), float(r.paid_amount_usd or 0),
+            float(rate) if rate is not None else "",
+            float(total_ves) if total_ves is not None else ""
         ])
     
     output.seek(0)
@@ -108,7 +121,7 @@ def create_repair(
     
     # Create repair record
     with transaction_wrapper(db):
-        db_repair = Repair(**repair_data, status="RECEIVED", created_by_id=current_user.id)
+        db_repair = Repair(**repair_data, status=RepairStatus.RECEIVED.value, created_by_id=current_user.id)
         db.add(db_repair)
         db.flush()  # Get repair ID without committing
         
@@ -132,6 +145,10 @@ def create_repair(
             
             # Deduct stock
             inventory.quantity -= item.quantity
+            StockService.record(
+                db, product.id, -item.quantity, inventory.quantity, "repair",
+                reference_type="repair", reference_id=db_repair.id, user_id=current_user.id
+            )
             
             # Use database price for security (ignore frontend price)
             item_price = product.price_usd 
@@ -142,7 +159,8 @@ def create_repair(
                 repair_id=db_repair.id,
                 product_id=product.id,
                 quantity=item.quantity,
-                unit_cost_usd=item_price # Storing transaction price
+                unit_cost_usd=item_price, # Storing transaction price
+                unit_cogs_usd=CostingService.consume(db, product.id, item.quantity)
             )
             db.add(repair_item)
         
@@ -150,7 +168,7 @@ def create_repair(
         # db_repair.parts_cost_usd = total_parts_cost (Removed: property has no setter)
         
         # Log initial status
-        log = RepairLog(repair_id=db_repair.id, user_id=current_user.id, status_to="RECEIVED", notes="Reparación recibida")
+        log = RepairLog(repair_id=db_repair.id, user_id=current_user.id, status_to=RepairStatus.RECEIVED.value, notes="Reparación recibida")
         db.add(log)
         
         db.refresh(db_repair)
@@ -168,21 +186,17 @@ def update_repair(
     if not db_repair:
         raise HTTPException(status_code=404, detail="Repair not found")
     
-    old_status = db_repair.status
     update_data = repair_in.model_dump(exclude_unset=True)
+    new_status = update_data.pop("status", None)
     
     for field, value in update_data.items():
         setattr(db_repair, field, value)
     
-    if "status" in update_data and update_data["status"] != old_status:
-        log = RepairLog(
-            repair_id=db_repair.id, 
-            user_id=current_user.id, 
-            status_from=old_status, 
-            status_to=update_data["status"],
-            notes=repair_in.notes
-        )
-        db.add(log)
+    if new_status and RepairStatus.normalize(new_status) != db_repair.status:
+        try:
+            RepairWorkflowService.transition(db, db_repair, new_status, current_user.id, repair_in.notes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     
     db.commit()
     db.refresh(db_repair)
@@ -202,7 +216,7 @@ def read_repairs(
 ):
     query = db.query(Repair)
     if status:
-        query = query.filter(Repair.status == status)
+        query = query.filter(Repair.status == RepairStatus.normalize(status))
     
     if search:
         search_filter = f"%{search}%"
@@ -226,7 +240,7 @@ def read_repairs(
         
         query = query.filter(
             or_(
-                Repair.status != "DELIVERED",
+                Repair.status != RepairStatus.DELIVERED.value,
                 Repair.paid_amount_usd < (
                     sa_func.coalesce(Repair.labor_cost_usd, 0) + 
                     sa_func.coalesce(parts_cost_subquery, 0)
@@ -250,33 +264,19 @@ def read_repairs(
     )
 
 def enrich_repair_objects(db: Session, repairs):
+    # Reincidencia de toda la lista en una sola consulta
     if not isinstance(repairs, list):
-        is_list = False
-        repairs_list = [repairs]
-    else:
-        is_list = True
-        repairs_list = repairs
-    
-    for r in repairs_list:
-        # Recurrence logic: Find any other repair for same customer AND (same device_imei OR same device_model)
-        query = db.query(Repair).filter(
-            Repair.customer_id == r.customer_id,
-            Repair.id != r.id
-        )
-        if r.device_imei:
-            query = query.filter(Repair.device_imei == r.device_imei)
-        else:
-            query = query.filter(Repair.device_model == r.device_model)
-        
-        previous = query.order_by(Repair.created_at.desc()).first()
-        if previous:
-            r.is_recurring = True
-            r.previous_repair_id = previous.id
-        else:
-            r.is_recurring = False
-            r.previous_repair_id = None
-            
-    return repairs_list if is_list else repairs_list[0]
+        return RepairWorkflowService.annotate_recurrence(db, [repairs])[0]
+    return RepairWorkflowService.annotate_recurrence(db, repairs)
+
+@router.get("/queues")
+def get_repair_queues(
+    technician_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Reparaciones por estado (todas o de un técnico), leídas de los contadores."""
+    return RepairWorkflowService.get_queues(db, technician_id)
 
 @router.get("/{repair_id}", response_model=RepairRead)
 def read_repair(
@@ -300,35 +300,43 @@ def update_repair_status(
     if not db_repair:
         raise HTTPException(status_code=404, detail="Repair not found")
     
-    old_status = db_repair.status
     new_status = status_in.get("status")
     
     if not new_status:
         raise HTTPException(status_code=400, detail="Status is required")
-        
-    db_repair.status = new_status.upper()
-    
-    # Logic for delivery and warranty
-    from datetime import datetime, timedelta
-    if db_repair.status == "DELIVERED" and old_status != "DELIVERED":
-        db_repair.delivered_at = datetime.now()
-        # Default warranty 30 days if not set
-        if not db_repair.warranty_expiration:
-            db_repair.warranty_expiration = db_repair.delivered_at + timedelta(days=30)
     
-    log = RepairLog(
-        repair_id=db_repair.id, 
-        user_id=current_user.id, 
-        status_from=old_status, 
-        status_to=db_repair.status,
-        notes=status_in.get("notes", "Estado actualizado desde la interfaz")
-    )
-    db.add(log)
+    # Validación de la transición, entrega/garantía y bitácora
+    try:
+        RepairWorkflowService.transition(db, db_repair, new_status, current_user.id, status_in.get("notes"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     db.commit()
     db.refresh(db_repair)
     return enrich_repair_objects(db, db_repair)
 
+@router.post("/bulk-status", response_model=RepairBulkStatusResult)
+def bulk_update_repair_status(
+    status_in: RepairBulkStatusUpdate,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """
+    Cambia el estado de varias reparaciones a la vez (p.ej. IN_PROGRESS -> READY).
+    Las transiciones no permitidas se devuelven en `rejected` sin afectar al resto.
+    """
+    try:
+        return RepairWorkflowService.bulk_transition(
+            db,
+            status_in.repair_ids,
+            status_in.status,
+            current_user.id,
+            notes=status_in.notes,
+            notify=status_in.notify
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # --- Repair Items (Parts) Endpoints ---
 
 @router.post("/{repair_id}/items", response_model=RepairItemRead)
@@ -356,13 +364,18 @@ def add_repair_item(
     
     # Deduct from inventory
     inventory.quantity -= item_in.quantity
+    StockService.record(
+        db, product.id, -item_in.quantity, inventory.quantity, "repair",
+        reference_type="repair", reference_id=repair_id, user_id=current_user.id
+    )
     
     # Create repair item
     db_item = RepairItem(
         repair_id=repair_id,
         product_id=product.id,
         quantity=item_in.quantity,
-        unit_cost_usd=product.price_usd
+        unit_cost_usd=product.price_usd,
+        unit_cogs_usd=CostingService.consume(db, product.id, item_in.quantity)
     )
     db.add(db_item)
     db.commit()
@@ -395,9 +408,19 @@ def remove_repair_item(
         raise HTTPException(status_code=404, detail="Item no encontrado")
     
     # Return to inventory
+    CostingService.add_layer(
+        db, item.product_id, item.quantity,
+        item.unit_cogs_usd if item.unit_cogs_usd is not None else CostingService.current_cost(db, item.product_id),
+        "return", repair_id
+    )
     inventory = db.query(Inventory).filter(Inventory.product_id == item.product_id).first()
     if inventory:
         inventory.quantity += item.quantity
+        StockService.record(
+            db, item.product_id, item.quantity, inventory.quantity, "return",
+            reference_type="repair", reference_id=repair_id, user_id=current_user.id,
+            unit_cost=item.unit_cogs_usd, note="Repuesto devuelto al inventario"
+        )
     
     db.delete(item)
     db.commit()
@@ -450,8 +473,7 @@ def record_repair_payment(
     repair.paid_amount_usd = current_paid + amount
     
     # Get current exchange rate
-    rate_obj = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
-    current_rate = rate_obj.rate if rate_obj else Decimal('1.0')
+    current_rate = CurrencyService.current_rate(db) or Decimal('1.0')
 
     # Check if an open CashSession exists and record income
     open_session = db.query(CashSession).filter(
@@ -484,6 +506,17 @@ def record_repair_payment(
             description=f"Pago reparación #{repair.id}"
         )
         db.add(transaction)
+        queue_cash_session_update(db, open_session, delta_usd=amount, reason=f"repair_payment:{repair.id}")
+    
+    queue_event(
+        db,
+        "repair.payment_recorded",
+        repair_id=repair.id,
+        session_id=open_session.id if open_session else None,
+        amount_usd=amount,
+        paid_amount_usd=repair.paid_amount_usd,
+        payment_method=payment_in.payment_method
+    )
     
     # Log the payment
     log = RepairLog(
@@ -646,19 +679,38 @@ def send_repair_whatsapp(
     if not customer or not customer.phone:
         raise HTTPException(status_code=400, detail="El cliente no tiene un número de teléfono registrado.")
     
-    success = WhatsAppService.send_repair_status_notification(
+    config = WhatsAppService.load_config(db)
+    if not config:
+        raise HTTPException(status_code=400, detail="WhatsApp no está configurado. Verifique la configuración en Ajustes.")
+    
+    # Se encola; el worker del outbox hace el envío y los reintentos
+    message = OutboxService.enqueue(
         db,
         customer.phone,
-        customer.name,
-        repair.device_model,
-        repair.status,
-        repair.id
+        WhatsAppService.repair_status_message(
+            config["company_name"], customer.name, repair.device_model, repair.status, repair.id
+        ),
+        reference_type="repair",
+        reference_id=repair.id,
+        user_id=current_user.id
     )
+    db.commit()
     
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al enviar mensaje de WhatsApp. Verifique la configuración en Ajustes.")
+    return {"message": "WhatsApp en cola de envío", "message_id": message.id, "status": message.status}
+
+
+@router.post("/notify-ready-whatsapp")
+def notify_ready_repairs_whatsapp(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Encola un WhatsApp para cada reparación lista para retirar (READY) cuyo cliente tiene teléfono."""
+    if not WhatsAppService.load_config(db):
+        raise HTTPException(status_code=400, detail="WhatsApp no está configurado. Verifique la configuración en Ajustes.")
     
-    return {"message": "WhatsApp enviado correctamente"}
+    result = OutboxService.notify_ready_repairs(db, user_id=current_user.id)
+    db.commit()
+    return result
 
 
 
@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, extract
+from sqlalchemy import func, desc
 from ...core.database import get_db
 from ..deps import get_current_active_user
-from ...models.sale import Sale, SaleItem
+from ...models.sale import SaleItem
 from ...models.inventory import Product, Category
-from ...models.repair import Repair
 from ...models.finance import Payment
 from datetime import date, timedelta, datetime, timezone
 import calendar
 from fastapi.responses import StreamingResponse
 from ...services.report_service import ReportService
+from ...services.repair_workflow_service import RepairWorkflowService
+from ...services.technician_analytics_service import TechnicianAnalyticsService
+from ...utils.enums import ACTIVE_REPAIR_STATUSES, RepairStatus
 from ...models.inventory import Product, Inventory
 from ...utils.pdf_generator import PDFGenerator
 from reportlab.platypus import Paragraph, Spacer, Table
@@ -23,19 +26,15 @@ def get_reports_summary(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
-    """Obtiene KPIs generales para la página de reportes."""
+    """Obtiene KPIs generales para la página de reportes (desde el cubo kpi_monthly)."""
+    from ...services.kpi_service import KpiService, month_start
     
-    # Rango: Este mes vs Mes anterior
-    today = date.today()
-    first_day_this_month = date(today.year, today.month, 1)
-    
-    if today.month == 1:
-        first_day_last_month = date(today.year - 1, 12, 1)
-        last_day_last_month = date(today.year - 1, 12, 31)
-    else:
-        first_day_last_month = date(today.year, today.month - 1, 1)
-        # Último día del mes anterior
-        last_day_last_month = first_day_this_month - timedelta(days=1)
+    # Rango: Este mes vs Mes anterior (meses completos del cubo)
+    this_month = month_start(date.today())
+    last_month = month_start(this_month - timedelta(days=1))
+    months = {row.month: row for row in KpiService.get_months(db, last_month, this_month)}
+    current = months.get(this_month)
+    previous = months.get(last_month)
     
     # Función auxiliar para calcular tendencia
     def calculate_trend(current, previous):
@@ -45,37 +44,13 @@ def get_reports_summary(
         sign = "+" if percent >= 0 else ""
         return f"{sign}{percent:.1f}%"
 
-    # 1. Ventas Totales
-    sales_this_month = db.query(func.sum(Sale.total_usd)).filter(
-        Sale.created_at >= first_day_this_month
-    ).scalar() or 0
-    
-    sales_last_month = db.query(func.sum(Sale.total_usd)).filter(
-        Sale.created_at >= first_day_last_month,
-        Sale.created_at <= last_day_last_month
-    ).scalar() or 0
-    
-    # 2. Órdenes (Ventas + Reparaciones) count
-    orders_this_month = db.query(func.count(Sale.id)).filter(
-        Sale.created_at >= first_day_this_month
-    ).scalar() or 0
-    
-    orders_last_month = db.query(func.count(Sale.id)).filter(
-        Sale.created_at >= first_day_last_month,
-        Sale.created_at <= last_day_last_month
-    ).scalar() or 0
-    
-    # 3. Servicios (Reparaciones completadas)
-    services_this_month = db.query(func.count(Repair.id)).filter(
-        Repair.created_at >= first_day_this_month,
-        Repair.status != "cancelled"
-    ).scalar() or 0
-    
-    services_last_month = db.query(func.count(Repair.id)).filter(
-        Repair.created_at >= first_day_last_month,
-        Repair.created_at <= last_day_last_month,
-        Repair.status != "cancelled"
-    ).scalar() or 0
+    # 1. Ventas Totales, 2. Órdenes, 3. Servicios (reparaciones no canceladas)
+    sales_this_month = current.sales_revenue_usd if current else 0
+    sales_last_month = previous.sales_revenue_usd if previous else 0
+    orders_this_month = current.orders_count if current else 0
+    orders_last_month = previous.orders_count if previous else 0
+    services_this_month = current.services_count if current else 0
+    services_last_month = previous.services_count if previous else 0
     
     # 4. Ticket Promedio
     avg_ticket = sales_this_month / orders_this_month if orders_this_month > 0 else 0
@@ -111,36 +86,30 @@ def get_reports_summary(
 @router.get("/monthly-sales")
 def get_monthly_sales(
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_active_user)
+    current_user = Depends(get_current_active_user),
+    currency: str = "USD"
 ):
     """Ventas mensuales para el año actual."""
-    current_year = date.today().year
-    
-    # Inicializar con ceros
-    months_data = {i: 0 for i in range(1, 13)}
+    from ...services.kpi_service import KpiService
     
-    # Consulta agrupada por mes
-    results = db.query(
-        extract('month', Sale.created_at).label('month'),
-        func.sum(Sale.total_usd).label('total')
-    ).filter(
-        extract('year', Sale.created_at) == current_year
-    ).group_by('month').all()
-    
-    for r in results:
-        months_data[int(r.month)] = float(r.total)
+    current_year = date.today().year
+    rows = {
+        row.month.month: row
+        for row in KpiService.get_months(db, date(current_year, 1, 1), date(current_year, 12, 1))
+    }
     
-    # Formatear para rechart
-    chart_data = []
+    # Formatear para rechart (meses sin ventas en 0)
     month_names = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
     
-    for i in range(1, 13):
-        chart_data.append({
-            "name": month_names[i-1],
-            "sales": months_data[i]
-        })
-        
-    return chart_data
+    def amount(row):
+        if not row:
+            return 0.0
+        return float(row.sales_revenue_ves if currency == "VES" else row.sales_revenue_usd)
+    
+    return [
+        {"name": name, "sales": amount(rows.get(index + 1))}
+        for index, name in enumerate(month_names)
+    ]
 
 @router.get("/category-distribution")
 def get_category_distribution(
@@ -148,35 +117,36 @@ def get_category_distribution(
     current_user = Depends(get_current_active_user)
 ):
     """Ventas por categoría, incluyendo servicios."""
+    from ...models.kpi import KpiMonthly
     
-    # 1. Ventas de productos físicos por categoría
+    # 1. Unidades vendidas por categoría (suma de los meses del cubo)
     product_sales = db.query(
-        Category.name,
-        func.sum(SaleItem.quantity).label('count'),
-        func.count(SaleItem.id).label('transactions')
-    ).join(Product, Product.category_id == Category.id)\
-     .join(SaleItem, SaleItem.product_id == Product.id)\
-     .group_by(Category.name).all()
+        func.coalesce(Category.name, "Sin categoría"),
+        func.sum(KpiMonthly.units_sold).label('count')
+    ).outerjoin(Category, Category.id == KpiMonthly.dimension_id)\
+     .filter(KpiMonthly.dimension == "category")\
+     .group_by(Category.name)\
+     .having(func.sum(KpiMonthly.units_sold) > 0).all()
      
     data = []
     colors = ['#6366f1', '#ec4899', '#f59e0b', '#10b981', '#8b5cf6', '#3b82f6']
     
-    for idx, (cat_name, count, trans) in enumerate(product_sales):
+    for idx, (cat_name, count) in enumerate(product_sales):
         data.append({
             "name": cat_name,
             "value": int(count) if count else 0,
             "color": colors[idx % len(colors)]
         })
     
-    # 2. Servicios (Reparaciones)
-    services_count = db.query(func.count(Repair.id)).filter(
-        Repair.status == 'COMPLETED'  # O delivered
+    # 2. Servicios (reparaciones no canceladas)
+    services_count = db.query(func.sum(KpiMonthly.services_count)).filter(
+        KpiMonthly.dimension == "total"
     ).scalar() or 0
     
     if services_count > 0:
         data.append({
             "name": "Servicios Técnicos",
-            "value": services_count,
+            "value": int(services_count),
             "color": colors[len(data) % len(colors)]
         })
         
@@ -208,33 +178,21 @@ def get_top_products(
 
 @router.get("/technician-performance")
 def get_technician_performance(
+    days: int = Query(90, ge=1, le=3650),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
-    """Estadísticas de rendimiento técnico."""
+    """Estadísticas de rendimiento técnico (tarjetas del reporte)."""
     
-    # Total completado
-    completed = db.query(func.count(Repair.id)).filter(Repair.status == "COMPLETED").scalar() or 0
+    # Contadores por estado (repair_status_counts): lectura directa
+    counts = RepairWorkflowService.get_counts(db)
+    total_active = sum(counts[status] for status in ACTIVE_REPAIR_STATUSES if status != RepairStatus.READY.value)
     
-    # Tiempo promedio (Simulado por ahora ya que requeriría log complexo, o basado en created vs updated)
-    # Aquí podríamos hacer created_at vs updated_at para los status completed
-    
-    # Garantías (reparaciones que volvieron) - Esto es difícil sin marcar garantías explícitamente
-    # Asumimos que repair_type='warranty' si se implementó así, o buscamos por "Garantía" en notas
-    
-    # Simplemente retornamos datos reales básicos
-    
-    total_active = db.query(func.count(Repair.id)).filter(
-        Repair.status.in_(['RECEIVED', 'IN_PROGRESS', 'ON_HOLD'])
-    ).scalar() or 0
+    # Resumen por técnico desde technician_repair_stats (lo refresca el job technician_stats)
+    today = date.today()
+    technicians = TechnicianAnalyticsService.get_performance(db, today - timedelta(days=days - 1), today)
     
-    return [
-        {
-            "label": "Reparaciones Completadas",
-            "value": str(completed),
-            "count": "Total Histórico",
-            "color": "text-emerald-400"
-        },
+    cards = [
         {
             "label": "En Proceso Activo",
             "value": str(total_active),
@@ -242,6 +200,36 @@ def get_technician_performance(
             "color": "text-blue-400"
         }
     ]
+    for tech in technicians:
+        to_ready = tech["turnaround_hours"]["to_ready"]
+        detail = [f"{days} días"]
+        if to_ready["mean"] is not None:
+            detail.append(f"prom. {to_ready['mean']:.0f}h · p90 {to_ready['p90']:.0f}h")
+        if tech["rework_rate"] is not None:
+            detail.append(f"retrabajo {tech['rework_rate']:.0%}")
+        cards.append({
+            "label": tech["technician_name"],
+            "value": str(tech["completed"]),
+            "count": " · ".join(detail),
+            "color": "text-emerald-400"
+        })
+    return cards
+
+@router.get("/technician-performance/details")
+def get_technician_performance_details(
+    start_date: date,
+    end_date: date,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Throughput, tiempos (media / p50 / p90), retrabajo y repuestos por técnico."""
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="La fecha inicial debe ser anterior a la final")
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "technicians": TechnicianAnalyticsService.get_performance(db, start_date, end_date),
+    }
 
 @router.get("/monthly-financial-pdf")
 def generate_monthly_financial_report(
@@ -292,12 +280,13 @@ def get_profit_loss_report(
     start_date: date,
     end_date: date,
     format: str = "json",
+    currency: str = "USD",
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
     """Reporte de pérdidas y ganancias."""
     if format == "json":
-        return ReportService.get_profit_loss(db, start_date, end_date)
+        return ReportService.get_profit_loss(db, start_date, end_date, currency)
     
     financials = ReportService.get_profit_loss(db, start_date, end_date)
     pdf = PDFGenerator(filename_prefix=f"resultado_{start_date}_{end_date}")
@@ -327,6 +316,34 @@ def get_profit_loss_report(
         headers={"Content-Disposition": f"attachment; filename={pdf.filename}"}
     )
 
+@router.get("/profit-loss/periods")
+def get_profit_loss_periods(
+    start_date: date,
+    end_date: date,
+    currency: str = "USD",
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """P&L comparativo mes a mes del rango, con totales."""
+    from ...services.profit_loss_service import ProfitLossService
+    return ProfitLossService.get_comparative(db, start_date, end_date, currency)
+
+@router.get("/profit-loss/ytd")
+def get_profit_loss_ytd(
+    currency: str = "USD",
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """P&L del año en curso frente al mismo tramo del año anterior."""
+    from ...services.profit_loss_service import ProfitLossService
+    today = date.today()
+    # 29 de febrero → 28 en el año anterior
+    previous_end = today.replace(year=today.year - 1, day=min(today.day, calendar.monthrange(today.year - 1, today.month)[1]))
+    return {
+        "current": ProfitLossService.get_profit_loss(db, date(today.year, 1, 1), today, currency),
+        "previous": ProfitLossService.get_profit_loss(db, date(today.year - 1, 1, 1), previous_end, currency)
+    }
+
 @router.get("/aging")
 def get_aging_report(
     format: str = "json",
@@ -364,30 +381,35 @@ def get_aging_report(
 def get_product_kardex_report(
     product_id: int,
     format: str = "json",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
     """Reporte de movimientos de inventario (Kardex) para un producto."""
+    kardex = ReportService.get_product_kardex(db, product_id, start_date, end_date, limit=limit, offset=offset)
     if format == "json":
-        return ReportService.get_product_kardex(db, product_id)
+        return kardex
     
-    kardex = ReportService.get_product_kardex(db, product_id)
     product = db.query(Product).filter(Product.id == product_id).first()
     
     pdf = PDFGenerator(filename_prefix=f"kardex_{product_id}")
     elements = pdf.create_standard_header(db, f"KARDEX DE PRODUCTO: {product.name if product else product_id}")
     
-    data = [["Fecha", "Tipo", "Referencia", "Cambio", "Usuario"]]
+    data = [["Fecha", "Tipo", "Referencia", "Cambio", "Saldo", "Usuario"]]
     for entry in kardex:
         data.append([
             entry['date'].strftime('%Y-%m-%d %H:%M'),
             entry['type'],
             entry['reference'],
             str(entry['change']),
+            str(entry['balance']),
             entry['user']
         ])
     
-    t = Table(data, colWidths=[1.5*inch, 1*inch, 2*inch, 0.8*inch, 1.2*inch])
+    t = Table(data, colWidths=[1.4*inch, 1*inch, 1.8*inch, 0.7*inch, 0.7*inch, 1.1*inch])
     t.setStyle(pdf.get_table_style())
     elements.append(t)
     
@@ -398,6 +420,39 @@ def get_product_kardex_report(
         headers={"Content-Disposition": f"attachment; filename={pdf.filename}"}
     )
 
+@router.get("/kardex/{product_id}/stock-at")
+def get_product_stock_at(
+    product_id: int,
+    at: datetime,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Stock de un producto a una fecha/hora (último movimiento anterior)."""
+    from ...services.stock_service import StockService
+    return {"product_id": product_id, "at": at, "quantity": StockService.stock_at(db, product_id, at)}
+
+@router.get("/inventory/valuation")
+def get_inventory_valuation(
+    as_of: Optional[date] = None,
+    include_items: bool = False,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Valoración del inventario al cierre de una fecha (snapshot + movimientos posteriores)."""
+    from ...services.inventory_snapshot_service import InventorySnapshotService
+    return InventorySnapshotService.get_valuation(db, as_of or date.today(), include_items)
+
+@router.post("/inventory/snapshots")
+def create_inventory_snapshot(
+    snapshot_date: Optional[date] = None,
+    full: Optional[bool] = None,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_active_user)
+):
+    """Genera (o regenera) el snapshot de inventario de un día; por defecto, ayer."""
+    from ...services.inventory_snapshot_service import InventorySnapshotService
+    return InventorySnapshotService.take_snapshot(db, snapshot_date, full)
+
 @router.get("/inventory/replenishment-report")
 def get_inventory_replenishment_report(
     format: str = "json",
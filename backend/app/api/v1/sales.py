@@ -18,7 +18,16 @@ from ...models.finance import AccountReceivable
 from ...models.customer import Customer
 from ...models.sale_repair import SaleRepair
 from ...core.utils import calculate_warranty_expiration
+from ...utils.enums import RepairStatus
 from ...services.whatsapp_service import WhatsAppService
+from ...services.outbox_service import OutboxService
+from ...services.ar_aging_service import ARAgingService
+from ...services.customer_ledger_service import CustomerLedgerService
+from ...services.costing_service import CostingService
+from ...services.stock_service import StockService
+from ...services.currency_service import CurrencyService
+from ...services.forecast_service import ForecastService
+from ...core.events import queue_event, queue_cash_session_update
 
 router = APIRouter(tags=["sales"])
 
@@ -41,50 +50,52 @@ def create_sale(
     total_usd = Decimal(0)
     repair_total_usd = Decimal(0)
     db_items = []
+    stock_moves = []  # (product_id, cambio, saldo) para stock_movements
     processed_repairs = []
     
     # 3. Procesar items de productos con bloqueo de stock
     with payment_transaction_wrapper(db):
         for item_in in sale_in.items:
-                product = db.query(Product).filter(Product.id == item_in.product_id).with_for_update().first()
-                if not product:
-                    raise HTTPException(status_code=404, detail=f"Producto {item_in.product_id} no encontrado")
-                
-                inventory = db.query(Inventory).filter(Inventory.product_id == product.id).first()
-                if not inventory or inventory.quantity < item_in.quantity:
-                    raise HTTPException(status_code=400, detail=f"Stock insuficiente para {product.name}")
-                
-                item_total_usd = product.price_usd * item_in.quantity
-                total_usd += item_total_usd
+            product = db.query(Product).filter(Product.id == item_in.product_id).with_for_update().first()
+            if not product:
+                raise HTTPException(status_code=404, detail=f"Producto {item_in.product_id} no encontrado")
+            
+            inventory = db.query(Inventory).filter(Inventory.product_id == product.id).first()
+            if not inventory or inventory.quantity < item_in.quantity:
+                raise HTTPException(status_code=400, detail=f"Stock insuficiente para {product.name}")
+            
+            item_total_usd = product.price_usd * item_in.quantity
+            total_usd += item_total_usd
+            
+            db_items.append(SaleItem(
+                product_id=product.id,
+                quantity=item_in.quantity,
+                unit_price_usd=product.price_usd,
+                unit_cost_usd=CostingService.consume(db, product.id, item_in.quantity),
+                subtotal_usd=item_total_usd
+            ))
+            
+            inventory.quantity -= item_in.quantity
+            stock_moves.append((product.id, -item_in.quantity, inventory.quantity))
+
+        # 4. Procesar órdenes de reparación (servicios)
+        if sale_in.repair_ids:
+            for repair_id in sale_in.repair_ids:
+                repair = db.query(Repair).filter(Repair.id == repair_id).with_for_update().first()
+                if not repair:
+                    raise HTTPException(status_code=404, detail=f"Reparación #{repair_id} no encontrada")
                 
-                db_items.append(SaleItem(
-                    product_id=product.id,
-                    quantity=item_in.quantity,
-                    unit_price_usd=product.price_usd,
-                    unit_cost_usd=product.cost_usd,
-                    subtotal_usd=item_total_usd
-                ))
+                # Calcular saldo pendiente usando la propiedad unificada
+                total_cost = Decimal(str(repair.total_cost_usd or 0))
+                paid_amount = Decimal(str(repair.paid_amount_usd or 0))
+                remaining = total_cost - paid_amount
                 
-                inventory.quantity -= item_in.quantity
-
-            # 4. Procesar órdenes de reparación (servicios)
-            if sale_in.repair_ids:
-                for repair_id in sale_in.repair_ids:
-                    repair = db.query(Repair).filter(Repair.id == repair_id).with_for_update().first()
-                    if not repair:
-                        raise HTTPException(status_code=404, detail=f"Reparación #{repair_id} no encontrada")
-                    
-                    # Calcular saldo pendiente usando la propiedad unificada
-                    total_cost = Decimal(str(repair.total_cost_usd or 0))
-                    paid_amount = Decimal(str(repair.paid_amount_usd or 0))
-                    remaining = total_cost - paid_amount
-                    
-                    if remaining > 0:
-                        repair_total_usd += remaining
-                        processed_repairs.append(repair)
+                if remaining > 0:
+                    repair_total_usd += remaining
+                    processed_repairs.append(repair)
 
-            # Add repair totals to grand total
-            total_usd += repair_total_usd
+        # Add repair totals to grand total
+        total_usd += repair_total_usd
 
         total_ves = total_usd * rate.rate
 
@@ -103,6 +114,10 @@ def create_sale(
         if pending_debt_usd > 0 and not sale_in.customer_id:
             raise HTTPException(status_code=400, detail="Pagos parciales requieren un cliente registrado.")
 
+        # Validar límite de crédito (lectura por PK, bloquea la fila del cliente)
+        if pending_debt_usd > Decimal('0.01'):
+            CustomerLedgerService.check_credit(db, sale_in.customer_id, pending_debt_usd)
+
         # 7. Crear venta
         db_sale = Sale(
             customer_id=sale_in.customer_id,
@@ -120,6 +135,12 @@ def create_sale(
         db.add(db_sale)
         db.flush()
 
+        for product_id, change, balance in stock_moves:
+            StockService.record(
+                db, product_id, change, balance, "sale",
+                reference_type="sale", reference_id=db_sale.id, user_id=current_user.id
+            )
+
         # 8. Crear Payment y Cash Transaction para el monto pagado
         if amount_paid_usd > 0:
             amount_paid_ves = amount_paid_usd * rate.rate
@@ -149,15 +170,15 @@ def create_sale(
 
             if sale_in.payment_currency == "VES":
                 session.expected_amount_ves += amount_paid_ves
+                queue_cash_session_update(db, session, delta_ves=amount_paid_ves, reason=f"sale:{db_sale.id}")
             else:
                 session.expected_amount += amount_paid_usd
+                queue_cash_session_update(db, session, delta_usd=amount_paid_usd, reason=f"sale:{db_sale.id}")
 
         # 9. Crear Account Receivable para deuda pendiente
         if pending_debt_usd > Decimal('0.01'):
             customer = db.query(Customer).filter(Customer.id == sale_in.customer_id).first()
             if customer:
-                customer.current_debt = (customer.current_debt or 0) + pending_debt_usd
-                
                 db_ar = AccountReceivable(
                     customer_id=customer.id,
                     sale_id=db_sale.id,
@@ -169,6 +190,23 @@ def create_sale(
                     created_by=current_user.id
                 )
                 db.add(db_ar)
+                db.flush()
+                ARAgingService.record_charge(db, db_ar)
+                CustomerLedgerService.record_charge(db, db_ar)
+
+        queue_event(
+            db,
+            "sale.created",
+            sale_id=db_sale.id,
+            session_id=session.id,
+            user_id=current_user.id,
+            customer_id=db_sale.customer_id,
+            total_usd=total_usd,
+            amount_paid_usd=amount_paid_usd,
+            pending_debt_usd=pending_debt_usd,
+            payment_method=sale_in.payment_method,
+            currency=sale_in.payment_currency
+        )
 
         # 10. Actualizar reparaciones: marcar como entregadas y registrar pago
         for repair in processed_repairs:
@@ -191,18 +229,18 @@ def create_sale(
             # Apply payment
             repair.paid_amount_usd = paid_before + paid_now
             
-            # Create Link in Pivot Table
-            if paid_now > 0:
-                sale_repair_link = SaleRepair(
-                    sale_id=db_sale.id,
-                    repair_id=repair.id,
-                    amount_allocated_usd=paid_now
-                )
-                db.add(sale_repair_link)
+            # Create Link in Pivot Table: the part of the sale total that bills this repair
+            # (the statement subtracts it from the repair charge)
+            sale_repair_link = SaleRepair(
+                sale_id=db_sale.id,
+                repair_id=repair.id,
+                amount_allocated_usd=remaining
+            )
+            db.add(sale_repair_link)
 
             # Trigger Delivery and Warranty IF Fully Paid via this transaction
             if repair.paid_amount_usd >= total_cost and total_cost > 0:
-                repair.status = "delivered"
+                repair.status = RepairStatus.DELIVERED.value
                 repair.delivered_at = datetime.now(timezone.utc)
                 repair.warranty_expiration = calculate_warranty_expiration(datetime.now(timezone.utc), 7)
                 
@@ -210,15 +248,16 @@ def create_sale(
                     repair_id=repair.id,
                     user_id=current_user.id,
                     status_from=old_status,
-                    status_to="delivered",
+                    status_to=RepairStatus.DELIVERED.value,
                     notes=f"Entregado via Venta POS #{db_sale.id} (Garantía hasta {repair.warranty_expiration.strftime('%Y-%m-%d')})"
                 )
                 db.add(log)
 
-            # El commit se realiza automáticamente en payment_transaction_wrapper
-            db.refresh(db_sale)
-            return db_sale
+        # El commit se realiza automáticamente en payment_transaction_wrapper
         # El rollback se maneja automáticamente en caso de excepción
+    ForecastService.invalidate()
+    db.refresh(db_sale)
+    return db_sale
 
 
 @router.get("/history")
@@ -438,7 +477,7 @@ def return_sale(
         raise HTTPException(status_code=400, detail="Debes abrir una sesión de caja para procesar devoluciones.")
     
     # Get exchange rate
-    rate = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
+    rate = CurrencyService.current_rate(db)
     if not rate:
         raise HTTPException(status_code=400, detail="No hay tasa de cambio activa.")
     
@@ -469,12 +508,20 @@ def return_sale(
                     unit_price_usd=sale_item.unit_price_usd
                 ))
                 
-                # Restore inventory
+                # Restore inventory (vuelve como capa al costo con que se vendió)
+                CostingService.add_layer(
+                    db, item_in.product_id, item_in.quantity, sale_item.unit_cost_usd, "return", sale_id
+                )
                 inventory = db.query(Inventory).filter(Inventory.product_id == item_in.product_id).first()
                 if inventory:
                     inventory.quantity += item_in.quantity
+                    StockService.record(
+                        db, item_in.product_id, item_in.quantity, inventory.quantity, "return",
+                        reference_type="sale", reference_id=sale_id, user_id=current_user.id,
+                        unit_cost=sale_item.unit_cost_usd, note=return_in.reason
+                    )
         
-        total_return_ves = total_return_usd * rate.rate
+        total_return_ves = total_return_usd * rate
         
         # Create return record
         db_return = SaleReturn(
@@ -482,7 +529,7 @@ def return_sale(
             user_id=current_user.id,
             total_amount_usd=total_return_usd,
             total_amount_ves=total_return_ves,
-            exchange_rate=rate.rate,
+            exchange_rate=rate,
             reason=return_in.reason,
             items=return_items
         )
@@ -495,7 +542,7 @@ def return_sale(
             transaction_type="refund",
             amount_usd=-total_return_usd,
             amount_ves=-total_return_ves,
-            exchange_rate=rate.rate,
+            exchange_rate=rate,
             currency="USD",
             description=f"Devolución Venta #{sale_id}",
             reference_id=db_return.id
@@ -506,6 +553,7 @@ def return_sale(
         session.expected_amount -= total_return_usd
         
         db.commit()
+        ForecastService.invalidate()
         db.refresh(db_return)
         return db_return
         
@@ -534,15 +582,19 @@ def send_sale_whatsapp(
     if not customer or not customer.phone:
         raise HTTPException(status_code=400, detail="El cliente no tiene un número de teléfono registrado.")
     
-    success = WhatsAppService.send_ticket_notification(
-        db, 
-        customer.phone, 
-        customer.name, 
-        float(sale.total_usd), 
-        f"V-{sale.id}"
-    )
+    config = WhatsAppService.load_config(db)
+    if not config:
+        raise HTTPException(status_code=400, detail="WhatsApp no está configurado. Verifique la configuración en Ajustes.")
     
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al enviar mensaje de WhatsApp. Verifique la configuración en Ajustes.")
+    # Se encola; el worker del outbox hace el envío y los reintentos
+    message = OutboxService.enqueue(
+        db,
+        customer.phone,
+        WhatsAppService.ticket_message(config["company_name"], customer.name, float(sale.total_usd), f"V-{sale.id}"),
+        reference_type="sale",
+        reference_id=sale.id,
+        user_id=current_user.id
+    )
+    db.commit()
     
-    return {"message": "WhatsApp enviado correctamente"}
+    return {"message": "WhatsApp en cola de envío", "message_id": message.id, "status": message.status}
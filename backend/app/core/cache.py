@@ -68,5 +68,16 @@ class CacheService:
             logger.error("Error deleting from cache", key=key, error=str(e))
             return False
 
+    def incr(self, key: str) -> Optional[int]:
+        """Atomically increment a counter (shared version numbers between workers)."""
+        if not self.redis_client:
+            return None
+
+        try:
+            return self.redis_client.incr(key)
+        except Exception as e:
+            logger.error("Error incrementing cache key", key=key, error=str(e))
+            return None
+
 # Singleton instance
 cache = CacheService()
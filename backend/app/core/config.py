@@ -28,6 +28,11 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://redis:6379/0"
     
+    # Live events (SSE) - 'memory' (single worker) or 'redis' (pub/sub, multi-worker)
+    EVENT_BROKER: str = "memory"
+    EVENTS_CHANNEL: str = "serviceflow:events"
+    SSE_HEARTBEAT_SECONDS: int = 15
+    
     # Rate Limiting
     RATE_LIMIT_PER_MINUTE: int = 60
     LOGIN_RATE_LIMIT: str = "5/minute"
@@ -41,6 +46,31 @@ class Settings(BaseSettings):
     DEFAULT_MIN_STOCK: int = 5
     MAX_PAGINATION_SIZE: int = 100
     DEFAULT_PAGINATION_SIZE: int = 20
+    INVENTORY_COSTING_METHOD: str = "fifo"  # 'fifo' o 'average' (promedio ponderado)
+    FORECAST_HISTORY_DAYS: int = 90  # Días de demanda usados para el pronóstico de reabastecimiento
+    FORECAST_DEFAULT_LEAD_TIME_DAYS: int = 7  # Sin historial de recepciones del producto
+    
+    # Exchange rate ingestion
+    EXCHANGE_RATE_SOURCES: str = "bcv,file,manual"  # Orden de preferencia; se usa la primera que responde
+    BCV_URL: str = "https://www.bcv.org.ve/"
+    BCV_VERIFY_SSL: bool = True  # Desactivar solo si la cadena de certificados del BCV está incompleta
+    EXCHANGE_RATE_FILE: Optional[str] = None  # Número o JSON {"rate", "date"}
+    MANUAL_EXCHANGE_RATE: Optional[Decimal] = None
+    EXCHANGE_RATE_FETCH_ATTEMPTS: int = 3
+    EXCHANGE_RATE_BACKOFF_SECONDS: float = 2.0
+    
+    # Scheduled jobs
+    JOB_RUNS_RETENTION_DAYS: int = 30
+    
+    # Outbound messages (outbox worker)
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_CONCURRENCY: int = 5
+    OUTBOX_RATE_PER_SECOND: float = 5.0  # Por proveedor
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_BACKOFF_SECONDS: float = 30.0  # Se duplica en cada intento
+    OUTBOX_LEASE_SECONDS: int = 120  # Tras este tiempo un mensaje en 'sending' se vuelve a reclamar
+    OUTBOX_POLL_SECONDS: float = 5.0
+    OUTBOX_SEND_TIMEOUT_SECONDS: float = 10.0
     
     # WhatsApp
     WHATSAPP_API_TOKEN: Optional[str] = None
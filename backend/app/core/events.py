@@ -0,0 +1,225 @@
+"""
+Live event broker for Serviceflow Pro.
+
+Domain events (new sales, payments, cash session deltas, repair status
+changes) are queued on the SQLAlchemy session with `queue_event()` and only
+published after the transaction commits, so subscribers never see data that
+was rolled back.
+
+Brokers:
+- InProcessBroker: asyncio queues, single worker (default).
+- RedisBroker: Redis pub/sub fan-out for multi-worker deployments
+  (EVENT_BROKER=redis).
+"""
+import asyncio
+import json
+import decimal
+import threading
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .config import settings
+from .logging import get_logger
+
+logger = get_logger("events")
+
+PENDING_EVENTS_KEY = "pending_events"
+
+
+def _json_default(value: Any):
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def serialize_event(evt: Dict[str, Any]) -> str:
+    return json.dumps(evt, default=_json_default)
+
+
+class Subscription:
+    """Handle returned by EventBroker.subscribe(); `get()` waits for the next event."""
+
+    def __init__(self, maxsize: int = 100):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def put_nowait(self, evt: Dict[str, Any]) -> None:
+        # Slow consumers drop the oldest event instead of blocking publishers
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(evt)
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+
+class EventBroker:
+    """Interface shared by the in-process and Redis brokers."""
+
+    def publish(self, evt: Dict[str, Any]) -> None:
+        """Thread-safe: can be called from sync endpoints running in the threadpool."""
+        raise NotImplementedError
+
+    def subscribe(self):
+        """Async context manager yielding a Subscription."""
+        raise NotImplementedError
+
+
+class InProcessBroker(EventBroker):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[Subscription, asyncio.AbstractEventLoop] = {}
+
+    def publish(self, evt: Dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for subscription, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(subscription.put_nowait, evt)
+            except RuntimeError:
+                # Event loop already closed
+                self._remove(subscription)
+
+    def _remove(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscribers.pop(subscription, None)
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[Subscription]:
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers[subscription] = asyncio.get_running_loop()
+        try:
+            yield subscription
+        finally:
+            self._remove(subscription)
+
+
+class RedisBroker(EventBroker):
+    def __init__(self, url: str, channel: str):
+        import redis
+        self.url = url
+        self.channel = channel
+        self._publisher = redis.from_url(url, socket_timeout=5)
+
+    def publish(self, evt: Dict[str, Any]) -> None:
+        try:
+            self._publisher.publish(self.channel, serialize_event(evt))
+        except Exception as e:
+            logger.error("Failed to publish event to Redis", error=str(e), event_type=evt.get("type"))
+
+    @asynccontextmanager
+    async def subscribe(self) -> AsyncIterator[Subscription]:
+        import redis.asyncio as aioredis
+
+        client = aioredis.from_url(self.url, decode_responses=True)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(self.channel)
+        subscription = Subscription()
+
+        async def reader():
+            async for message in pubsub.listen():
+                if message.get("type") == "message":
+                    subscription.put_nowait(json.loads(message["data"]))
+
+        task = asyncio.create_task(reader())
+        try:
+            yield subscription
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe(self.channel)
+            await pubsub.close()
+            await client.close()
+
+
+_broker: Optional[EventBroker] = None
+
+
+def get_broker() -> EventBroker:
+    global _broker
+    if _broker is None:
+        if settings.EVENT_BROKER == "redis":
+            _broker = RedisBroker(settings.REDIS_URL, settings.EVENTS_CHANNEL)
+        else:
+            _broker = InProcessBroker()
+        logger.info("Event broker initialized", broker=type(_broker).__name__)
+    return _broker
+
+
+def queue_event(db: Session, event_type: str, **payload: Any) -> None:
+    """Queue an event on the session; it is published after the next successful commit."""
+    if not db.in_transaction():
+        # Tie the event to a transaction so a rollback discards it
+        db.begin()
+    db.info.setdefault(PENDING_EVENTS_KEY, []).append({
+        "type": event_type,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "data": payload,
+    })
+
+
+def queue_cash_session_update(db: Session, cash_session, delta_usd=0, delta_ves=0, reason: str = None) -> None:
+    """Shortcut for the balance delta of a cash session (what the till dashboards watch)."""
+    queue_event(
+        db,
+        "cash_session.updated",
+        session_id=cash_session.id,
+        session_code=cash_session.session_code,
+        user_id=cash_session.user_id,
+        delta_usd=delta_usd,
+        delta_ves=delta_ves,
+        expected_amount=cash_session.expected_amount,
+        expected_amount_ves=cash_session.expected_amount_ves,
+        reason=reason,
+    )
+
+
+def _queue_repair_status_change(mapper, connection, target) -> None:
+    # Every status change writes a RepairLog; payment-only logs keep the same status
+    if target.status_from == target.status_to:
+        return
+    session = object_session(target)
+    if session is not None:
+        queue_event(
+            session,
+            "repair.status_changed",
+            repair_id=target.repair_id,
+            status_from=target.status_from,
+            status_to=target.status_to,
+            user_id=target.user_id,
+        )
+
+
+def _publish_pending(session: Session) -> None:
+    pending = session.info.pop(PENDING_EVENTS_KEY, None)
+    if not pending:
+        return
+    broker = get_broker()
+    for evt in pending:
+        broker.publish(evt)
+
+
+def _discard_pending(session: Session, previous_transaction) -> None:
+    # A rolled-back savepoint must not drop events queued by the outer transaction
+    if previous_transaction.nested:
+        return
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+def register_event_listeners() -> None:
+    """Publish queued events after commit and drop them on rollback."""
+    from ..models.repair import RepairLog
+
+    if not event.contains(Session, "after_commit", _publish_pending):
+        event.listen(Session, "after_commit", _publish_pending)
+        # after_soft_rollback also fires for savepoints and when no DB transaction was begun
+        event.listen(Session, "after_soft_rollback", _discard_pending)
+        event.listen(RepairLog, "after_insert", _queue_repair_status_change)
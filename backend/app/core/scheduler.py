@@ -0,0 +1,343 @@
+"""
+Periodic jobs for Serviceflow Pro.
+
+Every worker process runs the same scheduler loop, but each scheduled slot
+executes once per cluster:
+
+- Before running, a worker inserts the run into ``job_runs``. The unique
+  (job_name, scheduled_for) key lets exactly one worker claim the slot;
+  the others get an IntegrityError and skip it.
+- On PostgreSQL the winner also holds ``pg_try_advisory_lock`` for the
+  job while it runs, so a slow run is never overlapped by the next slot.
+- A failed run is retried by the worker that ran it, ``retry_after`` later
+  and doubling on each attempt (up to ``max_retries``), unless the next
+  cron slot comes first. Each retry is its own claimed slot.
+- Jobs with ``run_at_startup`` get a one-off slot (the startup minute)
+  when that check returns True, e.g. the rate job when today has no rate.
+
+Schedules use the 5-field cron syntax (minute hour day month weekday) in
+server local time. Sync jobs run in a worker thread; async jobs are awaited.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import socket
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import SessionLocal
+from .logging import get_logger
+from ..models.job import JobRun
+
+logger = get_logger("scheduler")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+MAX_SLEEP_SECONDS = 60
+
+
+class CronSchedule:
+    """Cron de 5 campos: minuto hora día-mes mes día-semana (0/7 = domingo)."""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Invalid cron expression: {expression!r}")
+        self.expression = expression
+        fields = [self._parse(part, low, high) for part, (low, high) in zip(parts, self.RANGES[:4])]
+        self.minutes, self.hours, self.days, self.months = fields
+        self.weekdays = {0 if day == 7 else day for day in self._parse(parts[4], 0, 7)}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for item in part.split(","):
+            value_range, _, step = item.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(v) for v in value_range.split("-"))
+            else:
+                start = end = int(value_range)
+                if step:
+                    end = high
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field out of range: {item!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        # Igual que cron: si se restringen ambos, basta con que coincida uno
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Primer minuto que cumple el cron estrictamente después de `moment`."""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months or not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable
+    schedule: CronSchedule
+    description: str = ""
+    retry_after: Optional[timedelta] = None
+    max_retries: int = 3
+    run_at_startup: Optional[Callable[[], bool]] = None
+    next_run: Optional[datetime] = field(default=None, compare=False)
+    retry_at: Optional[datetime] = field(default=None, compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+def _advisory_key(name: str) -> int:
+    return int.from_bytes(hashlib.sha1(name.encode()).digest()[:8], "big", signed=True)
+
+
+def _summary(result) -> Optional[str]:
+    if result is None:
+        return None
+    return json.dumps(result, default=str)[:4000]
+
+
+class Scheduler:
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self.jobs: Dict[str, Job] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def add_job(self, name: str, cron: str, func: Callable, description: str = "",
+                retry_after: Optional[timedelta] = None, max_retries: int = 3,
+                run_at_startup: Optional[Callable[[], bool]] = None) -> Job:
+        job = Job(name=name, func=func, schedule=CronSchedule(cron), description=description,
+                  retry_after=retry_after, max_retries=max_retries, run_at_startup=run_at_startup)
+        self.jobs[name] = job
+        return job
+
+    def job(self, name: str, cron: str, description: str = "", **options):
+        """Decorador equivalente a add_job."""
+        def decorator(func: Callable) -> Callable:
+            self.add_job(name, cron, func, description, **options)
+            return func
+        return decorator
+
+    # --- Ejecución ---
+
+    def _claim(self, job: Job, scheduled_for: datetime) -> Optional[int]:
+        """Inserta la corrida del turno; None si otro worker ya lo reclamó."""
+        db = self.session_factory()
+        try:
+            run = JobRun(
+                job_name=job.name,
+                scheduled_for=scheduled_for,
+                status="running",
+                worker=WORKER_ID,
+                started_at=datetime.now(timezone.utc)
+            )
+            try:
+                with db.begin_nested():
+                    db.add(run)
+                db.commit()
+            except IntegrityError:
+                # El savepoint ya se revirtió: otro worker tiene el turno
+                return None
+            return run.id
+        finally:
+            db.close()
+
+    def _lock(self, job: Job):
+        """Advisory lock de PostgreSQL por tarea; None si otra corrida sigue en curso."""
+        db = self.session_factory()
+        if db.get_bind().dialect.name != "postgresql":
+            return db
+        # La sesión queda abierta (misma conexión) hasta _unlock
+        acquired = db.execute(select(func.pg_try_advisory_lock(_advisory_key(job.name)))).scalar()
+        if not acquired:
+            db.close()
+            return None
+        return db
+
+    def _unlock(self, job: Job, db: Session) -> None:
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                db.execute(select(func.pg_advisory_unlock(_advisory_key(job.name))))
+        finally:
+            db.close()
+
+    def _finish(self, run_id: int, status: str, started: datetime, result=None, error: str = None) -> None:
+        db = self.session_factory()
+        try:
+            finished = datetime.now(timezone.utc)
+            run = db.get(JobRun, run_id)
+            run.status = status
+            run.finished_at = finished
+            run.duration_ms = int((finished - started).total_seconds() * 1000)
+            run.result = _summary(result)
+            run.error = error
+            db.commit()
+        finally:
+            db.close()
+
+    async def run_job(self, job: Job, scheduled_for: datetime) -> Optional[int]:
+        """Ejecuta un turno si este worker lo reclama. Devuelve el id de job_runs o None."""
+        run_id = await asyncio.to_thread(self._claim, job, scheduled_for)
+        if run_id is None:
+            return None
+
+        started = datetime.now(timezone.utc)
+        lock = await asyncio.to_thread(self._lock, job)
+        if lock is None:
+            logger.warning("Job still running elsewhere, slot skipped", job=job.name)
+            await asyncio.to_thread(self._finish, run_id, "skipped", started, None, "Previous run still in progress")
+            return run_id
+
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                result = await job.func()
+            else:
+                result = await asyncio.to_thread(job.func)
+            await asyncio.to_thread(self._finish, run_id, "success", started, result)
+            logger.info("Job completed", job=job.name, scheduled_for=scheduled_for.isoformat())
+            job.attempts, job.retry_at = 0, None
+        except Exception as e:
+            logger.error("Job failed", job=job.name, error=str(e), exc_info=True)
+            await asyncio.to_thread(self._finish, run_id, "failed", started, None, str(e))
+            self._schedule_retry(job)
+        finally:
+            await asyncio.to_thread(self._unlock, job, lock)
+        return run_id
+
+    def _schedule_retry(self, job: Job) -> None:
+        """Backoff exponencial: retry_after, 2x, 4x... salvo que el próximo turno llegue antes."""
+        if job.retry_after is None or job.attempts >= job.max_retries:
+            job.attempts, job.retry_at = 0, None
+            return
+        retry_at = (datetime.now() + job.retry_after * 2 ** job.attempts).replace(microsecond=0)
+        if job.next_run is not None and retry_at >= job.next_run:
+            job.attempts, job.retry_at = 0, None
+            return
+        job.attempts += 1
+        job.retry_at = retry_at
+        logger.info("Job retry scheduled", job=job.name, attempt=job.attempts, retry_at=retry_at.isoformat())
+
+    async def run_startup(self, job: Job) -> Optional[int]:
+        """Turno único al arrancar (el minuto actual) si job.run_at_startup lo pide."""
+        if job.run_at_startup is None or not await asyncio.to_thread(job.run_at_startup):
+            return None
+        return await self.run_job(job, datetime.now().replace(second=0, microsecond=0))
+
+    async def trigger(self, name: str) -> Optional[int]:
+        """Ejecución manual inmediata (turno = ahora, al segundo)."""
+        job = self.jobs[name]
+        return await self.run_job(job, datetime.now().replace(microsecond=0))
+
+    def prune_runs(self) -> dict:
+        """Borra el historial más antiguo que JOB_RUNS_RETENTION_DAYS."""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.JOB_RUNS_RETENTION_DAYS)
+        db = self.session_factory()
+        try:
+            deleted = db.execute(delete(JobRun).where(JobRun.started_at < cutoff)).rowcount
+            db.commit()
+            return {"deleted": deleted}
+        finally:
+            db.close()
+
+    # --- Bucle ---
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _loop(self) -> None:
+        now = datetime.now()
+        for job in self.jobs.values():
+            job.next_run = job.schedule.next_after(now)
+            if job.run_at_startup is not None:
+                self._spawn(self.run_startup(job))
+        while True:
+            now = datetime.now()
+            for job in self.jobs.values():
+                if job.next_run <= now:
+                    job.attempts, job.retry_at = 0, None
+                    self._spawn(self.run_job(job, job.next_run))
+                    job.next_run = job.schedule.next_after(now)
+                elif job.retry_at is not None and job.retry_at <= now:
+                    retry_at, job.retry_at = job.retry_at, None
+                    self._spawn(self.run_job(job, retry_at))
+            pending = [moment for job in self.jobs.values() for moment in (job.next_run, job.retry_at) if moment]
+            upcoming = min(pending, default=now + timedelta(seconds=MAX_SLEEP_SECONDS))
+            await asyncio.sleep(min(max((upcoming - datetime.now()).total_seconds(), 0.5), MAX_SLEEP_SECONDS))
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info("Scheduler started", jobs=list(self.jobs), worker=WORKER_ID)
+
+    async def stop(self) -> None:
+        tasks = [task for task in (self._task, *self._running) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    # --- Consulta ---
+
+    def get_jobs(self, db: Session, sample: int = 20) -> List[dict]:
+        """Tareas registradas con su próximo turno, última corrida y duración reciente."""
+        jobs = []
+        for job in self.jobs.values():
+            runs = db.query(JobRun).filter(
+                JobRun.job_name == job.name,
+                JobRun.duration_ms.isnot(None)
+            ).order_by(JobRun.started_at.desc()).limit(sample).all()
+            last = db.query(JobRun).filter(JobRun.job_name == job.name).order_by(JobRun.started_at.desc()).first()
+            durations = [run.duration_ms for run in runs if run.status == "success"]
+            jobs.append({
+                "name": job.name,
+                "description": job.description,
+                "schedule": job.schedule.expression,
+                "next_run": job.next_run or job.schedule.next_after(datetime.now()),
+                "retry_at": job.retry_at,
+                "last_run": {
+                    "id": last.id,
+                    "status": last.status,
+                    "worker": last.worker,
+                    "scheduled_for": last.scheduled_for,
+                    "started_at": last.started_at,
+                    "duration_ms": last.duration_ms,
+                    "error": last.error,
+                } if last else None,
+                "avg_duration_ms": round(sum(durations) / len(durations)) if durations else None,
+                "max_duration_ms": max(durations) if durations else None,
+                "failures": sum(1 for run in runs if run.status == "failed"),
+            })
+        return jobs
+
+
+scheduler = Scheduler()
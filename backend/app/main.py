@@ -11,6 +11,7 @@ Production-ready FastAPI application with:
 """
 import uuid
 from contextlib import asynccontextmanager
+from datetime import date, timedelta
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -25,7 +26,7 @@ from .core.exceptions import register_exception_handlers
 from .api.v1 import (
     auth, customers, inventory, sales, finance, 
     repairs, dashboard, purchases, expenses, reports, 
-    users, settings as settings_router, health, audit
+    users, settings as settings_router, health, audit, events, admin
 )
 
 
@@ -46,33 +47,115 @@ async def lifespan(app: FastAPI):
     # Register Audit Listeners
     from .services.audit_service import register_audit_listeners
     register_audit_listeners()
+
+    # Publish live events (SSE) after commit
+    from .core.events import register_event_listeners
+    register_event_listeners()
+
+    # Invalidate cached customer profiles on sales, payments and repairs
+    from .services.customer_profile_service import register_profile_cache_listeners
+    register_profile_cache_listeners()
+
+    # Keep Inventory.is_low_stock in sync and publish threshold crossings
+    from .services.low_stock_service import register_low_stock_listeners
+    register_low_stock_listeners()
+
+    # Activity feed rows for sales, repairs and customers
+    from .services.activity_service import register_activity_listeners
+    register_activity_listeners()
+
+    # Monthly KPI cube: refresh the touched months after commit
+    from .services.kpi_service import register_kpi_listeners
+    register_kpi_listeners()
+
+    # Cached closed-month P&L: drop the months whose source rows change
+    from .services.profit_loss_service import register_profit_loss_listeners
+    register_profit_loss_listeners()
+
+    # Per-status repair counters (dashboard and technician queues)
+    from .services.repair_workflow_service import register_repair_workflow_listeners
+    register_repair_workflow_listeners()
+
+    # Parts changes mark their repair for the next technician stats refresh
+    from .services.technician_analytics_service import register_technician_stats_listeners
+    register_technician_stats_listeners()
     
-    # Initialize Currency Auto-Update
-    from .services.currency_service import CurrencyService
+    # Periodic jobs: every worker runs the scheduler loop, each slot runs once per cluster
+    from .core.scheduler import scheduler
     from .core.database import SessionLocal
-    import asyncio
-    import random
-    
-    async def schedule_currency_updates():
-        while True:
-            try:
-                logger.info("Running scheduled currency update")
-                db = SessionLocal()
-                try:
-                    await CurrencyService.update_official_rate(db)
-                finally:
-                    db.close()
-                logger.info("Currency update completed successfully, waiting 4 hours")
-                await asyncio.sleep(14400)  # 4 hours
-            except Exception as e:
-                logger.error(f"Error in scheduled currency update: {e}", exc_info=True)
-                # Exponential backoff: wait between 1-4 hours before retry
-                backoff_seconds = random.uniform(3600, 14400)
-                logger.info(f"Retrying currency update in {backoff_seconds:.0f} seconds")
-                await asyncio.sleep(backoff_seconds)
-            
-    asyncio.create_task(schedule_currency_updates())
-    
+    from .services.currency_service import register_rate_index_listeners
+    from .services.rate_ingestion_service import RateIngestionService
+    from .services.report_service import ReportService
+    from .services.ar_aging_service import ARAgingService
+    from .services.inventory_snapshot_service import InventorySnapshotService
+    from .services.technician_analytics_service import TechnicianAnalyticsService
+    register_rate_index_listeners()
+
+    async def update_exchange_rate():
+        # Fetch with retries/fallback; the DB write runs in a worker thread
+        rate = await RateIngestionService.ingest()
+        if rate is None:
+            raise RuntimeError("No exchange rate source available")
+        return {"rate": rate.rate, "source": rate.source, "effective_date": rate.effective_date}
+
+    def exchange_rate_missing_today():
+        # Arranque sin tasa del día: no esperar al próximo turno de 4 horas
+        db = SessionLocal()
+        try:
+            return not RateIngestionService.has_rate_for(db, date.today())
+        finally:
+            db.close()
+
+    def run_nightly_ar_jobs():
+        # Re-bucket de cartera + scoring de riesgo en el mismo job
+        db = SessionLocal()
+        try:
+            return ReportService.calculate_aging_and_risk(db)
+        finally:
+            db.close()
+
+    def ar_aging_stale():
+        # Buckets de un día anterior (el job nocturno no corrió): re-clasificar al arrancar
+        db = SessionLocal()
+        try:
+            return ARAgingService.is_stale(db)
+        finally:
+            db.close()
+
+    def run_technician_stats_refresh():
+        # Solo las reparaciones con bitácora o cambios desde la última corrida
+        db = SessionLocal()
+        try:
+            return TechnicianAnalyticsService.refresh(db)
+        finally:
+            db.close()
+
+    def run_nightly_inventory_snapshot():
+        # Snapshot de inventario al cierre de ayer (delta, completo los lunes)
+        db = SessionLocal()
+        try:
+            return InventorySnapshotService.take_snapshot(db)
+        finally:
+            db.close()
+
+    scheduler.add_job(
+        "exchange_rate_update", "0 */4 * * *", update_exchange_rate, "Tasa oficial USD/VES (BCV con respaldo)",
+        retry_after=timedelta(minutes=5), max_retries=4, run_at_startup=exchange_rate_missing_today
+    )
+    scheduler.add_job(
+        "ar_aging", "5 0 * * *", run_nightly_ar_jobs, "Antigüedad de cartera y riesgo de crédito",
+        run_at_startup=ar_aging_stale
+    )
+    scheduler.add_job("inventory_snapshot", "15 0 * * *", run_nightly_inventory_snapshot, "Snapshot diario de inventario")
+    scheduler.add_job("technician_stats", "20 * * * *", run_technician_stats_refresh, "Resumen de rendimiento técnico (incremental)")
+    scheduler.add_job("job_runs_prune", "30 3 * * *", scheduler.prune_runs, "Limpia el historial de job_runs")
+    scheduler.start()
+
+    # Outbound messages (WhatsApp): handlers enqueue, this worker sends
+    from .services.outbox_service import outbox_worker, register_outbox_listeners
+    register_outbox_listeners()
+    outbox_worker.start()
+
     # Initialize Sentry if DSN is configured
     try:
         import os
@@ -101,6 +184,9 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down Serviceflow Pro")
+    await scheduler.stop()
+    await outbox_worker.stop()
+    await RateIngestionService.close()
 
 
 # Create FastAPI application
@@ -183,6 +269,8 @@ app.include_router(expenses.router, prefix=f"{settings.API_V1_STR}/expenses", ta
 app.include_router(reports.router, prefix=f"{settings.API_V1_STR}/reports", tags=["Reports"])
 app.include_router(purchases.router, prefix=f"{settings.API_V1_STR}/purchases", tags=["Purchases"])
 app.include_router(audit.router, prefix=f"{settings.API_V1_STR}/audit", tags=["Audit"])
+app.include_router(events.router, prefix=f"{settings.API_V1_STR}/events", tags=["Events"])
+app.include_router(admin.router, prefix=f"{settings.API_V1_STR}/admin", tags=["Admin"])
 app.include_router(health.router, prefix=f"{settings.API_V1_STR}", tags=["Health"])
 
 
@@ -1,12 +1,15 @@
 from .base import Base
 from .user import User, Role, user_roles
 from .customer import Customer
-from .inventory import Category, Product, Inventory
-from .finance import ExchangeRate, Payment, CashSession, CashTransaction, AccountReceivable, CustomerPayment
+from .inventory import Category, Product, Inventory, InventoryCostLayer, StockMovement, InventorySnapshot
+from .finance import ExchangeRate, Payment, CashSession, CashTransaction, AccountReceivable, CustomerPayment, CustomerARBalance, CustomerLedgerEntry
 from .sale import Sale, SaleItem, SaleReturn, SaleReturnItem
 from .sale_repair import SaleRepair
-from .repair import Repair, RepairItem, RepairLog
-from .notification import Notification
+from .repair import Repair, RepairItem, RepairLog, RepairStatusCount
+from .notification import Notification, OutboundMessage
 from .purchase import Supplier, PurchaseOrder, PurchaseItem
 from .settings import SystemSetting
 from .audit import AuditLog
+from .activity import ActivityEvent
+from .kpi import KpiMonthly, ProfitLossPeriod, TechnicianRepairStat
+from .job import JobRun
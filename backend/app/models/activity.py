@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index
+from sqlalchemy.sql import func
+from .base import Base
+
+class ActivityEvent(Base):
+    """Feed de actividad (ventas, reparaciones, clientes, alertas de stock).
+
+    Se escribe en la misma transacción que el registro que lo origina; el
+    feed se lee por rango del id (cursor) o de created_at.
+    """
+    __tablename__ = "activity_events"
+    __table_args__ = (
+        Index("ix_activity_events_created", "created_at", "id"),
+        Index("ix_activity_events_type_id", "event_type", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(20), nullable=False)  # 'sale', 'repair', 'customer', 'alert'
+    title = Column(String(100), nullable=False)
+    description = Column(String(255), nullable=False)
+    reference_type = Column(String(20))  # 'sale', 'repair', 'customer', 'product'
+    reference_id = Column(Integer)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, Date, Boolean, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DECIMAL, Date, Boolean, DateTime, ForeignKey, Index
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from .base import Base
+from ..utils.enums import PaymentMethod
 
 class ExchangeRate(Base):
     __tablename__ = "exchange_rates"
@@ -28,6 +29,9 @@ class ExpenseCategory(Base):
 
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = (
+        Index("ix_expenses_session_method_currency", "session_id", "payment_method", "currency"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     category_id = Column(Integer, ForeignKey("expense_categories.id"), nullable=False)
@@ -51,12 +55,19 @@ class Expense(Base):
     session = relationship("CashSession")
     user = relationship("User")
 
+    @validates("payment_method")
+    def validate_payment_method(self, key, value):
+        return PaymentMethod.normalize(value)
+
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_session_method_currency", "session_id", "payment_method", "currency"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True)
-    repair_id = Column(Integer, ForeignKey("repairs.id"), nullable=True)
+    sale_id = Column(Integer, ForeignKey("sales.id"), nullable=True, index=True)
+    repair_id = Column(Integer, ForeignKey("repairs.id"), nullable=True, index=True)
     session_id = Column(Integer, ForeignKey("cash_sessions.id"), nullable=True)
     
     amount_usd = Column(DECIMAL(10, 2), nullable=False)
@@ -73,6 +84,10 @@ class Payment(Base):
     repair = relationship("Repair")
     session = relationship("CashSession", back_populates="payments")
 
+    @validates("payment_method")
+    def validate_payment_method(self, key, value):
+        return PaymentMethod.normalize(value)
+
 class CashSession(Base):
     __tablename__ = "cash_sessions"
 
@@ -163,9 +178,79 @@ class AccountReceivable(Base):
     payments = relationship("CustomerPayment", back_populates="account")
 
 
+class CustomerARBalance(Base):
+    """Saldo y antigüedad de cuentas por cobrar pre-agregados por cliente.
+
+    Se actualiza de forma incremental al crear o abonar una cuenta por cobrar y
+    se re-clasifica completo cada noche (ver ARAgingService). Los buckets se
+    calculan respecto a ``as_of_date``.
+    """
+    __tablename__ = "customer_ar_balances"
+
+    customer_id = Column(Integer, ForeignKey("customers.id"), primary_key=True)
+
+    open_balance = Column(DECIMAL(12, 2), default=0, nullable=False)
+    open_accounts = Column(Integer, default=0, nullable=False)
+
+    # Buckets por días de atraso respecto a as_of_date
+    bucket_current = Column(DECIMAL(12, 2), default=0, nullable=False)  # Aún no vence
+    bucket_1_30 = Column(DECIMAL(12, 2), default=0, nullable=False)
+    bucket_31_60 = Column(DECIMAL(12, 2), default=0, nullable=False)
+    bucket_61_90 = Column(DECIMAL(12, 2), default=0, nullable=False)
+    bucket_over_90 = Column(DECIMAL(12, 2), default=0, nullable=False)
+
+    oldest_due_date = Column(Date, nullable=True)
+    as_of_date = Column(Date, nullable=False, index=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    customer = relationship("Customer")
+
+    @property
+    def overdue_balance(self):
+        return (self.bucket_1_30 or 0) + self.delinquent_balance
+
+    @property
+    def delinquent_balance(self):
+        """Saldo con más de 30 días de atraso (morosidad)."""
+        return (self.bucket_31_60 or 0) + (self.bucket_61_90 or 0) + (self.bucket_over_90 or 0)
+
+
+class CustomerLedgerEntry(Base):
+    """Libro de crédito del cliente (solo inserciones).
+
+    Cada cargo, abono o ajuste de conciliación agrega una fila con el monto
+    firmado (+ cargo, - abono). ``customers.current_debt`` es el saldo
+    denormalizado de este libro y se actualiza en la misma transacción
+    (ver CustomerLedgerService).
+    """
+    __tablename__ = "customer_ledger_entries"
+    __table_args__ = (
+        Index("ix_customer_ledger_entries_customer_id_id", "customer_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=False)
+    entry_type = Column(String(20), nullable=False)  # 'charge', 'payment', 'adjustment'
+
+    amount = Column(DECIMAL(12, 2), nullable=False)  # Firmado
+    balance_after = Column(DECIMAL(12, 2), nullable=False)
+
+    account_id = Column(Integer, ForeignKey("accounts_receivable.id"), nullable=True)
+    payment_id = Column(Integer, ForeignKey("customer_payments.id"), nullable=True)
+    description = Column(String(255))
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    customer = relationship("Customer")
+
+
 class CustomerPayment(Base):
     """Customer payments/abonos against accounts receivable"""
     __tablename__ = "customer_payments"
+    __table_args__ = (
+        Index("ix_customer_payments_session_method_currency", "session_id", "payment_method", "currency"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     account_id = Column(Integer, ForeignKey("accounts_receivable.id"), nullable=False)
@@ -193,6 +278,10 @@ class CustomerPayment(Base):
     customer = relationship("Customer")
     session = relationship("CashSession")
 
+    @validates("payment_method")
+    def validate_payment_method(self, key, value):
+        return PaymentMethod.normalize(value)
+
 class AccountsPayable(Base):
     """Cuentas por pagar - Tracks debt to suppliers"""
     __tablename__ = "accounts_payable"
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, ForeignKey, Text, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, DECIMAL, ForeignKey, Text, Boolean, Date, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from .base import Base
 
 class Category(Base):
@@ -41,6 +41,13 @@ class Product(Base):
 
 class Inventory(Base):
     __tablename__ = "inventory"
+    __table_args__ = (
+        # Índice parcial: el conjunto de stock bajo se lee en O(k)
+        Index(
+            "ix_inventory_low_stock", "product_id",
+            postgresql_where=text("is_low_stock"), sqlite_where=text("is_low_stock = 1")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), unique=True)
@@ -48,6 +55,8 @@ class Inventory(Base):
     min_stock = Column(Integer, default=5)
     max_stock = Column(Integer)
     location = Column(String(100))
+    # quantity <= min_stock; lo mantiene LowStockService en cada escritura
+    is_low_stock = Column(Boolean, default=False, nullable=False)
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     product = relationship("Product", back_populates="inventory")
@@ -70,3 +79,80 @@ class InventoryLog(Base):
     inventory = relationship("Inventory", back_populates="logs")
     product = relationship("Product")
     user = relationship("User")
+
+class InventoryCostLayer(Base):
+    """Capa de costo (lote de entrada) de un producto.
+
+    Las compras, devoluciones y ajustes positivos crean capas; las ventas y
+    repuestos de reparaciones las consumen en orden FIFO (por id). Ver
+    CostingService.
+    """
+    __tablename__ = "inventory_cost_layers"
+    __table_args__ = (
+        Index("ix_inventory_cost_layers_product_remaining", "product_id", "remaining_quantity"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    source_type = Column(String(20), nullable=False)  # 'purchase', 'return', 'adjustment', 'opening'
+    source_id = Column(Integer, nullable=True)
+
+    quantity = Column(Integer, nullable=False)
+    remaining_quantity = Column(Integer, nullable=False)
+    unit_cost_usd = Column(DECIMAL(12, 4), nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    product = relationship("Product")
+
+class StockMovement(Base):
+    """Libro de movimientos de stock (solo inserciones).
+
+    Cada entrada o salida (ventas, devoluciones, repuestos, compras, ajustes)
+    registra la cantidad firmada y el saldo resultante, de modo que el Kardex
+    es un recorrido por rango del índice (product_id, created_at) y el stock a
+    una fecha es una búsqueda del último movimiento anterior.
+    """
+    __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_product_created", "product_id", "created_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    movement_type = Column(String(20), nullable=False)  # 'sale', 'return', 'repair', 'purchase', 'adjustment', 'opening'
+
+    quantity = Column(Integer, nullable=False)  # Firmada: + entrada, - salida
+    balance_after = Column(Integer, nullable=False)
+    unit_cost_usd = Column(DECIMAL(12, 4), nullable=True)
+
+    reference_type = Column(String(20), nullable=True)  # 'sale', 'repair', 'purchase'
+    reference_id = Column(Integer, nullable=True)
+    note = Column(String(255))
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    product = relationship("Product")
+    user = relationship("User")
+
+class InventorySnapshot(Base):
+    """Cantidad y costo por producto al cierre de un día.
+
+    Los snapshots completos (semanales) guardan todos los productos; los
+    diarios son deltas con solo los productos que cambiaron desde su último
+    registro. Ver InventorySnapshotService.
+    """
+    __tablename__ = "inventory_snapshots"
+    __table_args__ = (
+        UniqueConstraint("product_id", "snapshot_date", name="uq_inventory_snapshots_product_date"),
+        Index("ix_inventory_snapshots_date_product", "snapshot_date", "product_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    unit_cost_usd = Column(DECIMAL(12, 4), nullable=False)
+    is_full = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from .base import Base
+
+class JobRun(Base):
+    """Historial de ejecuciones de tareas periódicas (app.core.scheduler).
+
+    La fila se inserta antes de ejecutar la tarea: el UNIQUE (job_name,
+    scheduled_for) hace que solo un worker del cluster reclame cada turno.
+    """
+    __tablename__ = "job_runs"
+    __table_args__ = (
+        UniqueConstraint("job_name", "scheduled_for", name="uq_job_runs_slot"),
+        Index("ix_job_runs_job_started", "job_name", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    job_name = Column(String(100), nullable=False)
+    scheduled_for = Column(DateTime, nullable=False)  # Turno del cron (hora local del servidor)
+    status = Column(String(20), nullable=False, default="running")  # 'running', 'success', 'failed', 'skipped'
+    worker = Column(String(100))  # host:pid que ejecutó la tarea
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True))
+    duration_ms = Column(Integer)
+    result = Column(Text)  # Resumen JSON devuelto por la tarea
+    error = Column(Text)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,88 @@
+from sqlalchemy import Column, Integer, String, DECIMAL, Date, DateTime, Boolean, ForeignKey, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from .base import Base
+
+class KpiMonthly(Base):
+    """Cubo mensual de KPIs de reportes.
+
+    Una fila por (mes, dimensión, id): dimension 'total' (id 0), 'user'
+    (vendedor/técnico) o 'category' (categoría del producto; 0 = sin
+    categoría). KpiService le suma deltas en cada flush (upsert).
+    """
+    __tablename__ = "kpi_monthly"
+    __table_args__ = (
+        UniqueConstraint("month", "dimension", "dimension_id", name="uq_kpi_monthly_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False)  # Primer día del mes
+    dimension = Column(String(10), nullable=False)  # 'total', 'user', 'category'
+    dimension_id = Column(Integer, nullable=False, default=0)
+
+    sales_revenue_usd = Column(DECIMAL(14, 2), default=0, nullable=False)
+    sales_revenue_ves = Column(DECIMAL(20, 2), default=0, nullable=False)
+    orders_count = Column(Integer, default=0, nullable=False)
+    units_sold = Column(Integer, default=0, nullable=False)
+    services_count = Column(Integer, default=0, nullable=False)
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ProfitLossPeriod(Base):
+    """P&L de un mes cerrado (inmutable), en USD y en VES a la tasa de cada transacción.
+
+    Lo escribe ProfitLossService la primera vez que se consulta el mes
+    después de cerrado; el mes en curso siempre se calcula en vivo.
+    """
+    __tablename__ = "profit_loss_periods"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False, unique=True)  # Primer día del mes
+
+    sales_usd = Column(DECIMAL(14, 2), default=0, nullable=False)
+    sales_ves = Column(DECIMAL(20, 2), default=0, nullable=False)
+    repairs_usd = Column(DECIMAL(14, 2), default=0, nullable=False)
+    repairs_ves = Column(DECIMAL(20, 2), default=0, nullable=False)
+    product_cogs_usd = Column(DECIMAL(14, 2), default=0, nullable=False)
+    product_cogs_ves = Column(DECIMAL(20, 2), default=0, nullable=False)
+    repair_cogs_usd = Column(DECIMAL(14, 2), default=0, nullable=False)
+    repair_cogs_ves = Column(DECIMAL(20, 2), default=0, nullable=False)
+    expenses_usd = Column(DECIMAL(14, 2), default=0, nullable=False)
+    expenses_ves = Column(DECIMAL(20, 2), default=0, nullable=False)
+
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class TechnicianRepairStat(Base):
+    """Resumen por reparación para el rendimiento técnico (una fila por reparación).
+
+    Hitos RECEIVED → READY → DELIVERED, reaperturas y repuestos, calculados
+    desde repair_logs. TechnicianAnalyticsService recalcula solo las
+    reparaciones con bitácora o cambios posteriores a last_log_id /
+    source_updated_at; los reportes agregan esta tabla, no la bitácora.
+    """
+    __tablename__ = "technician_repair_stats"
+    __table_args__ = (
+        Index("ix_technician_repair_stats_ready", "technician_id", "ready_at"),
+        Index("ix_technician_repair_stats_returns", "previous_technician_id", "received_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    repair_id = Column(Integer, ForeignKey("repairs.id", ondelete="CASCADE"), nullable=False, unique=True)
+    technician_id = Column(Integer, nullable=False, default=0)  # 0 = sin técnico asignado
+
+    received_at = Column(DateTime(timezone=True))
+    ready_at = Column(DateTime(timezone=True))  # Primera vez en READY (o entrega directa)
+    delivered_at = Column(DateTime(timezone=True))
+    hours_to_ready = Column(DECIMAL(10, 2))
+    hours_ready_to_delivered = Column(DECIMAL(10, 2))
+    hours_to_delivered = Column(DECIMAL(10, 2))
+
+    reopened_count = Column(Integer, default=0, nullable=False)  # READY/DELIVERED → IN_PROGRESS
+    is_warranty_return = Column(Boolean, default=False, nullable=False)  # Reingreso dentro de la garantía
+    previous_technician_id = Column(Integer, nullable=True)  # Técnico de la reparación anterior del equipo
+
+    parts_quantity = Column(Integer, default=0, nullable=False)
+    parts_cost_usd = Column(DECIMAL(12, 2), default=0, nullable=False)
+
+    last_log_id = Column(Integer, nullable=False, default=0)
+    source_updated_at = Column(DateTime(timezone=True))
+    computed_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
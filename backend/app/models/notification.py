@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from .base import Base
 
@@ -13,3 +13,32 @@ class Notification(Base):
     type = Column(String(50))  # 'inventory', 'sale', 'repair', 'system'
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class OutboundMessage(Base):
+    """Outbox de mensajes salientes (WhatsApp, ...).
+
+    Los handlers solo insertan la fila; el worker de OutboxService la envía,
+    reintenta con backoff y deja el estado por mensaje. next_attempt_at sirve
+    también de lease mientras el mensaje está en 'sending'.
+    """
+    __tablename__ = "outbound_messages"
+    __table_args__ = (
+        Index("ix_outbound_messages_due", "status", "next_attempt_at"),
+        Index("ix_outbound_messages_reference", "reference_type", "reference_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String(20), nullable=False, default="whatsapp")  # NotificationType
+    recipient = Column(String(50), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")  # 'pending', 'sending', 'sent', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text)
+    reference_type = Column(String(20))  # 'sale', 'repair'
+    reference_id = Column(Integer)
+    batch_id = Column(String(36), index=True)  # Envíos masivos
+    created_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
@@ -1,11 +1,16 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, ForeignKey, DateTime, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, DECIMAL, ForeignKey, DateTime, Text, Index, UniqueConstraint
+from sqlalchemy.orm import relationship, validates
 from sqlalchemy.sql import func
 from decimal import Decimal
 from .base import Base
+from ..utils.enums import RepairStatus
 
 class Repair(Base):
     __tablename__ = "repairs"
+    __table_args__ = (
+        Index("ix_repairs_status_created", "status", "created_at"),
+        Index("ix_repairs_user_status", "user_id", "status"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"))
@@ -17,7 +22,7 @@ class Repair(Base):
     problem_description = Column(Text, nullable=False)
     technical_report = Column(Text)
     
-    status = Column(String(20), default="RECEIVED")  # 'RECEIVED', 'IN_PROGRESS', 'READY', 'DELIVERED', 'CANCELLED'
+    status = Column(String(20), default=RepairStatus.RECEIVED.value)  # RepairStatus (siempre en mayúsculas)
     
     # Enhanced Service Info
     service_type = Column(String(20), default="SERVICE") # 'SOFTWARE', 'HARDWARE', 'REVISION'
@@ -44,6 +49,10 @@ class Repair(Base):
     logs = relationship("RepairLog", back_populates="repair")
     sale_links = relationship("SaleRepair", back_populates="repair")
 
+    @validates("status")
+    def _normalize_status(self, key, value):
+        return RepairStatus.normalize(value)
+
     @property
     def parts_cost_usd(self) -> Decimal:
         """Calculate total cost of parts used"""
@@ -116,12 +125,17 @@ class RepairItem(Base):
     
     quantity = Column(Integer, default=1)
     unit_cost_usd = Column(DECIMAL(10, 2))
+    unit_cogs_usd = Column(DECIMAL(10, 2), nullable=True)  # Costo real consumido de las capas (COGS)
     
     repair = relationship("Repair", back_populates="items")
     product = relationship("Product")
 
 class RepairLog(Base):
     __tablename__ = "repair_logs"
+    __table_args__ = (
+        # Ventanas por reparación en orden cronológico (rendimiento técnico)
+        Index("ix_repair_logs_repair_created", "repair_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     repair_id = Column(Integer, ForeignKey("repairs.id"))
@@ -134,3 +148,24 @@ class RepairLog(Base):
 
     repair = relationship("Repair", back_populates="logs")
     user = relationship("User")
+
+    @validates("status_from", "status_to")
+    def _normalize_status(self, key, value):
+        return RepairStatus.normalize(value)
+
+class RepairStatusCount(Base):
+    """Contador de reparaciones por estado (technician_id 0 = todas).
+
+    Se actualiza en cada alta, cambio de estado/técnico o baja de una
+    reparación; el dashboard y las colas por técnico lo leen directamente.
+    """
+    __tablename__ = "repair_status_counts"
+    __table_args__ = (
+        UniqueConstraint("status", "technician_id", name="uq_repair_status_counts_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False)
+    technician_id = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -54,6 +54,7 @@ class AccountTransaction(BaseModel):
     amount: Decimal
     reference: Optional[str] = None
     description: Optional[str] = None
+    balance: Optional[Decimal] = None  # Saldo acumulado tras el movimiento
     
     class Config:
         from_attributes = True
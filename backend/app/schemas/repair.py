@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from decimal import Decimal
 from datetime import datetime
@@ -91,3 +91,22 @@ class RepairRead(RepairBase):
         from_attributes = True
 
 
+
+
+# Bulk status transition
+class RepairBulkStatusUpdate(BaseModel):
+    repair_ids: List[int] = Field(..., min_length=1, max_length=500)
+    status: str
+    notes: Optional[str] = None
+    notify: bool = False  # Encolar WhatsApp al cliente de cada reparación movida
+
+class RepairBulkRejected(BaseModel):
+    id: int
+    status: Optional[str] = None
+    reason: str
+
+class RepairBulkStatusResult(BaseModel):
+    updated: List[RepairRead] = []
+    rejected: List[RepairBulkRejected] = []
+    notifications_queued: int = 0
+    batch_id: Optional[str] = None
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from ..models.activity import ActivityEvent
+from ..models.customer import Customer
+from ..models.inventory import Product
+from ..models.repair import Repair
+from ..models.sale import Sale
+
+# Ícono y color del widget por tipo de evento
+ACTIVITY_STYLES = {
+    "sale": ("CheckCircle2", "emerald"),
+    "repair": ("Wrench", "primary"),
+    "customer": ("Users", "blue"),
+    "alert": ("AlertCircle", "amber"),
+}
+
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _time_ago(dt: Optional[datetime], now: datetime) -> str:
+    """Tiempo transcurrido en formato legible."""
+    if not dt:
+        return "Hace un momento"
+    diff = now - _as_utc(dt)
+    if diff.days > 0:
+        return f"Hace {diff.days} día{'s' if diff.days > 1 else ''}"
+    hours = diff.seconds // 3600
+    if hours > 0:
+        return f"Hace {hours} hora{'s' if hours > 1 else ''}"
+    minutes = diff.seconds // 60
+    if minutes > 0:
+        return f"Hace {minutes} min"
+    return "Hace un momento"
+
+
+def record_activity(connection, event_type: str, title: str, description: str,
+                    reference_type: str = None, reference_id: int = None, user_id: int = None) -> None:
+    """Inserta el evento con la conexión de la transacción en curso (desde listeners del ORM)."""
+    connection.execute(
+        ActivityEvent.__table__.insert().values(
+            event_type=event_type,
+            title=title,
+            description=description[:255],
+            reference_type=reference_type,
+            reference_id=reference_id,
+            user_id=user_id
+        )
+    )
+
+
+def record_low_stock_activity(connection, product_id: int, quantity: int) -> None:
+    name = connection.execute(select(Product.name).where(Product.id == product_id)).scalar()
+    record_activity(
+        connection, "alert", "Stock Bajo", f"{name or f'Producto #{product_id}'} (Quedan {quantity or 0})",
+        "product", product_id
+    )
+
+
+def _sale_event(sale) -> dict:
+    return {
+        "event_type": "sale", "title": "Venta Finalizada",
+        "description": f"Venta #{sale.id} por ${float(sale.total_usd or 0):.2f}",
+        "reference_type": "sale", "reference_id": sale.id, "user_id": sale.user_id,
+    }
+
+
+def _repair_event(repair) -> dict:
+    device = repair.device_model or "Equipo"
+    problem = repair.problem_description or ""
+    if len(problem) > 30:
+        problem = f"{problem[:30]}..."
+    return {
+        "event_type": "repair", "title": "Equipo Recibido", "description": f"{device} - {problem}",
+        "reference_type": "repair", "reference_id": repair.id, "user_id": repair.created_by_id,
+    }
+
+
+def _customer_event(customer) -> dict:
+    return {
+        "event_type": "customer", "title": "Nuevo Cliente", "description": f"{customer.name} - Registrado",
+        "reference_type": "customer", "reference_id": customer.id, "user_id": None,
+    }
+
+
+def _on_sale_insert(mapper, connection, target: Sale) -> None:
+    record_activity(connection, **_sale_event(target))
+
+
+def _on_repair_insert(mapper, connection, target: Repair) -> None:
+    record_activity(connection, **_repair_event(target))
+
+
+def _on_customer_insert(mapper, connection, target: Customer) -> None:
+    record_activity(connection, **_customer_event(target))
+
+
+class ActivityService:
+    """
+    Feed de actividad (activity_events). Los eventos se escriben en la misma
+    transacción que la venta, reparación, cliente o alerta de stock, y se leen
+    con una sola consulta por rango del índice usando cursores de id.
+    """
+
+    @staticmethod
+    def backfill(db: Session, days: int = 7) -> int:
+        """
+        Llena un feed vacío con las ventas, reparaciones y clientes de los
+        últimos `days` días, en orden cronológico y con los mismos textos que
+        los listeners (lo usa scripts/setup_database.py).
+        """
+        if db.execute(select(ActivityEvent.id).limit(1)).first():
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+        sources = (
+            (_sale_event, select(Sale.id, Sale.total_usd, Sale.user_id, Sale.created_at), Sale.created_at),
+            (
+                _repair_event,
+                select(Repair.id, Repair.device_model, Repair.problem_description, Repair.created_by_id, Repair.created_at),
+                Repair.created_at
+            ),
+            (_customer_event, select(Customer.id, Customer.name, Customer.created_at), Customer.created_at),
+        )
+        rows = []
+        for build, query, created_at in sources:
+            for row in db.execute(query.where(created_at >= cutoff)):
+                rows.append({**build(row), "created_at": row.created_at})
+        rows.sort(key=lambda row: (_as_utc(row["created_at"]), row["event_type"], row["reference_id"]))
+        for row in rows:
+            row["description"] = row["description"][:255]
+        if rows:
+            db.execute(ActivityEvent.__table__.insert(), rows)
+        db.commit()
+        return len(rows)
+
+    @staticmethod
+    def get_feed(
+        db: Session,
+        limit: int = 10,
+        since_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        event_type: Optional[str] = None
+    ) -> list:
+        """
+        Eventos más recientes primero.
+
+        - `since_id`: solo eventos nuevos (polling incremental).
+        - `before_id`: página siguiente del historial.
+        """
+        query = select(ActivityEvent)
+        if since_id is not None:
+            query = query.where(ActivityEvent.id > since_id)
+        if before_id is not None:
+            query = query.where(ActivityEvent.id < before_id)
+        if event_type:
+            query = query.where(ActivityEvent.event_type == event_type)
+        query = query.order_by(ActivityEvent.id.desc()).limit(limit)
+
+        now = datetime.now(timezone.utc)
+        feed = []
+        for activity in db.execute(query).scalars():
+            icon, color = ACTIVITY_STYLES.get(activity.event_type, ("Bell", "slate"))
+            feed.append({
+                "id": activity.id,
+                "type": activity.event_type,
+                "icon": icon,
+                "title": activity.title,
+                "description": activity.description,
+                "reference_type": activity.reference_type,
+                "reference_id": activity.reference_id,
+                "time": _time_ago(activity.created_at, now),
+                "timestamp": activity.created_at.isoformat() if activity.created_at else now.isoformat(),
+                "color": color
+            })
+        return feed
+
+
+def register_activity_listeners() -> None:
+    """Escribe activity_events al insertar ventas, reparaciones y clientes."""
+    if event.contains(Sale, "after_insert", _on_sale_insert):
+        return
+    event.listen(Sale, "after_insert", _on_sale_insert)
+    event.listen(Repair, "after_insert", _on_repair_insert)
+    event.listen(Customer, "after_insert", _on_customer_insert)
@@ -0,0 +1,205 @@
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, case, literal
+from sqlalchemy.orm import Session
+
+from ..models.finance import AccountReceivable, CustomerARBalance
+from ..core.logging import get_logger
+
+logger = get_logger("ar_aging")
+
+BUCKET_COLUMNS = ("bucket_current", "bucket_1_30", "bucket_31_60", "bucket_61_90", "bucket_over_90")
+
+
+class ARAgingService:
+    """
+    Mantiene la tabla customer_ar_balances (saldo y antigüedad por cliente).
+
+    - record_charge / record_payment: actualización incremental de una fila.
+    - rebucket_all: reconstrucción completa en una sola sentencia INSERT ... SELECT
+      (job nocturno y seed de scripts/setup_database.py), necesaria porque los
+      saldos cambian de bucket con el tiempo.
+    """
+
+    @staticmethod
+    def bucket_for(due_date: date, as_of: date) -> str:
+        """Devuelve la columna de bucket según los días de atraso a la fecha as_of."""
+        days_overdue = (as_of - due_date).days
+        if days_overdue <= 0:
+            return "bucket_current"
+        if days_overdue <= 30:
+            return "bucket_1_30"
+        if days_overdue <= 60:
+            return "bucket_31_60"
+        if days_overdue <= 90:
+            return "bucket_61_90"
+        return "bucket_over_90"
+
+    @staticmethod
+    def _open_ar_aggregate(as_of: date):
+        """Columnas agregadas por cliente sobre las cuentas abiertas (sin GROUP BY aplicado)."""
+        balance = AccountReceivable.total_amount - func.coalesce(AccountReceivable.paid_amount, 0)
+        due = AccountReceivable.due_date
+
+        def bucket_sum(condition):
+            return func.coalesce(func.sum(case((condition, balance), else_=0)), 0)
+
+        return [
+            AccountReceivable.customer_id.label("customer_id"),
+            func.coalesce(func.sum(balance), 0).label("open_balance"),
+            func.count(AccountReceivable.id).label("open_accounts"),
+            bucket_sum(due >= as_of).label("bucket_current"),
+            bucket_sum((due < as_of) & (due >= as_of - timedelta(days=30))).label("bucket_1_30"),
+            bucket_sum((due < as_of - timedelta(days=30)) & (due >= as_of - timedelta(days=60))).label("bucket_31_60"),
+            bucket_sum((due < as_of - timedelta(days=60)) & (due >= as_of - timedelta(days=90))).label("bucket_61_90"),
+            bucket_sum(due < as_of - timedelta(days=90)).label("bucket_over_90"),
+            func.min(due).label("oldest_due_date"),
+            literal(as_of).label("as_of_date"),
+        ]
+
+    @staticmethod
+    def rebucket_all(db: Session, as_of: Optional[date] = None) -> dict:
+        """Reconstruye la tabla completa desde accounts_receivable (job nocturno)."""
+        as_of = as_of or date.today()
+        started = time.perf_counter()
+
+        columns = ARAgingService._open_ar_aggregate(as_of)
+        source = (
+            db.query(*columns)
+            .filter(AccountReceivable.status != "paid")
+            .group_by(AccountReceivable.customer_id)
+            .subquery()
+        )
+        target_columns = [
+            "customer_id", "open_balance", "open_accounts", *BUCKET_COLUMNS,
+            "oldest_due_date", "as_of_date",
+        ]
+        table = CustomerARBalance.__table__
+
+        db.execute(table.delete())
+        result = db.execute(
+            table.insert().from_select(
+                target_columns,
+                db.query(*[source.c[name] for name in target_columns]).statement,
+            )
+        )
+        db.commit()
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info("AR aging rebucketed", rows=result.rowcount, as_of=as_of.isoformat(), elapsed_ms=elapsed_ms)
+        return {"rows": result.rowcount, "as_of": as_of, "elapsed_ms": elapsed_ms}
+
+    @staticmethod
+    def is_stale(db: Session) -> bool:
+        """
+        True si hay buckets calculados a una fecha anterior a hoy (p.ej. el job
+        nocturno no corrió). Solo lo consulta el scheduler al arrancar; las
+        lecturas nunca reconstruyen la tabla.
+        """
+        oldest_as_of = db.query(func.min(CustomerARBalance.as_of_date)).scalar()
+        return oldest_as_of is not None and oldest_as_of < date.today()
+
+    @staticmethod
+    def refresh_customer(db: Session, customer_id: int, as_of: Optional[date] = None) -> Optional[CustomerARBalance]:
+        """Recalcula la fila de un cliente con un agregado sobre sus cuentas abiertas."""
+        as_of = as_of or date.today()
+        db.flush()
+        row = (
+            db.query(*ARAgingService._open_ar_aggregate(as_of))
+            .filter(AccountReceivable.customer_id == customer_id, AccountReceivable.status != "paid")
+            .group_by(AccountReceivable.customer_id)
+            .first()
+        )
+        balance = db.query(CustomerARBalance).filter(CustomerARBalance.customer_id == customer_id).with_for_update().first()
+        if not row:
+            if balance:
+                db.delete(balance)
+            return None
+
+        values = row._asdict()
+        if not balance:
+            balance = CustomerARBalance(customer_id=customer_id)
+            db.add(balance)
+        for field, value in values.items():
+            if field != "customer_id":
+                setattr(balance, field, value)
+        return balance
+
+    @staticmethod
+    def record_charge(db: Session, account: AccountReceivable) -> None:
+        """Suma una cuenta por cobrar nueva al saldo agregado de su cliente."""
+        amount = Decimal(str(account.total_amount or 0)) - Decimal(str(account.paid_amount or 0))
+        balance = db.query(CustomerARBalance).filter(
+            CustomerARBalance.customer_id == account.customer_id
+        ).with_for_update().first()
+
+        if not balance:
+            # Primera cuenta abierta del cliente: agregado puntual. La tabla ya viene
+            # construida desde scripts/setup_database.py (seed_ar_aging)
+            ARAgingService.refresh_customer(db, account.customer_id)
+            return
+
+        bucket = ARAgingService.bucket_for(account.due_date, balance.as_of_date)
+        setattr(balance, bucket, (getattr(balance, bucket) or 0) + amount)
+        balance.open_balance = (balance.open_balance or 0) + amount
+        balance.open_accounts = (balance.open_accounts or 0) + 1
+        if balance.oldest_due_date is None or account.due_date < balance.oldest_due_date:
+            balance.oldest_due_date = account.due_date
+
+    @staticmethod
+    def record_payment(db: Session, account: AccountReceivable, amount: Decimal) -> None:
+        """
+        Descuenta un abono del saldo agregado. Debe llamarse después de actualizar
+        paid_amount/status de la cuenta.
+        """
+        balance = db.query(CustomerARBalance).filter(
+            CustomerARBalance.customer_id == account.customer_id
+        ).with_for_update().first()
+
+        if not balance:
+            ARAgingService.refresh_customer(db, account.customer_id)
+            return
+
+        amount = Decimal(str(amount))
+        bucket = ARAgingService.bucket_for(account.due_date, balance.as_of_date)
+        setattr(balance, bucket, max(Decimal(0), (getattr(balance, bucket) or 0) - amount))
+        balance.open_balance = max(Decimal(0), (balance.open_balance or 0) - amount)
+
+        if account.status != "paid":
+            return
+
+        balance.open_accounts = (balance.open_accounts or 0) - 1
+        if balance.open_accounts <= 0:
+            db.delete(balance)
+            return
+
+        if account.due_date == balance.oldest_due_date:
+            balance.oldest_due_date = db.query(func.min(AccountReceivable.due_date)).filter(
+                AccountReceivable.customer_id == account.customer_id,
+                AccountReceivable.status != "paid",
+                AccountReceivable.id != account.id
+            ).scalar()
+
+    @staticmethod
+    def get_totals(db: Session) -> dict:
+        """Totales globales de la cartera en una sola consulta sobre la tabla agregada."""
+        delinquent = (
+            CustomerARBalance.bucket_31_60 + CustomerARBalance.bucket_61_90 + CustomerARBalance.bucket_over_90
+        )
+        row = db.query(
+            func.coalesce(func.sum(CustomerARBalance.open_balance), 0).label("open_balance"),
+            func.coalesce(func.sum(CustomerARBalance.bucket_current), 0).label("bucket_current"),
+            func.coalesce(func.sum(CustomerARBalance.bucket_1_30), 0).label("bucket_1_30"),
+            func.coalesce(func.sum(CustomerARBalance.bucket_31_60), 0).label("bucket_31_60"),
+            func.coalesce(func.sum(CustomerARBalance.bucket_61_90), 0).label("bucket_61_90"),
+            func.coalesce(func.sum(CustomerARBalance.bucket_over_90), 0).label("bucket_over_90"),
+            func.count(case((delinquent > 0, CustomerARBalance.customer_id))).label("delinquent_customers"),
+        ).one()
+        totals = {key: Decimal(str(value)) for key, value in row._asdict().items() if key != "delinquent_customers"}
+        totals["overdue_balance"] = totals["bucket_1_30"] + totals["bucket_31_60"] + totals["bucket_61_90"] + totals["bucket_over_90"]
+        totals["delinquent_balance"] = totals["bucket_31_60"] + totals["bucket_61_90"] + totals["bucket_over_90"]
+        totals["delinquent_customers"] = row.delinquent_customers or 0
+        return totals
@@ -1,61 +1,99 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case, literal, select, union_all
 from ..models.finance import CashSession, Payment, CustomerPayment, Expense, CashTransaction
+from ..utils.enums import PaymentMethod
 from decimal import Decimal
 
 class CashService:
+    @staticmethod
+    def _session_movements(session_id: int):
+        """
+        UNION ALL de los movimientos de la sesión con el monto en su moneda física.
+        Cada rama filtra por session_id y usa el índice (session_id, payment_method, currency).
+        """
+        def physical_amount(model):
+            return case((model.currency == "VES", model.amount_ves), else_=model.amount_usd)
+
+        sales = select(
+            literal("sales").label("source"),
+            Payment.payment_method.label("payment_method"),
+            Payment.currency.label("currency"),
+            physical_amount(Payment).label("amount")
+        ).where(Payment.session_id == session_id)
+
+        ar_payments = select(
+            literal("ar_payments").label("source"),
+            CustomerPayment.payment_method.label("payment_method"),
+            CustomerPayment.currency.label("currency"),
+            physical_amount(CustomerPayment).label("amount")
+        ).where(CustomerPayment.session_id == session_id)
+
+        # Expense.amount ya está expresado en su propia moneda
+        expenses = select(
+            literal("expenses").label("source"),
+            Expense.payment_method.label("payment_method"),
+            Expense.currency.label("currency"),
+            Expense.amount.label("amount")
+        ).where(Expense.session_id == session_id)
+
+        return union_all(sales, ar_payments, expenses).subquery("movements")
+
+    @staticmethod
+    def get_session_breakdown(db: Session, session_id: int):
+        """Totales por origen y método de pago (USD y VES) en una sola consulta."""
+        movements = CashService._session_movements(session_id)
+        rows = db.query(
+            movements.c.source,
+            movements.c.payment_method,
+            func.sum(case((movements.c.currency == "USD", movements.c.amount), else_=0)).label("total_usd"),
+            func.sum(case((movements.c.currency == "VES", movements.c.amount), else_=0)).label("total_ves"),
+            func.count().label("count")
+        ).group_by(movements.c.source, movements.c.payment_method).all()
+
+        return [
+            {
+                "source": row.source,
+                "payment_method": row.payment_method,
+                "total_usd": Decimal(str(row.total_usd or 0)),
+                "total_ves": Decimal(str(row.total_ves or 0)),
+                "count": row.count
+            }
+            for row in rows
+        ]
+
     @staticmethod
     def calculate_session_summary(db: Session, session_id: int):
         session = db.query(CashSession).filter(CashSession.id == session_id).first()
         if not session:
             return None
-        
+
         # 1. Opening amounts
         opening_usd = session.opening_amount or Decimal(0)
         opening_ves = session.opening_amount_ves or Decimal(0)
-        
-        # 2. Sum cash payments from direct sales (filtered by physical currency)
-        cash_sales_usd = db.query(func.sum(Payment.amount_usd)).filter(
-            Payment.session_id == session_id,
-            Payment.payment_method.ilike("cash"),
-            Payment.currency == "USD"
-        ).scalar() or Decimal(0)
 
-        cash_sales_ves = db.query(func.sum(Payment.amount_ves)).filter(
-            Payment.session_id == session_id,
-            Payment.payment_method.ilike("cash"),
-            Payment.currency == "VES"
-        ).scalar() or Decimal(0)
-        
-        # 3. Sum cash payments from accounts receivable (filtered by physical currency)
-        cash_ar_usd = db.query(func.sum(CustomerPayment.amount_usd)).filter(
-            CustomerPayment.session_id == session_id,
-            CustomerPayment.payment_method.ilike("cash"),
-            CustomerPayment.currency == "USD"
-        ).scalar() or Decimal(0)
+        # 2. Ventas, abonos y gastos de la sesión agrupados por método (una sola consulta)
+        by_method = CashService.get_session_breakdown(db, session_id)
 
-        cash_ar_ves = db.query(func.sum(CustomerPayment.amount_ves)).filter(
-            CustomerPayment.session_id == session_id,
-            CustomerPayment.payment_method.ilike("cash"),
-            CustomerPayment.currency == "VES"
-        ).scalar() or Decimal(0)
-        
-        # 4. Subtract cash expenses
-        cash_expenses_usd = db.query(func.sum(Expense.amount)).filter(
-            Expense.session_id == session_id,
-            Expense.payment_method.ilike("cash"),
-            Expense.currency == "USD"
-        ).scalar() or Decimal(0)
+        cash_totals = {
+            (source, currency): Decimal(0)
+            for source in ("sales", "ar_payments", "expenses")
+            for currency in ("USD", "VES")
+        }
+        for row in by_method:
+            if row["payment_method"] == PaymentMethod.CASH.value:
+                cash_totals[(row["source"], "USD")] += row["total_usd"]
+                cash_totals[(row["source"], "VES")] += row["total_ves"]
+
+        cash_sales_usd = cash_totals[("sales", "USD")]
+        cash_sales_ves = cash_totals[("sales", "VES")]
+        cash_ar_usd = cash_totals[("ar_payments", "USD")]
+        cash_ar_ves = cash_totals[("ar_payments", "VES")]
+        cash_expenses_usd = cash_totals[("expenses", "USD")]
+        cash_expenses_ves = cash_totals[("expenses", "VES")]
 
-        cash_expenses_ves = db.query(func.sum(Expense.amount)).filter(
-            Expense.session_id == session_id,
-            Expense.payment_method.ilike("cash"),
-            Expense.currency == "VES"
-        ).scalar() or Decimal(0)
-        
         expected_closing_usd = opening_usd + cash_sales_usd + cash_ar_usd - cash_expenses_usd
         expected_closing_ves = opening_ves + cash_sales_ves + cash_ar_ves - cash_expenses_ves
-        
+
         return {
             "opening_amount_usd": opening_usd,
             "opening_amount_ves": opening_ves,
@@ -66,5 +104,6 @@ class CashService:
             "cash_expenses_usd": cash_expenses_usd,
             "cash_expenses_ves": cash_expenses_ves,
             "expected_closing_amount_usd": expected_closing_usd,
-            "expected_closing_amount_ves": expected_closing_ves
+            "expected_closing_amount_ves": expected_closing_ves,
+            "by_method": by_method
         }
@@ -0,0 +1,348 @@
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+from sqlalchemy import func, case, select, update, insert, literal, union_all
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.logging import get_logger
+from ..models.inventory import Product, Inventory, InventoryCostLayer
+from ..models.purchase import PurchaseOrder, PurchaseItem
+from ..models.repair import Repair, RepairItem
+from ..models.sale import Sale, SaleItem
+from .profit_loss_service import ProfitLossService
+from .technician_analytics_service import TechnicianAnalyticsService
+
+logger = get_logger("costing")
+
+COSTING_METHODS = ("fifo", "average")
+CENT = Decimal("0.01")
+
+def _least(a, b):
+    return case((a < b, a), else_=b)
+
+
+def _greatest(a, b):
+    return case((a > b, a), else_=b)
+
+
+class CostingService:
+    """
+    Motor de costeo de inventario basado en capas (inventory_cost_layers).
+
+    - Entradas (compras, devoluciones, ajustes) crean capas.
+    - Salidas (ventas, repuestos) consumen capas en orden FIFO con un UPDATE
+      set-based (suma acumulada vía window function), sin recorrer lotes en Python.
+    - El costo devuelto depende de INVENTORY_COSTING_METHOD: FIFO usa el costo
+      de las capas consumidas; 'average' usa el promedio ponderado de
+      Product.cost_usd (las capas se consumen igual para la valoración).
+    - Los ajustes manuales (edición de producto, importación CSV, ajuste de
+      stock) pasan por adjust: crean o consumen capas igual que compras y ventas.
+    """
+
+    @staticmethod
+    def method() -> str:
+        method = (settings.INVENTORY_COSTING_METHOD or "fifo").lower()
+        return method if method in COSTING_METHODS else "fifo"
+
+    @staticmethod
+    def current_cost(db: Session, product_id: int) -> Decimal:
+        """Costo unitario vigente del producto (cabeza FIFO o promedio)."""
+        cost = None
+        if CostingService.method() == "fifo":
+            cost = db.query(InventoryCostLayer.unit_cost_usd).filter(
+                InventoryCostLayer.product_id == product_id,
+                InventoryCostLayer.remaining_quantity > 0
+            ).order_by(InventoryCostLayer.id).limit(1).scalar()
+        if cost is None:
+            cost = db.query(Product.cost_usd).filter(Product.id == product_id).scalar()
+
+        return Decimal(str(cost or 0)).quantize(CENT, ROUND_HALF_UP)
+
+    @staticmethod
+    def add_layer(
+        db: Session,
+        product_id: int,
+        quantity: int,
+        unit_cost: Decimal,
+        source_type: str,
+        source_id: Optional[int] = None
+    ) -> None:
+        """
+        Registra una entrada de stock. Debe llamarse antes de sumar la cantidad
+        en Inventory: con el método 'average' recalcula Product.cost_usd con el
+        stock previo.
+        """
+        if quantity <= 0:
+            return
+        unit_cost = Decimal(str(unit_cost or 0))
+        db.add(InventoryCostLayer(
+            product_id=product_id,
+            source_type=source_type,
+            source_id=source_id,
+            quantity=quantity,
+            remaining_quantity=quantity,
+            unit_cost_usd=unit_cost
+        ))
+
+        if CostingService.method() == "average":
+            on_hand = select(
+                case((Inventory.quantity > 0, Inventory.quantity), else_=0)
+            ).where(Inventory.product_id == product_id).scalar_subquery()
+            on_hand = func.coalesce(on_hand, 0)
+            db.execute(
+                update(Product)
+                .where(Product.id == product_id)
+                .values(cost_usd=func.round(
+                    (on_hand * func.coalesce(Product.cost_usd, 0) + quantity * unit_cost) / (on_hand + quantity), 2
+                ))
+                .execution_options(synchronize_session="fetch")
+            )
+
+    @staticmethod
+    def adjust(db: Session, product_id: int, delta: int, unit_cost: Decimal, source_type: str = "adjustment") -> None:
+        """
+        Ajuste manual de stock: una entrada crea una capa y una salida consume
+        las más antiguas. Debe llamarse antes de cambiar Inventory.quantity.
+        """
+        if delta > 0:
+            CostingService.add_layer(db, product_id, delta, unit_cost, source_type)
+        elif delta < 0:
+            CostingService.consume(db, product_id, -delta)
+
+    @staticmethod
+    def add_purchase_layers(db: Session, purchase_id: int) -> int:
+        """Una capa por línea de la orden de compra (INSERT ... SELECT)."""
+        result = db.execute(
+            insert(InventoryCostLayer).from_select(
+                ["product_id", "source_type", "source_id", "quantity", "remaining_quantity", "unit_cost_usd"],
+                select(
+                    PurchaseItem.product_id,
+                    literal("purchase"),
+                    PurchaseItem.purchase_id,
+                    PurchaseItem.quantity,
+                    PurchaseItem.quantity,
+                    PurchaseItem.unit_cost_usd
+                ).where(
+                    PurchaseItem.purchase_id == purchase_id,
+                    PurchaseItem.quantity > 0
+                ).order_by(PurchaseItem.id)
+            )
+        )
+        return result.rowcount
+
+    @staticmethod
+    def consume(db: Session, product_id: int, quantity: int) -> Decimal:
+        """
+        Consume `quantity` unidades de las capas más antiguas y devuelve el
+        costo unitario a registrar en la línea (venta o repuesto).
+        """
+        if quantity <= 0:
+            return CostingService.current_cost(db, product_id)
+
+        # Serializa el consumo del mismo producto
+        fallback_cost = db.query(Product.cost_usd).filter(Product.id == product_id).with_for_update().scalar()
+        fallback_cost = Decimal(str(fallback_cost or 0))
+
+        layers = InventoryCostLayer
+        ordered = select(
+            layers.id.label("id"),
+            layers.remaining_quantity.label("remaining"),
+            layers.unit_cost_usd.label("unit_cost"),
+            (func.sum(layers.remaining_quantity).over(order_by=layers.id) - layers.remaining_quantity).label("before")
+        ).where(
+            layers.product_id == product_id,
+            layers.remaining_quantity > 0
+        ).subquery("ordered")
+        take = _least(ordered.c.remaining, quantity - ordered.c.before)
+
+        taken, taken_cost = db.execute(
+            select(
+                func.coalesce(func.sum(take), 0),
+                func.coalesce(func.sum(take * ordered.c.unit_cost), 0)
+            ).where(ordered.c.before < quantity)
+        ).one()
+
+        if taken:
+            db.execute(
+                update(layers)
+                .where(layers.id == ordered.c.id, ordered.c.before < quantity)
+                .values(remaining_quantity=layers.remaining_quantity - take)
+                .execution_options(synchronize_session=False)
+            )
+
+        if CostingService.method() == "average":
+            return fallback_cost.quantize(CENT, ROUND_HALF_UP)
+
+        # Stock sin capas (anterior al motor de costeo): costo del producto
+        shortfall = quantity - int(taken)
+        total_cost = Decimal(str(taken_cost)) + shortfall * fallback_cost
+        return (total_cost / quantity).quantize(CENT, ROUND_HALF_UP)
+
+    @staticmethod
+    def _consumptions():
+        """Salidas históricas (ventas y repuestos) con su posición acumulada por producto."""
+        lines = union_all(
+            select(
+                literal("sale").label("kind"),
+                SaleItem.id.label("line_id"),
+                SaleItem.product_id.label("product_id"),
+                SaleItem.quantity.label("quantity"),
+                Sale.created_at.label("moved_at")
+            ).join(Sale, Sale.id == SaleItem.sale_id).where(SaleItem.quantity > 0),
+            select(
+                literal("repair").label("kind"),
+                RepairItem.id.label("line_id"),
+                RepairItem.product_id.label("product_id"),
+                RepairItem.quantity.label("quantity"),
+                Repair.created_at.label("moved_at")
+            ).join(Repair, Repair.id == RepairItem.repair_id).where(RepairItem.quantity > 0)
+        ).subquery("lines")
+        end = func.sum(lines.c.quantity).over(
+            partition_by=lines.c.product_id,
+            order_by=(lines.c.moved_at, lines.c.kind, lines.c.line_id)
+        )
+        return select(
+            lines.c.kind, lines.c.line_id, lines.c.product_id, lines.c.quantity,
+            (end - lines.c.quantity).label("start"), end.label("end")
+        ).subquery("consumptions")
+
+    @staticmethod
+    def _layer_positions():
+        end = func.sum(InventoryCostLayer.quantity).over(
+            partition_by=InventoryCostLayer.product_id,
+            order_by=InventoryCostLayer.id
+        )
+        return select(
+            InventoryCostLayer.id,
+            InventoryCostLayer.product_id,
+            InventoryCostLayer.quantity,
+            InventoryCostLayer.unit_cost_usd,
+            (end - InventoryCostLayer.quantity).label("start"),
+            end.label("end")
+        ).subquery("positions")
+
+    @staticmethod
+    def rebuild(db: Session) -> dict:
+        """
+        Backfill: reconstruye las capas desde las compras recibidas y recalcula
+        el COGS histórico (SaleItem.unit_cost_usd y RepairItem.unit_cogs_usd)
+        emparejando intervalos acumulados de entradas y salidas (FIFO) en SQL.
+
+        El stock que no se explica por compras se registra como una capa
+        'opening' al costo actual del producto.
+        """
+        started = time.perf_counter()
+        layers = InventoryCostLayer.__table__
+        layer_columns = ["product_id", "source_type", "source_id", "quantity", "remaining_quantity", "unit_cost_usd"]
+
+        db.execute(layers.delete())
+
+        # 1. Capa de apertura = salidas + stock actual - compras recibidas
+        received = (
+            select(PurchaseItem.product_id, func.sum(PurchaseItem.quantity).label("quantity"))
+            .join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.purchase_id)
+            .where(PurchaseOrder.status == "received")
+            .group_by(PurchaseItem.product_id)
+            .subquery("received")
+        )
+        consumptions = CostingService._consumptions()
+        consumed = (
+            select(consumptions.c.product_id, func.sum(consumptions.c.quantity).label("quantity"))
+            .group_by(consumptions.c.product_id)
+            .subquery("consumed")
+        )
+        on_hand = func.coalesce(case((Inventory.quantity > 0, Inventory.quantity), else_=0), 0)
+        opening_qty = func.coalesce(consumed.c.quantity, 0) + on_hand - func.coalesce(received.c.quantity, 0)
+        opening = (
+            select(
+                Product.id, literal("opening"), literal(None), opening_qty, opening_qty, Product.cost_usd
+            )
+            .select_from(Product)
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .outerjoin(received, received.c.product_id == Product.id)
+            .outerjoin(consumed, consumed.c.product_id == Product.id)
+            .where(opening_qty > 0)
+            .order_by(Product.id)
+        )
+        db.execute(insert(InventoryCostLayer).from_select(layer_columns, opening))
+
+        # 2. Capas de compras en orden de recepción
+        db.execute(insert(InventoryCostLayer).from_select(
+            layer_columns,
+            select(
+                PurchaseItem.product_id, literal("purchase"), PurchaseItem.purchase_id,
+                PurchaseItem.quantity, PurchaseItem.quantity, PurchaseItem.unit_cost_usd
+            )
+            .join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.purchase_id)
+            .where(PurchaseOrder.status == "received", PurchaseItem.quantity > 0)
+            .order_by(PurchaseOrder.received_date, PurchaseItem.id)
+        ))
+
+        # 3. Costo de cada salida = solapamiento de intervalos con las capas
+        positions = CostingService._layer_positions()
+        overlap = _least(positions.c.end, consumptions.c.end) - _greatest(positions.c.start, consumptions.c.start)
+        line_costs = (
+            select(
+                consumptions.c.kind,
+                consumptions.c.line_id,
+                func.round(func.sum(overlap * positions.c.unit_cost_usd) / consumptions.c.quantity, 2).label("unit_cost")
+            )
+            .join(positions, positions.c.product_id == consumptions.c.product_id)
+            .where(positions.c.start < consumptions.c.end, consumptions.c.start < positions.c.end)
+            .group_by(consumptions.c.kind, consumptions.c.line_id, consumptions.c.quantity)
+            .subquery("line_costs")
+        )
+        sales_updated = db.execute(
+            update(SaleItem)
+            .where(SaleItem.id == line_costs.c.line_id, line_costs.c.kind == "sale")
+            .values(unit_cost_usd=line_costs.c.unit_cost)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        repairs_updated = db.execute(
+            update(RepairItem)
+            .where(RepairItem.id == line_costs.c.line_id, line_costs.c.kind == "repair")
+            .values(unit_cogs_usd=line_costs.c.unit_cost)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        # 4. Remanente de cada capa tras todas las salidas
+        remaining = (
+            select(
+                positions.c.id,
+                _greatest(
+                    _least(positions.c.end - _greatest(positions.c.start, func.coalesce(consumed.c.quantity, 0)), positions.c.quantity),
+                    0
+                ).label("remaining")
+            )
+            .select_from(positions)
+            .outerjoin(consumed, consumed.c.product_id == positions.c.product_id)
+            .subquery("remaining")
+        )
+        db.execute(
+            update(InventoryCostLayer)
+            .where(InventoryCostLayer.id == remaining.c.id)
+            .values(remaining_quantity=remaining.c.remaining)
+            .execution_options(synchronize_session=False)
+        )
+        layer_count = db.execute(select(func.count()).select_from(layers)).scalar()
+        # El COGS histórico cambió con UPDATEs masivos: todo el P&L cacheado queda viejo
+        ProfitLossService.invalidate(db)
+        db.commit()
+        if repairs_updated:
+            # El UPDATE masivo no pasa por los listeners: recalcular el costo de
+            # repuestos del resumen técnico de las reparaciones con repuestos
+            TechnicianAnalyticsService.refresh(db, db.execute(select(RepairItem.repair_id).distinct()).scalars())
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(
+            "Inventory cost layers rebuilt",
+            layers=layer_count, sale_items=sales_updated, repair_items=repairs_updated, elapsed_ms=elapsed_ms
+        )
+        return {
+            "layers": layer_count,
+            "sale_items_updated": sales_updated,
+            "repair_items_updated": repairs_updated,
+            "elapsed_ms": elapsed_ms
+        }
@@ -1,66 +1,222 @@
-import httpx
-import re
+import bisect
+import time
+from dataclasses import dataclass
 from decimal import Decimal
 from datetime import date
+from typing import Iterable, Optional, Tuple
+import numpy as np
+from sqlalchemy import event, func
 from sqlalchemy.orm import Session
 from ..models.finance import ExchangeRate
 from ..core.cache import cache
+from ..core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+CURRENT_RATE_CACHE_KEY = "current_exchange_rate"
+# Contador en Redis que store_rate incrementa: los demás workers lo comparan
+# con la versión de su índice (un GET por lectura, sin tocar la tabla)
+RATE_VERSION_KEY = "exchange_rates:version"
+# Sin Redis, la firma de la tabla se consulta como mucho cada tantos segundos
+RATE_FALLBACK_CHECK_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class RateIndex:
+    """Foto inmutable del historial de tasas; se reemplaza completa, nunca se modifica."""
+    dates: Tuple[date, ...]
+    days: np.ndarray
+    rates: np.ndarray
+    version: tuple
+
+
+# Índice ordenado effective_date -> rate, por proceso. Los lectores toman la
+# referencia una vez y usan fechas y tasas de la misma foto.
+_rate_index: Optional[RateIndex] = None
+# Cambios hechos en este proceso (listeners / store_rate)
+_local_generation = 0
+# (firma de la tabla, momento de la consulta) cuando no hay Redis
+_fallback_version: tuple = (None, 0.0)
+
 class CurrencyService:
-    BCV_URL = "https://www.bcv.org.ve/"
-    
     @classmethod
     async def fetch_bcv_rate(cls) -> Decimal:
-        """Fetch the official USD/VES rate from BCV website."""
-        try:
-            async with httpx.AsyncClient(verify=False, timeout=10.0) as client:
-                response = await client.get(cls.BCV_URL)
-                response.raise_for_status()
-                
-                # Regex to find the dollar rate in the BCV page
-                # The BCV page has something like: <div id="dolar"> <strong> 36,5432 </strong> </div>
-                match = re.search(r'id="dolar".*?<strong>\s*([\d,.]+)\s*</strong>', response.text, re.DOTALL)
-                if match:
-                    rate_str = match.group(1).replace(',', '.')
-                    return Decimal(rate_str)
-                
-                logger.error("Could not find dollar rate in BCV response")
-                return None
-        except Exception as e:
-            logger.error(f"Error fetching BCV rate: {e}")
-            return None
+        """Fetch the official USD/VES rate from BCV website (shared client, retries)."""
+        from .rate_ingestion_service import BCVSource, RateIngestionService
+        quote = await RateIngestionService.fetch_with_retries(BCVSource(settings.BCV_URL))
+        return quote.rate if quote else None
 
     @classmethod
-    async def update_official_rate(cls, db: Session):
-        """Fetch and update the official rate in the database."""
-        rate = await cls.fetch_bcv_rate()
-        if not rate:
-            return None
-        
-        today = date.today()
-        # Check if rate for today exists
-        existing = db.query(ExchangeRate).filter(ExchangeRate.effective_date == today).first()
+    async def update_official_rate(cls, db: Session = None):
+        """
+        Fetch and update the official rate in the database.
+
+        Delegates to RateIngestionService (source fallback; the DB write runs
+        in a worker thread with its own session, `db` is kept for callers).
+        """
+        from .rate_ingestion_service import RateIngestionService
+        rate = await RateIngestionService.ingest()
+        return rate.rate if rate else None
+
+    @classmethod
+    def store_rate(cls, db: Session, rate: Decimal, source: str, effective_date: Optional[date] = None,
+                   overwrite: bool = True) -> ExchangeRate:
+        """
+        Crea o actualiza la tasa de una fecha y recalcula cuál queda activa.
+        Con overwrite=False (fuentes de respaldo) una tasa ya guardada se deja intacta.
+        """
+        effective_date = effective_date or date.today()
+        existing = db.query(ExchangeRate).filter(ExchangeRate.effective_date == effective_date).first()
         
+        if existing and not overwrite:
+            return existing
         if existing:
             existing.rate = rate
-            existing.source = "BCV (Auto)"
+            existing.source = source
         else:
-            # Deactivate current
-            db.query(ExchangeRate).filter(ExchangeRate.is_active == True).update({"is_active": False})
-            
-            new_rate = ExchangeRate(
+            existing = ExchangeRate(
                 rate=rate,
-                source="BCV (Auto)",
-                effective_date=today,
-                is_active=True
+                source=source,
+                effective_date=effective_date,
+                is_active=False
             )
-            db.add(new_rate)
+            db.add(existing)
         
+        db.flush()
+        cls.sync_active(db)
         db.commit()
-        # Clear cache
-        cache.delete("current_exchange_rate")
-        return rate
+        # Clear cache and tell the other workers to reload their index
+        cache.delete(cls.current_rate_cache_key())
+        cache.incr(RATE_VERSION_KEY)
+        cls.invalidate_rates()
+        return existing
+
+    @classmethod
+    def sync_active(cls, db: Session) -> None:
+        """Deja is_active solo en la tasa vigente hoy (la última con effective_date <= hoy)."""
+        current_id = db.query(ExchangeRate.id).filter(
+            ExchangeRate.effective_date <= date.today()
+        ).order_by(ExchangeRate.effective_date.desc()).limit(1).scalar()
+        db.query(ExchangeRate).filter(
+            ExchangeRate.is_active == True, ExchangeRate.id != current_id
+        ).update({"is_active": False}, synchronize_session="fetch")
+        if current_id is not None:
+            db.query(ExchangeRate).filter(
+                ExchangeRate.id == current_id, ExchangeRate.is_active != True
+            ).update({"is_active": True}, synchronize_session="fetch")
+
+    @classmethod
+    def current_rate_cache_key(cls) -> str:
+        # Por día: una tasa con fecha futura pasa a ser la vigente sin escritura
+        return f"{CURRENT_RATE_CACHE_KEY}:{date.today().isoformat()}"
+
+    # --- Índice histórico de tasas ---
+
+    @classmethod
+    def invalidate_rates(cls) -> None:
+        global _local_generation
+        _local_generation += 1
+
+    @classmethod
+    def _table_signature(cls, db: Session) -> tuple:
+        count, last_id, total = db.query(
+            func.count(ExchangeRate.id), func.max(ExchangeRate.id), func.sum(ExchangeRate.rate)
+        ).one()
+        return count, last_id, Decimal(str(total)) if total is not None else None
+
+    @classmethod
+    def _version(cls, db: Session) -> tuple:
+        global _fallback_version
+        if cache.redis_client is not None:
+            return _local_generation, cache.get(RATE_VERSION_KEY) or 0
+        signature, checked_at = _fallback_version
+        if signature is None or time.monotonic() - checked_at > RATE_FALLBACK_CHECK_SECONDS:
+            signature = cls._table_signature(db)
+            _fallback_version = (signature, time.monotonic())
+        return _local_generation, signature
+
+    @classmethod
+    def _index(cls, db: Session) -> RateIndex:
+        global _rate_index
+        version = cls._version(db)
+        index = _rate_index
+        if index is None or index.version != version:
+            rows = db.query(ExchangeRate.effective_date, ExchangeRate.rate).order_by(ExchangeRate.effective_date).all()
+            index = RateIndex(
+                dates=tuple(row.effective_date for row in rows),
+                days=np.array([row.effective_date for row in rows], dtype="datetime64[D]"),
+                rates=np.array([Decimal(str(row.rate)) for row in rows], dtype=object),
+                version=version,
+            )
+            _rate_index = index
+        return index
+
+    @classmethod
+    def _position(cls, index: RateIndex, day: date) -> int:
+        return bisect.bisect_right(index.dates, day) - 1
+
+    @classmethod
+    def rate_on(cls, db: Session, day: date) -> Optional[Decimal]:
+        """Tasa vigente en una fecha (la última con effective_date <= day), búsqueda binaria."""
+        index = cls._index(db)
+        position = cls._position(index, day)
+        return index.rates[position] if position >= 0 else None
+
+    @classmethod
+    def current_rate(cls, db: Session) -> Optional[Decimal]:
+        """Tasa vigente hoy; única definición de "tasa actual" (handlers, deps y ventas)."""
+        return cls.rate_on(db, date.today())
+
+    @classmethod
+    def current_rate_record(cls, db: Session) -> Optional[ExchangeRate]:
+        """Fila de la tasa vigente hoy, elegida con el mismo índice que current_rate."""
+        index = cls._index(db)
+        position = cls._position(index, date.today())
+        if position < 0:
+            return None
+        return db.query(ExchangeRate).filter(ExchangeRate.effective_date == index.dates[position]).first()
+
+    @classmethod
+    def rates_on(cls, db: Session, days: Iterable) -> np.ndarray:
+        """Tasa vigente para cada fecha (vectorizado); None donde no hay tasa previa."""
+        index = cls._index(db)
+        days = np.asarray(list(days), dtype="datetime64[D]")
+        positions = np.searchsorted(index.days, days, side="right") - 1
+        rates = np.full(len(days), None, dtype=object)
+        found = positions >= 0
+        rates[found] = index.rates[positions[found]]
+        return rates
+
+    @classmethod
+    def convert(cls, db: Session, amounts: Iterable, days: Iterable, to_currency: str = "VES") -> np.ndarray:
+        """
+        Convierte una columna completa de montos a la tasa de su fecha
+        (USD -> VES o VES -> USD). Devuelve Decimal redondeado a 2 decimales;
+        None donde no hay tasa.
+        """
+        amounts = np.array([Decimal(str(value or 0)) for value in amounts], dtype=object)
+        rates = cls.rates_on(db, days)
+        converted = np.full(len(amounts), None, dtype=object)
+        found = np.array([rate is not None and rate != 0 for rate in rates], dtype=bool)
+        if to_currency == "VES":
+            converted[found] = amounts[found] * rates[found]
+        else:
+            converted[found] = amounts[found] / rates[found]
+        return np.array(
+            [value.quantize(Decimal("0.01")) if value is not None else None for value in converted],
+            dtype=object
+        )
+
+
+def _mark_rates_stale(mapper, connection, target) -> None:
+    CurrencyService.invalidate_rates()
+
+
+def register_rate_index_listeners() -> None:
+    """Invalida el índice de tasas cuando se crea, modifica o borra una ExchangeRate."""
+    if event.contains(ExchangeRate, "after_insert", _mark_rates_stale):
+        return
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(ExchangeRate, event_name, _mark_rates_stale)
 
@@ -0,0 +1,302 @@
+import csv
+import io
+import os
+import re
+import tempfile
+import time
+import uuid
+from typing import Optional
+
+from sqlalchemy import (
+    Table, Column, Integer, String, Text, MetaData, Index,
+    select, update, insert, func, case, literal, and_, exists
+)
+from sqlalchemy.orm import Session
+
+from ..core.logging import get_logger
+from ..models.customer import Customer
+from .activity_service import record_activity
+
+logger = get_logger("customer_import")
+
+REJECTS_DIR = os.path.join(tempfile.gettempdir(), "serviceflow_import_rejects")
+REJECT_TOKEN_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+# Los rechazos contienen datos personales: se borran pasado este tiempo
+REJECTS_TTL_SECONDS = 24 * 60 * 60
+IMPORT_COLUMNS = ("name", "dni", "email", "phone", "address", "payment_terms")
+
+
+def _staging_table() -> Table:
+    metadata = MetaData()
+    staging = Table(
+        "customer_import_staging",
+        metadata,
+        Column("row_no", Integer, primary_key=True),
+        Column("name", Text),
+        Column("dni", Text),
+        Column("email", Text),
+        Column("phone", Text),
+        Column("address", Text),
+        Column("payment_terms", Text),
+        Column("match_key", Text),
+        Column("customer_id", Integer),
+        Column("reject_reason", String(100)),
+        prefixes=["TEMPORARY"],
+    )
+    Index("ix_customer_import_staging_match_key", staging.c.match_key)
+    return staging
+
+
+class CustomerImportService:
+    """
+    Importación masiva de clientes por etapas:
+
+    1. El CSV se normaliza y se carga en una tabla temporal
+       (COPY en PostgreSQL, executemany en otros motores).
+    2. Validación y deduplicación en SQL (dentro del archivo y contra
+       clientes existentes por DNI o, si no hay DNI, por email).
+    3. Merge con un UPDATE ... FROM y un INSERT ... SELECT.
+
+    Objetivo de rendimiento: 50.000 filas en menos de 5 s en PostgreSQL.
+    Las filas rechazadas quedan en un CSV descargable por REJECTS_TTL_SECONDS.
+    """
+
+    @staticmethod
+    def parse_csv(contents: bytes):
+        """Decodifica el archivo y devuelve (encabezados normalizados, filas)."""
+        try:
+            decoded = contents.decode("utf-8-sig")
+        except UnicodeDecodeError:
+            decoded = contents.decode("latin-1")
+
+        delimiter = ","
+        if ";" in decoded and decoded.count(";") > decoded.count(","):
+            delimiter = ";"
+
+        reader = csv.reader(io.StringIO(decoded), delimiter=delimiter)
+        header = next(reader, None)
+        if not header:
+            return [], []
+        fieldnames = [field.strip().lower().replace("ï»¿", "") for field in header]
+        positions = {name: fieldnames.index(name) for name in IMPORT_COLUMNS if name in fieldnames}
+
+        rows = []
+        for row_no, values in enumerate(reader, start=2):  # fila 1 = encabezado
+            if not any(values):
+                continue
+            record = {"row_no": row_no}
+            for name in IMPORT_COLUMNS:
+                index = positions.get(name)
+                value = values[index].strip() if index is not None and index < len(values) else ""
+                record[name] = value or None
+            rows.append(record)
+        return fieldnames, rows
+
+    @staticmethod
+    def _load_staging(db: Session, staging: Table, rows: list) -> None:
+        connection = db.connection()
+        staging.create(bind=connection)  # incluye el índice sobre match_key
+
+        if connection.dialect.name == "postgresql":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for record in rows:
+                writer.writerow([record["row_no"], *[record[name] for name in IMPORT_COLUMNS]])
+            buffer.seek(0)
+            columns = ", ".join(("row_no",) + IMPORT_COLUMNS)
+            # COPY trata el campo vacío sin comillas como NULL
+            cursor = connection.connection.dbapi_connection.cursor()
+            cursor.copy_expert(f"COPY customer_import_staging ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        elif rows:
+            connection.execute(staging.insert(), rows)
+
+    @staticmethod
+    def _validate(db: Session, staging: Table) -> None:
+        s = staging.c
+        if db.get_bind().dialect.name == "postgresql":
+            invalid_terms = s.payment_terms.op("!~")(r"^[0-9]{1,4}$")
+        else:
+            invalid_terms = (s.payment_terms.op("GLOB")("*[^0-9]*")) | (func.length(s.payment_terms) > 4)
+
+        db.execute(update(staging).values(
+            reject_reason=case(
+                (s.name.is_(None), "Nombre vacío"),
+                (func.length(s.name) > 200, "Nombre excede 200 caracteres"),
+                (func.length(s.dni) > 20, "DNI excede 20 caracteres"),
+                (func.length(s.phone) > 20, "Teléfono excede 20 caracteres"),
+                (func.length(s.email) > 255, "Email excede 255 caracteres"),
+                (and_(s.email.isnot(None), s.email.notlike("%_@_%")), "Email inválido"),
+                (and_(s.payment_terms.isnot(None), invalid_terms), "payment_terms inválido"),
+                else_=None
+            ),
+            match_key=case(
+                (s.dni.isnot(None), literal("dni:") + s.dni),
+                (s.email.isnot(None), literal("email:") + s.email),
+                else_=None
+            )
+        ))
+
+        # Duplicados dentro del archivo: gana la última aparición
+        later = staging.alias("later")
+        db.execute(
+            update(staging)
+            .where(
+                s.reject_reason.is_(None),
+                s.match_key.isnot(None),
+                exists().where(
+                    later.c.match_key == s.match_key,
+                    later.c.row_no > s.row_no,
+                    later.c.reject_reason.is_(None)
+                )
+            )
+            .values(reject_reason="Duplicado en archivo")
+        )
+
+        # Cliente existente: por DNI o, si la fila no trae DNI, por email
+        db.execute(
+            update(staging)
+            .where(s.reject_reason.is_(None), s.dni.isnot(None))
+            .values(customer_id=select(func.min(Customer.id)).where(Customer.dni == s.dni).scalar_subquery())
+        )
+        db.execute(
+            update(staging)
+            .where(s.reject_reason.is_(None), s.dni.is_(None), s.email.isnot(None))
+            .values(customer_id=select(func.min(Customer.id)).where(Customer.email == s.email).scalar_subquery())
+        )
+        # Dos filas (una por DNI y otra por email) pueden apuntar al mismo cliente
+        db.execute(
+            update(staging)
+            .where(
+                s.reject_reason.is_(None),
+                s.customer_id.isnot(None),
+                exists().where(
+                    later.c.customer_id == s.customer_id,
+                    later.c.row_no > s.row_no,
+                    later.c.reject_reason.is_(None)
+                )
+            )
+            .values(reject_reason="Duplicado en archivo")
+        )
+
+    @staticmethod
+    def _merge(db: Session, staging: Table) -> dict:
+        s = staging.c
+        valid = s.reject_reason.is_(None)
+
+        updated = db.execute(
+            update(Customer)
+            .where(Customer.id == s.customer_id, valid)
+            .values(
+                name=s.name,
+                email=func.coalesce(s.email, Customer.email),
+                phone=func.coalesce(s.phone, Customer.phone),
+                address=func.coalesce(s.address, Customer.address),
+                payment_terms=func.coalesce(func.cast(s.payment_terms, Integer), Customer.payment_terms)
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        # Los defaults del modelo son del lado de Python: se incluyen explícitamente
+        created = db.execute(
+            insert(Customer).from_select(
+                [
+                    "name", "dni", "email", "phone", "address", "payment_terms",
+                    "country", "dni_type", "loyalty_points", "credit_limit",
+                    "current_debt", "credit_status", "credit_score"
+                ],
+                select(
+                    s.name, s.dni, s.email, s.phone, s.address,
+                    func.coalesce(func.cast(s.payment_terms, Integer), 30),
+                    literal("Venezuela"), literal("V"), literal(0), literal(0),
+                    literal(0), literal("active"), literal(100)
+                ).where(valid, s.customer_id.is_(None)).order_by(s.row_no)
+            )
+        ).rowcount
+
+        return {"created": created, "updated": updated}
+
+    @staticmethod
+    def _expired(path: str, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - os.path.getmtime(path) > REJECTS_TTL_SECONDS
+
+    @staticmethod
+    def purge_expired_rejects() -> int:
+        """Borra los archivos de rechazos con más de REJECTS_TTL_SECONDS."""
+        if not os.path.isdir(REJECTS_DIR):
+            return 0
+        now = time.time()
+        removed = 0
+        for filename in os.listdir(REJECTS_DIR):
+            path = os.path.join(REJECTS_DIR, filename)
+            try:
+                if CustomerImportService._expired(path, now):
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue  # Otro worker lo borró
+        return removed
+
+    @staticmethod
+    def _write_rejects(db: Session, staging: Table) -> Optional[str]:
+        CustomerImportService.purge_expired_rejects()
+        s = staging.c
+        rejects = db.execute(
+            select(s.row_no, *[s[name] for name in IMPORT_COLUMNS], s.reject_reason)
+            .where(s.reject_reason.isnot(None))
+            .order_by(s.row_no)
+        )
+        token = uuid.uuid4().hex
+        os.makedirs(REJECTS_DIR, exist_ok=True)
+        path = os.path.join(REJECTS_DIR, f"{token}.csv")
+        count = 0
+        with open(path, "w", newline="", encoding="utf-8") as handle:
+            writer = csv.writer(handle)
+            writer.writerow(["fila", *IMPORT_COLUMNS, "motivo"])
+            for row in rejects:
+                writer.writerow(list(row))
+                count += 1
+        if not count:
+            os.remove(path)
+            return None
+        return token
+
+    @staticmethod
+    def reject_file_path(token: str) -> Optional[str]:
+        if not REJECT_TOKEN_PATTERN.match(token):
+            return None
+        path = os.path.join(REJECTS_DIR, f"{token}.csv")
+        if not os.path.exists(path):
+            return None
+        if CustomerImportService._expired(path):
+            CustomerImportService.purge_expired_rejects()
+            return None
+        return path
+
+    @staticmethod
+    def import_rows(db: Session, rows: list) -> dict:
+        started = time.perf_counter()
+        staging = _staging_table()
+        try:
+            CustomerImportService._load_staging(db, staging, rows)
+            CustomerImportService._validate(db, staging)
+            stats = CustomerImportService._merge(db, staging)
+            if stats["created"]:
+                # Un solo evento en el feed por importación (el INSERT en bloque no pasa por el ORM)
+                record_activity(
+                    db.connection(), "customer", "Clientes Importados",
+                    f"{stats['created']} clientes nuevos desde CSV"
+                )
+            stats["reject_token"] = CustomerImportService._write_rejects(db, staging)
+            stats["errors"] = db.execute(
+                select(func.count()).select_from(staging).where(staging.c.reject_reason.isnot(None))
+            ).scalar()
+            staging.drop(bind=db.connection())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        stats["rows"] = len(rows)
+        stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        logger.info("Customer import completed", **stats)
+        return stats
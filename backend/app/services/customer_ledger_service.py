@@ -0,0 +1,208 @@
+import time
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update, literal, or_
+from sqlalchemy.orm import Session
+
+from ..core.logging import get_logger
+from ..models.customer import Customer
+from ..models.finance import AccountReceivable, CustomerPayment, CustomerLedgerEntry
+
+logger = get_logger("customer_ledger")
+
+# Diferencias menores se consideran redondeo
+DRIFT_TOLERANCE = Decimal("0.005")
+BLOCKED_CREDIT_STATUSES = ("blocked", "suspended")
+
+
+class CustomerLedgerService:
+    """
+    Libro de crédito por cliente (customer_ledger_entries) con el saldo
+    denormalizado en customers.current_debt.
+
+    - post: inserta el movimiento y ajusta current_debt con un único
+      UPDATE ... RETURNING (sin leer-modificar-escribir en Python).
+    - check_credit: validación de límite en checkout con una lectura por PK.
+    - reconcile: detecta y corrige en bloque las diferencias contra las
+      cuentas por cobrar abiertas.
+    """
+
+    @staticmethod
+    def post(
+        db: Session,
+        customer_id: int,
+        amount: Decimal,
+        entry_type: str,
+        account_id: Optional[int] = None,
+        payment_id: Optional[int] = None,
+        description: Optional[str] = None,
+        created_by: Optional[int] = None
+    ) -> CustomerLedgerEntry:
+        amount = Decimal(str(amount))
+        balance_after = db.execute(
+            update(Customer)
+            .where(Customer.id == customer_id)
+            .values(current_debt=func.coalesce(Customer.current_debt, 0) + amount)
+            .returning(Customer.current_debt)
+        ).scalar_one()
+
+        entry = CustomerLedgerEntry(
+            customer_id=customer_id,
+            entry_type=entry_type,
+            amount=amount,
+            balance_after=balance_after,
+            account_id=account_id,
+            payment_id=payment_id,
+            description=description,
+            created_by=created_by
+        )
+        db.add(entry)
+        return entry
+
+    @staticmethod
+    def record_charge(db: Session, account: AccountReceivable) -> CustomerLedgerEntry:
+        """Registra el saldo pendiente de una cuenta por cobrar nueva."""
+        amount = Decimal(str(account.total_amount or 0)) - Decimal(str(account.paid_amount or 0))
+        return CustomerLedgerService.post(
+            db, account.customer_id, amount, "charge",
+            account_id=account.id,
+            description=account.notes,
+            created_by=account.created_by
+        )
+
+    @staticmethod
+    def record_payment(db: Session, payment: CustomerPayment) -> CustomerLedgerEntry:
+        """Registra un abono. El pago debe estar ya en la sesión (con id)."""
+        return CustomerLedgerService.post(
+            db, payment.customer_id, -Decimal(str(payment.amount_usd)), "payment",
+            account_id=payment.account_id,
+            payment_id=payment.id,
+            description=f"Abono ({payment.payment_method})",
+            created_by=payment.created_by
+        )
+
+    @staticmethod
+    def check_credit(db: Session, customer_id: int, amount: Decimal) -> None:
+        """
+        Verifica que el cliente pueda financiar `amount`. Bloquea la fila del
+        cliente hasta el commit para que dos ventas simultáneas no superen
+        juntas el límite. Un credit_limit en 0 significa sin límite.
+        """
+        row = db.query(
+            Customer.current_debt, Customer.credit_limit, Customer.credit_status
+        ).filter(Customer.id == customer_id).with_for_update().first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+
+        if row.credit_status in BLOCKED_CREDIT_STATUSES:
+            raise HTTPException(status_code=400, detail=f"El crédito del cliente está {row.credit_status}")
+
+        debt = Decimal(str(row.current_debt or 0))
+        limit = Decimal(str(row.credit_limit or 0))
+        if limit > 0 and debt + Decimal(str(amount)) > limit:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Límite de crédito excedido: deuda ${debt:.2f} + ${Decimal(str(amount)):.2f} supera ${limit:.2f}"
+            )
+
+    @staticmethod
+    def _drift_query():
+        expected = (
+            select(
+                AccountReceivable.customer_id.label("customer_id"),
+                func.sum(AccountReceivable.total_amount - func.coalesce(AccountReceivable.paid_amount, 0)).label("balance")
+            )
+            .where(AccountReceivable.status != "paid")
+            .group_by(AccountReceivable.customer_id)
+            .subquery("expected")
+        )
+        ledger = (
+            select(
+                CustomerLedgerEntry.customer_id.label("customer_id"),
+                func.sum(CustomerLedgerEntry.amount).label("balance")
+            )
+            .group_by(CustomerLedgerEntry.customer_id)
+            .subquery("ledger")
+        )
+        expected_balance = func.coalesce(expected.c.balance, 0)
+        ledger_balance = func.coalesce(ledger.c.balance, 0)
+        current_debt = func.coalesce(Customer.current_debt, 0)
+
+        return (
+            select(
+                Customer.id.label("customer_id"),
+                current_debt.label("current_debt"),
+                ledger_balance.label("ledger_balance"),
+                expected_balance.label("expected_balance"),
+                (expected_balance - ledger_balance).label("adjustment")
+            )
+            .select_from(Customer)
+            .outerjoin(expected, expected.c.customer_id == Customer.id)
+            .outerjoin(ledger, ledger.c.customer_id == Customer.id)
+            .where(or_(
+                func.abs(current_debt - expected_balance) > DRIFT_TOLERANCE,
+                func.abs(ledger_balance - expected_balance) > DRIFT_TOLERANCE
+            ))
+        )
+
+    @staticmethod
+    def reconcile(db: Session, apply: bool = False, sample_size: int = 50) -> dict:
+        """
+        Compara current_debt y el saldo del libro contra las cuentas por cobrar
+        abiertas. Con apply=True inserta un ajuste por cliente descuadrado
+        (INSERT ... SELECT) y reescribe current_debt en un solo UPDATE.
+        En el primer uso sirve además como saldo inicial del libro.
+        """
+        started = time.perf_counter()
+        drift = CustomerLedgerService._drift_query().subquery("drift")
+
+        drifted = db.execute(select(func.count()).select_from(drift)).scalar() or 0
+        sample = [
+            {key: (float(value) if isinstance(value, Decimal) else value) for key, value in row._asdict().items()}
+            for row in db.execute(select(drift).order_by(drift.c.customer_id).limit(sample_size))
+        ]
+
+        adjusted = updated = 0
+        if apply and drifted:
+            adjusted = db.execute(
+                CustomerLedgerEntry.__table__.insert().from_select(
+                    ["customer_id", "entry_type", "amount", "balance_after", "description"],
+                    select(
+                        drift.c.customer_id,
+                        literal("adjustment"),
+                        drift.c.adjustment,
+                        drift.c.expected_balance,
+                        literal("Conciliación contra cuentas por cobrar")
+                    ).where(func.abs(drift.c.adjustment) > DRIFT_TOLERANCE)
+                )
+            ).rowcount
+
+            expected_debt = select(
+                func.coalesce(func.sum(AccountReceivable.total_amount - func.coalesce(AccountReceivable.paid_amount, 0)), 0)
+            ).where(
+                AccountReceivable.customer_id == Customer.id,
+                AccountReceivable.status != "paid"
+            ).scalar_subquery()
+            updated = db.execute(
+                update(Customer)
+                .where(Customer.id.in_(select(drift.c.customer_id)))
+                .values(current_debt=expected_debt)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(
+            "Customer ledger reconciled",
+            drifted=drifted, adjusted=adjusted, updated=updated, applied=apply, elapsed_ms=elapsed_ms
+        )
+        return {
+            "drifted_customers": drifted,
+            "ledger_adjustments": adjusted,
+            "customers_updated": updated,
+            "applied": apply,
+            "sample": sample,
+            "elapsed_ms": elapsed_ms
+        }
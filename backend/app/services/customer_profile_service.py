@@ -0,0 +1,170 @@
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import event, func, case, cast, literal, select, union_all, String
+from sqlalchemy.orm import Session, selectinload, object_session
+
+from ..core.cache import cache
+from ..models.customer import Customer
+from ..models.finance import AccountReceivable, CustomerPayment
+from ..models.repair import Repair, RepairItem
+from ..models.sale import Sale
+from ..utils.enums import CLOSED_REPAIR_STATUSES
+
+PROFILE_CACHE_TTL = 300
+PENDING_INVALIDATIONS_KEY = "customer_profile_invalidations"
+
+
+class CustomerProfileService:
+    """
+    Read-model del perfil de cliente construido con agregados SQL:
+    totales en una consulta, listas recientes con LIMIT y el estado de
+    cuenta con saldo acumulado vía window function. Se cachea por cliente
+    y se invalida al registrar ventas, pagos o reparaciones.
+    """
+
+    @staticmethod
+    def cache_key(customer_id: int) -> str:
+        return f"customer_profile:{customer_id}"
+
+    @staticmethod
+    def get_sales_stats(db: Session, customer_id: int) -> dict:
+        total_spent, last_purchase_at, sales_count = db.query(
+            func.coalesce(func.sum(Sale.total_usd), 0),
+            func.max(Sale.created_at),
+            func.count(Sale.id)
+        ).filter(Sale.customer_id == customer_id).one()
+        return {
+            "total_spent": Decimal(str(total_spent)),
+            "last_purchase_date": last_purchase_at.date() if last_purchase_at else None,
+            "sales_count": sales_count
+        }
+
+    @staticmethod
+    def get_ledger(db: Session, customer_id: int, limit: int = 100) -> list:
+        """
+        Cargos y abonos del cliente (más recientes primero) con el saldo
+        acumulado calculado en SQL sobre todo el historial.
+        """
+        charges = select(
+            AccountReceivable.id.label("id"),
+            AccountReceivable.created_at.label("date"),
+            literal("CHARGE").label("type"),
+            AccountReceivable.total_amount.label("amount"),
+            case(
+                (AccountReceivable.sale_id.isnot(None), literal("Credit Sale #") + cast(AccountReceivable.sale_id, String)),
+                else_=literal("Repair #") + cast(AccountReceivable.repair_id, String)
+            ).label("reference"),
+            func.coalesce(AccountReceivable.notes, "Cargo a cuenta").label("description"),
+            AccountReceivable.total_amount.label("signed_amount")
+        ).where(AccountReceivable.customer_id == customer_id)
+
+        payments = select(
+            CustomerPayment.id.label("id"),
+            CustomerPayment.payment_date.label("date"),
+            literal("PAYMENT").label("type"),
+            CustomerPayment.amount_usd.label("amount"),
+            CustomerPayment.reference.label("reference"),
+            (literal("Abono (") + CustomerPayment.payment_method + literal(")")).label("description"),
+            (-CustomerPayment.amount_usd).label("signed_amount")
+        ).where(CustomerPayment.customer_id == customer_id)
+
+        movements = union_all(charges, payments).subquery("movements")
+        balance = func.sum(movements.c.signed_amount).over(
+            order_by=(movements.c.date, movements.c.type, movements.c.id),
+            rows=(None, 0)
+        )
+        ledger = select(
+            movements.c.id, movements.c.date, movements.c.type, movements.c.amount,
+            movements.c.reference, movements.c.description, balance.label("balance")
+        ).subquery("ledger")
+
+        rows = db.execute(
+            select(ledger).order_by(ledger.c.date.desc(), ledger.c.type.desc(), ledger.c.id.desc()).limit(limit)
+        ).all()
+        return [row._asdict() for row in rows]
+
+    @staticmethod
+    def build_profile(db: Session, customer: Customer, transactions_limit: int = 100) -> dict:
+        # Estados legados en minúsculas cuentan igual que los del enum
+        status = func.upper(Repair.status)
+        active_repairs = db.query(Repair).options(
+            selectinload(Repair.items), selectinload(Repair.logs)
+        ).filter(
+            Repair.customer_id == customer.id,
+            status.notin_(CLOSED_REPAIR_STATUSES)
+        ).order_by(Repair.created_at.desc()).all()
+
+        repair_history = db.query(Repair).options(
+            selectinload(Repair.items), selectinload(Repair.logs)
+        ).filter(
+            Repair.customer_id == customer.id,
+            status.in_(CLOSED_REPAIR_STATUSES)
+        ).order_by(Repair.created_at.desc()).limit(5).all()
+
+        recent_sales = db.query(Sale).options(selectinload(Sale.items)).filter(
+            Sale.customer_id == customer.id
+        ).order_by(Sale.created_at.desc()).limit(5).all()
+
+        stats = CustomerProfileService.get_sales_stats(db, customer.id)
+
+        return {
+            **{column.name: getattr(customer, column.name) for column in Customer.__table__.columns},
+            "total_spent": stats["total_spent"],
+            "last_purchase_date": stats["last_purchase_date"],
+            "active_repairs": active_repairs,
+            "repair_history": repair_history,
+            "recent_sales": recent_sales,
+            "transactions": CustomerProfileService.get_ledger(db, customer.id, transactions_limit)
+        }
+
+    @staticmethod
+    def get_cached(customer_id: int) -> Optional[dict]:
+        return cache.get(CustomerProfileService.cache_key(customer_id))
+
+    @staticmethod
+    def store(customer_id: int, profile_json: dict) -> None:
+        cache.set(CustomerProfileService.cache_key(customer_id), profile_json, ttl=PROFILE_CACHE_TTL)
+
+    @staticmethod
+    def invalidate(customer_id: int) -> None:
+        cache.delete(CustomerProfileService.cache_key(customer_id))
+
+
+def _mark_customer(mapper, connection, target):
+    customer_id = target.id if isinstance(target, Customer) else getattr(target, "customer_id", None)
+    if customer_id is None:
+        return
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(PENDING_INVALIDATIONS_KEY, set()).add(customer_id)
+
+
+def _mark_repair_item(mapper, connection, target):
+    # Los repuestos cambian el total de la reparación: invalidar a su cliente
+    session = object_session(target)
+    if session is None or target.repair_id is None:
+        return
+    customer_id = connection.execute(
+        select(Repair.customer_id).where(Repair.id == target.repair_id)
+    ).scalar()
+    if customer_id is not None:
+        session.info.setdefault(PENDING_INVALIDATIONS_KEY, set()).add(customer_id)
+
+
+def _invalidate_after_commit(session: Session):
+    for customer_id in session.info.pop(PENDING_INVALIDATIONS_KEY, set()):
+        CustomerProfileService.invalidate(customer_id)
+
+
+def register_profile_cache_listeners():
+    """Invalida el perfil cacheado cuando cambian ventas, reparaciones (y sus repuestos), cargos o abonos del cliente."""
+    if event.contains(Session, "after_commit", _invalidate_after_commit):
+        return
+    for model in (Customer, Sale, Repair, AccountReceivable, CustomerPayment):
+        for event_name in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, event_name, _mark_customer)
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(RepairItem, event_name, _mark_repair_item)
+    # Sin limpieza en rollback: invalidar de más es inofensivo
+    event.listen(Session, "after_commit", _invalidate_after_commit)
@@ -4,6 +4,7 @@ from ..schemas.finance import ExpenseCreate, ExpenseCategoryCreate
 from decimal import Decimal
 from datetime import date
 from fastapi import HTTPException, status
+from .currency_service import CurrencyService
 
 class ExpenseService:
     @staticmethod
@@ -26,14 +27,9 @@ class ExpenseService:
             raise HTTPException(status_code=404, detail="Expense category not found")
 
         # Get current exchange rate
-        from ..api.v1.finance import get_current_rate # Assuming this exists or we need a service for it
-        # Actually, let's fetch it from the DB directly to avoid circular imports if any
-        from ..models.finance import ExchangeRate
-        current_rate_obj = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).order_by(ExchangeRate.effective_date.desc()).first()
-        if not current_rate_obj:
+        current_rate = CurrencyService.current_rate(db)
+        if not current_rate:
             raise HTTPException(status_code=400, detail="No active exchange rate found")
-        
-        current_rate = current_rate_obj.rate
 
         # Calculate amounts
         amount_usd = expense_in.amount
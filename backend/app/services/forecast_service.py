@@ -0,0 +1,295 @@
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, union_all
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.logging import get_logger
+from ..models.inventory import Product, Inventory
+from ..models.purchase import PurchaseOrder, PurchaseItem
+from ..models.repair import Repair, RepairItem
+from ..models.sale import Sale, SaleItem, SaleReturn, SaleReturnItem
+from ..utils.enums import PaymentStatus, RepairStatus
+
+logger = get_logger("forecast")
+
+MOVING_AVERAGE_DAYS = 28
+SMOOTHING_ALPHA = 0.3
+SERVICE_LEVEL_Z = 1.65  # ~95% de nivel de servicio
+REVIEW_PERIOD_DAYS = 14  # Cobertura que se pide por encima del punto de reorden
+DEMAND_CACHE_TTL_SECONDS = 900
+
+# Ventas que no cuentan como demanda
+VOID_SALE_STATUSES = (PaymentStatus.CANCELLED.value, PaymentStatus.REFUNDED.value)
+
+# Matriz de demanda diaria (productos x días), por proceso: las ventas,
+# devoluciones y recepciones de este worker la invalidan; los demás workers
+# la reconstruyen al vencer DEMAND_CACHE_TTL_SECONDS
+_demand_cache: Dict[str, Any] = {}
+
+
+class ForecastService:
+    """
+    Pronóstico de demanda para reabastecimiento.
+
+    La demanda diaria de ventas y repuestos se carga con una sola consulta
+    agregada en una matriz NumPy (productos x días) que se cachea; promedio
+    móvil, suavizado exponencial, punto de reorden y cantidades sugeridas se
+    calculan vectorizados para todos los productos a la vez.
+    """
+
+    @staticmethod
+    def invalidate() -> None:
+        _demand_cache.clear()
+
+    @staticmethod
+    def _daily_demand_query(start: date, end: date):
+        """
+        Unidades por producto y día: ventas vigentes (sin anuladas ni
+        reembolsadas) menos lo devuelto, fechado en el día de la venta, más los
+        repuestos de reparaciones no canceladas.
+        """
+        sale_day = func.date(Sale.created_at)
+        valid_sale = func.coalesce(Sale.payment_status, PaymentStatus.PENDING.value).notin_(VOID_SALE_STATUSES)
+        in_range = (sale_day >= start.isoformat(), sale_day <= end.isoformat())
+        sales = (
+            select(
+                SaleItem.product_id.label("product_id"),
+                sale_day.label("day"),
+                SaleItem.quantity.label("quantity")
+            )
+            .join(Sale, Sale.id == SaleItem.sale_id)
+            .where(valid_sale, *in_range)
+        )
+        returns = (
+            select(
+                SaleReturnItem.product_id.label("product_id"),
+                sale_day.label("day"),
+                (-SaleReturnItem.quantity).label("quantity")
+            )
+            .join(SaleReturn, SaleReturn.id == SaleReturnItem.sale_return_id)
+            .join(Sale, Sale.id == SaleReturn.sale_id)
+            .where(valid_sale, *in_range)
+        )
+        repairs = (
+            select(
+                RepairItem.product_id.label("product_id"),
+                func.date(Repair.created_at).label("day"),
+                RepairItem.quantity.label("quantity")
+            )
+            .join(Repair, Repair.id == RepairItem.repair_id)
+            .where(
+                RepairItem.product_id.isnot(None),
+                Repair.status != RepairStatus.CANCELLED.value,
+                func.date(Repair.created_at) >= start.isoformat(),
+                func.date(Repair.created_at) <= end.isoformat()
+            )
+        )
+        demand = union_all(sales, returns, repairs).subquery("demand")
+        return select(
+            demand.c.product_id, demand.c.day, func.sum(demand.c.quantity).label("quantity")
+        ).group_by(demand.c.product_id, demand.c.day)
+
+    @staticmethod
+    def demand_matrix(db: Session, history_days: Optional[int] = None, end: Optional[date] = None) -> Dict[str, Any]:
+        """
+        Matriz de demanda diaria: {"product_ids", "days", "matrix"}. Se reconstruye
+        como máximo cada DEMAND_CACHE_TTL_SECONDS para el mismo rango de fechas.
+        """
+        history_days = history_days or settings.FORECAST_HISTORY_DAYS
+        end = end or date.today()
+        key = (end, history_days)
+        if _demand_cache.get("key") == key and time.monotonic() - _demand_cache["built_at"] < DEMAND_CACHE_TTL_SECONDS:
+            return _demand_cache
+
+        start = end - timedelta(days=history_days - 1)
+        days = pd.date_range(start, end, freq="D")
+        product_ids = np.array([pid for (pid,) in db.query(Product.id).order_by(Product.id)], dtype=np.int64)
+
+        frame = pd.DataFrame(
+            db.execute(ForecastService._daily_demand_query(start, end)).all(),
+            columns=["product_id", "day", "quantity"]
+        )
+        matrix = np.zeros((len(product_ids), len(days)), dtype=np.float64)
+        if not frame.empty and len(product_ids):
+            rows = np.searchsorted(product_ids, frame["product_id"].to_numpy(dtype=np.int64))
+            cols = (pd.to_datetime(frame["day"]) - days[0]).dt.days.to_numpy()
+            valid = (rows < len(product_ids)) & (cols >= 0) & (cols < len(days))
+            np.add.at(matrix, (rows[valid], cols[valid]), frame["quantity"].to_numpy(dtype=np.float64)[valid])
+            np.maximum(matrix, 0, out=matrix)
+
+        _demand_cache.clear()
+        _demand_cache.update({
+            "key": key,
+            "built_at": time.monotonic(),
+            "product_ids": product_ids,
+            "days": days,
+            "matrix": matrix
+        })
+        return _demand_cache
+
+    @staticmethod
+    def _lead_times(db: Session) -> Dict[int, float]:
+        """Días promedio entre la orden y la recepción, por producto (historial de compras)."""
+        rows = db.query(
+            PurchaseItem.product_id,
+            PurchaseOrder.created_at,
+            PurchaseOrder.received_date
+        ).join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.purchase_id).filter(
+            PurchaseOrder.status == "received",
+            PurchaseOrder.received_date.isnot(None)
+        ).all()
+        if not rows:
+            return {}
+        frame = pd.DataFrame(rows, columns=["product_id", "created_at", "received_date"])
+        elapsed = pd.to_datetime(frame["received_date"], utc=True) - pd.to_datetime(frame["created_at"], utc=True)
+        frame["days"] = elapsed.dt.total_seconds() / 86400
+        return frame.groupby("product_id")["days"].mean().clip(lower=1).to_dict()
+
+    @staticmethod
+    def _last_suppliers(db: Session) -> Dict[int, int]:
+        """Último proveedor al que se le compró cada producto."""
+        rank = func.row_number().over(
+            partition_by=PurchaseItem.product_id,
+            order_by=PurchaseOrder.id.desc()
+        )
+        ranked = (
+            select(PurchaseItem.product_id, PurchaseOrder.supplier_id, rank.label("rn"))
+            .join(PurchaseOrder, PurchaseOrder.id == PurchaseItem.purchase_id)
+            .where(PurchaseOrder.status != "cancelled")
+            .subquery()
+        )
+        return {
+            row.product_id: row.supplier_id
+            for row in db.execute(select(ranked.c.product_id, ranked.c.supplier_id).where(ranked.c.rn == 1))
+        }
+
+    @staticmethod
+    def score(db: Session, history_days: Optional[int] = None) -> pd.DataFrame:
+        """
+        Pronóstico por producto (un DataFrame indexado por product_id) con
+        demanda diaria (promedio móvil y suavizado exponencial), desviación,
+        tiempo de entrega, punto de reorden y cantidad sugerida.
+        """
+        started = time.perf_counter()
+        demand = ForecastService.demand_matrix(db, history_days)
+        matrix = demand["matrix"]
+        n_days = matrix.shape[1]
+
+        window = min(MOVING_AVERAGE_DAYS, n_days)
+        moving_average = matrix[:, -window:].mean(axis=1) if n_days else np.zeros(len(matrix))
+
+        # Suavizado exponencial simple en forma cerrada: pesos alpha*(1-alpha)^k
+        # desde el día más reciente; el día más antiguo arrastra el peso restante.
+        weights = SMOOTHING_ALPHA * (1 - SMOOTHING_ALPHA) ** np.arange(n_days)[::-1]
+        if n_days:
+            weights[0] = (1 - SMOOTHING_ALPHA) ** (n_days - 1)
+        smoothed = matrix @ weights
+        std = matrix.std(axis=1)
+
+        frame = pd.DataFrame({
+            "moving_average": moving_average,
+            "smoothed": smoothed,
+            "std": std
+        }, index=pd.Index(demand["product_ids"], name="product_id"))
+
+        stock = pd.DataFrame(
+            db.query(Product.id, Product.sku, Product.name, Product.cost_usd, Inventory.quantity, Inventory.min_stock)
+            .outerjoin(Inventory, Inventory.product_id == Product.id)
+            .filter(Product.is_active == True)
+            .all(),
+            columns=["product_id", "sku", "name", "cost_usd", "quantity", "min_stock"]
+        ).set_index("product_id")
+        frame = stock.join(frame, how="left")
+        frame[["moving_average", "smoothed", "std"]] = frame[["moving_average", "smoothed", "std"]].fillna(0.0)
+        frame["quantity"] = frame["quantity"].fillna(0).astype(int)
+        frame["min_stock"] = frame["min_stock"].fillna(0).astype(int)
+
+        lead_times = ForecastService._lead_times(db)
+        frame["lead_time_days"] = frame.index.map(lead_times).astype(float)
+        frame["lead_time_days"] = frame["lead_time_days"].fillna(float(settings.FORECAST_DEFAULT_LEAD_TIME_DAYS))
+
+        daily = np.maximum(frame["moving_average"].to_numpy(), frame["smoothed"].to_numpy())
+        lead = frame["lead_time_days"].to_numpy()
+        safety = SERVICE_LEVEL_Z * frame["std"].to_numpy() * np.sqrt(lead)
+        reorder_point = np.ceil(np.maximum(daily * lead + safety, frame["min_stock"].to_numpy()))
+        order_up_to = reorder_point + np.ceil(daily * REVIEW_PERIOD_DAYS)
+        on_hand = frame["quantity"].to_numpy()
+
+        frame["daily_demand"] = daily.round(3)
+        frame["safety_stock"] = np.ceil(safety)
+        frame["reorder_point"] = reorder_point.astype(int)
+        frame["suggested_quantity"] = np.where(
+            on_hand <= reorder_point, np.maximum(order_up_to - on_hand, 0), 0
+        ).astype(int)
+        frame["days_of_cover"] = np.where(daily > 0, on_hand / np.where(daily > 0, daily, 1), np.inf)
+
+        logger.info(
+            "Replenishment forecast scored",
+            products=len(frame), days=n_days, elapsed_ms=round((time.perf_counter() - started) * 1000, 2)
+        )
+        return frame
+
+    @staticmethod
+    def get_reorder_suggestions(db: Session, history_days: Optional[int] = None) -> List[dict]:
+        """Productos en o bajo su punto de reorden, ordenados por días de cobertura."""
+        frame = ForecastService.score(db, history_days)
+        frame = frame[frame["suggested_quantity"] > 0].sort_values(["days_of_cover", "quantity"])
+        cover = frame["days_of_cover"].where(np.isfinite(frame["days_of_cover"])).round(1)
+        return [
+            {
+                "id": int(product_id),
+                "sku": sku,
+                "name": name,
+                "quantity": int(quantity),
+                "min_stock": int(min_stock),
+                "daily_demand": float(daily),
+                "lead_time_days": round(float(lead), 1),
+                "reorder_point": int(reorder_point),
+                "days_of_cover": None if pd.isna(days) else float(days),
+                "needed": int(needed)
+            }
+            for product_id, sku, name, quantity, min_stock, daily, lead, reorder_point, days, needed in zip(
+                frame.index, frame["sku"], frame["name"], frame["quantity"], frame["min_stock"],
+                frame["daily_demand"], frame["lead_time_days"], frame["reorder_point"], cover,
+                frame["suggested_quantity"]
+            )
+        ]
+
+    @staticmethod
+    def suggest_purchase_orders(db: Session, history_days: Optional[int] = None) -> List[dict]:
+        """
+        Agrupa las sugerencias por el último proveedor de cada producto. Los
+        productos sin historial de compras quedan con supplier_id None.
+        """
+        suggestions = ForecastService.get_reorder_suggestions(db, history_days)
+        if not suggestions:
+            return []
+        suppliers = ForecastService._last_suppliers(db)
+        costs = dict(db.query(Product.id, Product.cost_usd).filter(
+            Product.id.in_([item["id"] for item in suggestions])
+        ).all())
+
+        orders = defaultdict(lambda: {"items": [], "total_amount_usd": Decimal(0)})
+        for item in suggestions:
+            unit_cost = Decimal(str(costs.get(item["id"]) or 0))
+            order = orders[suppliers.get(item["id"])]
+            order["items"].append({
+                "product_id": item["id"],
+                "sku": item["sku"],
+                "name": item["name"],
+                "quantity": item["needed"],
+                "unit_cost_usd": unit_cost
+            })
+            order["total_amount_usd"] += unit_cost * item["needed"]
+
+        return [
+            {"supplier_id": supplier_id, **order}
+            for supplier_id, order in sorted(orders.items(), key=lambda entry: (entry[0] is None, entry[0] or 0))
+        ]
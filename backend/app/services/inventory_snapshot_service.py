@@ -0,0 +1,186 @@
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, select, insert, literal, or_
+from sqlalchemy.orm import Session
+
+from ..core.logging import get_logger
+from ..models.inventory import Product, StockMovement, InventorySnapshot
+
+logger = get_logger("inventory_snapshots")
+
+# Lunes: snapshot completo; el resto de los días solo deltas
+FULL_SNAPSHOT_WEEKDAY = 0
+
+
+def _day_end(value: date) -> datetime:
+    """Límite exclusivo del día (00:00 del día siguiente)."""
+    return datetime.combine(value + timedelta(days=1), datetime.min.time())
+
+
+class InventorySnapshotService:
+    """
+    Snapshots diarios de inventario (inventory_snapshots) para valorar el
+    stock a cualquier fecha sin reconstruir toda la historia:
+
+    valoración(D) = último snapshot por producto <= D
+                    + movimientos de stock_movements posteriores al snapshot.
+    """
+
+    @staticmethod
+    def _balances_until(cutoff: datetime):
+        """Saldo por producto según el último movimiento anterior a `cutoff`."""
+        rank = func.row_number().over(
+            partition_by=StockMovement.product_id,
+            order_by=(StockMovement.created_at.desc(), StockMovement.id.desc())
+        )
+        ranked = (
+            select(StockMovement.product_id, StockMovement.balance_after.label("quantity"), rank.label("rn"))
+            .where(StockMovement.created_at < cutoff)
+            .subquery("ranked")
+        )
+        return select(ranked.c.product_id, ranked.c.quantity).where(ranked.c.rn == 1).subquery("balances")
+
+    @staticmethod
+    def _latest_rows(db: Session, as_of: date):
+        """Último registro por producto con snapshot_date <= as_of, desde el último snapshot completo."""
+        last_full = db.query(func.max(InventorySnapshot.snapshot_date)).filter(
+            InventorySnapshot.is_full == True,
+            InventorySnapshot.snapshot_date <= as_of
+        ).scalar()
+
+        rank = func.row_number().over(
+            partition_by=InventorySnapshot.product_id,
+            order_by=InventorySnapshot.snapshot_date.desc()
+        )
+        ranked = select(
+            InventorySnapshot.product_id,
+            InventorySnapshot.quantity,
+            InventorySnapshot.unit_cost_usd,
+            rank.label("rn")
+        ).where(InventorySnapshot.snapshot_date <= as_of)
+        if last_full:
+            ranked = ranked.where(InventorySnapshot.snapshot_date >= last_full)
+        ranked = ranked.subquery("ranked_snapshots")
+        return select(
+            ranked.c.product_id, ranked.c.quantity, ranked.c.unit_cost_usd
+        ).where(ranked.c.rn == 1).subquery("latest")
+
+    @staticmethod
+    def take_snapshot(db: Session, snapshot_date: Optional[date] = None, full: Optional[bool] = None) -> dict:
+        """
+        Escribe el snapshot al cierre de `snapshot_date` (por defecto ayer) con un
+        INSERT ... SELECT. En modo delta solo inserta productos cuya cantidad o
+        costo difiere de su último registro. Re-ejecutar el mismo día lo reemplaza.
+        """
+        started = time.perf_counter()
+        snapshot_date = snapshot_date or (date.today() - timedelta(days=1))
+        if full is None:
+            has_full = db.query(InventorySnapshot.id).filter(
+                InventorySnapshot.is_full == True,
+                InventorySnapshot.snapshot_date < snapshot_date
+            ).first()
+            full = snapshot_date.weekday() == FULL_SNAPSHOT_WEEKDAY or not has_full
+
+        db.query(InventorySnapshot).filter(
+            InventorySnapshot.snapshot_date == snapshot_date
+        ).delete(synchronize_session=False)
+
+        balances = InventorySnapshotService._balances_until(_day_end(snapshot_date))
+        source = (
+            select(
+                literal(snapshot_date),
+                balances.c.product_id,
+                balances.c.quantity,
+                Product.cost_usd,
+                literal(full)
+            )
+            .join(Product, Product.id == balances.c.product_id)
+        )
+        if not full:
+            previous = InventorySnapshotService._latest_rows(db, snapshot_date - timedelta(days=1))
+            source = source.outerjoin(previous, previous.c.product_id == balances.c.product_id).where(or_(
+                previous.c.product_id.is_(None),
+                previous.c.quantity != balances.c.quantity,
+                previous.c.unit_cost_usd != Product.cost_usd
+            ))
+
+        result = db.execute(
+            insert(InventorySnapshot).from_select(
+                ["snapshot_date", "product_id", "quantity", "unit_cost_usd", "is_full"], source
+            )
+        )
+        db.commit()
+
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.info(
+            "Inventory snapshot written",
+            snapshot_date=snapshot_date.isoformat(), rows=result.rowcount, full=full, elapsed_ms=elapsed_ms
+        )
+        return {"snapshot_date": snapshot_date, "rows": result.rowcount, "full": full, "elapsed_ms": elapsed_ms}
+
+    @staticmethod
+    def get_valuation(db: Session, as_of: date, include_items: bool = False) -> dict:
+        """
+        Valoración del inventario al cierre de `as_of` en un número fijo de
+        consultas: snapshot más reciente + movimientos posteriores. Sin
+        snapshots previos se usa el saldo del libro de movimientos.
+        """
+        snapshot_date = db.query(func.max(InventorySnapshot.snapshot_date)).filter(
+            InventorySnapshot.snapshot_date <= as_of
+        ).scalar()
+
+        items = {}
+        if snapshot_date:
+            latest = InventorySnapshotService._latest_rows(db, as_of)
+            for row in db.execute(select(latest)):
+                items[row.product_id] = {"quantity": row.quantity, "unit_cost_usd": Decimal(str(row.unit_cost_usd))}
+
+            # Movimientos entre el snapshot y la fecha pedida
+            replay = db.execute(
+                select(
+                    StockMovement.product_id,
+                    func.sum(StockMovement.quantity).label("change"),
+                    Product.cost_usd
+                )
+                .join(Product, Product.id == StockMovement.product_id)
+                .where(
+                    StockMovement.created_at >= _day_end(snapshot_date),
+                    StockMovement.created_at < _day_end(as_of)
+                )
+                .group_by(StockMovement.product_id, Product.cost_usd)
+            )
+            for row in replay:
+                item = items.setdefault(row.product_id, {"quantity": 0, "unit_cost_usd": Decimal(str(row.cost_usd))})
+                item["quantity"] += int(row.change or 0)
+        else:
+            balances = InventorySnapshotService._balances_until(_day_end(as_of))
+            rows = db.execute(
+                select(balances.c.product_id, balances.c.quantity, Product.cost_usd)
+                .join(Product, Product.id == balances.c.product_id)
+            )
+            for row in rows:
+                items[row.product_id] = {"quantity": row.quantity, "unit_cost_usd": Decimal(str(row.cost_usd))}
+
+        total_quantity = 0
+        total_value = Decimal(0)
+        for item in items.values():
+            on_hand = max(item["quantity"], 0)
+            item["value_usd"] = (on_hand * item["unit_cost_usd"]).quantize(Decimal("0.01"))
+            total_quantity += on_hand
+            total_value += item["value_usd"]
+
+        result = {
+            "as_of": as_of,
+            "snapshot_date": snapshot_date,
+            "products": len(items),
+            "total_quantity": total_quantity,
+            "total_value_usd": total_value
+        }
+        if include_items:
+            result["items"] = [
+                {"product_id": product_id, **item} for product_id, item in sorted(items.items())
+            ]
+        return result
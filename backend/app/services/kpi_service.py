@@ -0,0 +1,418 @@
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import and_, delete, event, func, insert, inspect, select, distinct
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+
+from ..core.logging import get_logger
+from ..models.inventory import Product
+from ..models.kpi import KpiMonthly
+from ..models.repair import Repair
+from ..models.sale import Sale, SaleItem
+from ..utils.enums import RepairStatus
+
+logger = get_logger("kpi")
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + 1, 1, 1) if month.month == 12 else date(month.year, month.month + 1, 1)
+
+
+class MonthTracker:
+    """
+    Marca en session.info[key] los meses de las filas escritas en cada flush.
+
+    `sources` = {Modelo: "columna_fecha"} o {Modelo: ("columna_fk", ModeloPadre)}
+    para las líneas que toman la fecha de su cabecera (SaleItem -> Sale).
+    La fecha se toma del objeto si está cargada; si no (atributos expirados
+    por un commit anterior, server_default) se consulta por id al terminar
+    el flush, una consulta por modelo. Las bajas se resuelven antes del
+    DELETE, mientras la fila todavía existe.
+    """
+
+    def __init__(self, key: str, sources: Dict[type, object]):
+        self.key = key
+        self.pending_key = f"{key}:pending"
+        self.sources = sources
+
+    def _date_source(self, model: type):
+        source = self.sources[model]
+        return (model, source) if isinstance(source, str) else (source[1], "created_at")
+
+    @staticmethod
+    def _column_value(connection, target, attribute: str):
+        if attribute in target.__dict__:
+            return target.__dict__[attribute]
+        table = inspect(target).mapper.local_table
+        return connection.execute(select(table.c[attribute]).where(table.c.id == target.id)).scalar()
+
+    def _mark(self, target, connection, resolve_now: bool) -> None:
+        session = object_session(target)
+        if session is None:
+            return
+        months: Set[date] = session.info.setdefault(self.key, set())
+        source = self.sources[type(target)]
+        if isinstance(source, str):
+            history = inspect(target).attrs[source].history
+            for value in history.deleted:
+                if isinstance(value, (date, datetime)):
+                    months.add(month_start(value))
+            date_model, row_id, value = type(target), target.id, target.__dict__.get(source)
+        else:
+            fk, date_model = source
+            parent = next((
+                v for v in target.__dict__.values() if isinstance(v, date_model)
+            ), None)
+            row_id = self._column_value(connection, target, fk)
+            value = parent.__dict__.get("created_at") if parent is not None else None
+
+        if isinstance(value, (date, datetime)):
+            months.add(month_start(value))
+        elif row_id is not None:
+            model, column = self._date_source(type(target))
+            if resolve_now:
+                value = connection.execute(select(getattr(model, column)).where(model.id == row_id)).scalar()
+                if value is not None:
+                    months.add(month_start(value))
+            else:
+                session.info.setdefault(self.pending_key, {}).setdefault((model, column), set()).add(row_id)
+
+    def _after_write(self, mapper, connection, target) -> None:
+        self._mark(target, connection, resolve_now=False)
+
+    def _before_delete(self, mapper, connection, target) -> None:
+        self._mark(target, connection, resolve_now=True)
+
+    def _resolve(self, session: Session, flush_context) -> None:
+        pending = session.info.pop(self.pending_key, None)
+        if not pending:
+            return
+        months = session.info.setdefault(self.key, set())
+        connection = session.connection()
+        for (model, column), ids in pending.items():
+            for value in connection.execute(select(getattr(model, column)).where(model.id.in_(ids))).scalars():
+                if value is not None:
+                    months.add(month_start(value))
+
+    def register(self) -> None:
+        if event.contains(Session, "after_flush_postexec", self._resolve):
+            return
+        for model in self.sources:
+            event.listen(model, "after_insert", self._after_write)
+            event.listen(model, "after_update", self._after_write)
+            event.listen(model, "before_delete", self._before_delete)
+        event.listen(Session, "after_flush_postexec", self._resolve)
+
+
+def _empty_row() -> dict:
+    return {
+        "sales_revenue_usd": Decimal(0),
+        "sales_revenue_ves": Decimal(0),
+        "orders_count": 0,
+        "units_sold": 0,
+        "services_count": 0,
+    }
+
+
+class KpiService:
+    """
+    Cubo mensual de KPIs (kpi_monthly) por total, usuario y categoría.
+
+    Cada flush que toca ventas, líneas o reparaciones lee el aporte previo y
+    posterior de esas filas (por id) y suma la diferencia con un upsert, en
+    la misma transacción; los cambios de estado de una reparación solo
+    cuentan si entra o sale de CANCELLED. refresh_month recalcula un mes
+    completo y lo usa rebuild. Los reportes leen el cubo en lugar de agregar
+    las tablas completas.
+    """
+
+    @staticmethod
+    def refresh_month(db: Session, month: date) -> int:
+        """Recalcula las filas de un mes (DELETE + INSERT del mes completo)."""
+        month = month_start(month)
+        end = next_month(month)
+
+        def in_month(column):
+            return and_(column >= month, column < end)
+
+        rows = defaultdict(_empty_row)
+        total = rows[("total", 0)]
+
+        sales = db.query(
+            Sale.user_id,
+            func.sum(Sale.total_usd),
+            func.sum(Sale.total_ves),
+            func.count(Sale.id)
+        ).filter(in_month(Sale.created_at)).group_by(Sale.user_id).all()
+        for user_id, revenue_usd, revenue_ves, orders in sales:
+            for row in (total, rows[("user", user_id or 0)]):
+                row["sales_revenue_usd"] += Decimal(str(revenue_usd or 0))
+                row["sales_revenue_ves"] += Decimal(str(revenue_ves or 0))
+                row["orders_count"] += orders
+
+        items = db.query(
+            Product.category_id,
+            func.sum(SaleItem.subtotal_usd),
+            func.sum(SaleItem.quantity),
+            func.count(distinct(SaleItem.sale_id))
+        ).join(Sale, Sale.id == SaleItem.sale_id)\
+         .join(Product, Product.id == SaleItem.product_id)\
+         .filter(in_month(Sale.created_at))\
+         .group_by(Product.category_id).all()
+        for category_id, revenue_usd, units, orders in items:
+            row = rows[("category", category_id or 0)]
+            row["sales_revenue_usd"] += Decimal(str(revenue_usd or 0))
+            row["units_sold"] += int(units or 0)
+            row["orders_count"] += orders
+            total["units_sold"] += int(units or 0)
+
+        services = db.query(Repair.user_id, func.count(Repair.id)).filter(
+            in_month(Repair.created_at),
+            Repair.status != RepairStatus.CANCELLED.value
+        ).group_by(Repair.user_id).all()
+        for user_id, count in services:
+            total["services_count"] += count
+            rows[("user", user_id or 0)]["services_count"] += count
+
+        db.execute(delete(KpiMonthly).where(KpiMonthly.month == month))
+        db.execute(insert(KpiMonthly), [
+            {"month": month, "dimension": dimension, "dimension_id": dimension_id, **values}
+            for (dimension, dimension_id), values in rows.items()
+        ])
+        return len(rows)
+
+    @staticmethod
+    def contribution(connection, sale_ids: Set[int], repair_ids: Set[int]) -> Dict[tuple, dict]:
+        """
+        Aporte de unas ventas y reparaciones al cubo, por (mes, dimensión, id).
+        Mismas reglas que refresh_month, filtrando por id en lugar de por mes.
+        """
+        rows = defaultdict(_empty_row)
+        if sale_ids:
+            sales = connection.execute(
+                select(Sale.user_id, Sale.created_at, Sale.total_usd, Sale.total_ves).where(Sale.id.in_(sale_ids))
+            )
+            for user_id, created_at, revenue_usd, revenue_ves in sales:
+                if created_at is None:
+                    continue
+                month = month_start(created_at)
+                for key in ((month, "total", 0), (month, "user", user_id or 0)):
+                    rows[key]["sales_revenue_usd"] += Decimal(str(revenue_usd or 0))
+                    rows[key]["sales_revenue_ves"] += Decimal(str(revenue_ves or 0))
+                    rows[key]["orders_count"] += 1
+
+            items = connection.execute(
+                select(
+                    Sale.created_at,
+                    Product.category_id,
+                    func.sum(SaleItem.subtotal_usd),
+                    func.sum(SaleItem.quantity)
+                ).join(Sale, Sale.id == SaleItem.sale_id)
+                .join(Product, Product.id == SaleItem.product_id)
+                .where(SaleItem.sale_id.in_(sale_ids))
+                .group_by(SaleItem.sale_id, Sale.created_at, Product.category_id)
+            )
+            for created_at, category_id, revenue_usd, units in items:
+                if created_at is None:
+                    continue
+                month = month_start(created_at)
+                row = rows[(month, "category", category_id or 0)]
+                row["sales_revenue_usd"] += Decimal(str(revenue_usd or 0))
+                row["units_sold"] += int(units or 0)
+                row["orders_count"] += 1  # Una fila por (venta, categoría)
+                rows[(month, "total", 0)]["units_sold"] += int(units or 0)
+
+        if repair_ids:
+            repairs = connection.execute(
+                select(Repair.user_id, Repair.created_at).where(
+                    Repair.id.in_(repair_ids),
+                    Repair.status != RepairStatus.CANCELLED.value
+                )
+            )
+            for user_id, created_at in repairs:
+                if created_at is None:
+                    continue
+                month = month_start(created_at)
+                for key in ((month, "total", 0), (month, "user", user_id or 0)):
+                    rows[key]["services_count"] += 1
+        return rows
+
+    @staticmethod
+    def apply_deltas(connection, after: Dict[tuple, dict], before: Optional[Dict[tuple, dict]] = None) -> int:
+        """
+        Suma (after - before) a kpi_monthly con un solo upsert
+        (x = x + excluded.x): escrituras concurrentes del mismo mes se acumulan
+        en lugar de competir por DELETE + INSERT.
+        """
+        before = before or {}
+        rows = []
+        for key in set(after) | set(before):
+            new, old = after.get(key) or _empty_row(), before.get(key) or _empty_row()
+            values = {field: new[field] - old[field] for field in new}
+            if any(values.values()):
+                month, dimension, dimension_id = key
+                rows.append({"month": month, "dimension": dimension, "dimension_id": dimension_id, **values})
+        if not rows:
+            return 0
+        dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(KpiMonthly).values(rows)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[KpiMonthly.month, KpiMonthly.dimension, KpiMonthly.dimension_id],
+            set_={
+                **{field: getattr(KpiMonthly, field) + getattr(stmt.excluded, field) for field in _empty_row()},
+                "updated_at": func.now(),
+            }
+        ))
+        return len(rows)
+
+    @staticmethod
+    def apply_repair_moves(connection, moves: Iterable[tuple]) -> int:
+        """
+        services_count para cambios de estado hechos fuera del ORM
+        (UPDATE masivo): moves = [(created_at, user_id, estado_anterior, estado_nuevo), ...].
+        """
+        deltas = defaultdict(_empty_row)
+        for created_at, user_id, old_status, new_status in moves:
+            change = int(_repair_counts(new_status)) - int(_repair_counts(old_status))
+            if not change or created_at is None:
+                continue
+            month = month_start(created_at)
+            for key in ((month, "total", 0), (month, "user", user_id or 0)):
+                deltas[key]["services_count"] += change
+        return KpiService.apply_deltas(connection, deltas)
+
+    @staticmethod
+    def refresh_months(db: Session, months: Iterable[date]) -> int:
+        return sum(KpiService.refresh_month(db, month) for month in sorted(set(months)))
+
+    @staticmethod
+    def rebuild(db: Session) -> dict:
+        """Backfill completo: desde la primera venta o reparación hasta el mes actual."""
+        started = time.perf_counter()
+        first_dates = [
+            value for value in (
+                db.query(func.min(Sale.created_at)).scalar(),
+                db.query(func.min(Repair.created_at)).scalar()
+            ) if value
+        ]
+        db.execute(delete(KpiMonthly))
+        months = []
+        if first_dates:
+            month = month_start(min(first_dates))
+            last = month_start(date.today())
+            while month <= last:
+                months.append(month)
+                month = next_month(month)
+        rows = KpiService.refresh_months(db, months)
+        db.commit()
+        return {"months": len(months), "rows": rows, "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+    @staticmethod
+    def get_months(db: Session, start: date, end: date, dimension: str = "total",
+                   dimension_id: Optional[int] = None) -> list:
+        """Filas del cubo entre dos meses (inclusive), ordenadas por mes."""
+        query = db.query(KpiMonthly).filter(
+            KpiMonthly.dimension == dimension,
+            KpiMonthly.month >= month_start(start),
+            KpiMonthly.month <= month_start(end)
+        )
+        if dimension_id is not None:
+            query = query.filter(KpiMonthly.dimension_id == dimension_id)
+        return query.order_by(KpiMonthly.month, KpiMonthly.dimension_id).all()
+
+
+# Columnas que cambian la contribución de una fila al cubo
+SALE_FIELDS = ("total_usd", "total_ves", "user_id", "created_at")
+SALE_ITEM_FIELDS = ("sale_id", "product_id", "quantity", "subtotal_usd")
+REPAIR_FIELDS = ("user_id", "created_at")
+KPI_SNAPSHOT_KEY = "kpi_snapshot"
+
+
+def _changed(target, fields) -> bool:
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in fields)
+
+
+def _repair_counts(status: Optional[str]) -> bool:
+    return RepairStatus.normalize(status) != RepairStatus.CANCELLED.value
+
+
+def _repair_touched(target: Repair) -> bool:
+    # Solo importa si cambia el mes/técnico o si entra o sale de CANCELLED
+    if _changed(target, REPAIR_FIELDS):
+        return True
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return False
+    if not history.deleted:
+        return True
+    return _repair_counts(history.deleted[0]) != _repair_counts(target.status)
+
+
+def _touched(session: Session):
+    """(ventas, reparaciones) cuya contribución al cubo puede cambiar en este flush."""
+    sale_ids, repair_ids = set(), set()
+    for target in session.new:
+        if isinstance(target, Sale):
+            sale_ids.add(target.id)
+        elif isinstance(target, SaleItem):
+            parent = target.__dict__.get("sale")
+            sale_ids.add(target.__dict__.get("sale_id") or (parent.id if parent is not None else None))
+        elif isinstance(target, Repair):
+            repair_ids.add(target.id)
+    for target in session.dirty:
+        if isinstance(target, Sale) and _changed(target, SALE_FIELDS):
+            sale_ids.add(target.id)
+        elif isinstance(target, SaleItem) and _changed(target, SALE_ITEM_FIELDS):
+            history = inspect(target).attrs.sale_id.history
+            sale_ids.update(history.deleted)
+            sale_ids.add(target.sale_id)
+        elif isinstance(target, Repair) and _repair_touched(target):
+            repair_ids.add(target.id)
+    for target in session.deleted:
+        if isinstance(target, Sale):
+            sale_ids.add(target.id)
+        elif isinstance(target, SaleItem):
+            sale_ids.add(target.sale_id)
+        elif isinstance(target, Repair):
+            repair_ids.add(target.id)
+    sale_ids.discard(None)
+    repair_ids.discard(None)
+    return sale_ids, repair_ids
+
+
+def _kpi_before_flush(session: Session, flush_context, instances) -> None:
+    sale_ids, repair_ids = _touched(session)
+    if not sale_ids and not repair_ids:
+        return
+    # Contribución previa leída de la base (el flush todavía no escribió)
+    before = KpiService.contribution(session.connection(), sale_ids, repair_ids)
+    session.info[KPI_SNAPSHOT_KEY] = (sale_ids, repair_ids, before)
+
+
+def _kpi_after_flush(session: Session, flush_context) -> None:
+    sale_ids, repair_ids = _touched(session)
+    previous = session.info.pop(KPI_SNAPSHOT_KEY, None)
+    if previous is not None:
+        sale_ids |= previous[0]
+        repair_ids |= previous[1]
+    if not sale_ids and not repair_ids:
+        return
+    connection = session.connection()
+    after = KpiService.contribution(connection, sale_ids, repair_ids)
+    KpiService.apply_deltas(connection, after, previous[2] if previous is not None else None)
+
+
+def register_kpi_listeners() -> None:
+    """Mantiene kpi_monthly en cada flush con deltas (misma transacción que la venta o reparación)."""
+    if event.contains(Session, "after_flush", _kpi_after_flush):
+        return
+    event.listen(Session, "before_flush", _kpi_before_flush)
+    event.listen(Session, "after_flush", _kpi_after_flush)
@@ -0,0 +1,83 @@
+from typing import Optional
+
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session, object_session
+
+from ..core.events import queue_event
+from ..models.inventory import Product, Inventory
+from .activity_service import record_low_stock_activity
+
+
+def _is_low(quantity: Optional[int], min_stock: Optional[int]) -> bool:
+    return (quantity or 0) <= (min_stock or 0)
+
+
+def _sync_flag(mapper, connection, target: Inventory) -> None:
+    # Solo se publica cuando la cantidad cruza el mínimo (en cualquier sentido)
+    low = _is_low(target.quantity, target.min_stock)
+    if bool(target.is_low_stock) == low:
+        return
+    target.is_low_stock = low
+    if low and target.product_id is not None:
+        record_low_stock_activity(connection, target.product_id, target.quantity)
+    session = object_session(target)
+    if session is not None and target.product_id is not None:
+        queue_event(
+            session,
+            "inventory.low_stock" if low else "inventory.restocked",
+            product_id=target.product_id,
+            quantity=target.quantity,
+            min_stock=target.min_stock,
+        )
+
+
+class LowStockService:
+    """
+    Conjunto de productos con stock bajo mantenido en Inventory.is_low_stock
+    (con índice parcial). El flag se actualiza al escribir el inventario y
+    cada cruce del mínimo se publica como evento en vivo (inventory.low_stock /
+    inventory.restocked) y las entradas a stock bajo quedan en el feed de
+    actividad, así el dashboard no recalcula el conjunto por visita.
+    """
+
+    @staticmethod
+    def get_low_stock(db: Session, limit: int = 50, include_out_of_stock: bool = True) -> list:
+        """Productos con stock bajo; solo recorre las filas del índice parcial."""
+        query = db.query(
+            Product.id, Product.sku, Product.name, Inventory.quantity, Inventory.min_stock
+        ).join(Inventory, Inventory.product_id == Product.id).filter(
+            Inventory.is_low_stock == True,
+            Product.is_active == True
+        )
+        if not include_out_of_stock:
+            query = query.filter(Inventory.quantity > 0)
+        return [
+            {
+                "id": row.id,
+                "sku": row.sku,
+                "name": row.name,
+                "quantity": row.quantity,
+                "min_stock": row.min_stock,
+            }
+            for row in query.order_by(Inventory.quantity.asc(), Product.id).limit(limit)
+        ]
+
+    @staticmethod
+    def refresh(db: Session) -> int:
+        """Recalcula el flag de todas las filas (reparación o backfill); no publica eventos."""
+        result = db.execute(
+            update(Inventory)
+            .where(Inventory.is_low_stock != (Inventory.quantity <= Inventory.min_stock))
+            .values(is_low_stock=Inventory.quantity <= Inventory.min_stock)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+
+def register_low_stock_listeners() -> None:
+    """Mantiene is_low_stock en los INSERT/UPDATE de Inventory hechos por el ORM."""
+    if event.contains(Inventory, "before_update", _sync_flag):
+        return
+    event.listen(Inventory, "before_insert", _sync_flag)
+    event.listen(Inventory, "before_update", _sync_flag)
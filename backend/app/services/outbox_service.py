@@ -0,0 +1,323 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..core.logging import get_logger
+from ..models.customer import Customer
+from ..models.notification import OutboundMessage
+from ..models.repair import Repair
+from ..utils.enums import NotificationStatus, RepairStatus
+from .whatsapp_service import WhatsAppService
+
+logger = get_logger("outbox")
+
+OUTBOX_WAKE_KEY = "outbox_wake"
+
+# Canal -> proveedor (load_config(db) y send(client, config, recipient, body))
+PROVIDERS = {
+    WhatsAppService.channel: WhatsAppService,
+}
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class RateLimiter:
+    """Espacia los envíos de un proveedor a `rate` mensajes por segundo."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class OutboxService:
+    """
+    Cola persistente de mensajes salientes (outbound_messages).
+
+    - Los handlers encolan en su propia transacción y responden de inmediato.
+    - El worker reclama lotes (FOR UPDATE SKIP LOCKED en PostgreSQL, con un
+      lease en next_attempt_at por si el proceso muere a mitad del envío),
+      los envía con un httpx.AsyncClient compartido y un límite de mensajes
+      por segundo por proveedor, y reintenta con backoff exponencial + jitter.
+    """
+
+    # --- Encolado ---
+
+    @staticmethod
+    def enqueue(db: Session, recipient: str, body: str, channel: str = WhatsAppService.channel,
+                reference_type: str = None, reference_id: int = None, user_id: int = None) -> OutboundMessage:
+        message = OutboundMessage(
+            channel=channel,
+            recipient=WhatsAppService.normalize_phone(recipient),
+            body=body,
+            status=NotificationStatus.PENDING.value,
+            next_attempt_at=_now(),
+            reference_type=reference_type,
+            reference_id=reference_id,
+            created_by_id=user_id
+        )
+        db.add(message)
+        db.info[OUTBOX_WAKE_KEY] = True
+        return message
+
+    @staticmethod
+    def enqueue_many(db: Session, messages: Iterable[dict], channel: str = WhatsAppService.channel,
+                     user_id: int = None) -> dict:
+        """Envío masivo: un solo INSERT para todo el lote, identificado por batch_id."""
+        batch_id = str(uuid.uuid4())
+        now = _now()
+        rows = [
+            {
+                "channel": channel,
+                "recipient": WhatsAppService.normalize_phone(message["recipient"]),
+                "body": message["body"],
+                "status": NotificationStatus.PENDING.value,
+                "attempts": 0,
+                "next_attempt_at": now,
+                "reference_type": message.get("reference_type"),
+                "reference_id": message.get("reference_id"),
+                "batch_id": batch_id,
+                "created_by_id": user_id,
+            }
+            for message in messages
+        ]
+        if rows:
+            db.execute(insert(OutboundMessage), rows)
+            db.info[OUTBOX_WAKE_KEY] = True
+        return {"batch_id": batch_id, "queued": len(rows)}
+
+    @staticmethod
+    def notify_ready_repairs(db: Session, user_id: int = None) -> dict:
+        """Encola el aviso de 'listo para retirar' para todas las reparaciones READY con teléfono."""
+        company_name = WhatsAppService.company_name(db)
+        repairs = db.query(
+            Repair.id, Repair.device_model, Repair.status, Customer.name, Customer.phone
+        ).join(Customer, Customer.id == Repair.customer_id).filter(
+            Repair.status == RepairStatus.READY.value,
+            Customer.phone.isnot(None),
+            Customer.phone != ""
+        ).order_by(Repair.id).all()
+        return OutboxService.enqueue_many(db, (
+            {
+                "recipient": row.phone,
+                "body": WhatsAppService.repair_status_message(
+                    company_name, row.name, row.device_model, row.status, row.id
+                ),
+                "reference_type": "repair",
+                "reference_id": row.id,
+            }
+            for row in repairs
+        ), user_id=user_id)
+
+    # --- Worker ---
+
+    @staticmethod
+    def claim_batch(db: Session, limit: int) -> Dict[str, dict]:
+        """
+        Reclama hasta `limit` mensajes vencidos: quedan en 'sending' con un lease
+        (next_attempt_at = ahora + OUTBOX_LEASE_SECONDS). Devuelve, por canal,
+        la configuración del proveedor (leída una vez) y los mensajes.
+        """
+        now = _now()
+        query = db.query(OutboundMessage).filter(
+            OutboundMessage.status.in_([NotificationStatus.PENDING.value, NotificationStatus.SENDING.value]),
+            OutboundMessage.next_attempt_at <= now
+        ).order_by(OutboundMessage.next_attempt_at, OutboundMessage.id).limit(limit)
+        if db.get_bind().dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+
+        batches: Dict[str, dict] = {}
+        lease = now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        for message in query.all():
+            if message.channel not in batches:
+                provider = PROVIDERS.get(message.channel)
+                batches[message.channel] = {
+                    "config": provider.load_config(db) if provider else None,
+                    "messages": [],
+                }
+            message.status = NotificationStatus.SENDING.value
+            message.attempts = (message.attempts or 0) + 1
+            message.next_attempt_at = lease
+            batches[message.channel]["messages"].append({
+                "id": message.id,
+                "recipient": message.recipient,
+                "body": message.body,
+                "attempts": message.attempts,
+            })
+        db.commit()
+        return batches
+
+    @staticmethod
+    def record_results(db: Session, results: List[dict]) -> None:
+        """Marca enviados; reprograma o da por fallidos los errores según intentos y tipo."""
+        now = _now()
+        messages = {m.id: m for m in db.query(OutboundMessage).filter(
+            OutboundMessage.id.in_([result["id"] for result in results])
+        )}
+        for result in results:
+            message = messages.get(result["id"])
+            if message is None:
+                continue
+            message.last_error = None if result["sent"] else result["detail"]
+            if result["sent"]:
+                message.status = NotificationStatus.SENT.value
+                message.sent_at = now
+            elif result["retryable"] and message.attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                delay = settings.OUTBOX_BACKOFF_SECONDS * 2 ** (message.attempts - 1)
+                message.status = NotificationStatus.PENDING.value
+                message.next_attempt_at = now + timedelta(seconds=delay + random.uniform(0, delay))
+            else:
+                message.status = NotificationStatus.FAILED.value
+        db.commit()
+
+    @staticmethod
+    def get_messages(db: Session, status: Optional[str] = None, batch_id: Optional[str] = None,
+                     reference_type: Optional[str] = None, reference_id: Optional[int] = None,
+                     limit: int = 50) -> list:
+        query = db.query(OutboundMessage)
+        if status:
+            query = query.filter(OutboundMessage.status == status)
+        if batch_id:
+            query = query.filter(OutboundMessage.batch_id == batch_id)
+        if reference_type:
+            query = query.filter(OutboundMessage.reference_type == reference_type)
+        if reference_id is not None:
+            query = query.filter(OutboundMessage.reference_id == reference_id)
+        return query.order_by(OutboundMessage.id.desc()).limit(limit).all()
+
+
+class OutboxWorker:
+    """Envía el outbox en segundo plano; cada proceso corre uno (el claim evita duplicados)."""
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self.client: Optional[httpx.AsyncClient] = None
+        self.limiters: Dict[str, RateLimiter] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.OUTBOX_SEND_TIMEOUT_SECONDS, connect=5.0),
+                limits=httpx.Limits(max_connections=settings.OUTBOX_CONCURRENCY,
+                                    max_keepalive_connections=settings.OUTBOX_CONCURRENCY),
+            )
+        return self.client
+
+    def _limiter(self, channel: str) -> RateLimiter:
+        if channel not in self.limiters:
+            self.limiters[channel] = RateLimiter(settings.OUTBOX_RATE_PER_SECOND)
+        return self.limiters[channel]
+
+    def _claim(self) -> Dict[str, dict]:
+        db = self.session_factory()
+        try:
+            return OutboxService.claim_batch(db, settings.OUTBOX_BATCH_SIZE)
+        finally:
+            db.close()
+
+    def _record(self, results: List[dict]) -> None:
+        db = self.session_factory()
+        try:
+            OutboxService.record_results(db, results)
+        finally:
+            db.close()
+
+    async def _send(self, channel: str, config: Optional[dict], message: dict, semaphore: asyncio.Semaphore) -> dict:
+        provider = PROVIDERS.get(channel)
+        if provider is None or config is None:
+            # Sin proveedor o sin credenciales: se reintenta por si lo configuran en Ajustes
+            return {"id": message["id"], "sent": False, "retryable": True,
+                    "detail": f"Canal '{channel}' no configurado"}
+        async with semaphore:
+            await self._limiter(channel).acquire()
+            sent, retryable, detail = await provider.send(self._get_client(), config, message["recipient"], message["body"])
+        return {"id": message["id"], "sent": sent, "retryable": retryable, "detail": detail}
+
+    async def run_once(self) -> int:
+        """Procesa un lote; devuelve cuántos mensajes reclamó."""
+        batches = await asyncio.to_thread(self._claim)
+        semaphore = asyncio.Semaphore(settings.OUTBOX_CONCURRENCY)
+        sends = [
+            self._send(channel, batch["config"], message, semaphore)
+            for channel, batch in batches.items()
+            for message in batch["messages"]
+        ]
+        if not sends:
+            return 0
+        results = await asyncio.gather(*sends)
+        await asyncio.to_thread(self._record, list(results))
+        sent = sum(1 for result in results if result["sent"])
+        logger.info("Outbox batch processed", claimed=len(results), sent=sent)
+        return len(results)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                # Lotes seguidos mientras haya trabajo pendiente
+                while await self.run_once() >= settings.OUTBOX_BATCH_SIZE:
+                    pass
+            except Exception as e:
+                logger.error("Outbox worker error", error=str(e))
+
+    def wake(self) -> None:
+        """Despierta al worker (seguro desde hilos del pool de FastAPI)."""
+        if self._loop is not None and self._wake is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self._loop = None
+            self._wake = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+outbox_worker = OutboxWorker()
+
+
+def _wake_after_commit(session: Session) -> None:
+    if session.info.pop(OUTBOX_WAKE_KEY, None):
+        outbox_worker.wake()
+
+
+def register_outbox_listeners() -> None:
+    """Despierta al worker cuando se confirma una transacción que encoló mensajes."""
+    if event.contains(Session, "after_commit", _wake_after_commit):
+        return
+    event.listen(Session, "after_commit", _wake_after_commit)
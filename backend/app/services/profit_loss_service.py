@@ -0,0 +1,273 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, event, func, insert, literal, or_, select, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.logging import get_logger
+from ..models.finance import Expense
+from ..models.kpi import ProfitLossPeriod
+from ..models.repair import Repair, RepairItem
+from ..models.sale import Sale, SaleItem, SaleReturn
+from ..utils.enums import RepairStatus
+from .currency_service import CurrencyService
+from .kpi_service import MonthTracker, month_start, next_month
+from .timeseries_service import TimeSeriesService
+
+logger = get_logger("profit_loss")
+
+PENDING_PL_MONTHS_KEY = "pending_profit_loss_months"
+
+LINES = ("sales", "repairs", "product_cogs", "repair_cogs", "expenses")
+CENT = Decimal("0.01")
+
+Range = Tuple[date, date]  # [inicio, fin) por días
+
+
+def _empty_period() -> Dict[str, Decimal]:
+    return {f"{line}_{currency}": Decimal(0) for line in LINES for currency in ("usd", "ves")}
+
+
+class ProfitLossService:
+    """
+    Estado de resultados por mes.
+
+    - Los meses cerrados se guardan en profit_loss_periods la primera vez
+      que se consultan. Cualquier escritura posterior en ventas, reparaciones,
+      repuestos, devoluciones o gastos de ese mes (según la fecha de la fila
+      de origen) borra el mes cacheado después del commit.
+    - El mes en curso y los bordes parciales de un rango se calculan en vivo
+      con una sola consulta (UNION ALL de las líneas, agrupado por mes).
+    - VES usa la tasa de cada transacción (Sale.total_ves, tasa de la venta
+      para su COGS, tasa del gasto). Las reparaciones no guardan tasa: se
+      agrupan por día y se convierten con el índice de CurrencyService.
+    """
+
+    @staticmethod
+    def _in_ranges(column, ranges: Iterable[Range], is_datetime: bool = True):
+        def bound(value: date):
+            return datetime.combine(value, time.min) if is_datetime else value
+        return or_(*[and_(column >= bound(start), column < bound(end)) for start, end in ranges])
+
+    @staticmethod
+    def _aggregate(db: Session, ranges: List[Range]) -> Dict[date, Dict[str, Decimal]]:
+        """Líneas del P&L por mes para los rangos dados, en una sola consulta."""
+        if not ranges:
+            return {}
+        dialect = db.get_bind().dialect.name
+
+        def bucket(column, size="month"):
+            return TimeSeriesService._bucket_expression(dialect, column, size)
+
+        repair_filters = (
+            ProfitLossService._in_ranges(Repair.created_at, ranges),
+            Repair.status != RepairStatus.CANCELLED.value
+        )
+        repair_item_cost = RepairItem.quantity * func.coalesce(RepairItem.unit_cogs_usd, RepairItem.unit_cost_usd)
+        expense_ves = case((Expense.currency == "VES", Expense.amount), else_=Expense.amount_usd * Expense.exchange_rate)
+
+        def line(name, date_column, amount_usd, amount_ves, size="month"):
+            return select(
+                bucket(date_column, size).label("bucket"),
+                literal(name).label("line"),
+                amount_usd.label("amount_usd"),
+                amount_ves.label("amount_ves")
+            )
+
+        branches = [
+            line("sales", Sale.created_at, Sale.total_usd, Sale.total_ves)
+            .where(ProfitLossService._in_ranges(Sale.created_at, ranges)),
+            line("repairs", Repair.created_at, Repair.labor_cost_usd, literal(0), size="day")
+            .where(*repair_filters),
+            line(
+                "product_cogs", Sale.created_at,
+                SaleItem.quantity * SaleItem.unit_cost_usd,
+                SaleItem.quantity * SaleItem.unit_cost_usd * Sale.exchange_rate
+            ).join(Sale, Sale.id == SaleItem.sale_id)
+            .where(ProfitLossService._in_ranges(Sale.created_at, ranges)),
+            line("repair_cogs", Repair.created_at, repair_item_cost, literal(0), size="day")
+            .join(Repair, Repair.id == RepairItem.repair_id)
+            .where(*repair_filters),
+            line("expenses", Expense.date, Expense.amount_usd, expense_ves)
+            .where(ProfitLossService._in_ranges(Expense.date, ranges, is_datetime=False)),
+        ]
+        data = union_all(*branches).subquery("pl_lines")
+        rows = db.execute(
+            select(data.c.bucket, data.c.line, func.sum(data.c.amount_usd), func.sum(data.c.amount_ves))
+            .group_by(data.c.bucket, data.c.line)
+        )
+
+        periods: Dict[date, Dict[str, Decimal]] = {}
+        repair_days = []
+        for bucket_value, line_name, amount_usd, amount_ves in rows:
+            day = date.fromisoformat(str(bucket_value)[:10])
+            amount_usd = Decimal(str(amount_usd or 0))
+            if line_name in ("repairs", "repair_cogs"):
+                repair_days.append((day, line_name, amount_usd))
+                amount_ves = 0
+            period = periods.setdefault(month_start(day), _empty_period())
+            period[f"{line_name}_usd"] += amount_usd.quantize(CENT)
+            period[f"{line_name}_ves"] += Decimal(str(amount_ves or 0)).quantize(CENT)
+
+        # Reparaciones: totales diarios convertidos a la tasa de cada día
+        if repair_days:
+            amounts_ves = CurrencyService.convert(
+                db, [amount for _, _, amount in repair_days], [day for day, _, _ in repair_days]
+            )
+            for (day, line_name, _), amount_ves in zip(repair_days, amounts_ves):
+                periods[month_start(day)][f"{line_name}_ves"] += amount_ves or Decimal(0)
+        return periods
+
+    @staticmethod
+    def get_periods(db: Session, start_date: date, end_date: date) -> List[dict]:
+        """
+        P&L de cada mes entre start_date y end_date (inclusive; los meses de
+        los extremos se recortan al rango). Los meses completos y cerrados
+        salen de profit_loss_periods; el resto se calcula en una consulta.
+        """
+        open_month = month_start(date.today())
+        range_end = end_date + timedelta(days=1)
+
+        months = []
+        month = month_start(start_date)
+        while month <= end_date:
+            months.append(month)
+            month = next_month(month)
+
+        # Meses completos dentro del rango y ya cerrados: cacheables
+        closed = [m for m in months if m >= start_date and next_month(m) <= range_end and m < open_month]
+        cached = {}
+        if closed:
+            cached = {
+                row.month: {key: getattr(row, key) for key in _empty_period()}
+                for row in db.query(ProfitLossPeriod).filter(ProfitLossPeriod.month.in_(closed))
+            }
+
+        missing_closed = [m for m in closed if m not in cached]
+        live_ranges = [
+            (max(m, start_date), min(next_month(m), range_end))
+            for m in months if m not in cached
+        ]
+        live = ProfitLossService._aggregate(db, live_ranges)
+
+        if missing_closed:
+            try:
+                db.execute(insert(ProfitLossPeriod), [
+                    {"month": m, **live.get(m, _empty_period())} for m in missing_closed
+                ])
+                db.commit()
+            except IntegrityError:
+                # Otra petición cacheó el mismo mes al mismo tiempo
+                db.rollback()
+
+        periods = []
+        for m in months:
+            values = cached.get(m) or live.get(m) or _empty_period()
+            periods.append({
+                "month": m,
+                "start": max(m, start_date),
+                "end": min(next_month(m), range_end) - timedelta(days=1),
+                "closed": m < open_month,
+                **values
+            })
+        return periods
+
+    @staticmethod
+    def summarize(periods: List[dict], start_date: date, end_date: date, target_currency: str = "USD") -> dict:
+        """Totales del P&L para una lista de meses, en la moneda pedida."""
+        suffix = "ves" if target_currency == "VES" else "usd"
+        totals = {line: sum((p[f"{line}_{suffix}"] for p in periods), Decimal(0)) for line in LINES}
+        revenue = totals["sales"] + totals["repairs"]
+        cogs = totals["product_cogs"] + totals["repair_cogs"]
+        gross_profit = revenue - cogs
+
+        rate = Decimal(1)
+        if target_currency == "VES":
+            revenue_usd = sum((p["sales_usd"] + p["repairs_usd"] for p in periods), Decimal(0))
+            # Tasa efectiva (promedio ponderado por ingresos) solo como referencia
+            rate = (revenue / revenue_usd).quantize(Decimal("0.000001")) if revenue_usd else Decimal(0)
+
+        return {
+            "period": {"start": start_date, "end": end_date},
+            "revenue": revenue,
+            "cogs": cogs,
+            "gross_profit": gross_profit,
+            "expenses": totals["expenses"],
+            "net_profit": gross_profit - totals["expenses"],
+            "currency": target_currency,
+            "exchange_rate": rate
+        }
+
+    @staticmethod
+    def get_profit_loss(db: Session, start_date: date, end_date: date, target_currency: str = "USD") -> dict:
+        periods = ProfitLossService.get_periods(db, start_date, end_date)
+        return ProfitLossService.summarize(periods, start_date, end_date, target_currency)
+
+    @staticmethod
+    def get_comparative(db: Session, start_date: date, end_date: date, target_currency: str = "USD") -> dict:
+        """Resultado mes a mes del rango, más los totales."""
+        periods = ProfitLossService.get_periods(db, start_date, end_date)
+        return {
+            "periods": [
+                {
+                    "month": p["month"],
+                    "closed": p["closed"],
+                    **ProfitLossService.summarize([p], p["start"], p["end"], target_currency)
+                }
+                for p in periods
+            ],
+            "total": ProfitLossService.summarize(periods, start_date, end_date, target_currency)
+        }
+
+    @staticmethod
+    def invalidate(db: Session, days: Optional[Iterable[date]] = None) -> int:
+        """Descarta los meses cacheados de esas fechas (todos si no se indican)."""
+        query = delete(ProfitLossPeriod)
+        if days is not None:
+            months = {month_start(day) for day in days}
+            if not months:
+                return 0
+            query = query.where(ProfitLossPeriod.month.in_(months))
+        return db.execute(query).rowcount
+
+
+# Fecha que decide el mes de cada línea del P&L
+_month_tracker = MonthTracker(PENDING_PL_MONTHS_KEY, {
+    Sale: "created_at",
+    SaleItem: ("sale_id", Sale),
+    SaleReturn: ("sale_id", Sale),
+    Repair: "created_at",
+    RepairItem: ("repair_id", Repair),
+    Expense: "date",
+})
+
+
+def _invalidate_after_commit(session: Session) -> None:
+    months = session.info.pop(PENDING_PL_MONTHS_KEY, None)
+    closed = [m for m in months or () if m < month_start(date.today())]
+    if not closed:
+        return
+    try:
+        with Session(bind=session.get_bind()) as pl_db:
+            ProfitLossService.invalidate(pl_db, closed)
+            pl_db.commit()
+    except Exception as e:
+        logger.error("Failed to invalidate cached P&L months", months=[m.isoformat() for m in closed], error=str(e))
+
+
+def _discard_pending(session: Session, previous_transaction) -> None:
+    # El rollback de un savepoint no descarta lo marcado por la transacción externa
+    if previous_transaction.nested:
+        return
+    session.info.pop(PENDING_PL_MONTHS_KEY, None)
+
+
+def register_profit_loss_listeners() -> None:
+    """Borra del cache los meses cerrados cuyas líneas cambian."""
+    if event.contains(Session, "after_commit", _invalidate_after_commit):
+        return
+    _month_tracker.register()
+    event.listen(Session, "after_commit", _invalidate_after_commit)
+    event.listen(Session, "after_soft_rollback", _discard_pending)
@@ -0,0 +1,247 @@
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update, insert, case, literal, exists
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from ..core.events import queue_event
+from ..core.logging import get_logger
+from ..models.finance import AccountsPayable
+from ..models.inventory import Product, Inventory, InventoryLog
+from ..models.purchase import Supplier, PurchaseOrder, PurchaseItem
+from ..schemas.purchase import PurchaseOrderCreate, PurchaseOrderRead, PurchaseItemRead
+from .costing_service import CostingService
+from .forecast_service import ForecastService
+from .stock_service import StockService
+
+logger = get_logger("purchases")
+
+
+class PurchaseService:
+    """
+    Órdenes de compra con operaciones por lote: los productos se validan
+    con un solo IN y la recepción actualiza inventario, bitácora y costo
+    promedio ponderado con sentencias set-based (sin consultas por línea).
+    """
+
+    @staticmethod
+    def to_read(purchase: PurchaseOrder, include_items: bool = True) -> PurchaseOrderRead:
+        return PurchaseOrderRead(
+            id=purchase.id,
+            supplier_id=purchase.supplier_id,
+            supplier_name=purchase.supplier.name,
+            user_id=purchase.user_id,
+            username=purchase.user.username,
+            status=purchase.status,
+            total_amount_usd=purchase.total_amount_usd,
+            expected_date=purchase.expected_date,
+            received_date=purchase.received_date,
+            notes=purchase.notes,
+            created_at=purchase.created_at,
+            items=[
+                PurchaseItemRead(
+                    id=item.id,
+                    product_id=item.product_id,
+                    product_name=item.product.name,
+                    quantity=item.quantity,
+                    unit_cost_usd=item.unit_cost_usd,
+                    subtotal_usd=item.subtotal_usd
+                ) for item in purchase.items
+            ] if include_items else []
+        )
+
+    @staticmethod
+    def get_order(db: Session, purchase_id: int) -> PurchaseOrder:
+        """Carga la orden con proveedor, usuario e ítems (con producto) en consultas fijas."""
+        purchase = db.query(PurchaseOrder).options(
+            joinedload(PurchaseOrder.supplier),
+            joinedload(PurchaseOrder.user),
+            selectinload(PurchaseOrder.items).joinedload(PurchaseItem.product)
+        ).filter(PurchaseOrder.id == purchase_id).first()
+        if not purchase:
+            raise HTTPException(status_code=404, detail="Orden de compra no encontrada")
+        return purchase
+
+    @staticmethod
+    def create_order(db: Session, purchase_in: PurchaseOrderCreate, user_id: int) -> PurchaseOrder:
+        supplier = db.query(Supplier).filter(Supplier.id == purchase_in.supplier_id).first()
+        if not supplier:
+            raise HTTPException(status_code=404, detail="Proveedor no encontrado")
+        if not purchase_in.items:
+            raise HTTPException(status_code=400, detail="La orden debe tener al menos un producto")
+
+        for item_in in purchase_in.items:
+            if item_in.quantity <= 0 or item_in.unit_cost_usd < 0:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Cantidad o costo inválido para el producto {item_in.product_id}"
+                )
+
+        # Validación de productos en una sola consulta
+        product_ids = {item_in.product_id for item_in in purchase_in.items}
+        found = {product_id for (product_id,) in db.query(Product.id).filter(Product.id.in_(product_ids))}
+        missing = sorted(product_ids - found)
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Productos no encontrados: {', '.join(str(pid) for pid in missing)}"
+            )
+
+        total_amount = Decimal(0)
+        rows = []
+        for item_in in purchase_in.items:
+            subtotal = item_in.unit_cost_usd * item_in.quantity
+            total_amount += subtotal
+            rows.append({
+                "product_id": item_in.product_id,
+                "quantity": item_in.quantity,
+                "unit_cost_usd": item_in.unit_cost_usd,
+                "subtotal_usd": subtotal
+            })
+
+        purchase = PurchaseOrder(
+            supplier_id=purchase_in.supplier_id,
+            user_id=user_id,
+            expected_date=purchase_in.expected_date,
+            notes=purchase_in.notes,
+            status="draft",  # Starts as draft/ordered
+            total_amount_usd=total_amount
+        )
+        db.add(purchase)
+        db.flush()
+
+        # Ítems en un solo executemany (no se necesitan sus ids hasta recargar la orden)
+        db.execute(insert(PurchaseItem), [{**row, "purchase_id": purchase.id} for row in rows])
+        db.commit()
+        return PurchaseService.get_order(db, purchase.id)
+
+    @staticmethod
+    def _received_totals(purchase_id: int):
+        """Cantidad y costo recibido por producto (una orden puede repetir productos)."""
+        return (
+            select(
+                PurchaseItem.product_id.label("product_id"),
+                func.sum(PurchaseItem.quantity).label("quantity"),
+                func.sum(PurchaseItem.subtotal_usd).label("cost")
+            )
+            .where(PurchaseItem.purchase_id == purchase_id)
+            .group_by(PurchaseItem.product_id)
+            .subquery("received")
+        )
+
+    @staticmethod
+    def receive(db: Session, purchase_id: int, user_id: int) -> PurchaseOrder:
+        """
+        Recibe la orden completa:
+
+        1. Crea las filas de inventario faltantes (INSERT ... SELECT).
+        2. Recalcula el costo promedio ponderado de los productos con el stock previo.
+        3. Inserta la bitácora (InventoryLog) en bloque.
+        4. Suma las cantidades con un UPDATE ... FROM (y recalcula is_low_stock).
+        5. Registra una capa de costo por línea (CostingService) y los
+           movimientos de stock por producto (StockService).
+        """
+        purchase = db.query(PurchaseOrder).filter(PurchaseOrder.id == purchase_id).with_for_update().first()
+        if not purchase:
+            raise HTTPException(status_code=404, detail="Orden de compra no encontrada")
+        if purchase.status == "received":
+            raise HTTPException(status_code=400, detail="Esta orden ya fue recibida")
+        if purchase.status == "cancelled":
+            raise HTTPException(status_code=400, detail="No se puede recibir una orden cancelada")
+
+        received = PurchaseService._received_totals(purchase.id)
+
+        # 1. Inventario faltante
+        db.execute(
+            insert(Inventory).from_select(
+                ["product_id", "quantity", "min_stock"],
+                select(received.c.product_id, literal(0), literal(5)).where(
+                    ~exists().where(Inventory.product_id == received.c.product_id)
+                )
+            )
+        )
+
+        # Bloquear las filas de inventario afectadas durante la recepción
+        db.query(Inventory.id).filter(
+            Inventory.product_id.in_(select(received.c.product_id))
+        ).with_for_update().all()
+
+        # 2. Costo promedio ponderado (el stock negativo no aporta costo)
+        on_hand = case((Inventory.quantity > 0, Inventory.quantity), else_=0)
+        db.execute(
+            update(Product)
+            .where(
+                Product.id == received.c.product_id,
+                Inventory.product_id == Product.id,
+                received.c.quantity > 0
+            )
+            .values(cost_usd=func.round(
+                (on_hand * func.coalesce(Product.cost_usd, 0) + received.c.cost) / (on_hand + received.c.quantity), 2
+            ))
+            .execution_options(synchronize_session=False)
+        )
+
+        # 3. Bitácora con cantidades previas y nuevas
+        db.execute(
+            insert(InventoryLog).from_select(
+                ["inventory_id", "product_id", "user_id", "old_quantity", "new_quantity", "adjustment", "reason"],
+                select(
+                    Inventory.id,
+                    Inventory.product_id,
+                    literal(user_id),
+                    Inventory.quantity,
+                    Inventory.quantity + received.c.quantity,
+                    received.c.quantity,
+                    literal(f"Recepción de orden de compra #{purchase.id}")
+                ).where(Inventory.product_id == received.c.product_id)
+            )
+        )
+
+        # 4. Cantidades y flag de stock bajo (el UPDATE en bloque no pasa por los
+        #    listeners del ORM: se publican aquí los productos que salen del stock bajo)
+        restocked = db.execute(
+            select(Inventory.product_id, Inventory.quantity + received.c.quantity, Inventory.min_stock).where(
+                Inventory.product_id == received.c.product_id,
+                Inventory.is_low_stock == True,
+                Inventory.quantity + received.c.quantity > Inventory.min_stock
+            )
+        ).all()
+        db.execute(
+            update(Inventory)
+            .where(Inventory.product_id == received.c.product_id)
+            .values(
+                quantity=Inventory.quantity + received.c.quantity,
+                is_low_stock=Inventory.quantity + received.c.quantity <= Inventory.min_stock
+            )
+            .execution_options(synchronize_session=False)
+        )
+        for product_id, quantity, min_stock in restocked:
+            queue_event(db, "inventory.restocked", product_id=product_id, quantity=quantity, min_stock=min_stock)
+        CostingService.add_purchase_layers(db, purchase.id)
+        StockService.record_purchase(db, purchase.id, user_id)
+        db.execute(
+            update(PurchaseItem)
+            .where(PurchaseItem.purchase_id == purchase.id)
+            .values(received_quantity=PurchaseItem.quantity)
+            .execution_options(synchronize_session=False)
+        )
+
+        purchase.status = "received"
+        purchase.received_date = datetime.now(timezone.utc)
+
+        # Create Accounts Payable (AP)
+        payment_terms = db.query(Supplier.payment_terms).filter(Supplier.id == purchase.supplier_id).scalar()
+        db.add(AccountsPayable(
+            supplier_id=purchase.supplier_id,
+            purchase_order_id=purchase.id,
+            total_amount=purchase.total_amount_usd,
+            due_date=date.today() + timedelta(days=payment_terms or 0),
+            status="pending"
+        ))
+
+        db.commit()
+        # Las sugerencias de compra siguientes se recalculan sin la matriz cacheada
+        ForecastService.invalidate()
+        logger.info("Purchase order received", purchase_id=purchase.id, user_id=user_id)
+        return PurchaseService.get_order(db, purchase.id)
@@ -0,0 +1,307 @@
+import abc
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import func
+
+from ..core.config import settings
+from ..core.database import SessionLocal
+from ..core.logging import get_logger
+from ..models.finance import ExchangeRate
+from .currency_service import CurrencyService
+
+logger = get_logger("rate_ingestion")
+
+# En la página del BCV el bloque es: <div id="dolar"> ... <strong> 36,5432 </strong> ...
+BCV_RATE_PATTERN = re.compile(r"<strong>\s*([\d.,]+)\s*</strong>")
+BCV_BLOCK_SIZE = 2000
+
+
+@dataclass
+class RateQuote:
+    rate: Decimal
+    source: str
+    effective_date: date
+
+
+def _parse_rate(value) -> Optional[Decimal]:
+    try:
+        rate = Decimal(str(value).strip().replace(",", "."))
+    except (InvalidOperation, ValueError):
+        return None
+    return rate if rate > 0 else None
+
+
+class RateSource(abc.ABC):
+    """Fuente de tasa USD/VES. `fetch` devuelve None si la fuente no tiene dato."""
+
+    name = "base"
+    retryable = False
+
+    @abc.abstractmethod
+    async def fetch(self, client: httpx.AsyncClient) -> Optional[RateQuote]:
+        ...
+
+
+class BCVSource(RateSource):
+    """
+    Página del BCV con peticiones condicionales (ETag / If-Modified-Since):
+    si no cambió (304) se reutiliza la última tasa leída sin descargar ni parsear.
+    """
+
+    name = "BCV (Auto)"
+    retryable = True
+
+    def __init__(self, url: str = "https://www.bcv.org.ve/"):
+        self.url = url
+        self._validators: Dict[str, str] = {}
+        self._last_quote: Optional[RateQuote] = None
+
+    async def fetch(self, client: httpx.AsyncClient) -> Optional[RateQuote]:
+        response = await client.get(self.url, headers=self._validators)
+        if response.status_code == 304 and self._last_quote is not None:
+            return RateQuote(self._last_quote.rate, self.name, date.today())
+        response.raise_for_status()
+
+        rate = self.parse(response.text)
+        if rate is None:
+            logger.error("Could not find dollar rate in BCV response")
+            return None
+
+        self._validators = {
+            header: response.headers[source]
+            for header, source in (("If-None-Match", "etag"), ("If-Modified-Since", "last-modified"))
+            if source in response.headers
+        }
+        self._last_quote = RateQuote(rate, self.name, date.today())
+        return self._last_quote
+
+    @staticmethod
+    def parse(html: str) -> Optional[Decimal]:
+        """Busca solo dentro del bloque id="dolar" en lugar de recorrer toda la página."""
+        start = html.find('id="dolar"')
+        if start < 0:
+            return None
+        match = BCV_RATE_PATTERN.search(html, start, start + BCV_BLOCK_SIZE)
+        return _parse_rate(match.group(1)) if match else None
+
+
+class ManualSource(RateSource):
+    """Tasa fija configurada (MANUAL_EXCHANGE_RATE); útil como último respaldo."""
+
+    name = "Manual"
+
+    def __init__(self, rate):
+        self.rate = _parse_rate(rate) if rate is not None else None
+
+    async def fetch(self, client: httpx.AsyncClient) -> Optional[RateQuote]:
+        if self.rate is None:
+            return None
+        return RateQuote(self.rate, self.name, date.today())
+
+
+class FileSource(RateSource):
+    """
+    Tasa leída de un archivo local: un número, o JSON {"rate": ..., "date": "YYYY-MM-DD"}.
+    Sustituye al BCV en pruebas y entornos sin salida a internet.
+    """
+
+    name = "File"
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    async def fetch(self, client: httpx.AsyncClient) -> Optional[RateQuote]:
+        if not self.path.exists():
+            return None
+        content = (await asyncio.to_thread(self.path.read_text)).strip()
+        effective_date = date.today()
+        if content.startswith("{"):
+            data = json.loads(content)
+            content = data.get("rate")
+            if data.get("date"):
+                effective_date = date.fromisoformat(data["date"])
+        rate = _parse_rate(content)
+        return RateQuote(rate, self.name, effective_date) if rate is not None else None
+
+
+def build_sources(names: Optional[str] = None) -> List[RateSource]:
+    """Cadena de fuentes en orden de preferencia según EXCHANGE_RATE_SOURCES."""
+    available = {
+        "bcv": lambda: BCVSource(settings.BCV_URL),
+        "file": lambda: FileSource(settings.EXCHANGE_RATE_FILE) if settings.EXCHANGE_RATE_FILE else None,
+        "manual": lambda: ManualSource(settings.MANUAL_EXCHANGE_RATE),
+    }
+    sources = []
+    for name in (names or settings.EXCHANGE_RATE_SOURCES).split(","):
+        factory = available.get(name.strip().lower())
+        source = factory() if factory else None
+        if source is not None:
+            sources.append(source)
+    return sources
+
+
+_client: Optional[httpx.AsyncClient] = None
+_sources: Optional[List[RateSource]] = None
+_metrics = {
+    "sources": {},
+    "last_success_at": None,
+    "last_source": None,
+    "last_rate": None,
+}
+
+
+def _source_metrics(name: str) -> dict:
+    return _metrics["sources"].setdefault(name, {
+        "fetches": 0,
+        "failures": 0,
+        "not_found": 0,
+        "last_latency_ms": None,
+        "avg_latency_ms": None,
+        "last_error": None,
+    })
+
+
+class RateIngestionService:
+    """
+    Ingesta de la tasa oficial:
+
+    - Un solo httpx.AsyncClient compartido (pool de conexiones keep-alive).
+    - Reintentos con backoff exponencial y jitter en errores de red / 5xx.
+    - Fuentes en cadena (BCV, archivo, manual): se usa la primera que responde.
+    - La escritura en BD corre en un hilo (asyncio.to_thread), fuera del event loop.
+    - Métricas de latencia por fuente y antigüedad de la tasa (get_metrics).
+    """
+
+    @staticmethod
+    def get_client() -> httpx.AsyncClient:
+        global _client
+        if _client is None or _client.is_closed:
+            _client = httpx.AsyncClient(
+                verify=settings.BCV_VERIFY_SSL,
+                timeout=httpx.Timeout(10.0, connect=5.0),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+                headers={"User-Agent": f"{settings.PROJECT_NAME} rate-ingestion"},
+                follow_redirects=True,
+            )
+        return _client
+
+    @staticmethod
+    async def close() -> None:
+        global _client
+        if _client is not None:
+            await _client.aclose()
+            _client = None
+
+    @staticmethod
+    def get_sources() -> List[RateSource]:
+        # Se conservan entre corridas para reutilizar los validadores ETag del BCV
+        global _sources
+        if _sources is None:
+            _sources = build_sources()
+        return _sources
+
+    @staticmethod
+    async def fetch_with_retries(source: RateSource, client: Optional[httpx.AsyncClient] = None,
+                                 attempts: Optional[int] = None) -> Optional[RateQuote]:
+        client = client or RateIngestionService.get_client()
+        attempts = attempts or (settings.EXCHANGE_RATE_FETCH_ATTEMPTS if source.retryable else 1)
+        stats = _source_metrics(source.name)
+
+        for attempt in range(1, attempts + 1):
+            started = time.perf_counter()
+            try:
+                quote = await source.fetch(client)
+                latency_ms = round((time.perf_counter() - started) * 1000, 2)
+                stats["fetches"] += 1
+                stats["last_latency_ms"] = latency_ms
+                previous = stats["avg_latency_ms"]
+                stats["avg_latency_ms"] = latency_ms if previous is None else round(previous * 0.8 + latency_ms * 0.2, 2)
+                if quote is None:
+                    stats["not_found"] += 1
+                return quote
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                stats["failures"] += 1
+                stats["last_error"] = str(e)
+                retry = isinstance(e, httpx.TransportError) or e.response.status_code >= 500
+                if not retry or attempt == attempts:
+                    logger.warning("Exchange rate fetch failed", source=source.name, attempt=attempt, error=str(e))
+                    return None
+                # Backoff exponencial con jitter completo
+                delay = random.uniform(0, settings.EXCHANGE_RATE_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                logger.info("Retrying exchange rate fetch", source=source.name, attempt=attempt, delay=round(delay, 2))
+                await asyncio.sleep(delay)
+            except Exception as e:
+                stats["failures"] += 1
+                stats["last_error"] = str(e)
+                logger.error("Exchange rate source error", source=source.name, error=str(e))
+                return None
+        return None
+
+    @staticmethod
+    def _store(quote: RateQuote, overwrite: bool = True) -> ExchangeRate:
+        db = SessionLocal()
+        try:
+            rate = CurrencyService.store_rate(db, quote.rate, quote.source, quote.effective_date, overwrite=overwrite)
+            db.refresh(rate)
+            db.expunge(rate)
+            return rate
+        finally:
+            db.close()
+
+    @staticmethod
+    async def ingest(sources: Optional[List[RateSource]] = None) -> Optional[ExchangeRate]:
+        """
+        Obtiene la tasa de la primera fuente disponible y la guarda. None si ninguna respondió.
+
+        Solo la fuente principal reemplaza la tasa ya guardada para la fecha;
+        las de respaldo únicamente la crean si falta (el Manual de respaldo no
+        pisa la tasa del BCV de hoy).
+        """
+        for position, source in enumerate(sources or RateIngestionService.get_sources()):
+            quote = await RateIngestionService.fetch_with_retries(source)
+            if quote is None:
+                continue
+            rate = await asyncio.to_thread(RateIngestionService._store, quote, position == 0)
+            _metrics.update({
+                "last_success_at": datetime.now(timezone.utc),
+                "last_source": rate.source,
+                "last_rate": rate.rate,
+            })
+            if rate.source == quote.source and rate.rate == quote.rate:
+                logger.info("Exchange rate updated", source=quote.source, rate=str(quote.rate))
+            else:
+                logger.info("Fallback rate ignored, kept existing rate", source=quote.source, kept=rate.source)
+            return rate
+        logger.error("No exchange rate source available")
+        return None
+
+    @staticmethod
+    def has_rate_for(db, day: date) -> bool:
+        """True si ya hay una tasa guardada para esa fecha (de cualquier fuente)."""
+        return db.query(ExchangeRate.id).filter(ExchangeRate.effective_date == day).first() is not None
+
+    @staticmethod
+    def get_metrics(db) -> dict:
+        """Latencia por fuente y antigüedad de la tasa (última ingesta y última fecha en BD)."""
+        now = datetime.now(timezone.utc)
+        latest_date = db.query(func.max(ExchangeRate.effective_date)).scalar()
+        last_success_at = _metrics["last_success_at"]
+        return {
+            "sources": {name: dict(values) for name, values in _metrics["sources"].items()},
+            "last_success_at": last_success_at,
+            "last_source": _metrics["last_source"],
+            "last_rate": _metrics["last_rate"],
+            "seconds_since_last_success": round((now - last_success_at).total_seconds()) if last_success_at else None,
+            "latest_effective_date": latest_date,
+            "rate_age_days": (date.today() - latest_date).days if latest_date else None,
+        }
@@ -0,0 +1,349 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from ..core.config import settings
+from ..core.events import queue_event
+from ..models.audit import AuditLog
+from ..models.customer import Customer
+from ..models.repair import Repair, RepairLog, RepairStatusCount
+from ..utils.enums import ACTIVE_REPAIR_STATUSES, CLOSED_REPAIR_STATUSES, RepairStatus
+from .customer_profile_service import PENDING_INVALIDATIONS_KEY
+from .kpi_service import KpiService, month_start
+from .profit_loss_service import PENDING_PL_MONTHS_KEY
+from .outbox_service import OutboxService
+from .whatsapp_service import WhatsAppService
+
+S = RepairStatus
+
+# Estado actual -> estados a los que puede pasar
+TRANSITIONS: Dict[str, FrozenSet[str]] = {
+    S.RECEIVED.value: frozenset({S.DIAGNOSIS, S.WAITING_APPROVAL, S.IN_PROGRESS, S.ON_HOLD, S.READY, S.CANCELLED}),
+    S.DIAGNOSIS.value: frozenset({S.WAITING_APPROVAL, S.IN_PROGRESS, S.WAITING_PARTS, S.ON_HOLD, S.READY, S.CANCELLED}),
+    S.WAITING_APPROVAL.value: frozenset({S.IN_PROGRESS, S.ON_HOLD, S.CANCELLED}),
+    S.IN_PROGRESS.value: frozenset({S.WAITING_PARTS, S.ON_HOLD, S.READY, S.CANCELLED}),
+    S.WAITING_PARTS.value: frozenset({S.IN_PROGRESS, S.ON_HOLD, S.CANCELLED}),
+    S.ON_HOLD.value: frozenset({S.IN_PROGRESS, S.WAITING_PARTS, S.READY, S.CANCELLED}),
+    S.READY.value: frozenset({S.DELIVERED, S.IN_PROGRESS, S.ON_HOLD}),  # IN_PROGRESS = retrabajo
+    S.DELIVERED.value: frozenset({S.IN_PROGRESS}),  # Reingreso por garantía
+    S.CANCELLED.value: frozenset({S.RECEIVED}),  # Reabrir
+}
+
+# technician_id del contador que suma todas las reparaciones
+ALL_TECHNICIANS = 0
+
+
+def _count_keys(status: Optional[str], technician_id: Optional[int]) -> List[Tuple[str, int]]:
+    """Filas de repair_status_counts que cuentan una reparación."""
+    if not status:
+        return []
+    keys = [(status, ALL_TECHNICIANS)]
+    if technician_id:
+        keys.append((status, technician_id))
+    return keys
+
+
+def apply_count_deltas(connection, deltas: Counter) -> None:
+    """Suma los deltas a repair_status_counts con un solo upsert (count = count + delta)."""
+    rows = [
+        {"status": status, "technician_id": technician_id, "count": delta}
+        for (status, technician_id), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(RepairStatusCount).values(rows)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[RepairStatusCount.status, RepairStatusCount.technician_id],
+        set_={"count": RepairStatusCount.count + stmt.excluded.count, "updated_at": func.now()}
+    ))
+
+
+class RepairWorkflowService:
+    """
+    Transiciones de estado de reparaciones validadas contra TRANSITIONS.
+
+    bulk_transition mueve muchas reparaciones con un número fijo de
+    consultas: un SELECT, un UPDATE, un INSERT de RepairLog, uno de
+    AuditLog, uno del outbox (si se notifica) y la recarga de resultados.
+
+    repair_status_counts lleva el número de reparaciones por estado (total y
+    por técnico); los listeners lo mantienen en cada flush, así que el
+    dashboard y las colas por técnico lo leen sin recorrer repairs.
+    """
+
+    @staticmethod
+    def can_transition(current: Optional[str], new_status: str) -> bool:
+        return RepairStatus.normalize(new_status) in TRANSITIONS.get(RepairStatus.normalize(current) or "", frozenset())
+
+    @staticmethod
+    def transition(db: Session, repair: Repair, new_status: str, user_id: int,
+                   notes: Optional[str] = None) -> RepairLog:
+        """
+        Cambio de estado individual: valida contra TRANSITIONS, registra la
+        entrega/garantía y agrega el RepairLog. No hace commit.
+        """
+        new_status = RepairStatus.normalize(new_status)
+        if new_status not in TRANSITIONS:
+            raise ValueError(f"Estado desconocido: {new_status}")
+        old_status = repair.status
+        if not RepairWorkflowService.can_transition(old_status, new_status):
+            raise ValueError(f"Transición no permitida: {old_status} → {new_status}")
+
+        repair.status = new_status
+        if new_status == S.DELIVERED.value:
+            repair.delivered_at = datetime.now(timezone.utc)
+            if not repair.warranty_expiration:
+                repair.warranty_expiration = repair.delivered_at + timedelta(days=settings.DEFAULT_WARRANTY_DAYS)
+
+        log = RepairLog(
+            repair_id=repair.id,
+            user_id=user_id,
+            status_from=old_status,
+            status_to=new_status,
+            notes=notes or "Estado actualizado desde la interfaz"
+        )
+        db.add(log)
+        return log
+
+    # --- Contadores por estado ---
+
+    @staticmethod
+    def get_counts(db: Session, technician_id: int = ALL_TECHNICIANS) -> Dict[str, int]:
+        """Reparaciones por estado (todas, o solo las asignadas a un técnico)."""
+        counts = {status.value: 0 for status in RepairStatus}
+        rows = db.query(RepairStatusCount.status, RepairStatusCount.count).filter(
+            RepairStatusCount.technician_id == technician_id
+        )
+        for status, count in rows:
+            counts[status] = count
+        return counts
+
+    @staticmethod
+    def count_active(db: Session, technician_id: int = ALL_TECHNICIANS) -> int:
+        """Reparaciones en cola de trabajo (todo lo que no está entregado ni cancelado)."""
+        return db.query(func.coalesce(func.sum(RepairStatusCount.count), 0)).filter(
+            RepairStatusCount.technician_id == technician_id,
+            RepairStatusCount.status.in_(ACTIVE_REPAIR_STATUSES)
+        ).scalar()
+
+    @staticmethod
+    def get_queues(db: Session, technician_id: Optional[int] = None) -> dict:
+        counts = RepairWorkflowService.get_counts(db, technician_id or ALL_TECHNICIANS)
+        return {
+            "technician_id": technician_id,
+            "counts": counts,
+            "active": sum(counts.get(status, 0) for status in ACTIVE_REPAIR_STATUSES),
+            "closed": sum(counts.get(status, 0) for status in CLOSED_REPAIR_STATUSES),
+        }
+
+    @staticmethod
+    def rebuild_counters(db: Session) -> dict:
+        """Recalcula repair_status_counts desde repairs (migración o reparación de desvíos)."""
+        deltas: Counter = Counter()
+        rows = db.execute(
+            select(Repair.status, Repair.user_id, func.count(Repair.id)).group_by(Repair.status, Repair.user_id)
+        ).all()
+        for status, technician_id, count in rows:
+            for key in _count_keys(status, technician_id):
+                deltas[key] += count
+        db.execute(delete(RepairStatusCount))
+        apply_count_deltas(db.connection(), deltas)
+        db.commit()
+        return {"rows": len(deltas), "repairs": sum(count for _, _, count in rows)}
+
+    @staticmethod
+    def load_repairs(db: Session, repair_ids: Iterable[int]) -> List[Repair]:
+        """Reparaciones con cliente, repuestos y bitácora precargados, y la reincidencia calculada."""
+        repairs = db.query(Repair).options(
+            joinedload(Repair.customer),
+            selectinload(Repair.items),
+            selectinload(Repair.logs)
+        ).filter(Repair.id.in_(list(repair_ids))).order_by(Repair.id).all()
+        return RepairWorkflowService.annotate_recurrence(db, repairs)
+
+    @staticmethod
+    def annotate_recurrence(db: Session, repairs: List[Repair]) -> List[Repair]:
+        """
+        is_recurring / previous_repair_id: otra reparación del mismo cliente con
+        el mismo IMEI (o el mismo modelo si no hay IMEI), la más reciente.
+        Una sola consulta para toda la lista.
+        """
+        customer_ids = {r.customer_id for r in repairs if r.customer_id is not None}
+        by_customer: Dict[int, list] = {}
+        if customer_ids:
+            rows = db.execute(
+                select(Repair.id, Repair.customer_id, Repair.device_imei, Repair.device_model, Repair.created_at)
+                .where(Repair.customer_id.in_(customer_ids))
+            ).all()
+            for row in rows:
+                by_customer.setdefault(row.customer_id, []).append(row)
+
+        for r in repairs:
+            if r.device_imei:
+                matches = [o for o in by_customer.get(r.customer_id, ()) if o.id != r.id and o.device_imei == r.device_imei]
+            else:
+                matches = [o for o in by_customer.get(r.customer_id, ()) if o.id != r.id and o.device_model == r.device_model]
+            previous = max(matches, key=lambda o: (o.created_at is not None, o.created_at, o.id), default=None)
+            r.is_recurring = previous is not None
+            r.previous_repair_id = previous.id if previous else None
+        return repairs
+
+    @staticmethod
+    def bulk_transition(db: Session, repair_ids: List[int], new_status: str, user_id: int,
+                        notes: Optional[str] = None, notify: bool = False) -> dict:
+        """
+        Mueve las reparaciones válidas a `new_status` y devuelve las que no
+        pudieron moverse con el motivo (no existe, ya está en ese estado o
+        transición no permitida).
+        """
+        new_status = RepairStatus.normalize(new_status) or ""
+        if new_status not in TRANSITIONS:
+            raise ValueError(f"Estado desconocido: {new_status}")
+        ids = list(dict.fromkeys(repair_ids))
+
+        query = select(
+            Repair.id, Repair.status, Repair.user_id, Repair.customer_id, Repair.created_at, Repair.device_model,
+            Customer.name.label("customer_name"), Customer.phone
+        ).outerjoin(Customer, Customer.id == Repair.customer_id).where(Repair.id.in_(ids))
+        if db.get_bind().dialect.name == "postgresql":
+            query = query.with_for_update(of=Repair)
+        rows = {row.id: row for row in db.execute(query)}
+
+        moves, rejected = [], []
+        for repair_id in ids:
+            row = rows.get(repair_id)
+            if row is None:
+                rejected.append({"id": repair_id, "status": None, "reason": "Reparación no encontrada"})
+            elif RepairStatus.normalize(row.status) == new_status:
+                rejected.append({"id": repair_id, "status": row.status, "reason": "Ya se encuentra en ese estado"})
+            elif not RepairWorkflowService.can_transition(row.status, new_status):
+                rejected.append({"id": repair_id, "status": row.status,
+                                 "reason": f"Transición no permitida: {row.status} → {new_status}"})
+            else:
+                moves.append(row)
+
+        result = {"updated": [], "rejected": rejected, "notifications_queued": 0, "batch_id": None}
+        if not moves:
+            return result
+
+        move_ids = [row.id for row in moves]
+        now = datetime.now(timezone.utc)
+        values = {"status": new_status, "updated_at": func.now()}
+        if new_status == S.DELIVERED.value:
+            values["delivered_at"] = now
+            values["warranty_expiration"] = func.coalesce(
+                Repair.warranty_expiration, now + timedelta(days=settings.DEFAULT_WARRANTY_DAYS)
+            )
+        db.execute(
+            update(Repair).where(Repair.id.in_(move_ids)).values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(insert(RepairLog), [
+            {"repair_id": row.id, "user_id": user_id, "status_from": row.status, "status_to": new_status,
+             "notes": notes or "Cambio de estado masivo"}
+            for row in moves
+        ])
+        db.execute(insert(AuditLog), [
+            {"user_id": user_id, "action": "UPDATE", "target_type": "REPAIR", "target_id": row.id,
+             "details": {"status": {"old": row.status, "new": new_status}, "bulk": True}}
+            for row in moves
+        ])
+
+        # El UPDATE/INSERT masivo no pasa por los listeners del ORM: contadores
+        # por estado, cubo de KPIs y meses del P&L (si entra o sale de CANCELLED),
+        # perfiles de cliente cacheados y eventos SSE de cambio de estado
+        deltas: Counter = Counter()
+        for row in moves:
+            for key in _count_keys(row.status, row.user_id):
+                deltas[key] -= 1
+            for key in _count_keys(new_status, row.user_id):
+                deltas[key] += 1
+        apply_count_deltas(db.connection(), deltas)
+
+        KpiService.apply_repair_moves(db.connection(), (
+            (row.created_at, row.user_id, row.status, new_status) for row in moves
+        ))
+        if S.CANCELLED.value in {new_status, *(RepairStatus.normalize(row.status) for row in moves)}:
+            months = {month_start(row.created_at or now) for row in moves}
+            db.info.setdefault(PENDING_PL_MONTHS_KEY, set()).update(months)
+
+        db.info.setdefault(PENDING_INVALIDATIONS_KEY, set()).update(
+            row.customer_id for row in moves if row.customer_id
+        )
+        for row in moves:
+            queue_event(db, "repair.status_changed", repair_id=row.id, status_from=row.status,
+                        status_to=new_status, user_id=user_id)
+
+        if notify:
+            company_name = WhatsAppService.company_name(db)
+            queued = OutboxService.enqueue_many(db, (
+                {
+                    "recipient": row.phone,
+                    "body": WhatsAppService.repair_status_message(
+                        company_name, row.customer_name, row.device_model, new_status, row.id
+                    ),
+                    "reference_type": "repair",
+                    "reference_id": row.id,
+                }
+                for row in moves if row.phone
+            ), user_id=user_id)
+            result["notifications_queued"] = queued["queued"]
+            result["batch_id"] = queued["batch_id"] if queued["queued"] else None
+
+        db.commit()
+        result["updated"] = RepairWorkflowService.load_repairs(db, move_ids)
+        return result
+
+
+def _history(target: Repair, attribute: str):
+    """(valor anterior, valor actual) del atributo en este flush."""
+    history = inspect(target).attrs[attribute].history
+    current = getattr(target, attribute)
+    previous = history.deleted[0] if history.deleted else current
+    return previous, current
+
+
+def _repair_inserted(mapper, connection, target: Repair) -> None:
+    apply_count_deltas(connection, Counter(_count_keys(target.status, target.user_id)))
+
+
+def _repair_updated(mapper, connection, target: Repair) -> None:
+    old_status, new_status = _history(target, "status")
+    old_technician, new_technician = _history(target, "user_id")
+    if (old_status, old_technician) == (new_status, new_technician):
+        return
+    deltas: Counter = Counter(_count_keys(new_status, new_technician))
+    deltas.subtract(_count_keys(old_status, old_technician))
+    apply_count_deltas(connection, deltas)
+
+
+def _repair_deleted(mapper, connection, target: Repair) -> None:
+    old_status, _ = _history(target, "status")
+    old_technician, _ = _history(target, "user_id")
+    deltas: Counter = Counter()
+    deltas.subtract(_count_keys(old_status, old_technician))
+    apply_count_deltas(connection, deltas)
+
+
+def _keep_previous(target, value, oldvalue, initiator):
+    # Solo fuerza a cargar el valor anterior (active_history) para _history
+    pass
+
+
+def register_repair_workflow_listeners() -> None:
+    """Mantiene repair_status_counts en la misma transacción que el cambio de la reparación."""
+    for attribute in (Repair.status, Repair.user_id):
+        if not event.contains(attribute, "set", _keep_previous):
+            event.listen(attribute, "set", _keep_previous, active_history=True)
+    for name, listener in (
+        ("after_insert", _repair_inserted),
+        ("after_update", _repair_updated),
+        ("after_delete", _repair_deleted),
+    ):
+        if not event.contains(Repair, name, listener):
+            event.listen(Repair, name, listener)
@@ -1,197 +1,95 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case
-from ..models.sale import Sale, SaleItem
-from ..models.finance import Expense, AccountReceivable, ExchangeRate
-from ..models.inventory import InventoryLog, Product, Inventory
-from decimal import Decimal
 from datetime import date, datetime
 
 class ReportService:
     @staticmethod
     def get_profit_loss(db: Session, start_date: date, end_date: date, target_currency: str = "USD"):
-        from ..models.repair import Repair, RepairItem
-        # 1. Revenue (Accrual: All sales + all repair labor)
-        sales_revenue = db.query(func.sum(Sale.total_usd)).filter(
-            func.date(Sale.created_at) >= start_date,
-            func.date(Sale.created_at) <= end_date
-        ).scalar() or Decimal(0)
-        
-        repair_revenue = db.query(func.sum(Repair.labor_cost_usd)).filter(
-            func.date(Repair.created_at) >= start_date,
-            func.date(Repair.created_at) <= end_date,
-            Repair.status != "CANCELLED"
-        ).scalar() or Decimal(0)
-        
-        revenue_usd = sales_revenue + repair_revenue
-        
-        # 2. COGS (Cost of Goods Sold - Products + Repair Parts)
-        product_cogs = db.query(func.sum(SaleItem.quantity * SaleItem.unit_cost_usd)).join(Sale).filter(
-            func.date(Sale.created_at) >= start_date,
-            func.date(Sale.created_at) <= end_date
-        ).scalar() or Decimal(0)
-        
-        repair_cogs = db.query(func.sum(RepairItem.quantity * RepairItem.unit_cost_usd)).join(Repair).filter(
-            func.date(Repair.created_at) >= start_date,
-            func.date(Repair.created_at) <= end_date,
-            Repair.status != "CANCELLED"
-        ).scalar() or Decimal(0)
-        
-        cogs_usd = product_cogs + repair_cogs
-        
-        # 3. Expenses
-        expenses_usd = db.query(func.sum(Expense.amount_usd)).filter(
-            Expense.date >= start_date,
-            Expense.date <= end_date
-        ).scalar() or Decimal(0)
-        
-        gross_profit_usd = revenue_usd - cogs_usd
-        net_profit_usd = gross_profit_usd - expenses_usd
-        
-        # Convert to target currency if needed
-        rate = Decimal(1)
-        if target_currency == "VES":
-            rate_obj = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).first()
-            if rate_obj:
-                rate = rate_obj.rate
-        
-        return {
-            "period": {"start": start_date, "end": end_date},
-            "revenue": revenue_usd * rate,
-            "cogs": cogs_usd * rate,
-            "gross_profit": gross_profit_usd * rate,
-            "expenses": expenses_usd * rate,
-            "net_profit": net_profit_usd * rate,
-            "currency": target_currency,
-            "exchange_rate": rate
-        }
+        """P&L del rango: meses cerrados desde caché, el resto en vivo (ver ProfitLossService)."""
+        from .profit_loss_service import ProfitLossService
+        return ProfitLossService.get_profit_loss(db, start_date, end_date, target_currency)
 
     @staticmethod
     def get_aging_report(db: Session):
-        today = date.today()
-        
-        aging_query = db.query(
-            case(
-                (AccountReceivable.due_date >= today, "current"),
-                (AccountReceivable.due_date < today, "overdue")
-            ).label("aging_category"),
-            func.sum(AccountReceivable.total_amount - AccountReceivable.paid_amount).label("total_balance")
-        ).filter(AccountReceivable.status != "paid").group_by("aging_category").all()
+        """Buckets de antigüedad de la cartera, leídos de customer_ar_balances."""
+        from .ar_aging_service import ARAgingService
 
-        # More detailed buckets
-        buckets = {
-            "0-30": Decimal(0),
-            "31-60": Decimal(0),
-            "61-90": Decimal(0),
-            "90+": Decimal(0)
+        totals = ARAgingService.get_totals(db)
+        return {
+            "0-30": totals["bucket_current"] + totals["bucket_1_30"],
+            "31-60": totals["bucket_31_60"],
+            "61-90": totals["bucket_61_90"],
+            "90+": totals["bucket_over_90"]
         }
-        
-        pending_ars = db.query(AccountReceivable).filter(AccountReceivable.status != "paid").all()
-        for ar in pending_ars:
-            days_overdue = (today - ar.due_date).days
-            balance = ar.total_amount - ar.paid_amount
-            
-            if days_overdue <= 0:
-                buckets["0-30"] += balance # Current or soon due
-            elif days_overdue <= 30:
-                buckets["0-30"] += balance
-            elif days_overdue <= 60:
-                buckets["31-60"] += balance
-            elif days_overdue <= 90:
-                buckets["61-90"] += balance
-            else:
-                buckets["90+"] += balance
-                
-        return buckets
+
+    # Penalización de credit_score según el bucket vencido más antiguo con saldo
+    RISK_PENALTIES = (
+        ("bucket_over_90", 60),
+        ("bucket_61_90", 40),
+        ("bucket_31_60", 25),
+        ("bucket_1_30", 10),
+    )
+    # Mora > 60 días suspende el crédito (no toca clientes 'blocked' manualmente)
+    SUSPEND_PENALTY = 40
 
     @staticmethod
     def calculate_aging_and_risk(db: Session):
-        today = date.today()
-        pending_ars = db.query(AccountReceivable).filter(AccountReceivable.status != "paid").all()
-        
-        affected_customers = set()
-        for ar in pending_ars:
-            days_overdue = (today - ar.due_date).days
-            if days_overdue > 30:
-                from ..models.customer import Customer
-                customer = db.query(Customer).filter(Customer.id == ar.customer_id).first()
-                if customer:
-                    customer.notes = (customer.notes or "") + f" | Riesgo detectado {today}: Mora > 30 días en AP #{ar.id}"
-                    # Assuming there might be a risk_status field, if not, notes is safer for now.
-                    # Let's check Customer model if it has risk fields.
-                    affected_customers.add(customer.id)
-        
+        """
+        Job de riesgo crediticio: re-clasifica la cartera y actualiza
+        credit_score/credit_status de todos los clientes con un solo UPDATE.
+        Es idempotente: solo toca filas cuyo valor calculado cambió.
+        """
+        import time
+        from sqlalchemy import update, select, literal
+        from ..models.customer import Customer
+        from ..models.finance import CustomerARBalance
+        from .ar_aging_service import ARAgingService
+
+        started = time.perf_counter()
+        rebucket = ARAgingService.rebucket_all(db)
+
+        penalty = func.coalesce(
+            select(
+                case(
+                    *[(getattr(CustomerARBalance, column) > 0, points) for column, points in ReportService.RISK_PENALTIES],
+                    else_=0
+                )
+            ).where(CustomerARBalance.customer_id == Customer.id).scalar_subquery(),
+            0
+        )
+        new_score = literal(100) - penalty
+        new_status = case((penalty >= ReportService.SUSPEND_PENALTY, "suspended"), else_="active")
+
+        result = db.execute(
+            update(Customer)
+            .where(
+                func.coalesce(Customer.credit_status, "active") != "blocked",
+                Customer.credit_score.is_distinct_from(new_score) | Customer.credit_status.is_distinct_from(new_status)
+            )
+            .values(credit_score=new_score, credit_status=new_status)
+            .execution_options(synchronize_session=False)
+        )
         db.commit()
-        return {"updated_customers": list(affected_customers), "message": "Aging calculated and risk updated in notes."}
 
-    @staticmethod
-    def get_product_kardex(db: Session, product_id: int):
-        # 1. Get Inventory Logs (Manual adjustments, returns)
-        # 2. Get Sales (Outgoing)
-        # 3. Get Purchases (Incoming)
-        
-        # For simplicity, let's use a unified view if we had one, but we have separate tables.
-        # Let's combine them into a list and sort by date.
-        
-        kardex = []
-        
-        # Sales
-        sales = db.query(SaleItem).filter(SaleItem.product_id == product_id).join(Sale).all()
-        for item in sales:
-            kardex.append({
-                "date": item.sale.created_at,
-                "type": "VENTA",
-                "reference": f"Sale #{item.sale_id}",
-                "change": -item.quantity,
-                "user": item.sale.user.username if item.sale.user else "N/A"
-            })
-            
-        # Inventory Logs
-        logs = db.query(InventoryLog).filter(InventoryLog.product_id == product_id).all()
-        for log in logs:
-            kardex.append({
-                "date": log.created_at,
-                "type": "AJUSTE",
-                "reference": log.reason,
-                "change": log.adjustment,
-                "user": log.user.username if log.user else "N/A"
-            })
-            
-        # Purchases
-        from ..models.purchase import PurchaseItem
-        purchases = db.query(PurchaseItem).filter(PurchaseItem.product_id == product_id).join(PurchaseItem.purchase).filter(PurchaseItem.purchase.has(status="received")).all()
-        for item in purchases:
-            kardex.append({
-                "date": item.purchase.received_date,
-                "type": "COMPRA",
-                "reference": f"Purchase #{item.purchase_id}",
-                "change": item.quantity,
-                "user": item.purchase.user.username if item.purchase.user else "N/A"
-            })
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            "rows_touched": result.rowcount,
+            "customers_with_balance": rebucket["rows"],
+            "elapsed_ms": elapsed_ms,
+            "message": "Aging recalculated and credit risk updated."
+        }
 
-        # Sort by date
-        kardex.sort(key=lambda x: x["date"], reverse=True)
-        return kardex
+    @staticmethod
+    def get_product_kardex(db: Session, product_id: int, start_date: date = None, end_date: date = None,
+                           limit: int = 100, offset: int = 0):
+        """Kardex paginado leído de stock_movements (un recorrido por rango del índice)."""
+        from .stock_service import StockService
+        start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+        end = datetime.combine(end_date, datetime.max.time()) if end_date else None
+        return StockService.get_kardex(db, product_id, start, end, limit=limit, offset=offset)
 
     @staticmethod
     def get_replenishment_report(db: Session):
-        """Identifica productos que están por debajo del stock mínimo."""
-        results = db.query(
-            Product.id,
-            Product.sku,
-            Product.name,
-            Inventory.quantity,
-            Inventory.min_stock
-        ).join(Inventory, Product.id == Inventory.product_id)\
-         .filter(Inventory.quantity <= Inventory.min_stock)\
-         .order_by(Inventory.quantity.asc()).all()
-         
-        return [
-            {
-                "id": r.id,
-                "sku": r.sku,
-                "name": r.name,
-                "quantity": r.quantity,
-                "min_stock": r.min_stock,
-                "needed": max(0, r.min_stock * 2 - r.quantity) # Recomendación simple
-            } for r in results
-        ]
+        """Productos en o bajo su punto de reorden según la demanda pronosticada."""
+        from .forecast_service import ForecastService
+        return ForecastService.get_reorder_suggestions(db)
@@ -0,0 +1,194 @@
+import csv
+import io
+import tempfile
+from decimal import Decimal
+from typing import BinaryIO, Iterator
+
+from sqlalchemy import func, cast, literal, select, union_all, String
+from sqlalchemy.orm import Session
+from reportlab.lib.units import inch
+
+from ..models.customer import Customer
+from ..models.finance import CustomerPayment, Payment
+from ..models.repair import Repair, RepairItem
+from ..models.sale import Sale
+from ..models.sale_repair import SaleRepair
+from ..utils.pdf_generator import PDFGenerator
+
+# Filas por lote leídas del cursor del servidor
+STATEMENT_BATCH_SIZE = 500
+# Los archivos generados pasan a disco al superar este tamaño
+SPOOL_MAX_SIZE = 5 * 1024 * 1024
+
+STATEMENT_COLUMNS = ["Fecha", "Tipo", "Referencia", "Monto (USD)", "Saldo (USD)"]
+
+
+class CustomerStatementService:
+    """
+    Estado de cuenta del cliente en streaming: ventas, reparaciones, pagos
+    en caja y abonos se combinan con un UNION ALL ordenado en el servidor y
+    se recorren por lotes, acumulando el saldo fila a fila (memoria constante).
+
+    Cada venta o reparación es un cargo por su total; lo cobrado al momento
+    (payments) y los abonos a la deuda (customer_payments) son créditos, así
+    el saldo final coincide con lo pendiente en cuentas por cobrar. Una
+    reparación cobrada en el POS ya va dentro del total de la venta: su cargo
+    excluye lo asignado en sale_repairs.
+    """
+
+    @staticmethod
+    def statement_query(customer_id: int):
+        sales = select(
+            Sale.created_at.label("date"),
+            literal("VENTA").label("type"),
+            (literal("#") + cast(Sale.id, String)).label("ref"),
+            Sale.total_usd.label("amount"),
+            literal(1).label("seq"),
+            Sale.id.label("id")
+        ).where(Sale.customer_id == customer_id)
+
+        parts_cost = select(
+            func.coalesce(func.sum(RepairItem.unit_cost_usd * RepairItem.quantity), 0)
+        ).where(RepairItem.repair_id == Repair.id).scalar_subquery()
+        billed_in_sales = select(
+            func.coalesce(func.sum(SaleRepair.amount_allocated_usd), 0)
+        ).where(SaleRepair.repair_id == Repair.id).scalar_subquery()
+
+        repairs = select(
+            Repair.created_at.label("date"),
+            literal("REPARACIÓN").label("type"),
+            (
+                literal("#") + cast(Repair.id, String)
+                + literal(" (") + func.coalesce(Repair.device_model, "") + literal(")")
+            ).label("ref"),
+            (func.coalesce(Repair.labor_cost_usd, 0) + parts_cost - billed_in_sales).label("amount"),
+            literal(2).label("seq"),
+            Repair.id.label("id")
+        ).where(Repair.customer_id == customer_id)
+
+        sale_payments = select(
+            Payment.created_at.label("date"),
+            literal("PAGO").label("type"),
+            func.coalesce(Payment.reference, literal("Venta #") + cast(Payment.sale_id, String)).label("ref"),
+            (-Payment.amount_usd).label("amount"),
+            literal(3).label("seq"),
+            Payment.id.label("id")
+        ).join(Sale, Sale.id == Payment.sale_id).where(Sale.customer_id == customer_id)
+
+        repair_payments = select(
+            Payment.created_at.label("date"),
+            literal("PAGO").label("type"),
+            func.coalesce(Payment.reference, literal("Reparación #") + cast(Payment.repair_id, String)).label("ref"),
+            (-Payment.amount_usd).label("amount"),
+            literal(3).label("seq"),
+            Payment.id.label("id")
+        ).join(Repair, Repair.id == Payment.repair_id).where(Repair.customer_id == customer_id)
+
+        payments = select(
+            CustomerPayment.payment_date.label("date"),
+            literal("PAGO/ABONO").label("type"),
+            func.coalesce(CustomerPayment.reference, "N/A").label("ref"),
+            (-CustomerPayment.amount_usd).label("amount"),
+            literal(4).label("seq"),
+            CustomerPayment.id.label("id")
+        ).where(CustomerPayment.customer_id == customer_id)
+
+        movements = union_all(sales, repairs, sale_payments, repair_payments, payments).subquery("movements")
+        return select(
+            movements.c.date, movements.c.type, movements.c.ref, movements.c.amount
+        ).order_by(movements.c.date, movements.c.seq, movements.c.id)
+
+    @staticmethod
+    def iter_entries(db: Session, customer_id: int) -> Iterator[dict]:
+        """Recorre el historial en orden cronológico con saldo acumulado."""
+        result = db.execute(
+            CustomerStatementService.statement_query(customer_id).execution_options(yield_per=STATEMENT_BATCH_SIZE)
+        )
+        balance = Decimal(0)
+        for row in result:
+            amount = Decimal(str(row.amount or 0))
+            balance += amount
+            yield {
+                "date": row.date,
+                "type": row.type,
+                "ref": row.ref,
+                "amount": amount,
+                "balance": balance
+            }
+
+    @staticmethod
+    def _format_row(entry: dict, date_format: str) -> list:
+        return [
+            entry["date"].strftime(date_format) if entry["date"] else "",
+            entry["type"],
+            entry["ref"] or "",
+            f"{entry['amount']:.2f}",
+            f"{entry['balance']:.2f}"
+        ]
+
+    @staticmethod
+    def stream_csv(db: Session, customer_id: int) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(STATEMENT_COLUMNS)
+        for index, entry in enumerate(CustomerStatementService.iter_entries(db, customer_id), start=1):
+            writer.writerow(CustomerStatementService._format_row(entry, "%Y-%m-%d %H:%M"))
+            if index % STATEMENT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate(0)
+        yield buffer.getvalue()
+
+    @staticmethod
+    def write_pdf(db: Session, customer: Customer, fileobj: BinaryIO) -> str:
+        pdf = PDFGenerator(filename_prefix=f"historial_{customer.id}")
+        rows = (
+            CustomerStatementService._format_row(entry, "%d/%m/%Y")
+            for entry in CustomerStatementService.iter_entries(db, customer.id)
+        )
+        pdf.write_table_pages(
+            db,
+            fileobj,
+            f"ESTADO DE CUENTA: {customer.name}",
+            [
+                f"DNI/RIF: {customer.dni or 'N/A'}",
+                f"Saldo Pendiente: ${float(customer.current_debt or 0):.2f}"
+            ],
+            list(zip(STATEMENT_COLUMNS, [1.0 * inch, 1.1 * inch, 2.4 * inch, 1.1 * inch, 1.1 * inch])),
+            rows
+        )
+        return pdf.filename
+
+    @staticmethod
+    def write_excel(db: Session, customer: Customer, fileobj: BinaryIO) -> None:
+        from openpyxl import Workbook
+
+        # write_only: las filas se escriben directamente al XML sin mantener celdas en memoria
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("Historial")
+        sheet.append(STATEMENT_COLUMNS)
+        for entry in CustomerStatementService.iter_entries(db, customer.id):
+            sheet.append([
+                entry["date"].strftime("%Y-%m-%d %H:%M") if entry["date"] else "",
+                entry["type"],
+                entry["ref"],
+                float(entry["amount"]),
+                float(entry["balance"])
+            ])
+        workbook.save(fileobj)
+
+    @staticmethod
+    def spooled_file():
+        return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+
+    @staticmethod
+    def iter_file(fileobj: BinaryIO, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        try:
+            fileobj.seek(0)
+            while True:
+                chunk = fileobj.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            fileobj.close()
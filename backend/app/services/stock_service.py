@@ -0,0 +1,161 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, select, insert, literal
+from sqlalchemy.orm import Session
+
+from ..models.inventory import Inventory, StockMovement
+from ..models.purchase import PurchaseItem
+from ..models.user import User
+
+MOVEMENT_LABELS = {
+    "sale": "VENTA",
+    "return": "DEVOLUCIÓN",
+    "repair": "REPARACIÓN",
+    "purchase": "COMPRA",
+    "adjustment": "AJUSTE",
+    "opening": "SALDO INICIAL",
+}
+
+REFERENCE_LABELS = {
+    "sale": "Venta",
+    "repair": "Reparación",
+    "purchase": "Compra",
+}
+
+
+class StockService:
+    """
+    Libro de movimientos de stock (stock_movements).
+
+    Quien modifica Inventory.quantity registra aquí el movimiento con el
+    saldo resultante; el Kardex y el stock a una fecha se leen solo de esta
+    tabla usando el índice (product_id, created_at, id).
+    """
+
+    @staticmethod
+    def record(
+        db: Session,
+        product_id: int,
+        quantity: int,
+        balance_after: int,
+        movement_type: str,
+        reference_type: Optional[str] = None,
+        reference_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        unit_cost: Optional[Decimal] = None,
+        note: Optional[str] = None
+    ) -> Optional[StockMovement]:
+        if not quantity:
+            return None
+        movement = StockMovement(
+            product_id=product_id,
+            movement_type=movement_type,
+            quantity=quantity,
+            balance_after=balance_after,
+            unit_cost_usd=unit_cost,
+            reference_type=reference_type,
+            reference_id=reference_id,
+            user_id=user_id,
+            note=note[:255] if note else None
+        )
+        db.add(movement)
+        return movement
+
+    @staticmethod
+    def record_purchase(db: Session, purchase_id: int, user_id: int) -> int:
+        """
+        Un movimiento por producto recibido (INSERT ... SELECT). Debe llamarse
+        después de sumar las cantidades en inventory.
+        """
+        received = (
+            select(
+                PurchaseItem.product_id.label("product_id"),
+                func.sum(PurchaseItem.quantity).label("quantity"),
+                func.sum(PurchaseItem.subtotal_usd).label("cost")
+            )
+            .where(PurchaseItem.purchase_id == purchase_id)
+            .group_by(PurchaseItem.product_id)
+            .subquery("received")
+        )
+        result = db.execute(
+            insert(StockMovement).from_select(
+                [
+                    "product_id", "movement_type", "quantity", "balance_after", "unit_cost_usd",
+                    "reference_type", "reference_id", "user_id"
+                ],
+                select(
+                    received.c.product_id,
+                    literal("purchase"),
+                    received.c.quantity,
+                    Inventory.quantity,
+                    received.c.cost / received.c.quantity,
+                    literal("purchase"),
+                    literal(purchase_id),
+                    literal(user_id)
+                )
+                .join(Inventory, Inventory.product_id == received.c.product_id)
+                .where(received.c.quantity > 0)
+            )
+        )
+        return result.rowcount
+
+    @staticmethod
+    def get_kardex(
+        db: Session,
+        product_id: int,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        limit: int = 100,
+        offset: int = 0
+    ) -> list:
+        """Movimientos del producto (más recientes primero) en una sola consulta paginada."""
+        query = (
+            select(
+                StockMovement.created_at,
+                StockMovement.movement_type,
+                StockMovement.reference_type,
+                StockMovement.reference_id,
+                StockMovement.note,
+                StockMovement.quantity,
+                StockMovement.balance_after,
+                StockMovement.unit_cost_usd,
+                User.username
+            )
+            .outerjoin(User, User.id == StockMovement.user_id)
+            .where(StockMovement.product_id == product_id)
+        )
+        if start:
+            query = query.where(StockMovement.created_at >= start)
+        if end:
+            query = query.where(StockMovement.created_at <= end)
+        query = query.order_by(StockMovement.created_at.desc(), StockMovement.id.desc()).limit(limit).offset(offset)
+
+        kardex = []
+        for row in db.execute(query):
+            if row.reference_type:
+                reference = f"{REFERENCE_LABELS.get(row.reference_type, row.reference_type)} #{row.reference_id}"
+            else:
+                reference = row.note or ""
+            kardex.append({
+                "date": row.created_at,
+                "type": MOVEMENT_LABELS.get(row.movement_type, row.movement_type.upper()),
+                "reference": reference,
+                "change": row.quantity,
+                "balance": row.balance_after,
+                "unit_cost_usd": row.unit_cost_usd,
+                "user": row.username or "N/A"
+            })
+        return kardex
+
+    @staticmethod
+    def stock_at(db: Session, product_id: int, at: datetime) -> int:
+        """Stock del producto a una fecha: saldo del último movimiento anterior (búsqueda por índice)."""
+        balance = db.execute(
+            select(StockMovement.balance_after)
+            .where(StockMovement.product_id == product_id, StockMovement.created_at <= at)
+            .order_by(StockMovement.created_at.desc(), StockMovement.id.desc())
+            .limit(1)
+        ).scalar()
+        return balance or 0
@@ -0,0 +1,302 @@
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import and_, case, delete, event, func, insert, or_, select, union, update
+from sqlalchemy.orm import Session
+
+from ..core.logging import get_logger
+from ..models.kpi import TechnicianRepairStat
+from ..models.repair import Repair, RepairItem, RepairLog
+from ..models.user import User
+from ..utils.enums import RepairStatus
+
+logger = get_logger("technician_analytics")
+
+S = RepairStatus
+REFRESH_CHUNK_SIZE = 500
+PERCENTILES = (50, 90)
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite devuelve fechas sin zona; se asumen en UTC como las guarda la app
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _hours(start: Optional[datetime], end: Optional[datetime]) -> Optional[Decimal]:
+    if start is None or end is None or end < start:
+        return None
+    return Decimal(str(round((end - start).total_seconds() / 3600, 2)))
+
+
+def _distribution(values: List[float]) -> dict:
+    """Media y percentiles (horas) de una lista de duraciones."""
+    if not values:
+        return {"mean": None, "count": 0, **{f"p{p}": None for p in PERCENTILES}}
+    data = np.asarray(values, dtype=float)
+    return {
+        "mean": round(float(data.mean()), 2),
+        "count": int(data.size),
+        **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(data, PERCENTILES))},
+    }
+
+
+class TechnicianAnalyticsService:
+    """
+    Rendimiento por técnico a partir de repair_logs.
+
+    - refresh: una sola consulta por lote de reparaciones. Funciones de
+      ventana sobre la bitácora (LAG para detectar reaperturas, FIRST_VALUE
+      para quién marcó READY) y sobre repairs (LAG por cliente + equipo para
+      los reingresos en garantía), más los repuestos; el resultado reemplaza
+      las filas de technician_repair_stats de esas reparaciones.
+    - Incremental: solo se recalculan las reparaciones con bitácora nueva
+      (id > último last_log_id) o modificadas después del último
+      source_updated_at (los cambios de repuestos actualizan
+      Repair.updated_at); el primer refresh hace el backfill completo.
+    - get_performance agrega la tabla resumen (throughput, media y
+      percentiles de tiempos, retrabajo y repuestos) en el rango pedido.
+    """
+
+    @staticmethod
+    def _pending_repair_ids(db: Session) -> List[int]:
+        last_log_id, last_updated_at = db.query(
+            func.max(TechnicianRepairStat.last_log_id),
+            func.max(TechnicianRepairStat.source_updated_at)
+        ).one()
+        changed = [select(RepairLog.repair_id).where(RepairLog.id > (last_log_id or 0))]
+        if last_updated_at is not None:
+            changed.append(select(Repair.id).where(Repair.updated_at > last_updated_at))
+        # Reparaciones sin fila: todas en el primer refresh; luego las creadas sin bitácora
+        changed.append(
+            select(Repair.id).outerjoin(TechnicianRepairStat, TechnicianRepairStat.repair_id == Repair.id)
+            .where(TechnicianRepairStat.id.is_(None))
+        )
+        return sorted({row for row in db.execute(union(*changed)).scalars() if row is not None})
+
+    @staticmethod
+    def _compute(db: Session, repair_ids: List[int]) -> List[dict]:
+        """Filas de technician_repair_stats para un lote de reparaciones (una consulta)."""
+        log_order = (RepairLog.created_at, RepairLog.id)
+        transitions = select(
+            RepairLog.id,
+            RepairLog.repair_id,
+            RepairLog.status_to,
+            RepairLog.created_at,
+            func.lag(RepairLog.status_to, type_=RepairLog.status_to.type).over(partition_by=RepairLog.repair_id, order_by=log_order).label("previous_status"),
+            func.first_value(RepairLog.user_id).over(
+                partition_by=(RepairLog.repair_id, RepairLog.status_to), order_by=log_order
+            ).label("first_user_id"),
+        ).where(RepairLog.repair_id.in_(repair_ids)).subquery()
+
+        t = transitions.c
+        milestones = select(
+            t.repair_id,
+            func.min(case((t.status_to == S.RECEIVED.value, t.created_at))).label("received_at"),
+            func.min(case((t.status_to == S.READY.value, t.created_at))).label("ready_at"),
+            func.min(case((t.status_to == S.DELIVERED.value, t.created_at))).label("delivered_at"),
+            func.max(case((t.status_to == S.READY.value, t.first_user_id))).label("ready_user_id"),
+            func.sum(case((and_(
+                t.status_to == S.IN_PROGRESS.value,
+                t.previous_status.in_([S.READY.value, S.DELIVERED.value])
+            ), 1), else_=0)).label("reopened_count"),
+            func.max(t.id).label("last_log_id"),
+        ).group_by(t.repair_id).subquery()
+
+        parts = select(
+            RepairItem.repair_id,
+            func.sum(RepairItem.quantity).label("quantity"),
+            func.sum(func.coalesce(RepairItem.unit_cogs_usd, RepairItem.unit_cost_usd, 0) * RepairItem.quantity).label("cost_usd"),
+        ).where(RepairItem.repair_id.in_(repair_ids)).group_by(RepairItem.repair_id).subquery()
+
+        # Reparación anterior del mismo cliente y equipo (IMEI o, sin IMEI, modelo)
+        device = func.coalesce(func.nullif(Repair.device_imei, ""), Repair.device_model)
+        repair_order = (Repair.created_at, Repair.id)
+        history = select(
+            Repair.id,
+            Repair.user_id,
+            Repair.created_at,
+            Repair.delivered_at,
+            Repair.updated_at,
+            func.lag(Repair.user_id).over(partition_by=(Repair.customer_id, device), order_by=repair_order).label("previous_user_id"),
+            func.lag(Repair.warranty_expiration, type_=Repair.warranty_expiration.type).over(partition_by=(Repair.customer_id, device), order_by=repair_order).label("previous_warranty"),
+            func.lag(Repair.id).over(partition_by=(Repair.customer_id, device), order_by=repair_order).label("previous_id"),
+        ).where(or_(
+            Repair.id.in_(repair_ids),
+            Repair.customer_id.in_(select(Repair.customer_id).where(Repair.id.in_(repair_ids)))
+        )).subquery()
+
+        h, m = history.c, milestones.c
+        rows = db.execute(
+            select(
+                h.id, h.user_id, h.created_at, h.delivered_at, h.updated_at,
+                h.previous_id, h.previous_user_id, h.previous_warranty,
+                m.received_at, m.ready_at, m.delivered_at.label("logged_delivered_at"),
+                m.ready_user_id, m.reopened_count, m.last_log_id,
+                parts.c.quantity, parts.c.cost_usd,
+            )
+            .outerjoin(milestones, m.repair_id == h.id)
+            .outerjoin(parts, parts.c.repair_id == h.id)
+            .where(h.id.in_(repair_ids))
+        ).all()
+
+        stats = []
+        for row in rows:
+            received_at = _aware(row.received_at or row.created_at)
+            delivered_at = _aware(row.logged_delivered_at or row.delivered_at)
+            # Entregas directas (POS) sin pasar por READY: la entrega cierra el trabajo
+            ready_at = _aware(row.ready_at) or delivered_at
+            previous_warranty = _aware(row.previous_warranty)
+            stats.append({
+                "repair_id": row.id,
+                "technician_id": row.user_id or row.ready_user_id or 0,
+                "received_at": received_at,
+                "ready_at": ready_at,
+                "delivered_at": delivered_at,
+                "hours_to_ready": _hours(received_at, ready_at),
+                "hours_ready_to_delivered": _hours(ready_at, delivered_at),
+                "hours_to_delivered": _hours(received_at, delivered_at),
+                "reopened_count": int(row.reopened_count or 0),
+                "is_warranty_return": bool(
+                    row.previous_id is not None and previous_warranty is not None
+                    and received_at is not None and received_at <= previous_warranty
+                ),
+                "previous_technician_id": row.previous_user_id if row.previous_id is not None else None,
+                "parts_quantity": int(row.quantity or 0),
+                "parts_cost_usd": Decimal(str(row.cost_usd or 0)).quantize(Decimal("0.01")),
+                "last_log_id": row.last_log_id or 0,
+                "source_updated_at": row.updated_at,
+            })
+        return stats
+
+    @staticmethod
+    def refresh(db: Session, repair_ids: Optional[Iterable[int]] = None) -> dict:
+        """Recalcula las reparaciones indicadas o, por defecto, las que cambiaron desde el último refresh."""
+        started = time.perf_counter()
+        ids = sorted(set(repair_ids)) if repair_ids is not None else TechnicianAnalyticsService._pending_repair_ids(db)
+        rows = 0
+        for offset in range(0, len(ids), REFRESH_CHUNK_SIZE):
+            chunk = ids[offset:offset + REFRESH_CHUNK_SIZE]
+            stats = TechnicianAnalyticsService._compute(db, chunk)
+            db.execute(delete(TechnicianRepairStat).where(TechnicianRepairStat.repair_id.in_(chunk)))
+            if stats:
+                db.execute(insert(TechnicianRepairStat), stats)
+            rows += len(stats)
+        db.commit()
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        if ids:
+            logger.info("Technician stats refreshed", repairs=rows, elapsed_ms=elapsed_ms)
+        return {"repairs": rows, "elapsed_ms": elapsed_ms}
+
+    @staticmethod
+    def rebuild(db: Session) -> dict:
+        db.execute(delete(TechnicianRepairStat))
+        db.commit()
+        return TechnicianAnalyticsService.refresh(db)
+
+    @staticmethod
+    def get_performance(db: Session, start_date: date, end_date: date) -> List[dict]:
+        """
+        Métricas por técnico entre dos fechas (inclusive). Una reparación
+        cuenta como completada en la fecha en que llegó a READY; los reingresos
+        en garantía se atribuyen al técnico de la reparación anterior.
+        rework_rate = (reaperturas + reingresos en garantía) / completadas.
+        """
+        start = datetime.combine(start_date, dt_time.min)
+        end = datetime.combine(end_date + timedelta(days=1), dt_time.min)
+        weeks = max((end - start).days / 7, 1 / 7)
+
+        def in_range(column):
+            return and_(column >= start, column < end)
+
+        metrics: Dict[int, dict] = defaultdict(lambda: {
+            "completed": 0, "delivered": 0, "reopened": 0, "warranty_returns": 0,
+            "parts_quantity": 0, "parts_cost_usd": Decimal(0),
+            "to_ready": [], "ready_to_delivered": [], "to_delivered": [],
+        })
+
+        completed = db.query(
+            TechnicianRepairStat.technician_id,
+            TechnicianRepairStat.hours_to_ready,
+            TechnicianRepairStat.reopened_count,
+            TechnicianRepairStat.parts_quantity,
+            TechnicianRepairStat.parts_cost_usd,
+        ).filter(in_range(TechnicianRepairStat.ready_at))
+        for technician_id, hours, reopened, quantity, cost in completed:
+            row = metrics[technician_id]
+            row["completed"] += 1
+            row["reopened"] += reopened or 0
+            row["parts_quantity"] += quantity or 0
+            row["parts_cost_usd"] += Decimal(str(cost or 0))
+            if hours is not None:
+                row["to_ready"].append(float(hours))
+
+        delivered = db.query(
+            TechnicianRepairStat.technician_id,
+            TechnicianRepairStat.hours_ready_to_delivered,
+            TechnicianRepairStat.hours_to_delivered,
+        ).filter(in_range(TechnicianRepairStat.delivered_at))
+        for technician_id, ready_to_delivered, to_delivered in delivered:
+            row = metrics[technician_id]
+            row["delivered"] += 1
+            if ready_to_delivered is not None:
+                row["ready_to_delivered"].append(float(ready_to_delivered))
+            if to_delivered is not None:
+                row["to_delivered"].append(float(to_delivered))
+
+        returns = db.query(
+            TechnicianRepairStat.previous_technician_id,
+            func.count(TechnicianRepairStat.id)
+        ).filter(
+            TechnicianRepairStat.is_warranty_return == True,
+            in_range(TechnicianRepairStat.received_at)
+        ).group_by(TechnicianRepairStat.previous_technician_id)
+        for technician_id, count in returns:
+            metrics[technician_id or 0]["warranty_returns"] += count
+
+        names = dict(
+            db.query(User.id, func.coalesce(User.full_name, User.username)).filter(User.id.in_(list(metrics))).all()
+        ) if metrics else {}
+
+        result = []
+        for technician_id, row in metrics.items():
+            rework = row["reopened"] + row["warranty_returns"]
+            result.append({
+                "technician_id": technician_id,
+                "technician_name": names.get(technician_id) or "Sin asignar",
+                "completed": row["completed"],
+                "delivered": row["delivered"],
+                "throughput_per_week": round(row["completed"] / weeks, 2),
+                "turnaround_hours": {
+                    "to_ready": _distribution(row["to_ready"]),
+                    "ready_to_delivered": _distribution(row["ready_to_delivered"]),
+                    "to_delivered": _distribution(row["to_delivered"]),
+                },
+                "reopened": row["reopened"],
+                "warranty_returns": row["warranty_returns"],
+                "rework_rate": round(rework / row["completed"], 4) if row["completed"] else None,
+                "parts_quantity": row["parts_quantity"],
+                "parts_cost_usd": row["parts_cost_usd"],
+                "parts_per_repair": round(row["parts_quantity"] / row["completed"], 2) if row["completed"] else None,
+            })
+        return sorted(result, key=lambda r: (-r["completed"], r["technician_name"]))
+
+
+def _touch_repair(mapper, connection, target) -> None:
+    # Los repuestos no tienen marca de tiempo propia: el cambio se refleja en
+    # Repair.updated_at, que _pending_repair_ids compara con source_updated_at
+    if target.repair_id is not None:
+        connection.execute(update(Repair).where(Repair.id == target.repair_id).values(updated_at=func.now()))
+
+
+def register_technician_stats_listeners() -> None:
+    """Altas, cambios y bajas de repuestos marcan su reparación para el próximo refresh."""
+    if event.contains(RepairItem, "after_insert", _touch_repair):
+        return
+    for event_name in ("after_insert", "after_update", "after_delete"):
+        event.listen(RepairItem, event_name, _touch_repair)
@@ -0,0 +1,149 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Iterable, List
+
+from sqlalchemy import func, case, literal, literal_column, select, union_all
+from sqlalchemy.orm import Session
+
+BUCKETS = ("day", "week", "month")
+
+
+class Series:
+    """
+    Definición de una serie para TimeSeriesService.aggregate.
+
+    - date_column: columna de fecha/hora que define el bucket.
+    - amount_usd: expresión del monto en USD.
+    - amount_ves: expresión del monto en VES; si se omite se calcula con
+      amount_usd * exchange_rate (tasa histórica de cada fila).
+    """
+
+    def __init__(self, name: str, date_column, amount_usd, amount_ves=None, exchange_rate=None, filters: Iterable = ()):
+        if amount_ves is None and exchange_rate is None:
+            raise ValueError(f"La serie '{name}' necesita amount_ves o exchange_rate")
+        self.name = name
+        self.date_column = date_column
+        self.amount_usd = amount_usd
+        self.amount_ves = amount_ves if amount_ves is not None else amount_usd * exchange_rate
+        self.filters = list(filters)
+
+
+class TimeSeriesService:
+    """
+    Agregación de series temporales con relleno de huecos en SQL.
+
+    Un calendario (generate_series en PostgreSQL, CTE recursivo en SQLite)
+    se une por LEFT JOIN con el UNION ALL de todas las series, de modo que
+    cualquier gráfico se resuelve en una sola consulta.
+    """
+
+    @staticmethod
+    def bucket_start(value: date, bucket: str) -> date:
+        if bucket == "day":
+            return value
+        if bucket == "week":
+            return value - timedelta(days=value.weekday())  # Lunes
+        if bucket == "month":
+            return value.replace(day=1)
+        raise ValueError(f"Bucket no soportado: {bucket}")
+
+    @staticmethod
+    def next_bucket(value: date, bucket: str) -> date:
+        if bucket == "day":
+            return value + timedelta(days=1)
+        if bucket == "week":
+            return value + timedelta(days=7)
+        if value.month == 12:
+            return value.replace(year=value.year + 1, month=1, day=1)
+        return value.replace(month=value.month + 1, day=1)
+
+    @staticmethod
+    def _bucket_expression(dialect: str, column, bucket: str):
+        """Inicio del bucket como texto 'YYYY-MM-DD' (misma clave en ambos dialectos)."""
+        if dialect == "postgresql":
+            return func.to_char(func.date_trunc(bucket, column), "YYYY-MM-DD")
+        if bucket == "day":
+            return func.date(column)
+        if bucket == "week":
+            return func.date(column, "-6 days", "weekday 1")
+        return func.strftime("%Y-%m-01", column)
+
+    @staticmethod
+    def _calendar(dialect: str, start: date, end: date, bucket: str):
+        """Una fila por bucket entre start y end (ambos ya alineados)."""
+        if dialect == "postgresql":
+            series = func.generate_series(
+                literal(datetime.combine(start, time.min)),
+                literal(datetime.combine(end, time.min)),
+                literal_column(f"interval '1 {bucket}'")
+            ).table_valued("value").render_derived(name="gs")
+            return select(func.to_char(series.c.value, "YYYY-MM-DD").label("bucket")).subquery("calendar")
+
+        step = {"day": "+1 day", "week": "+7 days", "month": "+1 month"}[bucket]
+        calendar = select(literal(start.isoformat()).label("bucket")).cte("calendar", recursive=True)
+        calendar = calendar.union_all(
+            select(func.date(calendar.c.bucket, step)).where(func.date(calendar.c.bucket, step) <= end.isoformat())
+        )
+        return calendar
+
+    @staticmethod
+    def aggregate(
+        db: Session,
+        series: List[Series],
+        start: date,
+        end: date,
+        bucket: str = "day"
+    ) -> List[dict]:
+        """
+        Devuelve una fila por bucket (incluidos los vacíos) con
+        `<serie>_usd` y `<serie>_ves` para cada serie, en una sola consulta.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"Bucket no soportado: {bucket}")
+
+        dialect = db.get_bind().dialect.name
+        start = TimeSeriesService.bucket_start(start, bucket)
+        end = TimeSeriesService.bucket_start(end, bucket)
+        range_end = datetime.combine(TimeSeriesService.next_bucket(end, bucket), time.min)
+
+        branches = [
+            select(
+                TimeSeriesService._bucket_expression(dialect, s.date_column, bucket).label("bucket"),
+                literal(s.name).label("series"),
+                s.amount_usd.label("amount_usd"),
+                s.amount_ves.label("amount_ves")
+            ).where(
+                s.date_column >= datetime.combine(start, time.min),
+                s.date_column < range_end,
+                *s.filters
+            )
+            for s in series
+        ]
+        data = union_all(*branches).subquery("data")
+        calendar = TimeSeriesService._calendar(dialect, start, end, bucket)
+
+        columns = []
+        for s in series:
+            for currency in ("usd", "ves"):
+                amount = data.c[f"amount_{currency}"]
+                columns.append(
+                    func.coalesce(func.sum(case((data.c.series == s.name, amount), else_=0)), 0)
+                    .label(f"{s.name}_{currency}")
+                )
+
+        query = (
+            select(calendar.c.bucket, *columns)
+            .select_from(calendar.outerjoin(data, data.c.bucket == calendar.c.bucket))
+            .group_by(calendar.c.bucket)
+            .order_by(calendar.c.bucket)
+        )
+
+        rows = []
+        for row in db.execute(query):
+            values = row._asdict()
+            values["bucket"] = date.fromisoformat(str(values["bucket"])[:10])
+            for key, value in values.items():
+                if key != "bucket":
+                    values[key] = float(Decimal(str(value or 0)))
+            rows.append(values)
+        return rows
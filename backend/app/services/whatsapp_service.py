@@ -1,95 +1,104 @@
-import requests
 import logging
+from typing import Optional, Tuple
+
+import httpx
 from sqlalchemy.orm import Session
+
 from ..models.settings import SystemSetting
+from ..utils.enums import NotificationType, RepairStatus
 
 logger = logging.getLogger(__name__)
 
+REPAIR_STATUS_LABELS = {
+    "RECEIVED": "Recibido 📥",
+    "IN_PROGRESS": "En Reparación 🛠️",
+    "ON_HOLD": "En Espera ⏳",
+    "READY": "Listo para Retirar ✅",
+    "DELIVERED": "Entregado 📦",
+    "CANCELLED": "Cancelado ❌"
+}
+
+
 class WhatsAppService:
+    """
+    Mensajes de WhatsApp. Los handlers solo encolan (OutboxService); el envío
+    HTTP lo hace el worker del outbox con WhatsAppService.send.
+    """
+
+    channel = NotificationType.WHATSAPP.value
+
     @staticmethod
     def _get_settings(db: Session):
         return db.query(SystemSetting).filter(SystemSetting.is_active == True).first()
 
     @staticmethod
-    def send_notification(db: Session, phone: str, message: str) -> bool:
-        """
-        Sends a simple text message via WhatsApp API configured in settings.
-        Expects phone in 584121234567 format.
-        """
-        if not phone:
-            logger.error("WhatsApp: No phone number provided")
-            return False
-
+    def load_config(db: Session) -> Optional[dict]:
+        """URL, token y empresa; se lee una vez por lote, no por mensaje."""
         settings = WhatsAppService._get_settings(db)
         if not settings or not settings.whatsapp_api_url or not settings.whatsapp_token:
-            logger.error("WhatsApp: API not configured in settings")
-            return False
+            return None
+        return {
+            "url": settings.whatsapp_api_url,
+            "token": settings.whatsapp_token,
+            "company_name": settings.company_name or "ServiceFlow Pro",
+        }
+
+    @staticmethod
+    def normalize_phone(phone: str) -> str:
+        # Expects phone in 584121234567 format (remove + and spaces)
+        return phone.replace('+', '').replace(' ', '')
 
-        # Normalize phone (remove +)
-        clean_phone = phone.replace('+', '').replace(' ', '')
+    @staticmethod
+    async def send(client: httpx.AsyncClient, config: dict, phone: str, message: str) -> Tuple[bool, bool, str]:
+        """
+        Envía un texto. Devuelve (enviado, reintentable, detalle).
 
+        This is a generic implementation. Depending on the provider (Meta, Twilio,
+        UltraMsg, etc.) the payload structure might vary; we use a JSON POST.
+        """
+        payload = {
+            "to": phone,
+            "message": message,
+            "token": config["token"]  # Some providers use token in body
+        }
+        headers = {
+            "Authorization": f"Bearer {config['token']}",
+            "Content-Type": "application/json"
+        }
         try:
-            # This is a generic implementation. Depending on the provider (Meta, Twilio, UltraMsg, etc.)
-            # the payload structure might vary. We'll use a standard JSON POST approach.
-            payload = {
-                "to": clean_phone,
-                "message": message,
-                "token": settings.whatsapp_token # Some providers use token in body
-            }
-            
-            headers = {
-                "Authorization": f"Bearer {settings.whatsapp_token}",
-                "Content-Type": "application/json"
-            }
-
-            response = requests.post(
-                settings.whatsapp_api_url,
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
-
-            if response.status_code in [200, 201]:
-                logger.info(f"WhatsApp message sent to {clean_phone}")
-                return True
-            else:
-                logger.error(f"WhatsApp API error: {response.text}")
-                return False
-
-        except Exception as e:
-            logger.error(f"WhatsApp exception: {str(e)}")
-            return False
+            response = await client.post(config["url"], json=payload, headers=headers)
+        except httpx.TransportError as e:
+            return False, True, f"{type(e).__name__}: {e}"
+
+        if response.status_code in (200, 201):
+            logger.info(f"WhatsApp message sent to {phone}")
+            return True, False, response.text[:500]
+        # 429 y 5xx se reintentan; el resto (credenciales, número inválido) no
+        retryable = response.status_code == 429 or response.status_code >= 500
+        logger.error(f"WhatsApp API error ({response.status_code}): {response.text[:500]}")
+        return False, retryable, f"HTTP {response.status_code}: {response.text[:500]}"
 
     @staticmethod
-    def send_ticket_notification(db: Session, phone: str, customer_name: str, amount: float, reference: str):
+    def ticket_message(company_name: str, customer_name: str, amount: float, reference: str) -> str:
         """Pre-formatted message for sales tickets."""
-        company_name = WhatsAppService._get_settings(db).company_name or "ServiceFlow Pro"
-        message = (
+        return (
             f"Hola {customer_name}! 📄\n\n"
             f"Gracias por preferir *{company_name}*.\n"
             f"Tu comprobante de pago *#{reference}* por un monto de *${amount:.2f}* ha sido generado con éxito.\n\n"
             f"¡Feliz día! ✨"
         )
-        return WhatsAppService.send_notification(db, phone, message)
 
     @staticmethod
-    def send_repair_status_notification(db: Session, phone: str, customer_name: str, device: str, status: str, repair_id: int):
+    def repair_status_message(company_name: str, customer_name: str, device: str, status: str, repair_id: int) -> str:
         """Pre-formatted message for repair updates."""
-        company_name = WhatsAppService._get_settings(db).company_name or "ServiceFlow Pro"
-        status_map = {
-            "RECEIVED": "Recibido 📥",
-            "IN_PROGRESS": "En Reparación 🛠️",
-            "ON_HOLD": "En Espera ⏳",
-            "COMPLETED": "Listo para Retirar ✅",
-            "DELIVERED": "Entregado 📦",
-            "CANCELLED": "Cancelado ❌"
-        }
-        
-        status_friendly = status_map.get(status.upper(), status)
-        
-        message = (
+        status_friendly = REPAIR_STATUS_LABELS.get(RepairStatus.normalize(status), status)
+        return (
             f"Hola {customer_name}! 👋\n\n"
             f"Te informamos que tu equipo *{device}* (ID: {repair_id}) se encuentra en estado: *{status_friendly}* en *{company_name}*.\n\n"
             f"Te avisaremos ante cualquier novedad. ¡Muchas gracias!"
         )
-        return WhatsAppService.send_notification(db, phone, message)
+
+    @staticmethod
+    def company_name(db: Session) -> str:
+        settings = WhatsAppService._get_settings(db)
+        return (settings.company_name if settings else None) or "ServiceFlow Pro"
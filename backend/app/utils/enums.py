@@ -17,10 +17,33 @@ class RepairStatus(str, Enum):
     WAITING_APPROVAL = "WAITING_APPROVAL"
     IN_PROGRESS = "IN_PROGRESS"
     WAITING_PARTS = "WAITING_PARTS"
+    ON_HOLD = "ON_HOLD"
     READY = "READY"
     DELIVERED = "DELIVERED"
     CANCELLED = "CANCELLED"
 
+    @staticmethod
+    def normalize(value):
+        """Forma canónica (mayúsculas) con la que se guarda el estado; mapea alias heredados."""
+        if value is None:
+            return None
+        if isinstance(value, Enum):
+            value = value.value
+        value = str(value).strip().upper().replace(" ", "_")
+        return REPAIR_STATUS_ALIASES.get(value, value)
+
+
+# Valores heredados que aparecen en datos y código antiguo
+REPAIR_STATUS_ALIASES = {
+    "COMPLETED": RepairStatus.READY.value,
+    "FINISHED": RepairStatus.READY.value,
+    "WAITING_FOR_PARTS": RepairStatus.WAITING_PARTS.value,
+}
+
+# Reparaciones cerradas; cualquier otro estado está en cola de trabajo
+CLOSED_REPAIR_STATUSES = (RepairStatus.DELIVERED.value, RepairStatus.CANCELLED.value)
+ACTIVE_REPAIR_STATUSES = tuple(s.value for s in RepairStatus if s.value not in CLOSED_REPAIR_STATUSES)
+
 
 class PaymentMethod(str, Enum):
     """Métodos de pago aceptados."""
@@ -31,6 +54,15 @@ class PaymentMethod(str, Enum):
     MOBILE_PAYMENT = "mobile_payment"
     OTHER = "other"
 
+    @staticmethod
+    def normalize(value):
+        """Forma canónica (minúsculas, sin espacios) con la que se guarda el método de pago."""
+        if value is None:
+            return None
+        if isinstance(value, Enum):
+            value = value.value
+        return str(value).strip().lower()
+
 
 class PaymentStatus(str, Enum):
     """Estados de pago."""
@@ -94,6 +126,7 @@ class NotificationType(str, Enum):
 class NotificationStatus(str, Enum):
     """Estados de envío de notificaciones."""
     PENDING = "pending"
+    SENDING = "sending"
     SENT = "sent"
     DELIVERED = "delivered"
     FAILED = "failed"
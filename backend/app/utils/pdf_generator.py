@@ -9,6 +9,8 @@ from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
+from reportlab.pdfgen import canvas as pdf_canvas
+from typing import BinaryIO, Iterable, List, Tuple
 from ..models.settings import SystemSetting
 from sqlalchemy.orm import Session
 
@@ -103,3 +105,79 @@ class PDFGenerator:
         doc.build(elements)
         buffer.seek(0)
         return buffer
+
+    def write_table_pages(
+        self,
+        db: Session,
+        fileobj: BinaryIO,
+        title: str,
+        summary_lines: List[str],
+        columns: List[Tuple[str, float]],
+        rows: Iterable[List[str]]
+    ):
+        """
+        Draws a long table straight onto the canvas, one page at a time.
+        Unlike SimpleDocTemplate + Table, rows are consumed from an iterator
+        and never held in memory as flowables.
+        """
+        info = self._get_company_info(db)
+        page_width, page_height = letter
+        margin = 50
+        row_height = 16
+        c = pdf_canvas.Canvas(fileobj, pagesize=letter)
+        page = 1
+
+        def draw_column_header(y):
+            c.setFillColor(colors.HexColor("#2d3748"))
+            c.rect(margin, y - 4, page_width - 2 * margin, row_height + 2, fill=1, stroke=0)
+            c.setFillColor(colors.whitesmoke)
+            c.setFont("Helvetica-Bold", 10)
+            x = margin + 4
+            for header, width in columns:
+                c.drawString(x, y, header)
+                x += width
+            c.setFillColor(colors.black)
+            c.setFont("Helvetica", 9)
+            return y - row_height - 4
+
+        def draw_footer():
+            c.setFont("Helvetica", 8)
+            c.setFillColor(colors.grey)
+            c.drawRightString(page_width - margin, margin / 2, f"Página {page}")
+            c.setFillColor(colors.black)
+
+        # First page header
+        y = page_height - margin
+        c.setFont("Helvetica-Bold", 16)
+        c.setFillColor(colors.HexColor("#1a365d"))
+        c.drawString(margin, y, title.upper())
+        c.setFillColor(colors.black)
+        y -= 22
+        c.setFont("Helvetica-Bold", 12)
+        c.drawString(margin, y, info["name"] or "")
+        y -= 16
+        c.setFont("Helvetica", 9)
+        c.drawString(margin, y, f"RIF: {info['tax_id']} | Tel: {info['phone']} | {info['email']}")
+        y -= 14
+        c.drawString(margin, y, f"Fecha de Generación: {datetime.now(timezone.utc).strftime('%d/%m/%Y %H:%M')}")
+        y -= 20
+        c.setFont("Helvetica", 10)
+        for line in summary_lines:
+            c.drawString(margin, y, line)
+            y -= 14
+        y = draw_column_header(y - 10)
+
+        for row in rows:
+            if y < margin + row_height:
+                draw_footer()
+                c.showPage()
+                page += 1
+                y = draw_column_header(page_height - margin)
+            x = margin + 4
+            for (_, width), value in zip(columns, row):
+                c.drawString(x, y, str(value)[:60])
+                x += width
+            y -= row_height
+
+        draw_footer()
+        c.save()
@@ -0,0 +1,44 @@
+"""
+ServiceFlow Pro - Reconstrucción de capas de costo de inventario
+
+Regenera inventory_cost_layers desde las compras recibidas y recalcula el
+COGS histórico (sale_items.unit_cost_usd y repair_items.unit_cogs_usd) con
+emparejamiento FIFO en SQL. Ejecutar una vez tras activar el motor de
+costeo o después de correcciones masivas de inventario.
+
+Uso: python scripts/rebuild_inventory_costs.py
+"""
+
+import sys
+import os
+
+# Agregar el directorio padre al path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.models import *  # Registra todos los modelos
+from app.services.costing_service import CostingService
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    db = SessionLocal()
+    try:
+        result = CostingService.rebuild(db)
+    finally:
+        db.close()
+
+    logger.info(
+        f"✓ Capas: {result['layers']}, ventas recalculadas: {result['sale_items_updated']}, "
+        f"repuestos recalculados: {result['repair_items_updated']} ({result['elapsed_ms']} ms)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""
+ServiceFlow Pro - Reconstrucción del cubo mensual de KPIs
+
+Regenera kpi_monthly (ventas, órdenes, servicios y unidades por mes, usuario
+y categoría) desde las ventas y reparaciones. Ejecutar al desplegar el cubo:
+cada flush solo suma deltas sobre las filas existentes.
+
+Uso: python scripts/rebuild_kpi_cube.py
+"""
+
+import sys
+import os
+
+# Agregar el directorio padre al path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.models import *  # Registra todos los modelos
+from app.services.kpi_service import KpiService
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    db = SessionLocal()
+    try:
+        result = KpiService.rebuild(db)
+    finally:
+        db.close()
+
+    logger.info(f"✓ Cubo de KPIs: {result['months']} meses, {result['rows']} filas ({result['elapsed_ms']} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+ServiceFlow Pro - Conciliación del libro de crédito de clientes
+
+Compara customers.current_debt y customer_ledger_entries contra las cuentas
+por cobrar abiertas y, con --apply, corrige las diferencias en bloque
+(un ajuste por cliente + un UPDATE de current_debt).
+
+Uso:
+    python scripts/reconcile_customer_ledger.py           # solo reporte
+    python scripts/reconcile_customer_ledger.py --apply   # corrige
+"""
+
+import argparse
+import sys
+import os
+
+# Agregar el directorio padre al path para imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.database import SessionLocal
+from app.models import *  # Registra todos los modelos
+from app.services.customer_ledger_service import CustomerLedgerService
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concilia el libro de crédito de clientes")
+    parser.add_argument("--apply", action="store_true", help="Corrige las diferencias encontradas")
+    parser.add_argument("--sample", type=int, default=20, help="Clientes descuadrados a listar")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        result = CustomerLedgerService.reconcile(db, apply=args.apply, sample_size=args.sample)
+    finally:
+        db.close()
+
+    logger.info(f"Clientes descuadrados: {result['drifted_customers']}")
+    for row in result["sample"]:
+        logger.info(
+            f"  Cliente #{row['customer_id']}: current_debt={row['current_debt']:.2f} "
+            f"libro={row['ledger_balance']:.2f} esperado={row['expected_balance']:.2f}"
+        )
+    if args.apply:
+        logger.info(
+            f"✓ Ajustes insertados: {result['ledger_adjustments']}, "
+            f"clientes actualizados: {result['customers_updated']} ({result['elapsed_ms']} ms)"
+        )
+    elif result["drifted_customers"]:
+        logger.info("Ejecute con --apply para corregir")
+
+
+if __name__ == "__main__":
+    main()
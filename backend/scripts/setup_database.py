@@ -64,6 +64,27 @@ MIGRATIONS = [
     "ALTER TABLE sales ADD COLUMN IF NOT EXISTS exchange_rate_at_time DECIMAL(18, 6)",
     "ALTER TABLE accounts_receivable ADD COLUMN IF NOT EXISTS exchange_rate_at_time DECIMAL(18, 6)",
     "ALTER TABLE sale_items ADD COLUMN IF NOT EXISTS unit_cost_usd DECIMAL(10, 2) DEFAULT 0",
+    
+    # === Cash session summary - índices por (sesión, método, moneda) ===
+    "CREATE INDEX IF NOT EXISTS ix_payments_session_method_currency ON payments (session_id, payment_method, currency)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_payments_session_method_currency ON customer_payments (session_id, payment_method, currency)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_session_method_currency ON expenses (session_id, payment_method, currency)",
+    
+    # === Costeo de inventario - costo real de repuestos ===
+    "ALTER TABLE repair_items ADD COLUMN IF NOT EXISTS unit_cogs_usd DECIMAL(10, 2)",
+
+    # === Stock bajo - flag mantenido en escritura + índice parcial ===
+    "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS is_low_stock BOOLEAN NOT NULL DEFAULT FALSE",
+    "CREATE INDEX IF NOT EXISTS ix_inventory_low_stock ON inventory (product_id) WHERE is_low_stock",
+
+    # === Flujo de reparaciones - colas por estado y por técnico ===
+    "CREATE INDEX IF NOT EXISTS ix_repairs_status_created ON repairs (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_repairs_user_status ON repairs (user_id, status)",
+    "CREATE INDEX IF NOT EXISTS ix_repair_logs_repair_created ON repair_logs (repair_id, created_at, id)",
+
+    # === Estado de cuenta - pagos en caja por venta / reparación ===
+    "CREATE INDEX IF NOT EXISTS ix_payments_sale_id ON payments (sale_id)",
+    "CREATE INDEX IF NOT EXISTS ix_payments_repair_id ON payments (repair_id)",
 ]
 
 # Migraciones de datos (UPDATE statements)
@@ -71,6 +92,38 @@ DATA_MIGRATIONS = [
     # Actualizar categorías existentes con su tipo correcto
     ("UPDATE categories SET type = 'service' WHERE name IN ('Software', 'Hardware', 'Servicios')", "Categorías de servicio"),
     ("UPDATE categories SET type = 'physical' WHERE name IN ('Accesorios', 'Repuestos')", "Categorías físicas"),
+    # Normalizar métodos de pago (antes se comparaban con ILIKE)
+    ("UPDATE payments SET payment_method = LOWER(TRIM(payment_method)) WHERE payment_method <> LOWER(TRIM(payment_method))", "Métodos de pago (payments)"),
+    ("UPDATE customer_payments SET payment_method = LOWER(TRIM(payment_method)) WHERE payment_method <> LOWER(TRIM(payment_method))", "Métodos de pago (customer_payments)"),
+    ("UPDATE expenses SET payment_method = LOWER(TRIM(payment_method)) WHERE payment_method <> LOWER(TRIM(payment_method))", "Métodos de pago (expenses)"),
+    # Saldo inicial del libro de stock para productos sin movimientos
+    ("INSERT INTO stock_movements (product_id, movement_type, quantity, balance_after, note, created_at) "
+     "SELECT product_id, 'opening', quantity, quantity, 'Saldo inicial', CURRENT_TIMESTAMP FROM inventory "
+     "WHERE product_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM stock_movements sm WHERE sm.product_id = inventory.product_id)",
+     "Saldo inicial de stock_movements"),
+    ("UPDATE inventory SET is_low_stock = (COALESCE(quantity, 0) <= COALESCE(min_stock, 0)) "
+     "WHERE is_low_stock <> (COALESCE(quantity, 0) <= COALESCE(min_stock, 0))", "Flag de stock bajo (inventory)"),
+    # Estados de reparación canónicos (RepairStatus): mayúsculas y alias heredados
+    ("UPDATE repairs SET status = CASE UPPER(TRIM(status)) WHEN 'COMPLETED' THEN 'READY' WHEN 'FINISHED' THEN 'READY' "
+     "WHEN 'WAITING_FOR_PARTS' THEN 'WAITING_PARTS' ELSE UPPER(TRIM(status)) END "
+     "WHERE status <> UPPER(TRIM(status)) OR UPPER(TRIM(status)) IN ('COMPLETED', 'FINISHED', 'WAITING_FOR_PARTS')",
+     "Estados de reparación (repairs)"),
+    ("UPDATE repair_logs SET "
+     "status_from = CASE UPPER(TRIM(status_from)) WHEN 'COMPLETED' THEN 'READY' WHEN 'FINISHED' THEN 'READY' "
+     "WHEN 'WAITING_FOR_PARTS' THEN 'WAITING_PARTS' ELSE UPPER(TRIM(status_from)) END, "
+     "status_to = CASE UPPER(TRIM(status_to)) WHEN 'COMPLETED' THEN 'READY' WHEN 'FINISHED' THEN 'READY' "
+     "WHEN 'WAITING_FOR_PARTS' THEN 'WAITING_PARTS' ELSE UPPER(TRIM(status_to)) END "
+     "WHERE status_from <> UPPER(TRIM(status_from)) OR status_to <> UPPER(TRIM(status_to)) "
+     "OR UPPER(TRIM(status_from)) IN ('COMPLETED', 'FINISHED', 'WAITING_FOR_PARTS') "
+     "OR UPPER(TRIM(status_to)) IN ('COMPLETED', 'FINISHED', 'WAITING_FOR_PARTS')",
+     "Estados de reparación (repair_logs)"),
+    # Contadores por estado: se reconstruyen desde repairs ya normalizado
+    ("DELETE FROM repair_status_counts", "Contadores por estado (limpieza)"),
+    ("INSERT INTO repair_status_counts (status, technician_id, count, updated_at) "
+     "SELECT status, 0, COUNT(*), NOW() FROM repairs WHERE status IS NOT NULL GROUP BY status "
+     "UNION ALL SELECT status, user_id, COUNT(*), NOW() FROM repairs "
+     "WHERE status IS NOT NULL AND user_id IS NOT NULL GROUP BY status, user_id",
+     "Contadores por estado (repair_status_counts)"),
 ]
 
 
@@ -132,6 +185,41 @@ def run_data_migrations():
             conn.rollback()
 
 
+def seed_ar_aging():
+    """
+    Construye customer_ar_balances desde accounts_receivable (INSERT ... SELECT).
+
+    Las escrituras incrementales (record_charge/record_payment) asumen que la
+    tabla ya está construida; sin este paso quedaría solo con los clientes que
+    tuvieron movimientos después del despliegue.
+    """
+    from app.services.ar_aging_service import ARAgingService
+
+    db = SessionLocal()
+    try:
+        result = ARAgingService.rebucket_all(db)
+        logger.info(f"✓ Antigüedad de cartera construida: {result['rows']} clientes")
+    except Exception as e:
+        logger.warning(f"⚠ Construcción de customer_ar_balances falló: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def seed_activity_feed():
+    """Feed de actividad vacío: carga los últimos 7 días (ventas, reparaciones, clientes)."""
+    from app.services.activity_service import ActivityService
+
+    db = SessionLocal()
+    try:
+        logger.info(f"✓ Feed de actividad (últimos 7 días): {ActivityService.backfill(db)} eventos")
+    except Exception as e:
+        logger.warning(f"⚠ Feed de actividad falló: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
 def create_initial_data():
     """Crea datos iniciales si no existen."""
     from app.models.user import User, Role
@@ -253,6 +341,8 @@ def main():
         logger.info("")
         logger.info("PASO 3/4: Ejecutando migraciones de datos...")
         run_data_migrations()
+        seed_ar_aging()
+        seed_activity_feed()
         
         # 4. Crear datos iniciales
         logger.info("")
@@ -0,0 +1,70 @@
+"""Tests unitarios para ActivityService (feed de actividad con cursores de id)."""
+
+from decimal import Decimal
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+
+from app.models.activity import ActivityEvent
+from app.models.customer import Customer
+from app.models.repair import Repair
+from app.models.sale import Sale
+from app.services.activity_service import ActivityService, record_activity
+
+
+def _events(db: Session, count: int) -> list:
+    connection = db.connection()
+    for index in range(count):
+        record_activity(connection, "sale" if index % 2 else "alert", f"Evento {index}", f"Descripción {index}")
+    return [row.id for row in db.query(ActivityEvent.id).order_by(ActivityEvent.id)]
+
+
+def test_before_id_pagina_sin_huecos_ni_repetidos(db: Session):
+    """Encadenar before_id con el último id de cada página recorre todo el feed una sola vez."""
+    ids = _events(db, 7)
+
+    seen = []
+    page = ActivityService.get_feed(db, limit=3)
+    while page:
+        seen.extend(item["id"] for item in page)
+        page = ActivityService.get_feed(db, limit=3, before_id=page[-1]["id"])
+
+    assert seen == sorted(ids, reverse=True)
+
+
+def test_since_id_solo_devuelve_eventos_nuevos(db: Session):
+    """El polling con since_id trae lo posterior al último visto; sin novedades devuelve vacío."""
+    ids = _events(db, 3)
+    assert ActivityService.get_feed(db, since_id=ids[-1]) == []
+
+    new_ids = _events(db, 2)[len(ids):]
+    feed = ActivityService.get_feed(db, since_id=ids[-1])
+    assert [item["id"] for item in feed] == sorted(new_ids, reverse=True)
+
+    filtered = ActivityService.get_feed(db, since_id=ids[0], before_id=new_ids[-1], event_type="sale")
+    assert all(ids[0] < item["id"] < new_ids[-1] and item["type"] == "sale" for item in filtered)
+
+
+def test_backfill_carga_los_ultimos_dias_en_orden(db: Session):
+    """Con el feed vacío carga ventas, reparaciones y clientes recientes con los textos de los listeners."""
+    now = datetime.now()
+    customer = Customer(name="Cliente Feed", phone="584121230000", created_at=now - timedelta(days=2))
+    old_customer = Customer(name="Cliente Viejo", phone="584121230001", created_at=now - timedelta(days=30))
+    db.add_all([customer, old_customer])
+    db.flush()
+    repair = Repair(customer_id=customer.id, device_model="Galaxy A10",
+                    problem_description="No enciende después de una caída fuerte", created_at=now - timedelta(days=1))
+    sale = Sale(customer_id=customer.id, total_usd=Decimal("12.5"), total_ves=Decimal("500"),
+                exchange_rate=Decimal("40"), created_at=now - timedelta(hours=3))
+    db.add_all([repair, sale])
+    db.flush()
+    db.query(ActivityEvent).delete()
+
+    assert ActivityService.backfill(db) == 3
+    assert ActivityService.backfill(db) == 0  # solo con el feed vacío
+
+    feed = ActivityService.get_feed(db)
+    assert [(item["type"], item["reference_id"]) for item in feed] == [
+        ("sale", sale.id), ("repair", repair.id), ("customer", customer.id)
+    ]
+    assert feed[0]["description"] == f"Venta #{sale.id} por $12.50"
+    assert feed[1]["description"] == "Galaxy A10 - No enciende después de una caí..."
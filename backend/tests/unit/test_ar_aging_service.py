@@ -0,0 +1,115 @@
+"""Tests unitarios para ARAgingService (tabla customer_ar_balances)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, timedelta
+from sqlalchemy.orm import Session
+
+from app.models.finance import AccountReceivable, CustomerARBalance
+from app.models.customer import Customer
+from app.services.ar_aging_service import ARAgingService
+from app.services.report_service import ReportService
+
+
+@pytest.fixture
+def aging_customer(db: Session):
+    """Crea un cliente de prueba para la cartera."""
+    customer = Customer(name="Cliente Aging", dni_type="V", dni="11223344")
+    db.add(customer)
+    db.flush()
+    return customer
+
+
+def _add_account(db: Session, customer: Customer, total: str, days_overdue: int, paid: str = "0"):
+    account = AccountReceivable(
+        customer_id=customer.id,
+        total_amount=Decimal(total),
+        paid_amount=Decimal(paid),
+        due_date=date.today() - timedelta(days=days_overdue),
+        status="pending"
+    )
+    db.add(account)
+    db.flush()
+    ARAgingService.record_charge(db, account)
+    db.flush()
+    return account
+
+
+def _balance(db: Session, customer: Customer) -> CustomerARBalance:
+    return db.query(CustomerARBalance).filter(CustomerARBalance.customer_id == customer.id).first()
+
+
+def test_bucket_for_limites():
+    """Verifica los límites de cada bucket de antigüedad."""
+    today = date.today()
+    assert ARAgingService.bucket_for(today, today) == "bucket_current"
+    assert ARAgingService.bucket_for(today - timedelta(days=1), today) == "bucket_1_30"
+    assert ARAgingService.bucket_for(today - timedelta(days=30), today) == "bucket_1_30"
+    assert ARAgingService.bucket_for(today - timedelta(days=31), today) == "bucket_31_60"
+    assert ARAgingService.bucket_for(today - timedelta(days=90), today) == "bucket_61_90"
+    assert ARAgingService.bucket_for(today - timedelta(days=91), today) == "bucket_over_90"
+
+
+def test_record_charge_acumula_por_bucket(db: Session, aging_customer: Customer):
+    """Cada cargo suma su saldo al bucket correspondiente."""
+    _add_account(db, aging_customer, "100.00", days_overdue=-5)
+    _add_account(db, aging_customer, "50.00", days_overdue=45, paid="10.00")
+    _add_account(db, aging_customer, "25.00", days_overdue=120)
+
+    balance = _balance(db, aging_customer)
+    assert balance.open_accounts == 3
+    assert balance.open_balance == Decimal("165.00")
+    assert balance.bucket_current == Decimal("100.00")
+    assert balance.bucket_31_60 == Decimal("40.00")
+    assert balance.bucket_over_90 == Decimal("25.00")
+    assert balance.delinquent_balance == Decimal("65.00")
+    assert balance.oldest_due_date == date.today() - timedelta(days=120)
+
+
+def test_record_payment_liquida_cuenta(db: Session, aging_customer: Customer):
+    """Un pago total descuenta el saldo y recalcula la fecha más antigua."""
+    _add_account(db, aging_customer, "80.00", days_overdue=10)
+    old = _add_account(db, aging_customer, "20.00", days_overdue=70)
+
+    old.paid_amount = old.total_amount
+    old.status = "paid"
+    ARAgingService.record_payment(db, old, Decimal("20.00"))
+    db.flush()
+
+    balance = _balance(db, aging_customer)
+    assert balance.open_accounts == 1
+    assert balance.open_balance == Decimal("80.00")
+    assert balance.bucket_61_90 == Decimal("0.00")
+    assert balance.oldest_due_date == date.today() - timedelta(days=10)
+
+
+def test_rebucket_all_coincide_con_incremental(db: Session, aging_customer: Customer):
+    """La reconstrucción completa produce los mismos buckets que el mantenimiento incremental."""
+    _add_account(db, aging_customer, "30.00", days_overdue=0)
+    _add_account(db, aging_customer, "70.00", days_overdue=65)
+    incremental = _balance(db, aging_customer)
+    expected = (incremental.bucket_current, incremental.bucket_61_90, incremental.open_accounts)
+
+    ARAgingService.rebucket_all(db)
+    db.expire_all()
+
+    rebuilt = _balance(db, aging_customer)
+    assert (rebuilt.bucket_current, rebuilt.bucket_61_90, rebuilt.open_accounts) == expected
+
+    buckets = ReportService.get_aging_report(db)
+    assert buckets["0-30"] >= Decimal("30.00")
+    assert buckets["61-90"] >= Decimal("70.00")
+
+
+def test_lecturas_no_reconstruyen_la_tabla(db: Session, aging_customer: Customer):
+    """get_totals solo lee; los buckets de días anteriores los re-clasifica el job (is_stale al arrancar)."""
+    _add_account(db, aging_customer, "40.00", days_overdue=10)
+    ARAgingService.rebucket_all(db, date.today() - timedelta(days=1))
+    assert ARAgingService.is_stale(db)
+
+    totals = ARAgingService.get_totals(db)
+    assert _balance(db, aging_customer).as_of_date == date.today() - timedelta(days=1)
+    assert totals["bucket_1_30"] >= Decimal("40.00")
+
+    ARAgingService.rebucket_all(db)
+    assert not ARAgingService.is_stale(db)
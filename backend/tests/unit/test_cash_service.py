@@ -0,0 +1,74 @@
+"""Tests unitarios para CashService (resumen de la sesión de caja por método de pago)."""
+
+from decimal import Decimal
+from datetime import date
+from sqlalchemy.orm import Session
+
+from app.models.customer import Customer
+from app.models.finance import AccountReceivable, CashSession, CustomerPayment, Expense, ExpenseCategory, Payment
+from app.models.repair import Repair
+from app.models.sale import Sale
+from app.models.user import User
+from app.services.cash_service import CashService
+
+RATE = Decimal("40")
+
+
+def _payment(model, amount_usd: str, method: str, currency: str = "USD", **fields):
+    amount_usd = Decimal(amount_usd)
+    return model(amount_usd=amount_usd, amount_ves=amount_usd * RATE, exchange_rate=RATE,
+                 payment_method=method, currency=currency, **fields)
+
+
+def test_resumen_mezcla_ventas_reparaciones_y_abonos_por_metodo(db: Session):
+    """Cada origen se agrupa por método normalizado; solo el efectivo entra en el cierre esperado."""
+    cashier = User(username="cajero_resumen", email="cajero_resumen@test.com", hashed_password="x", full_name="Cajero")
+    customer = Customer(name="Cliente Caja", phone="584125556677")
+    category = ExpenseCategory(name="Limpieza")
+    db.add_all([cashier, customer, category])
+    db.flush()
+    session = CashSession(user_id=cashier.id, session_code="CAJA-RESUMEN", opening_amount=Decimal("100.00"),
+                          opening_amount_ves=Decimal("1000.00"))
+    sale = Sale(customer_id=customer.id, user_id=cashier.id, total_usd=Decimal("40.00"),
+                total_ves=Decimal("1600.00"), exchange_rate=RATE)
+    repair = Repair(customer_id=customer.id, device_model="iPhone 8", problem_description="Batería", status="READY")
+    db.add_all([session, sale, repair])
+    db.flush()
+    account = AccountReceivable(customer_id=customer.id, sale_id=sale.id, total_amount=Decimal("40.00"),
+                                paid_amount=Decimal("0"), due_date=date(2026, 5, 1), status="pending")
+    db.add(account)
+    db.flush()
+
+    db.add_all([
+        # Ventas: grafías heredadas del método
+        _payment(Payment, "20.00", " Cash ", sale_id=sale.id, session_id=session.id),
+        _payment(Payment, "10.00", "TRANSFER", "VES", sale_id=sale.id, session_id=session.id),
+        # Reparación cobrada en la misma sesión (también es un Payment)
+        _payment(Payment, "25.00", "cash", "VES", repair_id=repair.id, session_id=session.id),
+        # Abonos a la deuda
+        _payment(CustomerPayment, "15.00", "CASH", account_id=account.id, customer_id=customer.id,
+                 session_id=session.id, balance_before=Decimal("40.00"), balance_after=Decimal("25.00")),
+        _payment(CustomerPayment, "5.00", "Mobile_Payment ", "VES", account_id=account.id, customer_id=customer.id,
+                 session_id=session.id, balance_before=Decimal("25.00"), balance_after=Decimal("20.00")),
+        Expense(category_id=category.id, session_id=session.id, user_id=cashier.id, description="Detergente",
+                amount=Decimal("4.00"), currency="USD", exchange_rate=RATE, amount_usd=Decimal("4.00"),
+                payment_method="Cash"),
+    ])
+    db.flush()
+
+    summary = CashService.calculate_session_summary(db, session.id)
+
+    by_method = {
+        (row["source"], row["payment_method"]): (row["total_usd"], row["total_ves"], row["count"])
+        for row in summary["by_method"]
+    }
+    assert by_method == {
+        ("sales", "cash"): (Decimal("20.00"), Decimal("1000.00"), 2),
+        ("sales", "transfer"): (Decimal("0"), Decimal("400.00"), 1),
+        ("ar_payments", "cash"): (Decimal("15.00"), Decimal("0"), 1),
+        ("ar_payments", "mobile_payment"): (Decimal("0"), Decimal("200.00"), 1),
+        ("expenses", "cash"): (Decimal("4.00"), Decimal("0"), 1),
+    }
+    assert (summary["cash_sales_usd"], summary["cash_sales_ves"]) == (Decimal("20.00"), Decimal("1000.00"))
+    assert summary["expected_closing_amount_usd"] == Decimal("131.00")  # 100 + 20 + 15 - 4
+    assert summary["expected_closing_amount_ves"] == Decimal("2000.00")  # 1000 + 1000 (reparación)
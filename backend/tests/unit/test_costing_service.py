@@ -0,0 +1,96 @@
+"""Tests unitarios para CostingService (capas de costo FIFO / promedio)."""
+
+import pytest
+from decimal import Decimal
+from datetime import datetime
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.inventory import Product, Inventory, InventoryCostLayer
+from app.models.purchase import Supplier, PurchaseOrder, PurchaseItem
+from app.models.sale import Sale, SaleItem
+from app.models.user import User
+from app.services.costing_service import CostingService
+
+
+@pytest.fixture
+def product(db: Session):
+    item = Product(sku="COST-001", name="Pantalla", cost_usd=Decimal("10.00"), price_usd=Decimal("25.00"))
+    db.add(item)
+    db.flush()
+    return item
+
+
+@pytest.fixture
+def user(db: Session):
+    item = User(username="costeo", email="costeo@test.com", hashed_password="x", full_name="Costeo")
+    db.add(item)
+    db.flush()
+    return item
+
+
+def _remaining(db: Session, product: Product):
+    return [
+        (layer.source_type, layer.remaining_quantity)
+        for layer in db.query(InventoryCostLayer).filter(InventoryCostLayer.product_id == product.id)
+        .order_by(InventoryCostLayer.id)
+    ]
+
+
+def test_consume_fifo_toma_las_capas_mas_antiguas(db: Session, product):
+    """Una salida que cruza dos capas se costea con el promedio de lo consumido; el faltante va al costo del producto."""
+    CostingService.add_layer(db, product.id, 5, Decimal("10.00"), "opening")
+    CostingService.add_layer(db, product.id, 5, Decimal("14.00"), "adjustment")
+    db.flush()
+
+    assert CostingService.consume(db, product.id, 7) == Decimal("11.14")  # (5*10 + 2*14) / 7
+    assert _remaining(db, product) == [("opening", 0), ("adjustment", 3)]
+    assert CostingService.current_cost(db, product.id) == Decimal("14.00")
+
+    # 3 unidades con capa a 14 + 1 sin capa al costo del producto (10)
+    assert CostingService.consume(db, product.id, 4) == Decimal("13.00")
+    assert _remaining(db, product) == [("opening", 0), ("adjustment", 0)]
+
+
+def test_adjust_promedio_pondera_con_el_stock_previo(db: Session, product, monkeypatch):
+    """Con 'average' una entrada recalcula Product.cost_usd; una salida consume capas sin cambiar el costo."""
+    monkeypatch.setattr(settings, "INVENTORY_COSTING_METHOD", "average")
+    db.add(Inventory(product_id=product.id, quantity=5))
+    db.flush()
+
+    CostingService.adjust(db, product.id, 5, Decimal("14.00"))
+    db.flush()
+    db.refresh(product)
+    assert product.cost_usd == Decimal("12.00")
+
+    CostingService.adjust(db, product.id, -2, product.cost_usd)
+    assert _remaining(db, product) == [("adjustment", 3)]
+    assert CostingService.current_cost(db, product.id) == Decimal("12.00")
+
+
+def test_rebuild_reconstruye_capas_y_cogs(db: Session, product, user):
+    """Apertura = salidas + stock - compras; la venta histórica toma primero la apertura y luego la compra."""
+    supplier = Supplier(name="Proveedor Costeo")
+    db.add(supplier)
+    db.flush()
+    purchase = PurchaseOrder(supplier_id=supplier.id, user_id=user.id, status="received",
+                             total_amount_usd=Decimal("70.00"), received_date=datetime(2026, 1, 5, 10, 0))
+    db.add(purchase)
+    db.flush()
+    db.add(PurchaseItem(purchase_id=purchase.id, product_id=product.id, quantity=5,
+                        unit_cost_usd=Decimal("14.00"), subtotal_usd=Decimal("70.00")))
+    sale = Sale(user_id=user.id, total_usd=Decimal("100.00"), total_ves=Decimal("4000.00"),
+                exchange_rate=Decimal("40"), created_at=datetime(2026, 1, 10, 12, 0))
+    db.add(sale)
+    db.flush()
+    line = SaleItem(sale_id=sale.id, product_id=product.id, quantity=4,
+                    unit_price_usd=Decimal("25.00"), subtotal_usd=Decimal("100.00"), unit_cost_usd=Decimal("0"))
+    db.add_all([line, Inventory(product_id=product.id, quantity=3)])
+    db.flush()
+
+    result = CostingService.rebuild(db)
+    db.expire_all()
+
+    assert result["layers"] == 2
+    assert _remaining(db, product) == [("opening", 0), ("purchase", 3)]
+    assert db.get(SaleItem, line.id).unit_cost_usd == Decimal("12.00")  # (2*10 + 2*14) / 4
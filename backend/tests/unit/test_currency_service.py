@@ -0,0 +1,69 @@
+"""Tests unitarios para CurrencyService (tasa vigente e índice de tasas)."""
+
+from decimal import Decimal
+from datetime import date, timedelta
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.models.finance import ExchangeRate
+from app.services import currency_service
+from app.services.currency_service import CurrencyService
+
+
+def test_tasa_con_fecha_futura_no_reemplaza_la_vigente(db: Session):
+    """is_active, current_rate y current_rate_record coinciden: la última tasa con fecha <= hoy."""
+    today = date.today()
+    CurrencyService.store_rate(db, Decimal("40.00"), "BCV", today)
+    CurrencyService.store_rate(db, Decimal("45.00"), "Manual", today + timedelta(days=1))
+
+    record = CurrencyService.current_rate_record(db)
+    assert record.effective_date == today
+    assert CurrencyService.current_rate(db) == Decimal("40.00")
+    active = db.query(ExchangeRate).filter(ExchangeRate.is_active == True).all()
+    assert [rate.effective_date for rate in active] == [today]
+
+
+class _SharedCache:
+    """Redis compartido entre workers (solo lo que usa CurrencyService)."""
+
+    redis_client = True
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+def test_indice_recarga_solo_cuando_cambia_la_version_compartida(db: Session, monkeypatch):
+    """Otro worker que guarda una tasa incrementa la versión en Redis; sin ese aviso no se consulta la tabla."""
+    monkeypatch.setattr(currency_service, "cache", _SharedCache())
+    today = date.today()
+    CurrencyService.store_rate(db, Decimal("40.00"), "BCV", today)
+    assert CurrencyService.current_rate(db) == Decimal("40.00")
+
+    # Cambio hecho por otro proceso: no pasa por los listeners de este
+    db.execute(update(ExchangeRate).where(ExchangeRate.effective_date == today).values(rate=Decimal("41.50")))
+    assert CurrencyService.current_rate(db) == Decimal("40.00")
+
+    currency_service.cache.incr(currency_service.RATE_VERSION_KEY)
+    assert CurrencyService.current_rate(db) == Decimal("41.50")
+
+
+def test_indice_es_una_foto_inmutable(db: Session):
+    """Una recarga reemplaza el índice completo; la foto que ya tenía un lector no cambia."""
+    CurrencyService.store_rate(db, Decimal("40.00"), "BCV", date.today() - timedelta(days=1))
+    snapshot = CurrencyService._index(db)
+
+    CurrencyService.store_rate(db, Decimal("42.00"), "BCV", date.today())
+    reloaded = CurrencyService._index(db)
+
+    assert reloaded is not snapshot
+    assert len(snapshot.dates) == len(snapshot.rates) == len(reloaded.dates) - 1
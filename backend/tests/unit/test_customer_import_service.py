@@ -0,0 +1,69 @@
+"""Tests unitarios para CustomerImportService (importación masiva de clientes por etapas)."""
+
+import csv
+import os
+import time
+from pathlib import Path
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.customer import Customer
+from app.services import customer_import_service
+from app.services.customer_import_service import CustomerImportService
+
+SAMPLE_CSV = Path(__file__).resolve().parents[1] / "fixtures" / "customers_test_sample.csv"
+
+
+@pytest.fixture(autouse=True)
+def rejects_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(customer_import_service, "REJECTS_DIR", str(tmp_path / "rejects"))
+    return tmp_path / "rejects"
+
+
+def _import(db: Session, extra_lines: str = "") -> dict:
+    contents = SAMPLE_CSV.read_bytes() + extra_lines.encode("utf-8")
+    _, rows = CustomerImportService.parse_csv(contents)
+    return CustomerImportService.import_rows(db, rows)
+
+
+def test_importa_actualiza_deduplica_y_rechaza(db: Session):
+    """Cliente existente por DNI se actualiza, el resto se inserta; duplicados e inválidos van al CSV de rechazos."""
+    existing = Customer(name="Pedro L.", dni="V-11223344", phone="0416-0000000", payment_terms=15)
+    db.add(existing)
+    db.flush()
+
+    stats = _import(db, (
+        "Juan Pérez Actualizado,V-12345678,juan.nuevo@example.com,0414-9999999,,60\n"
+        ",V-55555555,sin.nombre@example.com,,,\n"
+        "Correo Malo,V-66666666,correo-malo,,,\n"
+        "Plazo Malo,V-77777777,,,,3x\n"
+    ))
+
+    assert (stats["rows"], stats["created"], stats["updated"], stats["errors"]) == (8, 3, 1, 4)
+
+    db.refresh(existing)
+    assert (existing.name, existing.phone, existing.payment_terms) == ("Pedro Lopez", "0416-4444444", 30)
+    juan = db.query(Customer).filter(Customer.dni == "V-12345678").one()  # gana la última aparición
+    assert (juan.name, juan.email, juan.payment_terms) == ("Juan Pérez Actualizado", "juan.nuevo@example.com", 60)
+
+    path = CustomerImportService.reject_file_path(stats["reject_token"])
+    with open(path, newline="", encoding="utf-8") as handle:
+        reasons = {row["fila"]: row["motivo"] for row in csv.DictReader(handle)}
+    assert reasons == {
+        "2": "Duplicado en archivo", "7": "Nombre vacío",
+        "8": "Email inválido", "9": "payment_terms inválido",
+    }
+
+
+def test_rechazos_vencidos_se_borran(db: Session, rejects_dir):
+    """Pasado el TTL el token deja de servir y el archivo se elimina."""
+    stats = _import(db, ",V-55555555,,,,\n")
+    path = CustomerImportService.reject_file_path(stats["reject_token"])
+    assert path is not None
+
+    expired = time.time() - customer_import_service.REJECTS_TTL_SECONDS - 60
+    os.utime(path, (expired, expired))
+
+    assert CustomerImportService.reject_file_path(stats["reject_token"]) is None
+    assert not os.listdir(rejects_dir)
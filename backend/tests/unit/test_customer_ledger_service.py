@@ -0,0 +1,100 @@
+"""Tests unitarios para CustomerLedgerService (libro de crédito y current_debt)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, timedelta
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.finance import AccountReceivable, CustomerLedgerEntry
+from app.models.customer import Customer
+from app.services.customer_ledger_service import CustomerLedgerService
+
+
+@pytest.fixture
+def credit_customer(db: Session):
+    """Cliente con límite de crédito de $100."""
+    customer = Customer(name="Cliente Crédito", dni_type="V", dni="55667788", credit_limit=Decimal("100.00"))
+    db.add(customer)
+    db.flush()
+    return customer
+
+
+def _add_account(db: Session, customer: Customer, total: str, paid: str = "0"):
+    account = AccountReceivable(
+        customer_id=customer.id,
+        total_amount=Decimal(total),
+        paid_amount=Decimal(paid),
+        due_date=date.today() + timedelta(days=30),
+        status="pending"
+    )
+    db.add(account)
+    db.flush()
+    CustomerLedgerService.record_charge(db, account)
+    db.flush()
+    return account
+
+
+def test_post_actualiza_saldo_y_libro(db: Session, credit_customer: Customer):
+    """Cada movimiento ajusta current_debt y guarda el saldo resultante en el libro."""
+    _add_account(db, credit_customer, "60.00", paid="10.00")
+    entry = CustomerLedgerService.post(db, credit_customer.id, Decimal("-20.00"), "payment")
+    db.flush()
+
+    db.refresh(credit_customer)
+    assert credit_customer.current_debt == Decimal("30.00")
+    assert entry.balance_after == Decimal("30.00")
+    amounts = [e.amount for e in db.query(CustomerLedgerEntry).filter(
+        CustomerLedgerEntry.customer_id == credit_customer.id
+    ).order_by(CustomerLedgerEntry.id)]
+    assert amounts == [Decimal("50.00"), Decimal("-20.00")]
+
+
+def test_check_credit_respeta_limite(db: Session, credit_customer: Customer):
+    """El límite se valida contra el saldo denormalizado."""
+    _add_account(db, credit_customer, "80.00")
+
+    CustomerLedgerService.check_credit(db, credit_customer.id, Decimal("20.00"))
+    with pytest.raises(HTTPException) as exc:
+        CustomerLedgerService.check_credit(db, credit_customer.id, Decimal("20.01"))
+    assert exc.value.status_code == 400
+
+
+def test_check_credit_cliente_bloqueado(db: Session, credit_customer: Customer):
+    """Un cliente bloqueado no puede financiar compras."""
+    credit_customer.credit_status = "blocked"
+    db.flush()
+
+    with pytest.raises(HTTPException):
+        CustomerLedgerService.check_credit(db, credit_customer.id, Decimal("1.00"))
+
+
+def test_reconcile_corrige_descuadre(db: Session, credit_customer: Customer):
+    """La conciliación detecta el descuadre y lo corrige con un ajuste."""
+    _add_account(db, credit_customer, "40.00")
+    # Cuenta creada sin pasar por el libro y current_debt editado a mano
+    db.add(AccountReceivable(
+        customer_id=credit_customer.id,
+        total_amount=Decimal("15.00"),
+        due_date=date.today(),
+        status="pending"
+    ))
+    credit_customer.current_debt = Decimal("999.00")
+    db.flush()
+
+    report = CustomerLedgerService.reconcile(db)
+    assert report["drifted_customers"] == 1
+    assert report["sample"][0]["expected_balance"] == 55.0
+
+    result = CustomerLedgerService.reconcile(db, apply=True)
+    assert result["ledger_adjustments"] == 1
+    assert result["customers_updated"] == 1
+
+    db.refresh(credit_customer)
+    assert credit_customer.current_debt == Decimal("55.00")
+    adjustment = db.query(CustomerLedgerEntry).filter(
+        CustomerLedgerEntry.customer_id == credit_customer.id,
+        CustomerLedgerEntry.entry_type == "adjustment"
+    ).one()
+    assert adjustment.amount == Decimal("15.00")
+    assert CustomerLedgerService.reconcile(db)["drifted_customers"] == 0
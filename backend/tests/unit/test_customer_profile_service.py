@@ -0,0 +1,94 @@
+"""Tests unitarios para CustomerProfileService (perfil de cliente con agregados SQL)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, datetime
+from sqlalchemy.orm import Session
+
+from app.models.customer import Customer
+from app.models.finance import AccountReceivable, CustomerPayment
+from app.models.repair import Repair, RepairItem
+from app.models.sale import Sale
+from app.services.customer_profile_service import CustomerProfileService, register_profile_cache_listeners
+
+
+@pytest.fixture
+def customer(db: Session):
+    item = Customer(name="Cliente Perfil", phone="584127778899")
+    db.add(item)
+    db.flush()
+    return item
+
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    register_profile_cache_listeners()
+    customer_ids = []
+    monkeypatch.setattr(CustomerProfileService, "invalidate", customer_ids.append)
+    return customer_ids
+
+
+def _sale(db: Session, customer: Customer, total: str, created_at: datetime):
+    sale = Sale(customer_id=customer.id, total_usd=Decimal(total), total_ves=Decimal(total) * 40,
+                exchange_rate=Decimal("40"), created_at=created_at)
+    db.add(sale)
+    db.flush()
+    return sale
+
+
+def _repair(db: Session, customer: Customer, status: str, created_at: datetime):
+    repair = Repair(customer_id=customer.id, device_model="Moto E", problem_description="Display",
+                    status=status, created_at=created_at)
+    db.add(repair)
+    db.flush()
+    return repair
+
+
+def test_totales_y_reparaciones_activas_e_historicas(db: Session, customer):
+    """Total gastado y última compra en una consulta; estados legados en minúsculas se clasifican igual."""
+    _sale(db, customer, "40.00", datetime(2026, 2, 1, 10, 0))
+    _sale(db, customer, "15.50", datetime(2026, 2, 9, 16, 0))
+    active = _repair(db, customer, "IN_PROGRESS", datetime(2026, 2, 3, 9, 0))
+    legacy_delivered = _repair(db, customer, "delivered", datetime(2026, 2, 4, 9, 0))
+    cancelled = _repair(db, customer, "CANCELLED", datetime(2026, 2, 5, 9, 0))
+
+    stats = CustomerProfileService.get_sales_stats(db, customer.id)
+    assert stats == {"total_spent": Decimal("55.50"), "last_purchase_date": date(2026, 2, 9), "sales_count": 2}
+
+    profile = CustomerProfileService.build_profile(db, customer)
+    assert [repair.id for repair in profile["active_repairs"]] == [active.id]
+    assert [repair.id for repair in profile["repair_history"]] == [cancelled.id, legacy_delivered.id]
+    assert profile["total_spent"] == Decimal("55.50")
+
+
+def test_ledger_limitado_conserva_el_saldo_de_todo_el_historial(db: Session, customer):
+    """Con limit solo vuelven los movimientos recientes, pero el saldo acumula desde el primero."""
+    for day, amount in ((1, "50.00"), (5, "30.00")):
+        db.add(AccountReceivable(customer_id=customer.id, total_amount=Decimal(amount), paid_amount=Decimal("0"),
+                                 due_date=date(2026, 4, day), status="pending",
+                                 created_at=datetime(2026, 3, day, 10, 0)))
+    db.flush()
+    account = db.query(AccountReceivable).filter(AccountReceivable.customer_id == customer.id).first()
+    db.add(CustomerPayment(account_id=account.id, customer_id=customer.id, amount_usd=Decimal("20.00"),
+                           amount_ves=Decimal("800.00"), exchange_rate=Decimal("40"),
+                           balance_before=Decimal("50.00"), balance_after=Decimal("30.00"),
+                           payment_method="cash", payment_date=datetime(2026, 3, 8, 10, 0)))
+    db.flush()
+
+    ledger = CustomerProfileService.get_ledger(db, customer.id, limit=2)
+
+    assert [(row["type"], Decimal(str(row["balance"]))) for row in ledger] == [
+        ("PAYMENT", Decimal("60.00")), ("CHARGE", Decimal("80.00"))
+    ]
+
+
+def test_repuesto_nuevo_invalida_el_perfil_del_cliente(db: Session, customer, invalidated):
+    """Un RepairItem no tiene customer_id: se invalida el cliente de su reparación al confirmar."""
+    repair = _repair(db, customer, "IN_PROGRESS", datetime(2026, 3, 1, 9, 0))
+    db.commit()
+    invalidated.clear()
+
+    db.add(RepairItem(repair_id=repair.id, quantity=1, unit_cost_usd=Decimal("12.00")))
+    db.commit()
+
+    assert invalidated == [customer.id]
@@ -0,0 +1,37 @@
+"""Tests unitarios para los eventos en vivo (SSE) publicados después del commit."""
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.events import queue_event, register_event_listeners
+
+
+class _Broker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, evt):
+        self.published.append(evt)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    register_event_listeners()
+    fake = _Broker()
+    monkeypatch.setattr(events, "get_broker", lambda: fake)
+    return fake
+
+
+def test_rollback_de_savepoint_conserva_los_eventos_de_la_transaccion(db: Session, broker):
+    """Un begin_nested revertido no descarta lo encolado antes; un rollback completo sí."""
+    queue_event(db, "test.event", value=1)
+    savepoint = db.begin_nested()
+    savepoint.rollback()
+    db.commit()
+    assert [evt["data"] for evt in broker.published] == [{"value": 1}]
+
+    queue_event(db, "test.event", value=2)
+    db.rollback()
+    db.commit()
+    assert len(broker.published) == 1
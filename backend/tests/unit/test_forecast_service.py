@@ -0,0 +1,116 @@
+"""Tests unitarios para ForecastService (matriz de demanda y punto de reorden)."""
+
+import math
+
+import numpy as np
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, time, timedelta
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.inventory import Product, Inventory
+from app.models.repair import Repair, RepairItem
+from app.models.sale import Sale, SaleItem, SaleReturn, SaleReturnItem
+from app.models.user import User
+from app.services.forecast_service import ForecastService, SMOOTHING_ALPHA, SERVICE_LEVEL_Z
+
+HISTORY_DAYS = 7
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    ForecastService.invalidate()
+    yield
+    ForecastService.invalidate()
+
+
+@pytest.fixture
+def seller(db: Session):
+    user = User(username="pronostico", email="pronostico@test.com", hashed_password="x", full_name="Pronóstico")
+    db.add(user)
+    db.flush()
+    return user
+
+
+@pytest.fixture
+def product(db: Session):
+    item = Product(sku="FC-001", name="Conector de carga", cost_usd=Decimal("1.50"), price_usd=Decimal("6.00"))
+    db.add(item)
+    db.flush()
+    db.add(Inventory(product_id=item.id, quantity=3, min_stock=2))
+    db.flush()
+    return item
+
+
+def _at(days_ago: int) -> datetime:
+    return datetime.combine(date.today() - timedelta(days=days_ago), time(12, 0))
+
+
+def _sale(db: Session, seller: User, product: Product, days_ago: int, quantity: int, status: str = "paid") -> Sale:
+    total = product.price_usd * quantity
+    sale = Sale(user_id=seller.id, total_usd=total, total_ves=total * 40, exchange_rate=Decimal("40"),
+                payment_status=status, created_at=_at(days_ago))
+    db.add(sale)
+    db.flush()
+    db.add(SaleItem(sale_id=sale.id, product_id=product.id, quantity=quantity,
+                    unit_price_usd=product.price_usd, subtotal_usd=total))
+    db.flush()
+    return sale
+
+
+def _repair_part(db: Session, seller: User, product: Product, days_ago: int, quantity: int, status: str) -> None:
+    repair = Repair(user_id=seller.id, device_model="Moto G", problem_description="Pin de carga",
+                    status=status, created_at=_at(days_ago))
+    db.add(repair)
+    db.flush()
+    db.add(RepairItem(repair_id=repair.id, product_id=product.id, quantity=quantity, unit_cost_usd=Decimal("1.50")))
+    db.flush()
+
+
+def _demand(db: Session, seller: User, product: Product) -> None:
+    """Demanda válida por día (del más antiguo a hoy): [2, 0, 0, 3, 0, 1, 0]."""
+    _sale(db, seller, product, 6, 2)
+    sale = _sale(db, seller, product, 3, 4)
+    _sale(db, seller, product, 1, 10, status="cancelled")
+    _sale(db, seller, product, 2, 8, status="refunded")
+    # Devolución de 1 unidad: resta en el día de la venta
+    sale_return = SaleReturn(sale_id=sale.id, user_id=seller.id, total_amount_usd=product.price_usd)
+    db.add(sale_return)
+    db.flush()
+    db.add(SaleReturnItem(sale_return_id=sale_return.id, product_id=product.id, quantity=1,
+                          unit_price_usd=product.price_usd))
+    _repair_part(db, seller, product, 1, 1, "IN_PROGRESS")
+    _repair_part(db, seller, product, 1, 5, "CANCELLED")
+    db.flush()
+
+
+def test_matriz_excluye_anuladas_reembolsadas_y_canceladas(db: Session, seller, product):
+    """Ventas anuladas o reembolsadas y reparaciones canceladas no suman; las devoluciones restan."""
+    _demand(db, seller, product)
+
+    demand = ForecastService.demand_matrix(db, HISTORY_DAYS)
+    row = demand["matrix"][list(demand["product_ids"]).index(product.id)]
+
+    assert row.tolist() == [2, 0, 0, 3, 0, 1, 0]
+
+
+def test_promedio_suavizado_y_punto_de_reorden(db: Session, seller, product):
+    """Los indicadores vectorizados coinciden con el cálculo día a día sobre la misma serie."""
+    _demand(db, seller, product)
+    series = [2, 0, 0, 3, 0, 1, 0]
+
+    smoothed = series[0]
+    for value in series[1:]:
+        smoothed = SMOOTHING_ALPHA * value + (1 - SMOOTHING_ALPHA) * smoothed
+    moving_average = sum(series) / len(series)
+    lead = float(settings.FORECAST_DEFAULT_LEAD_TIME_DAYS)
+    daily = max(moving_average, smoothed)
+    safety = SERVICE_LEVEL_Z * np.std(series) * math.sqrt(lead)
+
+    scored = ForecastService.score(db, HISTORY_DAYS).loc[product.id]
+
+    assert scored["moving_average"] == pytest.approx(moving_average)
+    assert scored["smoothed"] == pytest.approx(smoothed)
+    assert scored["reorder_point"] == math.ceil(max(daily * lead + safety, 2))
+    assert scored["suggested_quantity"] > 0  # 3 en mano, por debajo del punto de reorden
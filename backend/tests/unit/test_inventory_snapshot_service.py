@@ -0,0 +1,72 @@
+"""Tests unitarios para InventorySnapshotService (snapshots y valoración a una fecha)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+
+from app.models.inventory import Product, StockMovement, InventorySnapshot
+from app.services.inventory_snapshot_service import InventorySnapshotService
+
+# Lunes, para que el primer snapshot sea completo y el siguiente día un delta
+MONDAY = date(2026, 3, 2)
+
+
+@pytest.fixture
+def products(db: Session):
+    """Dos productos con costo $10 y $4."""
+    items = [
+        Product(sku="SNAP-001", name="Pantalla", cost_usd=Decimal("10.00"), price_usd=Decimal("20.00")),
+        Product(sku="SNAP-002", name="Batería", cost_usd=Decimal("4.00"), price_usd=Decimal("9.00")),
+    ]
+    db.add_all(items)
+    db.flush()
+    return items
+
+
+def _move(db: Session, product: Product, day: date, quantity: int, balance: int, hour: int = 12):
+    db.add(StockMovement(
+        product_id=product.id,
+        movement_type="adjustment",
+        quantity=quantity,
+        balance_after=balance,
+        created_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=hour)
+    ))
+    db.flush()
+
+
+def test_snapshot_completo_y_delta(db: Session, products):
+    """El lunes se guardan todos los productos; el martes solo los que cambiaron."""
+    screen, battery = products
+    _move(db, screen, MONDAY, 5, 5)
+    _move(db, battery, MONDAY, 10, 10)
+
+    first = InventorySnapshotService.take_snapshot(db, MONDAY)
+    assert first["full"] is True and first["rows"] == 2
+
+    _move(db, screen, MONDAY + timedelta(days=1), -2, 3)
+    second = InventorySnapshotService.take_snapshot(db, MONDAY + timedelta(days=1))
+    assert second["full"] is False and second["rows"] == 1
+
+    delta = db.query(InventorySnapshot).filter(InventorySnapshot.snapshot_date == MONDAY + timedelta(days=1)).one()
+    assert (delta.product_id, delta.quantity) == (screen.id, 3)
+
+
+def test_valoracion_con_snapshot_y_movimientos_posteriores(db: Session, products):
+    """La valoración combina el último snapshot con los movimientos de los días siguientes."""
+    screen, battery = products
+    _move(db, screen, MONDAY, 5, 5)
+    _move(db, battery, MONDAY, 10, 10)
+    InventorySnapshotService.take_snapshot(db, MONDAY)
+
+    _move(db, battery, MONDAY + timedelta(days=2), -4, 6)
+    _move(db, screen, MONDAY + timedelta(days=5), 1, 6)
+
+    valuation = InventorySnapshotService.get_valuation(db, MONDAY + timedelta(days=3), include_items=True)
+    assert valuation["snapshot_date"] == MONDAY
+    assert valuation["total_quantity"] == 11
+    assert valuation["total_value_usd"] == Decimal("74.00")
+
+    # Sin snapshot previo se usa el saldo del libro de movimientos
+    before = InventorySnapshotService.get_valuation(db, MONDAY - timedelta(days=1))
+    assert before["snapshot_date"] is None and before["total_quantity"] == 0
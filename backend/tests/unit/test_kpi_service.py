@@ -0,0 +1,149 @@
+"""Tests unitarios para KpiService (cubo mensual kpi_monthly)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, datetime
+from sqlalchemy.orm import Session
+
+from app.models.inventory import Category, Product
+from app.models.kpi import KpiMonthly
+from app.models.repair import Repair
+from app.models.sale import Sale, SaleItem
+from app.models.user import User
+from app.services.kpi_service import KpiService, register_kpi_listeners
+
+
+@pytest.fixture
+def seller(db: Session):
+    user = User(username="kpi_seller", email="kpi@test.com", hashed_password="x", full_name="Vendedor KPI")
+    db.add(user)
+    db.flush()
+    return user
+
+
+@pytest.fixture
+def product(db: Session):
+    category = Category(name="Accesorios KPI")
+    db.add(category)
+    db.flush()
+    item = Product(sku="KPI-001", name="Cargador", category_id=category.id,
+                   cost_usd=Decimal("3.00"), price_usd=Decimal("10.00"))
+    db.add(item)
+    db.flush()
+    return item
+
+
+def _sale(db: Session, user: User, product: Product, created_at: datetime, quantity: int):
+    sale = Sale(
+        user_id=user.id,
+        total_usd=product.price_usd * quantity,
+        total_ves=product.price_usd * quantity * 40,
+        exchange_rate=Decimal("40"),
+        created_at=created_at
+    )
+    db.add(sale)
+    db.flush()
+    db.add(SaleItem(sale_id=sale.id, product_id=product.id, quantity=quantity,
+                    unit_price_usd=product.price_usd, subtotal_usd=product.price_usd * quantity))
+    db.flush()
+    return sale
+
+
+def _row(db: Session, month: date, dimension: str, dimension_id: int = 0) -> KpiMonthly:
+    return db.query(KpiMonthly).filter(
+        KpiMonthly.month == month,
+        KpiMonthly.dimension == dimension,
+        KpiMonthly.dimension_id == dimension_id
+    ).one()
+
+
+def test_refresh_month_incluye_el_ultimo_dia(db: Session, seller, product):
+    """Las ventas del último día del mes (con hora) cuentan en su mes."""
+    _sale(db, seller, product, datetime(2026, 2, 3, 10, 0), 1)
+    _sale(db, seller, product, datetime(2026, 2, 28, 23, 30), 2)
+    _sale(db, seller, product, datetime(2026, 3, 1, 0, 5), 5)
+    db.add(Repair(device_model="Equipo", problem_description="No enciende", user_id=seller.id,
+                  status="RECEIVED", created_at=datetime(2026, 2, 10, 9, 0)))
+    db.add(Repair(device_model="Equipo", problem_description="Cancelada", user_id=seller.id,
+                  status="CANCELLED", created_at=datetime(2026, 2, 11, 9, 0)))
+    db.flush()
+
+    KpiService.refresh_month(db, date(2026, 2, 15))
+    db.flush()
+
+    total = _row(db, date(2026, 2, 1), "total")
+    assert total.sales_revenue_usd == Decimal("30.00")
+    assert (total.orders_count, total.units_sold, total.services_count) == (2, 3, 1)
+    assert _row(db, date(2026, 2, 1), "user", seller.id).orders_count == 2
+    assert _row(db, date(2026, 2, 1), "category", product.category_id).units_sold == 3
+
+
+def test_commit_refresca_el_mes_afectado(db: Session, seller, product):
+    """El hook posterior al commit recalcula el mes de la venta nueva."""
+    register_kpi_listeners()
+    month = date.today().replace(day=1)
+
+    _sale(db, seller, product, datetime.now(), 4)
+    db.commit()
+
+    total = _row(db, month, "total")
+    assert total.orders_count >= 1
+    assert _row(db, month, "category", product.category_id).units_sold == 4
+
+
+def test_cambio_con_atributos_expirados_refresca_el_mes_de_la_venta(db: Session, seller, product):
+    """Editar tras un commit una venta de un mes anterior recalcula ese mes, no el actual."""
+    register_kpi_listeners()
+    month = date(2025, 6, 1)
+    sale = _sale(db, seller, product, datetime(2025, 6, 15, 12, 0), 2)
+    db.commit()
+    assert _row(db, month, "total").sales_revenue_usd == Decimal("20.00")
+
+    # El commit expiró created_at: el mes se consulta en la base
+    sale.total_usd = Decimal("25.00")
+    db.commit()
+
+    assert _row(db, month, "total").sales_revenue_usd == Decimal("25.00")
+
+
+def _cube(db: Session, month: date) -> dict:
+    fields = ("sales_revenue_usd", "sales_revenue_ves", "orders_count", "units_sold", "services_count")
+    return {
+        (row.dimension, row.dimension_id): tuple(getattr(row, field) for field in fields)
+        for row in db.query(KpiMonthly).filter(KpiMonthly.month == month)
+        if any(getattr(row, field) for field in fields)
+    }
+
+
+def test_deltas_por_flush_coinciden_con_el_recalculo_del_mes(db: Session, seller, product):
+    """Altas, cambios y bajas aplicados como deltas dejan el mes igual que refresh_month."""
+    register_kpi_listeners()
+    month = date(2025, 4, 1)
+    other = Product(sku="KPI-002", name="Funda", cost_usd=Decimal("1.00"), price_usd=Decimal("5.00"))
+    db.add(other)
+    db.flush()
+
+    sale = _sale(db, seller, product, datetime(2025, 4, 3, 10, 0), 2)
+    extra = SaleItem(sale_id=sale.id, product_id=other.id, quantity=1,
+                     unit_price_usd=Decimal("5.00"), subtotal_usd=Decimal("5.00"))
+    db.add(extra)
+    repair = Repair(device_model="Equipo", problem_description="Pantalla", user_id=seller.id,
+                    status="RECEIVED", created_at=datetime(2025, 4, 8, 9, 0))
+    db.add(repair)
+    db.commit()
+    assert _row(db, month, "category", 0).orders_count == 1
+
+    sale.total_usd = Decimal("25.00")
+    db.delete(extra)
+    _sale(db, seller, product, datetime(2025, 4, 20, 10, 0), 1)
+    repair.status = "IN_PROGRESS"
+    db.flush()
+    assert _row(db, month, "total").services_count == 1
+    repair.status = "CANCELLED"
+    db.commit()
+
+    incremental = _cube(db, month)
+    assert incremental[("total", 0)][4] == 0
+    KpiService.refresh_month(db, month)
+    db.flush()
+    assert _cube(db, month) == incremental
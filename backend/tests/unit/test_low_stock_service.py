@@ -0,0 +1,75 @@
+"""Tests unitarios para el listener de stock bajo (Inventory.is_low_stock y eventos en vivo)."""
+
+import pytest
+from decimal import Decimal
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.events import register_event_listeners
+from app.models.inventory import Product, Inventory
+from app.services.low_stock_service import LowStockService, register_low_stock_listeners
+
+
+class _Broker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, evt):
+        self.published.append(evt)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    register_event_listeners()
+    register_low_stock_listeners()
+    fake = _Broker()
+    monkeypatch.setattr(events, "get_broker", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def inventory(db: Session, broker):
+    product = Product(sku="LOW-001", name="Mica templada", cost_usd=Decimal("1.00"), price_usd=Decimal("4.00"))
+    db.add(product)
+    db.flush()
+    item = Inventory(product_id=product.id, quantity=10, min_stock=5)
+    db.add(item)
+    db.commit()
+    broker.published.clear()
+    return item
+
+
+def _set_quantity(db: Session, inventory: Inventory, quantity: int) -> None:
+    inventory.quantity = quantity
+    db.commit()
+
+
+def _stock_events(broker) -> list:
+    return [(evt["type"], evt["data"]["quantity"]) for evt in broker.published if evt["type"].startswith("inventory.")]
+
+
+def test_cruce_del_minimo_marca_el_flag_y_publica_un_evento(db: Session, inventory, broker):
+    """Bajar de 10 a 4 (mínimo 5) activa is_low_stock y publica exactamente un inventory.low_stock."""
+    assert inventory.is_low_stock is False
+
+    _set_quantity(db, inventory, 4)
+
+    assert inventory.is_low_stock is True
+    assert _stock_events(broker) == [("inventory.low_stock", 4)]
+    assert [row["id"] for row in LowStockService.get_low_stock(db)] == [inventory.product_id]
+
+
+def test_cambios_sin_cruce_no_publican(db: Session, inventory, broker):
+    """Seguir por debajo del mínimo no publica; volver a superarlo publica un inventory.restocked."""
+    _set_quantity(db, inventory, 4)
+    broker.published.clear()
+
+    _set_quantity(db, inventory, 2)
+    _set_quantity(db, inventory, 5)  # igual al mínimo sigue siendo stock bajo
+    assert inventory.is_low_stock is True
+    assert _stock_events(broker) == []
+
+    _set_quantity(db, inventory, 9)
+    _set_quantity(db, inventory, 12)
+    assert inventory.is_low_stock is False
+    assert _stock_events(broker) == [("inventory.restocked", 9)]
@@ -0,0 +1,99 @@
+"""Tests unitarios para el outbox de mensajes (contra un servidor HTTP local)."""
+
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.notification import OutboundMessage
+from app.models.settings import SystemSetting
+from app.services.outbox_service import OutboxService, OutboxWorker
+
+
+class FakeProvider(BaseHTTPRequestHandler):
+    """Acepta todo salvo: 58400 -> 400 siempre, 58503 -> 503 la primera vez."""
+    received = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeProvider.received.append(payload)
+        attempts = sum(1 for p in FakeProvider.received if p["to"] == payload["to"])
+        if payload["to"] == "58400":
+            status = 400
+        elif payload["to"] == "58503" and attempts == 1:
+            status = 503
+        else:
+            status = 200
+        self.send_response(status)
+        self.end_headers()
+        self.wfile.write(b'{"ok": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def provider_url():
+    FakeProvider.received = []
+    server = HTTPServer(("127.0.0.1", 0), FakeProvider)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/send"
+    server.shutdown()
+
+
+def _status(db: Session, message_id: int) -> OutboundMessage:
+    db.expire_all()
+    return db.get(OutboundMessage, message_id)
+
+
+def test_envio_reintento_y_fallo(db: Session, provider_url, monkeypatch):
+    """Enviado, reintentado tras un 503 y fallido sin reintento ante un 400."""
+    monkeypatch.setattr(settings, "OUTBOX_RATE_PER_SECOND", 1000.0)
+    db.add(SystemSetting(company_name="Taller Test", whatsapp_api_url=provider_url,
+                         whatsapp_token="tok", is_active=True))
+    ok = OutboxService.enqueue(db, "+58 412 1234567", "Hola")
+    flaky = OutboxService.enqueue(db, "58503", "Hola")
+    rejected = OutboxService.enqueue(db, "58400", "Hola")
+    db.commit()
+
+    async def run(worker):
+        try:
+            return await worker.run_once()
+        finally:
+            await worker.stop()
+
+    worker = OutboxWorker(session_factory=lambda: Session(bind=db.get_bind()))
+    assert asyncio.run(run(worker)) == 3
+
+    assert _status(db, ok.id).status == "sent"
+    assert _status(db, ok.id).recipient == "584121234567"
+    assert _status(db, rejected.id).status == "failed"
+    retry = _status(db, flaky.id)
+    assert retry.status == "pending" and retry.attempts == 1 and "503" in retry.last_error
+
+    # Vence el backoff: el segundo intento sale
+    retry.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+    assert asyncio.run(run(worker)) == 1
+    assert _status(db, flaky.id).status == "sent"
+    assert len(FakeProvider.received) == 4
+    assert FakeProvider.received[0]["token"] == "tok"
+
+
+def test_envio_masivo_un_solo_lote(db: Session):
+    """enqueue_many inserta todos los mensajes con el mismo batch_id."""
+    result = OutboxService.enqueue_many(db, [
+        {"recipient": f"58412000000{i}", "body": "Listo", "reference_type": "repair", "reference_id": i}
+        for i in range(5)
+    ])
+    db.flush()
+
+    messages = OutboxService.get_messages(db, batch_id=result["batch_id"])
+    assert result["queued"] == 5
+    assert len(messages) == 5 and all(m.status == "pending" for m in messages)
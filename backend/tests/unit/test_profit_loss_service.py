@@ -0,0 +1,95 @@
+"""Tests unitarios para ProfitLossService (meses cerrados cacheados en profit_loss_periods)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, datetime
+from sqlalchemy.orm import Session
+
+from app.models.inventory import Product
+from app.models.kpi import ProfitLossPeriod
+from app.models.repair import Repair, RepairItem
+from app.models.sale import Sale
+from app.services.profit_loss_service import ProfitLossService, register_profit_loss_listeners
+
+MONTH = date(2025, 9, 1)
+
+
+@pytest.fixture(autouse=True)
+def listeners():
+    register_profit_loss_listeners()
+
+
+@pytest.fixture
+def september(db: Session):
+    """Una venta y una reparación recibida el 28 de septiembre (mes cerrado)."""
+    db.add(Sale(total_usd=Decimal("100.00"), total_ves=Decimal("4000.00"), exchange_rate=Decimal("40"),
+                created_at=datetime(2025, 9, 10, 12, 0)))
+    repair = Repair(device_model="Equipo", problem_description="No carga", status="RECEIVED",
+                    labor_cost_usd=Decimal("20.00"), created_at=datetime(2025, 9, 28, 17, 0))
+    db.add(repair)
+    db.commit()
+    return repair
+
+
+def _september(db: Session) -> dict:
+    return ProfitLossService.get_periods(db, MONTH, date(2025, 9, 30))[0]
+
+
+def _cached(db: Session):
+    return db.query(ProfitLossPeriod).filter(ProfitLossPeriod.month == MONTH).first()
+
+
+def test_mes_cerrado_se_cachea_con_los_mismos_totales_que_en_vivo(db: Session, september):
+    """La primera consulta guarda el mes; la segunda lo lee del cache con los mismos valores."""
+    live = ProfitLossService._aggregate(db, [(MONTH, date(2025, 10, 1))])[MONTH]
+
+    first = _september(db)
+    assert _cached(db) is not None
+    second = _september(db)
+
+    for key, value in live.items():
+        assert first[key] == value
+        assert second[key] == value
+    assert second["sales_usd"] == Decimal("100.00")
+    assert second["repairs_usd"] == Decimal("20.00")
+
+
+def test_cambios_posteriores_invalidan_el_mes_cacheado(db: Session, september):
+    """Facturar en octubre una reparación recibida en septiembre recalcula septiembre."""
+    _september(db)
+    assert _cached(db) is not None
+
+    # Atributos expirados por el commit: el mes sale de la fila, no de la fecha actual
+    september.labor_cost_usd = Decimal("50.00")
+    db.commit()
+
+    assert _cached(db) is None
+    assert _september(db)["repairs_usd"] == Decimal("50.00")
+
+
+def test_repuesto_agregado_invalida_el_mes_de_la_reparacion(db: Session, september):
+    """Las líneas de repuestos toman el mes de su reparación."""
+    product = Product(sku="PL-001", name="Conector", cost_usd=Decimal("4.00"), price_usd=Decimal("10.00"))
+    db.add(product)
+    db.commit()
+    _september(db)
+
+    db.add(RepairItem(repair_id=september.id, product_id=product.id, quantity=2,
+                      unit_cost_usd=Decimal("4.00"), unit_cogs_usd=Decimal("4.00")))
+    db.commit()
+
+    assert _cached(db) is None
+    assert _september(db)["repair_cogs_usd"] == Decimal("8.00")
+
+
+def test_rollback_de_savepoint_no_descarta_la_invalidacion(db: Session, september):
+    """Un begin_nested fallido dentro de la transacción no pierde los meses ya marcados."""
+    _september(db)
+
+    september.labor_cost_usd = Decimal("35.00")
+    db.flush()
+    savepoint = db.begin_nested()
+    savepoint.rollback()
+    db.commit()
+
+    assert _cached(db) is None
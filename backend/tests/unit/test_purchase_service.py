@@ -0,0 +1,84 @@
+"""Tests unitarios para PurchaseService.receive (recepción de órdenes de compra en bloque)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, timedelta
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.finance import AccountsPayable
+from app.models.inventory import Product, Inventory, InventoryCostLayer
+from app.models.purchase import Supplier, PurchaseOrder, PurchaseItem
+from app.models.user import User
+from app.services.purchase_service import PurchaseService
+
+
+@pytest.fixture
+def buyer(db: Session):
+    user = User(username="compras", email="compras@test.com", hashed_password="x", full_name="Compras")
+    db.add(user)
+    db.flush()
+    return user
+
+
+@pytest.fixture
+def supplier(db: Session):
+    item = Supplier(name="Distribuidora Repuestos", payment_terms=15)
+    db.add(item)
+    db.flush()
+    return item
+
+
+def _order(db: Session, supplier: Supplier, buyer: User, lines) -> PurchaseOrder:
+    """lines = [(producto, cantidad, costo unitario), ...]"""
+    total = sum(Decimal(cost) * quantity for _, quantity, cost in lines)
+    purchase = PurchaseOrder(supplier_id=supplier.id, user_id=buyer.id, status="ordered", total_amount_usd=total)
+    db.add(purchase)
+    db.flush()
+    for product, quantity, cost in lines:
+        db.add(PurchaseItem(purchase_id=purchase.id, product_id=product.id, quantity=quantity,
+                            unit_cost_usd=Decimal(cost), subtotal_usd=Decimal(cost) * quantity))
+    db.flush()
+    return purchase
+
+
+def test_recepcion_crea_inventario_promedia_costo_y_registra_cxp(db: Session, supplier, buyer):
+    """Producto sin fila de inventario y costo previo cero toma el costo de la compra; el otro se pondera."""
+    new_product = Product(sku="PO-NEW", name="Flex de carga", cost_usd=Decimal("0"), price_usd=Decimal("20.00"))
+    stocked = Product(sku="PO-OLD", name="Batería", cost_usd=Decimal("10.00"), price_usd=Decimal("25.00"))
+    db.add_all([new_product, stocked])
+    db.flush()
+    db.add(Inventory(product_id=stocked.id, quantity=6, min_stock=2))
+    db.flush()
+
+    purchase = _order(db, supplier, buyer, [(new_product, 4, "12.50"), (stocked, 4, "15.00")])
+    PurchaseService.receive(db, purchase.id, buyer.id)
+    db.expire_all()
+
+    inventory = db.query(Inventory).filter(Inventory.product_id == new_product.id).one()
+    assert (inventory.quantity, inventory.min_stock, inventory.is_low_stock) == (4, 5, True)
+    assert db.get(Product, new_product.id).cost_usd == Decimal("12.50")
+    assert db.get(Product, stocked.id).cost_usd == Decimal("12.00")  # (6*10 + 4*15) / 10
+    assert db.query(Inventory.quantity).filter(Inventory.product_id == stocked.id).scalar() == 10
+    assert db.query(InventoryCostLayer).filter(InventoryCostLayer.source_id == purchase.id).count() == 2
+
+    payable = db.query(AccountsPayable).filter(AccountsPayable.purchase_order_id == purchase.id).one()
+    assert payable.total_amount == Decimal("110.00")
+    assert payable.due_date == date.today() + timedelta(days=15)
+    assert payable.status == "pending"
+
+
+def test_orden_recibida_no_se_recibe_dos_veces(db: Session, supplier, buyer):
+    """La segunda recepción se rechaza sin duplicar stock ni cuentas por pagar."""
+    product = Product(sku="PO-TWICE", name="Pantalla", cost_usd=Decimal("30.00"), price_usd=Decimal("60.00"))
+    db.add(product)
+    db.flush()
+    purchase = _order(db, supplier, buyer, [(product, 2, "30.00")])
+    PurchaseService.receive(db, purchase.id, buyer.id)
+
+    with pytest.raises(HTTPException) as error:
+        PurchaseService.receive(db, purchase.id, buyer.id)
+
+    assert error.value.status_code == 400
+    assert db.query(Inventory.quantity).filter(Inventory.product_id == product.id).scalar() == 2
+    assert db.query(AccountsPayable).filter(AccountsPayable.purchase_order_id == purchase.id).count() == 1
@@ -0,0 +1,82 @@
+"""Tests unitarios para RateIngestionService (fuentes de tasa e ingesta en cadena)."""
+
+import asyncio
+import pytest
+from decimal import Decimal
+from datetime import date
+from sqlalchemy.orm import Session
+
+from app.models.finance import ExchangeRate
+from app.services import rate_ingestion_service
+from app.services.rate_ingestion_service import (
+    FileSource, ManualSource, RateIngestionService, RateQuote, RateSource
+)
+
+
+class _StaticSource(RateSource):
+    def __init__(self, name, rate=None):
+        self.name = name
+        self.rate = rate
+
+    async def fetch(self, client):
+        return RateQuote(Decimal(self.rate), self.name, date.today()) if self.rate else None
+
+
+@pytest.fixture(autouse=True)
+def session_factory(db: Session, monkeypatch):
+    # La ingesta guarda en un hilo con su propia sesión: misma conexión del test
+    monkeypatch.setattr(rate_ingestion_service, "SessionLocal", lambda: Session(bind=db.get_bind()))
+
+
+def _ingest(sources):
+    async def run():
+        try:
+            return await RateIngestionService.ingest(sources)
+        finally:
+            await RateIngestionService.close()
+    return asyncio.run(run())
+
+
+def _today(db: Session) -> ExchangeRate:
+    return db.query(ExchangeRate).filter(ExchangeRate.effective_date == date.today()).one()
+
+
+def test_rate_source_es_abstracta():
+    """Una fuente sin fetch no se puede instanciar."""
+    with pytest.raises(TypeError):
+        RateSource()
+
+
+def test_file_source_lee_numero_o_json(tmp_path):
+    """Número con coma decimal, JSON con fecha y archivo inexistente."""
+    plain = tmp_path / "rate.txt"
+    plain.write_text(" 36,5432 \n")
+    as_json = tmp_path / "rate.json"
+    as_json.write_text('{"rate": "40.10", "date": "2026-03-02"}')
+
+    async def run():
+        return (await FileSource(str(plain)).fetch(None), await FileSource(str(as_json)).fetch(None),
+                await FileSource(str(tmp_path / "missing.txt")).fetch(None))
+
+    from_text, from_json, missing = asyncio.run(run())
+    assert from_text.rate == Decimal("36.5432") and from_text.effective_date == date.today()
+    assert from_json.rate == Decimal("40.10") and from_json.effective_date == date(2026, 3, 2)
+    assert missing is None
+
+
+def test_ingesta_usa_el_respaldo_si_falta_la_tasa(db: Session, tmp_path):
+    """Sin BCV ni archivo, el respaldo Manual crea la tasa del día."""
+    rate = _ingest([_StaticSource("BCV (Auto)"), FileSource(str(tmp_path / "missing.txt")), ManualSource("38.5")])
+
+    assert rate.source == "Manual"
+    assert _today(db).rate == Decimal("38.5")
+
+
+def test_respaldo_no_pisa_la_tasa_de_una_fuente_principal(db: Session):
+    """Si el BCV ya guardó la tasa de hoy, una corrida que cae al Manual la conserva."""
+    _ingest([_StaticSource("BCV (Auto)", "41.25")])
+    rate = _ingest([_StaticSource("BCV (Auto)"), ManualSource("38.5")])
+
+    assert rate.source == "BCV (Auto)"
+    stored = _today(db)
+    assert stored.source == "BCV (Auto)" and stored.rate == Decimal("41.25")
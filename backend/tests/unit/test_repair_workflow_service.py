@@ -0,0 +1,130 @@
+"""Tests unitarios para RepairWorkflowService.bulk_transition (cambio de estado masivo)."""
+
+import pytest
+from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core import events
+from app.core.events import register_event_listeners
+from app.models.customer import Customer
+from app.models.repair import Repair, RepairLog
+from app.models.user import User
+from app.services.customer_profile_service import CustomerProfileService, register_profile_cache_listeners
+from app.services.repair_workflow_service import RepairWorkflowService, register_repair_workflow_listeners
+
+
+class _Broker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, evt):
+        self.published.append(evt)
+
+
+@pytest.fixture(autouse=True)
+def listeners():
+    register_event_listeners()
+    register_profile_cache_listeners()
+    register_repair_workflow_listeners()
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    fake = _Broker()
+    monkeypatch.setattr(events, "get_broker", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def invalidated(monkeypatch):
+    customer_ids = []
+    monkeypatch.setattr(CustomerProfileService, "invalidate", customer_ids.append)
+    return customer_ids
+
+
+@pytest.fixture
+def technician(db: Session):
+    user = User(username="tec_bulk", email="tec_bulk@test.com", hashed_password="x", full_name="Técnico Bulk")
+    db.add(user)
+    db.flush()
+    return user
+
+
+def _repairs(db: Session, technician: User, count: int, status: str = "READY"):
+    repairs = []
+    for index in range(count):
+        customer = Customer(name=f"Cliente Bulk {index}", phone=f"58412000{index:04d}")
+        db.add(customer)
+        db.flush()
+        repair = Repair(customer_id=customer.id, user_id=technician.id, device_model="Moto G",
+                        problem_description="Pantalla", status=status)
+        db.add(repair)
+        repairs.append(repair)
+    db.commit()
+    return repairs
+
+
+def test_rechaza_transiciones_invalidas_y_mueve_las_validas(db: Session, technician, broker, invalidated):
+    """Inexistentes, mismo estado y transiciones no permitidas vuelven en `rejected`."""
+    ready, delivered = _repairs(db, technician, 1) + _repairs(db, technician, 1, status="DELIVERED")
+    already = _repairs(db, technician, 1, status="IN_PROGRESS")[0]
+
+    result = RepairWorkflowService.bulk_transition(
+        db, [ready.id, delivered.id, already.id, 999999], "IN_PROGRESS", technician.id
+    )
+
+    assert [repair.id for repair in result["updated"]] == [ready.id, delivered.id]
+    assert [(item["id"], item["status"]) for item in result["rejected"]] == [
+        (already.id, "IN_PROGRESS"), (999999, None)
+    ]
+
+    result = RepairWorkflowService.bulk_transition(db, [ready.id], "DELIVERED", technician.id)
+    assert result["updated"] == []
+    assert result["rejected"][0]["reason"].startswith("Transición no permitida")
+
+
+def test_entrega_masiva_actualiza_contadores_garantia_perfiles_y_eventos(db: Session, technician, broker, invalidated):
+    """DELIVERED fija garantía, mueve los contadores, invalida perfiles y publica un evento por reparación."""
+    repairs = _repairs(db, technician, 2)
+    before = RepairWorkflowService.get_counts(db, technician.id)
+    broker.published.clear()
+    invalidated.clear()
+
+    result = RepairWorkflowService.bulk_transition(db, [r.id for r in repairs], "DELIVERED", technician.id)
+
+    after = RepairWorkflowService.get_counts(db, technician.id)
+    assert after["READY"] == before["READY"] - 2
+    assert after["DELIVERED"] == before["DELIVERED"] + 2
+    for repair in result["updated"]:
+        assert repair.status == "DELIVERED"
+        assert repair.delivered_at is not None
+        assert repair.warranty_expiration.replace(tzinfo=timezone.utc) > datetime.now(timezone.utc)
+        assert repair.logs[-1].status_to == "DELIVERED"
+
+    assert sorted(invalidated) == sorted(r.customer_id for r in repairs)
+    status_events = [evt["data"] for evt in broker.published if evt["type"] == "repair.status_changed"]
+    assert sorted(data["repair_id"] for data in status_events) == sorted(r.id for r in repairs)
+    assert all(data["status_from"] == "READY" and data["status_to"] == "DELIVERED" for data in status_events)
+
+
+def test_cantidad_de_consultas_no_depende_del_lote(db: Session, technician, broker, invalidated):
+    """Dos o seis reparaciones se mueven con el mismo número de sentencias SQL."""
+    engine = db.get_bind().engine
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def run(size: int) -> int:
+        ids = [r.id for r in _repairs(db, technician, size)]
+        statements.clear()
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            RepairWorkflowService.bulk_transition(db, ids, "IN_PROGRESS", technician.id)
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        assert db.query(RepairLog).filter(RepairLog.repair_id.in_(ids), RepairLog.status_to == "IN_PROGRESS").count() == size
+        return len(statements)
+
+    assert run(2) == run(6)
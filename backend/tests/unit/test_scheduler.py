@@ -0,0 +1,97 @@
+"""Tests unitarios para el scheduler de tareas periódicas."""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from app.core.scheduler import CronSchedule, Scheduler
+from app.models.job import JobRun
+
+
+def test_cron_next_after():
+    """El próximo turno respeta pasos, rangos y día de la semana."""
+    every_four_hours = CronSchedule("0 */4 * * *")
+    assert every_four_hours.next_after(datetime(2026, 3, 10, 4, 0)) == datetime(2026, 3, 10, 8, 0)
+    assert every_four_hours.next_after(datetime(2026, 3, 10, 22, 30)) == datetime(2026, 3, 11, 0, 0)
+
+    nightly = CronSchedule("5 0 * * *")
+    assert nightly.next_after(datetime(2026, 12, 31, 0, 5)) == datetime(2027, 1, 1, 0, 5)
+
+    # Lunes a viernes a las 8:30; el sábado 14/03/2026 salta al lunes
+    weekdays = CronSchedule("30 8 * * 1-5")
+    assert weekdays.next_after(datetime(2026, 3, 14, 9, 0)) == datetime(2026, 3, 16, 8, 30)
+
+
+def test_cada_turno_corre_una_sola_vez(db: Session):
+    """Dos workers que reclaman el mismo turno: solo uno ejecuta y queda en el historial."""
+    calls = []
+
+    def job():
+        calls.append(1)
+        return {"rows": 3}
+
+    def failing_job():
+        raise RuntimeError("fallo")
+
+    workers = [Scheduler(session_factory=lambda: Session(bind=db.get_bind())) for _ in range(2)]
+    for worker in workers:
+        worker.add_job("test_job", "0 * * * *", job)
+        worker.add_job("test_failing", "0 * * * *", failing_job)
+
+    slot = datetime(2026, 3, 10, 4, 0)
+
+    async def run_all():
+        first = await workers[0].run_job(workers[0].jobs["test_job"], slot)
+        second = await workers[1].run_job(workers[1].jobs["test_job"], slot)
+        failed = await workers[0].run_job(workers[0].jobs["test_failing"], slot)
+        return first, second, failed
+
+    first, second, failed = asyncio.run(run_all())
+
+    assert first is not None and second is None
+    assert len(calls) == 1
+    run = db.get(JobRun, first)
+    assert run.status == "success" and run.result == '{"rows": 3}' and run.duration_ms is not None
+    failed_run = db.get(JobRun, failed)
+    assert failed_run.status == "failed" and failed_run.error == "fallo"
+
+    jobs = {job["name"]: job for job in workers[1].get_jobs(db)}
+    assert jobs["test_job"]["last_run"]["status"] == "success"
+    assert jobs["test_failing"]["failures"] == 1
+
+
+def test_reintento_con_backoff_y_turno_de_arranque(db: Session):
+    """Una corrida fallida agenda un reintento (backoff exponencial); run_at_startup crea un turno único."""
+    attempts = []
+
+    def flaky_job():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("sin fuente")
+        return {"ok": True}
+
+    worker = Scheduler(session_factory=lambda: Session(bind=db.get_bind()))
+    job = worker.add_job("test_retry", "0 0 1 1 *", flaky_job, retry_after=timedelta(minutes=5),
+                         max_retries=3, run_at_startup=lambda: True)
+    job.next_run = job.schedule.next_after(datetime.now())
+
+    async def run_all():
+        startup = await worker.run_startup(job)
+        first_retry = job.retry_at
+        await worker.run_job(job, first_retry)
+        second_retry = job.retry_at
+        final = await worker.run_job(job, second_retry)
+        return startup, first_retry, second_retry, final
+
+    before = datetime.now()
+    startup, first_retry, second_retry, final = asyncio.run(run_all())
+
+    assert db.get(JobRun, startup).status == "failed"
+    assert timedelta(minutes=4) < first_retry - before <= timedelta(minutes=5)
+    assert timedelta(minutes=9) < second_retry - before <= timedelta(minutes=10)
+    assert db.get(JobRun, final).status == "success"
+    assert job.retry_at is None and job.attempts == 0
+
+    worker.add_job("test_no_startup", "0 * * * *", flaky_job, run_at_startup=lambda: False)
+    assert asyncio.run(worker.run_startup(worker.jobs["test_no_startup"])) is None
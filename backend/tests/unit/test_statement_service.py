@@ -0,0 +1,77 @@
+"""Tests unitarios para CustomerStatementService (estado de cuenta con saldo acumulado)."""
+
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+
+from app.models.customer import Customer
+from app.models.finance import AccountReceivable, CustomerPayment, Payment
+from app.models.repair import Repair
+from app.models.sale import Sale
+from app.models.sale_repair import SaleRepair
+from app.services.statement_service import CustomerStatementService
+
+
+def test_saldo_final_descuenta_pagos_en_caja_y_abonos(db: Session):
+    """Venta de $100 con $60 en caja, reparación pagada completa y un abono de $15: quedan $25."""
+    customer = Customer(name="Cliente Estado", phone="584121112233")
+    db.add(customer)
+    db.flush()
+
+    sale = Sale(customer_id=customer.id, total_usd=Decimal("100.00"), total_ves=Decimal("4000.00"),
+                exchange_rate=Decimal("40"), created_at=datetime(2026, 3, 1, 10, 0))
+    repair = Repair(customer_id=customer.id, device_model="Moto G", problem_description="Pin de carga",
+                    status="DELIVERED", labor_cost_usd=Decimal("30.00"), created_at=datetime(2026, 3, 2, 10, 0))
+    db.add_all([sale, repair])
+    db.flush()
+    account = AccountReceivable(customer_id=customer.id, sale_id=sale.id, total_amount=Decimal("40.00"),
+                                paid_amount=Decimal("15.00"), due_date=date(2026, 4, 1), status="partial")
+    db.add(account)
+    db.flush()
+    db.add_all([
+        Payment(sale_id=sale.id, amount_usd=Decimal("60.00"), amount_ves=Decimal("2400.00"),
+                exchange_rate=Decimal("40"), payment_method="cash", created_at=datetime(2026, 3, 1, 10, 0)),
+        Payment(repair_id=repair.id, amount_usd=Decimal("30.00"), amount_ves=Decimal("1200.00"),
+                exchange_rate=Decimal("40"), payment_method="cash", created_at=datetime(2026, 3, 3, 9, 0)),
+        CustomerPayment(account_id=account.id, customer_id=customer.id, amount_usd=Decimal("15.00"),
+                        amount_ves=Decimal("600.00"), exchange_rate=Decimal("40"), balance_before=Decimal("40.00"),
+                        balance_after=Decimal("25.00"), payment_method="cash",
+                        payment_date=datetime(2026, 3, 1, 10, 0) + timedelta(days=5)),
+    ])
+    db.flush()
+
+    entries = list(CustomerStatementService.iter_entries(db, customer.id))
+
+    assert [entry["type"] for entry in entries] == ["VENTA", "PAGO", "REPARACIÓN", "PAGO", "PAGO/ABONO"]
+    assert entries[2]["ref"] == f"#{repair.id} (Moto G)"
+    assert entries[-1]["balance"] == account.total_amount - account.paid_amount
+
+
+def test_reparacion_cobrada_en_venta_no_se_cobra_dos_veces(db: Session):
+    """Reparación de $30 con $10 de anticipo; el POS suma los $20 restantes a la venta y se paga todo: saldo 0."""
+    customer = Customer(name="Cliente POS", phone="584124445566")
+    db.add(customer)
+    db.flush()
+
+    repair = Repair(customer_id=customer.id, device_model="Redmi 9", problem_description="Batería",
+                    status="DELIVERED", labor_cost_usd=Decimal("30.00"), created_at=datetime(2026, 3, 1, 9, 0))
+    sale = Sale(customer_id=customer.id, total_usd=Decimal("70.00"), total_ves=Decimal("2800.00"),
+                exchange_rate=Decimal("40"), created_at=datetime(2026, 3, 4, 10, 0))
+    db.add_all([repair, sale])
+    db.flush()
+    db.add_all([
+        SaleRepair(sale_id=sale.id, repair_id=repair.id, amount_allocated_usd=Decimal("20.00")),
+        Payment(repair_id=repair.id, amount_usd=Decimal("10.00"), amount_ves=Decimal("400.00"),
+                exchange_rate=Decimal("40"), payment_method="cash", created_at=datetime(2026, 3, 1, 9, 30)),
+        Payment(sale_id=sale.id, amount_usd=Decimal("70.00"), amount_ves=Decimal("2800.00"),
+                exchange_rate=Decimal("40"), payment_method="cash", created_at=datetime(2026, 3, 4, 10, 0)),
+    ])
+    db.flush()
+
+    entries = list(CustomerStatementService.iter_entries(db, customer.id))
+
+    assert [(entry["type"], entry["amount"]) for entry in entries] == [
+        ("REPARACIÓN", Decimal("10.00")), ("PAGO", Decimal("-10.00")),
+        ("VENTA", Decimal("70.00")), ("PAGO", Decimal("-70.00")),
+    ]
+    assert entries[-1]["balance"] == 0
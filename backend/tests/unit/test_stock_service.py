@@ -0,0 +1,80 @@
+"""Tests unitarios para StockService (libro stock_movements, Kardex y stock a una fecha)."""
+
+import pytest
+from decimal import Decimal
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.models.inventory import Product, Inventory, StockMovement
+from app.services.stock_service import StockService
+from scripts.setup_database import DATA_MIGRATIONS
+
+START = datetime(2026, 4, 1, 8, 0)
+# (horas desde START, cambio): dos movimientos comparten hora para probar el desempate por id
+CHANGES = [(0, 10), (1, -3), (2, -2), (2, 5), (5, -4), (9, 6), (12, -1)]
+
+
+@pytest.fixture
+def product(db: Session):
+    item = Product(sku="KARDEX-001", name="Cable USB-C", cost_usd=Decimal("2.00"), price_usd=Decimal("5.00"))
+    db.add(item)
+    db.flush()
+    return item
+
+
+def _record_changes(db: Session, product: Product) -> list:
+    """Registra CHANGES y devuelve [(fecha, saldo), ...] en orden cronológico."""
+    balance = 0
+    running = []
+    for hours, change in CHANGES:
+        balance += change
+        movement = StockService.record(db, product.id, change, balance, "adjustment" if change > 0 else "sale")
+        movement.created_at = START + timedelta(hours=hours)
+        running.append((movement.created_at, balance))
+    db.flush()
+    return running
+
+
+def test_stock_at_coincide_con_el_saldo_acumulado(db: Session, product):
+    """Para cada instante, stock_at devuelve el saldo del último movimiento hasta esa fecha."""
+    running = _record_changes(db, product)
+
+    assert StockService.stock_at(db, product.id, START - timedelta(minutes=1)) == 0
+    for moved_at, balance in running:
+        expected = [b for at, b in running if at <= moved_at][-1]
+        assert StockService.stock_at(db, product.id, moved_at) == expected
+        assert StockService.stock_at(db, product.id, moved_at + timedelta(minutes=30)) == expected
+    assert StockService.stock_at(db, product.id, START + timedelta(days=1)) == running[-1][1]
+
+
+def test_paginas_del_kardex_son_contiguas(db: Session, product):
+    """Las páginas con limit/offset cubren todo el libro sin repetir ni saltar movimientos."""
+    _record_changes(db, product)
+    full = StockService.get_kardex(db, product.id, limit=100)
+
+    pages = []
+    for offset in range(0, len(full) + 3, 3):
+        pages.extend(StockService.get_kardex(db, product.id, limit=3, offset=offset))
+
+    assert pages == full
+    assert [entry["change"] for entry in full] == [change for _, change in reversed(CHANGES)]
+    assert all(newer["date"] >= older["date"] for newer, older in zip(full, full[1:]))
+
+
+def test_migracion_de_saldo_inicial_es_idempotente(db: Session, product):
+    """El seed de setup_database crea un 'opening' por producto sin movimientos y no duplica al repetirse."""
+    seeded = Product(sku="KARDEX-002", name="Protector", cost_usd=Decimal("1.00"), price_usd=Decimal("3.00"))
+    db.add(seeded)
+    db.flush()
+    db.add_all([Inventory(product_id=product.id, quantity=7), Inventory(product_id=seeded.id, quantity=4)])
+    StockService.record(db, product.id, 7, 7, "opening")
+    db.flush()
+    sql = next(sql for sql, description in DATA_MIGRATIONS if description == "Saldo inicial de stock_movements")
+
+    assert db.execute(text(sql)).rowcount == 1
+    assert db.execute(text(sql)).rowcount == 0
+
+    opening = db.query(StockMovement).filter(StockMovement.product_id == seeded.id).one()
+    assert (opening.movement_type, opening.quantity, opening.balance_after) == ("opening", 4, 4)
+    assert StockService.stock_at(db, seeded.id, datetime.now() + timedelta(days=1)) == 4
@@ -0,0 +1,134 @@
+"""Tests unitarios para TechnicianAnalyticsService (resumen technician_repair_stats)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+
+from app.models.customer import Customer
+from app.models.inventory import Product
+from app.models.kpi import TechnicianRepairStat
+from app.models.repair import Repair, RepairItem, RepairLog
+from app.models.user import User
+from app.services.technician_analytics_service import TechnicianAnalyticsService, register_technician_stats_listeners
+
+START = datetime(2026, 3, 2, 9, 0)
+
+
+@pytest.fixture
+def technician(db: Session):
+    user = User(username="tec_stats", email="tec_stats@test.com", hashed_password="x", full_name="Técnico Uno")
+    db.add(user)
+    db.flush()
+    return user
+
+
+@pytest.fixture
+def customer(db: Session):
+    item = Customer(name="Cliente Stats", phone="584120000000")
+    db.add(item)
+    db.flush()
+    return item
+
+
+def _repair(db: Session, technician: User, customer: Customer, created_at: datetime, steps,
+            device_imei: str = "3500", **kwargs):
+    """Reparación con su bitácora: steps = [(estado, horas desde created_at), ...]."""
+    repair = Repair(customer_id=customer.id, user_id=technician.id, device_model="Moto G",
+                    device_imei=device_imei, problem_description="Pantalla", created_at=created_at,
+                    status=steps[-1][0], **kwargs)
+    db.add(repair)
+    db.flush()
+    previous = None
+    for status, hours in steps:
+        db.add(RepairLog(repair_id=repair.id, user_id=technician.id, status_from=previous,
+                         status_to=status, created_at=created_at + timedelta(hours=hours)))
+        previous = status
+    db.flush()
+    return repair
+
+
+def _stat(db: Session, repair: Repair) -> TechnicianRepairStat:
+    return db.query(TechnicianRepairStat).filter(TechnicianRepairStat.repair_id == repair.id).one()
+
+
+def test_refresh_calcula_hitos_reaperturas_y_repuestos(db: Session, technician, customer):
+    """Los tiempos salen de la primera llegada a cada estado; READY → IN_PROGRESS es una reapertura."""
+    repair = _repair(db, technician, customer, START, [
+        ("RECEIVED", 0), ("IN_PROGRESS", 2), ("READY", 10),
+        ("IN_PROGRESS", 12), ("READY", 20), ("DELIVERED", 34),
+    ], warranty_expiration=START + timedelta(days=30))
+    product = Product(sku="STATS-001", name="Pantalla", cost_usd=Decimal("15.00"), price_usd=Decimal("40.00"))
+    db.add(product)
+    db.flush()
+    db.add(RepairItem(repair_id=repair.id, product_id=product.id, quantity=2,
+                      unit_cost_usd=Decimal("15.00"), unit_cogs_usd=Decimal("14.00")))
+    db.flush()
+
+    assert TechnicianAnalyticsService.refresh(db)["repairs"] >= 1
+
+    stat = _stat(db, repair)
+    assert stat.technician_id == technician.id
+    assert stat.hours_to_ready == Decimal("10.00")
+    assert stat.hours_ready_to_delivered == Decimal("24.00")
+    assert stat.hours_to_delivered == Decimal("34.00")
+    assert stat.reopened_count == 1
+    assert stat.parts_quantity == 2
+    assert stat.parts_cost_usd == Decimal("28.00")
+    assert stat.is_warranty_return is False
+
+
+def test_refresh_incremental_solo_recalcula_reparaciones_con_bitacora_nueva(db: Session, technician, customer):
+    """Un segundo refresh sin cambios no toca nada; una transición nueva solo recalcula esa reparación."""
+    first = _repair(db, technician, customer, START, [("RECEIVED", 0), ("READY", 5)])
+    _repair(db, technician, customer, START + timedelta(days=1), [("RECEIVED", 0), ("IN_PROGRESS", 1)],
+            device_imei="3600")
+    TechnicianAnalyticsService.refresh(db)
+
+    assert TechnicianAnalyticsService.refresh(db)["repairs"] == 0
+
+    db.add(RepairLog(repair_id=first.id, user_id=technician.id, status_from="READY",
+                     status_to="DELIVERED", created_at=START + timedelta(hours=8)))
+    db.flush()
+    assert TechnicianAnalyticsService.refresh(db)["repairs"] == 1
+    assert _stat(db, first).hours_to_delivered == Decimal("8.00")
+
+
+def test_refresh_detecta_repuestos_agregados_despues(db: Session, technician, customer):
+    """Un repuesto nuevo (sin bitácora) vuelve a marcar su reparación para el refresh."""
+    register_technician_stats_listeners()
+    repair = _repair(db, technician, customer, START, [("RECEIVED", 0), ("READY", 5)], updated_at=START)
+    TechnicianAnalyticsService.refresh(db)
+    assert _stat(db, repair).parts_quantity == 0
+
+    product = Product(sku="STATS-002", name="Batería", cost_usd=Decimal("9.00"), price_usd=Decimal("25.00"))
+    db.add(product)
+    db.flush()
+    db.add(RepairItem(repair_id=repair.id, product_id=product.id, quantity=1,
+                      unit_cost_usd=Decimal("9.00"), unit_cogs_usd=Decimal("9.00")))
+    db.flush()
+
+    assert TechnicianAnalyticsService.refresh(db)["repairs"] == 1
+    stat = _stat(db, repair)
+    assert stat.parts_quantity == 1
+    assert stat.parts_cost_usd == Decimal("9.00")
+
+
+def test_get_performance_percentiles_y_reingresos_en_garantia(db: Session, technician, customer):
+    """Media y percentiles por técnico; el reingreso en garantía cuenta como retrabajo del técnico anterior."""
+    for index, hours in enumerate((4, 8, 12, 40)):
+        _repair(db, technician, customer, START + timedelta(days=index), [("RECEIVED", 0), ("READY", hours)],
+                device_imei=f"IMEI-{index}", warranty_expiration=START + timedelta(days=index + 30))
+    # Mismo cliente y equipo que la primera, dentro de la garantía: reingreso
+    _repair(db, technician, customer, START + timedelta(days=10), [("RECEIVED", 0)], device_imei="IMEI-0")
+
+    TechnicianAnalyticsService.refresh(db)
+    result = TechnicianAnalyticsService.get_performance(db, date(2026, 3, 1), date(2026, 3, 31))
+
+    row = next(r for r in result if r["technician_id"] == technician.id)
+    assert row["technician_name"] == "Técnico Uno"
+    assert row["completed"] == 4
+    assert row["turnaround_hours"]["to_ready"]["mean"] == 16.0
+    assert row["turnaround_hours"]["to_ready"]["p50"] == 10.0
+    assert row["warranty_returns"] == 1
+    assert row["rework_rate"] == 0.25
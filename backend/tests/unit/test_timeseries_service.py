@@ -0,0 +1,75 @@
+"""Tests unitarios para TimeSeriesService (agregación con relleno de huecos en SQL)."""
+
+import pytest
+from decimal import Decimal
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+
+from app.models.finance import CashTransaction
+from app.services.timeseries_service import TimeSeriesService, Series
+
+
+def _series():
+    return [
+        Series(
+            "ingresos", CashTransaction.created_at, CashTransaction.amount_usd,
+            amount_ves=CashTransaction.amount_ves,
+            filters=[CashTransaction.transaction_type == "sale"]
+        ),
+        Series(
+            "egresos", CashTransaction.created_at, CashTransaction.amount_usd,
+            exchange_rate=CashTransaction.exchange_rate,
+            filters=[CashTransaction.transaction_type == "expense"]
+        ),
+    ]
+
+
+@pytest.fixture
+def movements(db: Session):
+    """Movimientos de caja en días distintos dentro de una semana fija."""
+    monday = date(2024, 3, 4)
+    rows = [
+        ("sale", "10.00", "400.00", monday),
+        ("sale", "5.00", "200.00", monday),
+        ("expense", "3.00", "0", monday + timedelta(days=2)),
+        ("sale", "7.00", "280.00", monday + timedelta(days=9)),
+    ]
+    for tx_type, usd, ves, day in rows:
+        db.add(CashTransaction(
+            session_id=1,
+            transaction_type=tx_type,
+            amount_usd=Decimal(usd),
+            amount_ves=Decimal(ves),
+            exchange_rate=Decimal("40"),
+            created_at=datetime.combine(day, datetime.min.time()) + timedelta(hours=10)
+        ))
+    db.flush()
+    return monday
+
+
+def test_buckets_diarios_rellenan_huecos(db: Session, movements: date):
+    """Cada día del rango aparece aunque no tenga movimientos."""
+    rows = TimeSeriesService.aggregate(db, _series(), movements, movements + timedelta(days=6), bucket="day")
+
+    assert [r["bucket"] for r in rows] == [movements + timedelta(days=i) for i in range(7)]
+    assert rows[0]["ingresos_usd"] == 15.0
+    assert rows[0]["ingresos_ves"] == 600.0
+    assert rows[1]["ingresos_usd"] == 0.0
+    # Sin amount_ves: se convierte con la tasa histórica de la fila
+    assert rows[2]["egresos_ves"] == 120.0
+
+
+def test_buckets_semanales_inician_en_lunes(db: Session, movements: date):
+    """Las semanas se alinean al lunes y agrupan los movimientos correspondientes."""
+    rows = TimeSeriesService.aggregate(db, _series(), movements + timedelta(days=3), movements + timedelta(days=10), bucket="week")
+
+    assert [r["bucket"] for r in rows] == [movements, movements + timedelta(days=7)]
+    assert rows[0]["ingresos_usd"] == 15.0
+    assert rows[0]["egresos_usd"] == 3.0
+    assert rows[1]["ingresos_usd"] == 7.0
+
+
+def test_bucket_invalido(db: Session):
+    """Un bucket no soportado produce ValueError."""
+    with pytest.raises(ValueError):
+        TimeSeriesService.aggregate(db, _series(), date(2024, 1, 1), date(2024, 1, 2), bucket="hour")